@@ -64,6 +64,7 @@ INSTALLED_APPS = [
     'bosscore',
     'bossmeta',
     'bossspatialdb',
+    'bosstiles',
     'sso',
     'mgmt', # for templating to work
     'bootstrapform', # style management console
@@ -158,4 +159,131 @@ CORS_ORIGIN_ALLOW_ALL = True
 RUN_HIGH_MEM_TESTS = os.environ.get('RUN_HIGH_MEM_TESTS')
 
 # Select nose2 test runner so testing Layers will work
-TEST_RUNNER="djnose2.TestRunner"
\ No newline at end of file
+TEST_RUNNER="djnose2.TestRunner"
+
+# Seconds between step function status refreshes by the poll_sfn_status command
+SFN_STATUS_POLL_INTERVAL = 10
+
+# Seconds a polled step function status is trusted by the views before they check AWS themselves
+SFN_STATUS_MAX_AGE = 60
+
+# Seconds the poll_sfn_status process that polls keeps its leadership without renewing it. Every endpoint server
+# runs the command, but only the leader calls AWS
+SFN_STATUS_LEADER_TTL = 60
+
+# Seconds the per experiment downsample geometry is cached server side and by clients of the geometry endpoint
+DOWNSAMPLE_GEOMETRY_CACHE_TIMEOUT = 3600
+DOWNSAMPLE_GEOMETRY_MAX_AGE = 300
+
+# Storage of pre-rendered tiles. 'local' keeps them under 'root', 's3' keeps them in 'bucket'
+TILE_STORE = {"type": "local", "root": "/tmp/boss-tiles"}
+
+# Tiles pre-rendered when a channel finishes downsampling, or None to only pre-render on demand with the
+# prerender_tiles command. e.g. {"orientations": ["xy"], "tile_sizes": [512], "formats": ["png"],
+# "profiles": ["default"], "resolutions": None, "workers": 4}. A resolutions of None renders every level. Stored
+# tiles stop being served when the downsample finishes and are removed by a background process either way
+TILE_PRERENDER_ON_DOWNSAMPLE = None
+
+# Prefetch the cuboids of neighbouring tiles after each tile request. The radius is the number of tiles to step
+# along each axis, and at most TILE_PREFETCH_MAX_PER_SEC tiles are prefetched per channel per second
+TILE_PREFETCH_ENABLED = False
+TILE_PREFETCH_RADIUS = 1
+TILE_PREFETCH_QUEUE_SIZE = 256
+TILE_PREFETCH_MAX_PER_SEC = 50
+
+# Seconds a prefetched cuboid counts towards the prefetch hit rate
+TILE_PREFETCH_MARKER_TTL = 300
+
+# Maximum number of tiles in a batch tile request
+TILE_BATCH_MAX_TILES = 128
+
+# Maximum number of channels blended into a composite tile
+TILE_COMPOSITE_MAX_CHANNELS = 8
+
+# PIL save options of each tile format, by encoder profile. Clients pick a profile with the encoder query parameter
+# and get "default" otherwise. "fast" trades bigger tiles for lower latency, e.g. for users on the local network.
+# PIL does not expose PNG filter selection, so the PNG compress_type (zlib strategy, 3 = run length) stands in for it
+TILE_ENCODER_PROFILES = {
+    "default": {"png": {"compress_level": 6},
+                "jpg": {"quality": 75, "progressive": False},
+                "webp": {"quality": 80, "method": 4}},
+    "fast": {"png": {"compress_level": 1, "compress_type": 3},
+             "jpg": {"quality": 75, "progressive": False},
+             "webp": {"quality": 75, "method": 0}},
+}
+
+# Seconds clients and caching proxies may reuse tiles of downsampled channels without revalidating them. Tile
+# responses are private unless TILE_CACHE_PUBLIC is set, which is only safe if the front end caches per user
+TILE_CACHE_MAX_AGE = 3600
+TILE_CACHE_PUBLIC = False
+
+# Default and maximum width and height in pixels of channel thumbnails, and seconds a rendered thumbnail is cached
+THUMBNAIL_DEFAULT_SIZE = 256
+THUMBNAIL_MAX_SIZE = 1024
+THUMBNAIL_CACHE_TIMEOUT = 86400
+
+# Add a Server-Timing header with the time spent in each stage of serving a tile. Stage times are always logged at
+# debug level
+TILE_SERVER_TIMING = False
+
+# Maximum number of ids in one page of an ids in region request
+IDS_MAX_PAGE_SIZE = 100000
+
+# Seconds the per cuboid annotation id sets of a channel are kept after the channel's last id set was cached
+CUBOID_IDS_CACHE_TTL = 7 * 24 * 3600
+
+# Maximum number of ids in a bulk bounding box request and the number of threads looking up their boxes
+BOUNDING_BOX_BULK_MAX_IDS = 100000
+BOUNDING_BOX_BULK_WORKERS = 16
+
+# Maximum number of ids in a bulk request for tight bounding boxes, which scan each object's cuboids
+BOUNDING_BOX_BULK_MAX_TIGHT_IDS = 100
+
+# Number of threads scanning cuboids for a tight bounding box and the seconds a computed box is kept
+BOUNDING_BOX_TIGHT_WORKERS = 8
+BOUNDING_BOX_TIGHT_CACHE_TTL = 24 * 3600
+
+# Number of threads reading cuboids for object statistics and the seconds computed statistics are kept
+OBJECT_STATS_WORKERS = 8
+OBJECT_STATS_CACHE_TTL = 24 * 3600
+
+# Number of threads reading cuboids for a voxel export and the maximum number of runs or voxels it returns, as
+# binary rows or as JSON
+OBJECT_VOXELS_WORKERS = 8
+OBJECT_VOXELS_MAX_ROWS = 50000000
+OBJECT_VOXELS_MAX_JSON_ROWS = 1000000
+
+# Number of ids reserved from a channel's id counter at a time, the seconds a request waits for another worker to
+# reserve a new block, the seconds after which an unfinished block reservation is counted as lost and the number of
+# leaked id ranges kept for auditing
+ID_RESERVE_BLOCK_SIZE = 10000
+ID_RESERVE_REFILL_WAIT = 2
+ID_RESERVE_REFILL_TIMEOUT = 60
+ID_RESERVE_MAX_LEAKS = 1000
+
+# Maximum number of ids in one relabel request and the number of threads rewriting cuboids
+RELABEL_MAX_IDS = 10000
+RELABEL_WORKERS = 8
+
+# Seconds a lock serialising the rewrites of a cuboid lasts and the seconds a rewrite waits for it
+CUBOID_LOCK_TTL = 60
+CUBOID_LOCK_WAIT = 30
+
+# Maximum number of cuboids in one cutout region clear and the number of threads writing them
+CUTOUT_CLEAR_MAX_CUBOIDS = 4096
+CUTOUT_CLEAR_WORKERS = 8
+
+# Seconds a write through the SpatialDB write buffer is assumed to wait for its flush and the seconds a cuboid rewrite
+# waits for the pending writes of its cuboids before giving up
+WRITE_BUFFER_FLUSH_TIME = 120
+WRITE_BUFFER_WAIT = 30
+
+# Maximum number of cuboids in one region copy between channels and the number of threads copying them
+COPY_MAX_CUBOIDS = 4096
+COPY_WORKERS = 8
+
+# Seconds a channel's cached cuboid index is kept after its last registration, the size past which it is trimmed of
+# evicted keys and the minimum seconds between trims of one index
+CACHE_INDEX_TTL = 7 * 24 * 3600
+CACHE_INDEX_TRIM_SIZE = 100000
+CACHE_INDEX_TRIM_INTERVAL = 300
@@ -58,6 +58,7 @@ urlpatterns = [
     url(r'^v1/groups/', include('bosscore.urls.group-urls', namespace='v1')),
     url(r'^v1/cutout/', include('bossspatialdb.urls', namespace='v1')),
     url(r'^v1/downsample/', include('bossspatialdb.urls_downsample', namespace='v1')),
+    url(r'^v1/copy/', include('bossspatialdb.urls_copy', namespace='v1')),
     url(r'^v1/image/', include('bosstiles.image_urls', namespace='v1')),
     url(r'^v1/tile/', include('bosstiles.tile_urls', namespace='v1')),
     url(r'^v1/ingest/', include('bossingest.urls', namespace='v1')),
@@ -76,6 +77,9 @@ urlpatterns = [
     url(r'^v1/reserve/', include('bossobject.urls.reserve_urls', namespace='v1')),
     url(r'^v1/ids/', include('bossobject.urls.ids_urls', namespace='v1')),
     url(r'^v1/boundingbox/', include('bossobject.urls.boundingbox_urls', namespace='v1')),
+    url(r'^v1/stats/', include('bossobject.urls.stats_urls', namespace='v1')),
+    url(r'^v1/voxels/', include('bossobject.urls.voxels_urls', namespace='v1')),
+    url(r'^v1/relabel/', include('bossobject.urls.relabel_urls', namespace='v1')),
 ]
 
 if 'djangooidc' in settings.INSTALLED_APPS:
@@ -0,0 +1,38 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bosscore.sfn_poller import SfnStatusPoller
+
+
+class Command(BaseCommand):
+    help = "Refresh the status of in-flight downsample and ingest step functions on an interval"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=settings.SFN_STATUS_POLL_INTERVAL,
+                            help="Seconds between polls")
+        parser.add_argument('--once', action='store_true', default=False,
+                            help="Poll a single time and exit")
+
+    def handle(self, *args, **options):
+        poller = SfnStatusPoller()
+        if options['once']:
+            if not poller.is_leader():
+                self.stdout.write("Another poller is refreshing the step function statuses")
+                return
+            statuses = poller.poll()
+            self.stdout.write("Refreshed {} step function statuses".format(len(statuses)))
+        else:
+            poller.run(options['interval'])
@@ -0,0 +1,128 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections
+
+import bossutils
+from bossutils.logger import BossLogger
+
+from bosscore.models import Channel
+from bosscore.sfn_status import SfnStatusCache
+from bossingest.models import IngestJob
+from bossingest.ingest_manager import IngestManager
+from bossspatialdb.downsample import update_downsample_status
+
+
+class SfnStatusPoller:
+    """
+    Background service that refreshes the status of every in-flight downsample and ingest step function
+
+    Each pass looks up every in-flight ARN once, applies any state transitions to the database and caches the raw
+    statuses so the views can answer polls without calling AWS. Every endpoint server runs a poller, but they elect
+    one leader through the cache and only the leader polls.
+    """
+
+    def __init__(self, status_cache=None):
+        """
+        Args:
+            status_cache (SfnStatusCache): Store for the statuses. Defaults to the KVIO cache
+        """
+        if status_cache is None:
+            status_cache = SfnStatusCache(settings.KVIO_SETTINGS)
+        self.status_cache = status_cache
+        self.token = uuid.uuid4().hex
+        self.log = BossLogger().logger
+
+    def is_leader(self):
+        """Check if this poller is, or just became, the leader
+
+        Returns:
+            (bool)
+        """
+        return self.status_cache.acquire_leadership(self.token, settings.SFN_STATUS_LEADER_TTL)
+
+    def get_statuses(self, arns):
+        """Look up the status of a batch of step function executions
+
+        Args:
+            arns (iterable(str)): ARNs of the executions. Duplicates are only looked up once
+
+        Returns:
+            (dict): Status of each execution keyed by ARN
+        """
+        session = bossutils.aws.get_session()
+        statuses = {}
+        for arn in set(arns):
+            try:
+                statuses[arn] = bossutils.aws.sfn_status(session, arn)
+            except Exception:
+                self.log.exception("Problem getting status of step function {}".format(arn))
+                continue
+            self.status_cache.set_status(arn, statuses[arn])
+        return statuses
+
+    def poll(self):
+        """Refresh every in-flight downsample and ingest job once
+
+        Returns:
+            (dict): Status of each execution keyed by ARN
+        """
+        channels = list(Channel.objects.filter(downsample_status="IN_PROGRESS")
+                        .exclude(downsample_arn__isnull=True).exclude(downsample_arn=""))
+        jobs = list(IngestJob.objects.filter(status=IngestJob.PREPARING)
+                    .exclude(step_function_arn__isnull=True).exclude(step_function_arn=""))
+
+        statuses = self.get_statuses([ch.downsample_arn for ch in channels] +
+                                     [job.step_function_arn for job in jobs])
+
+        for channel_obj in channels:
+            if channel_obj.downsample_arn in statuses:
+                try:
+                    update_downsample_status(channel_obj, statuses[channel_obj.downsample_arn])
+                except Exception:
+                    self.log.exception("Problem updating downsample status of channel {}".format(channel_obj.id))
+
+        ingest_mgmr = IngestManager()
+        for job in jobs:
+            if job.step_function_arn in statuses:
+                try:
+                    ingest_mgmr.update_ingest_status(job, statuses[job.step_function_arn])
+                except Exception:
+                    self.log.exception("Problem updating status of ingest job {}".format(job.id))
+
+        self.status_cache.beat()
+        return statuses
+
+    def run(self, interval):
+        """Poll forever while this poller is the leader, and wait to take over otherwise
+
+        Args:
+            interval (float): Seconds to wait between the start of each pass
+
+        Returns:
+            None
+        """
+        while True:
+            start = time.time()
+            # Long running process, so drop connections the database has timed out
+            close_old_connections()
+            try:
+                if self.is_leader():
+                    self.poll()
+            except Exception:
+                self.log.exception("Problem polling step function statuses")
+            time.sleep(max(0, interval - (time.time() - start)))
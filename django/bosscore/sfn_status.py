@@ -0,0 +1,125 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+
+from django.conf import settings
+
+import bossutils
+from spdb.spatialdb.rediskvio import RedisKVIO
+
+HEARTBEAT_KEY = "SFN-STATUS-POLLER&HEARTBEAT"
+LEADER_KEY = "SFN-STATUS-POLLER&LEADER"
+
+
+class SfnStatusCache:
+    """
+    Shared store of step function statuses written by the status poller and read by the views
+    """
+
+    def __init__(self, kv_conf):
+        """
+        Args:
+            kv_conf (dict): KVIO settings used to connect to the cache
+        """
+        self.client = RedisKVIO(kv_conf).cache_client
+
+    @staticmethod
+    def get_status_key(arn):
+        return "SFN-STATUS&{}".format(arn)
+
+    def get_status(self, arn):
+        """Get the cached status of a step function execution
+
+        Args:
+            arn (str): ARN of the step function execution
+
+        Returns:
+            (str|None): The cached status or None if it is missing or expired
+        """
+        status = self.client.get(self.get_status_key(arn))
+        if isinstance(status, bytes):
+            status = status.decode()
+        return status
+
+    def set_status(self, arn, status):
+        """Cache the status of a step function execution
+
+        Args:
+            arn (str): ARN of the step function execution
+            status (str): Status of the execution
+
+        Returns:
+            None
+        """
+        self.client.setex(self.get_status_key(arn), settings.SFN_STATUS_MAX_AGE, status)
+
+    def beat(self):
+        """Record that the poller has just refreshed every in-flight status"""
+        self.client.setex(HEARTBEAT_KEY, settings.SFN_STATUS_MAX_AGE, time.time())
+
+    def acquire_leadership(self, token, ttl):
+        """Become, or stay, the one poller that calls AWS
+
+        Args:
+            token (str): Unique id of the calling poller
+            ttl (int): Seconds the leadership lasts unless it is renewed
+
+        Returns:
+            (bool): True if the caller is the leader
+        """
+        if self.client.set(LEADER_KEY, token, nx=True, ex=ttl):
+            return True
+
+        def renew(pipe):
+            leader = pipe.get(LEADER_KEY)
+            if isinstance(leader, bytes):
+                leader = leader.decode()
+            if leader != token:
+                return False
+            pipe.multi()
+            pipe.expire(LEADER_KEY, ttl)
+            return True
+
+        return self.client.transaction(renew, LEADER_KEY, value_from_callable=True)
+
+    def is_poller_alive(self):
+        """Check if the poller has refreshed the statuses recently enough for the views to trust them
+
+        Returns:
+            (bool)
+        """
+        return bool(self.client.exists(HEARTBEAT_KEY))
+
+
+def get_sfn_status(arn):
+    """Get the status of a step function execution, preferring the value cached by the status poller
+
+    If the poller is not running or has not seen the execution yet, the status is looked up directly and cached.
+
+    Args:
+        arn (str): ARN of the step function execution
+
+    Returns:
+        (str): Status of the execution
+    """
+    status_cache = SfnStatusCache(settings.KVIO_SETTINGS)
+    if status_cache.is_poller_alive():
+        status = status_cache.get_status(arn)
+        if status is not None:
+            return status
+
+    session = bossutils.aws.get_session()
+    status = bossutils.aws.sfn_status(session, arn)
+    status_cache.set_status(arn, status)
+    return status
@@ -0,0 +1,56 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from unittest.mock import patch
+
+
+class FakeSfn:
+    """
+    Local stand-in for the bossutils.aws step function helpers
+
+    Executions start RUNNING and only change state when a test calls set_status(). Every status lookup is counted
+    so tests can check how often AWS would have been called.
+    """
+
+    def __init__(self):
+        self.executions = {}
+        self.status_calls = 0
+
+    def execute(self, session, sfn_name, args):
+        arn = "arn:aws:states:fake:execution:{}:{}".format(sfn_name, len(self.executions))
+        self.executions[arn] = {"status": "RUNNING", "args": args}
+        return arn
+
+    def status(self, session, arn):
+        self.status_calls += 1
+        return self.executions[arn]["status"]
+
+    def cancel(self, session, arn, error="Error", cause="Unknown Cause"):
+        self.executions[arn]["status"] = "ABORTED"
+
+    def set_status(self, arn, status):
+        self.executions[arn]["status"] = status
+
+    def patch(self):
+        """Patch the bossutils.aws step function helpers with this fake
+
+        Returns:
+            (list): Started patchers. Stop them in the test's tearDown()
+        """
+        patchers = [patch('bossutils.aws.sfn_execute', self.execute),
+                    patch('bossutils.aws.sfn_status', self.status),
+                    patch('bossutils.aws.sfn_cancel', self.cancel),
+                    patch('bossutils.aws.get_session', lambda: None)]
+        for patcher in patchers:
+            patcher.start()
+        return patchers
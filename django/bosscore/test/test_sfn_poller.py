@@ -0,0 +1,110 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from rest_framework.test import APITestCase
+from unittest.mock import patch
+from mockredis import mock_strict_redis_client
+
+from bosscore.models import Channel
+from bosscore.sfn_status import SfnStatusCache, get_sfn_status
+from bosscore.sfn_poller import SfnStatusPoller
+from bosscore.test.setup_db import SetupTestDB
+from bosscore.test.fake_sfn import FakeSfn
+from bossspatialdb.downsample import update_downsample_status
+
+KV_CONF = {"cache_host": "localhost", "cache_db": 1, "read_timeout": 86400}
+
+
+@patch('bossspatialdb.downsample.CuboidCacheIndex')
+class TestSfnStatusPoller(APITestCase):
+
+    def setUp(self):
+        """Put a channel in the IN_PROGRESS state backed by a fake step function"""
+        self.dbsetup = SetupTestDB()
+        self.user = self.dbsetup.create_user('testuser')
+        self.dbsetup.insert_downsample_data()
+
+        self.sfn = FakeSfn()
+        self.patchers = self.sfn.patch()
+        redis_patcher = patch('redis.StrictRedis', mock_strict_redis_client)
+        redis_patcher.start()
+        self.patchers.append(redis_patcher)
+        self.arn = self.sfn.execute(None, 'downsample', {})
+
+        channel_obj = Channel.objects.get(name='channel1', experiment__name='exp_ds_aniso')
+        channel_obj.downsample_status = "IN_PROGRESS"
+        channel_obj.downsample_arn = self.arn
+        channel_obj.save()
+        self.channel_id = channel_obj.id
+
+        self.status_cache = SfnStatusCache(KV_CONF)
+        self.poller = SfnStatusPoller(status_cache=self.status_cache)
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def get_status(self):
+        return Channel.objects.get(id=self.channel_id).downsample_status
+
+    def test_poll_running(self, mock_index):
+        """A running step function leaves the channel IN_PROGRESS and caches the status"""
+        statuses = self.poller.poll()
+        self.assertEqual(statuses, {self.arn: "RUNNING"})
+        self.assertEqual(self.get_status(), "IN_PROGRESS")
+        self.assertEqual(self.status_cache.get_status(self.arn), "RUNNING")
+        self.assertTrue(self.status_cache.is_poller_alive())
+
+    def test_poll_succeeded(self, mock_index):
+        """A finished step function marks the channel DOWNSAMPLED and clears its cached cuboids"""
+        self.sfn.set_status(self.arn, "SUCCEEDED")
+        self.poller.poll()
+        self.assertEqual(self.get_status(), "DOWNSAMPLED")
+        self.assertTrue(mock_index.return_value.clear_async.called)
+
+    def test_poll_failed(self, mock_index):
+        """A failed step function marks the channel FAILED"""
+        self.sfn.set_status(self.arn, "TIMED_OUT")
+        self.poller.poll()
+        self.assertEqual(self.get_status(), "FAILED")
+
+    def test_get_sfn_status_reads_poller_cache(self, mock_index):
+        """While the poller is alive the views do not call AWS"""
+        self.poller.poll()
+        calls = self.sfn.status_calls
+
+        with patch('bosscore.sfn_status.SfnStatusCache', return_value=self.status_cache):
+            self.assertEqual(get_sfn_status(self.arn), "RUNNING")
+        self.assertEqual(self.sfn.status_calls, calls)
+
+    def test_get_sfn_status_without_poller(self, mock_index):
+        """Without a poller the views fall back to calling AWS"""
+        with patch('bosscore.sfn_status.SfnStatusCache', return_value=self.status_cache):
+            self.assertEqual(get_sfn_status(self.arn), "RUNNING")
+        self.assertEqual(self.sfn.status_calls, 1)
+
+    def test_single_leader(self, mock_index):
+        """Only one of the pollers sharing a cache polls AWS"""
+        other = SfnStatusPoller(status_cache=self.status_cache)
+        self.assertTrue(self.poller.is_leader())
+        self.assertFalse(other.is_leader())
+        self.assertTrue(self.poller.is_leader())
+
+    def test_transition_applied_once(self, mock_index):
+        """A poller and a view seeing the same execution finish only clear the cache once"""
+        poller_copy = Channel.objects.get(id=self.channel_id)
+        view_copy = Channel.objects.get(id=self.channel_id)
+
+        self.assertEqual(update_downsample_status(poller_copy, "SUCCEEDED"), "DOWNSAMPLED")
+        self.assertEqual(update_downsample_status(view_copy, "SUCCEEDED"), "DOWNSAMPLED")
+        self.assertEqual(mock_index.return_value.clear_async.call_count, 1)
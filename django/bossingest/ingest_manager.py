@@ -626,6 +626,29 @@ class IngestManager:
         policy = BossUtil.generate_ingest_policy(ingest_job.id, upload_queue, bucket_name, ingest_type=ingest_job.ingest_type)
         ingest_creds.generate_credentials(ingest_job.id, policy.arn)
 
+    def update_ingest_status(self, ingest_job, sfn_status):
+        """
+        Apply the status of a preparing job's step function to the job
+        Args:
+            ingest_job: Ingest job model
+            sfn_status: Status of the job's step function execution
+        Returns:
+            (int): The job's status after the update
+
+        """
+        if ingest_job.status == IngestJob.PREPARING and sfn_status == 'SUCCEEDED':
+            # The upload queue is populated, so generate credentials and start uploading. The status poller and the
+            # views can both see the step function finish, so only the one whose conditional update wins does this
+            updated = IngestJob.objects.filter(id=ingest_job.id, status=IngestJob.PREPARING) \
+                .update(status=IngestJob.UPLOADING)
+            if updated:
+                ingest_job.status = IngestJob.UPLOADING
+                self.generate_ingest_credentials(ingest_job)
+            else:
+                ingest_job.refresh_from_db(fields=["status"])
+
+        return ingest_job.status
+
     def remove_ingest_credentials(self, job_id):
         """
         Remove the ingest credentials for a job
@@ -26,6 +26,10 @@ from bosscore.error import BossError, ErrorCodes, BossHTTPError
 from bossingest.ingest_manager import IngestManager, INGEST_BUCKET
 from bossingest.serializers import IngestJobListSerializer
 from bosscore.models import Collection, Experiment, Channel
+from bosscore.sfn_status import get_sfn_status
+from bosscore.lookup import LookUpKey
+from bossspatialdb.data_version import bump_data_version
+from bossspatialdb.id_cache import clear_cuboid_ids
 from bossingest.models import IngestJob
 from bossutils.logger import BossLogger
 
@@ -132,14 +136,12 @@ class IngestJobView(IngestServiceView):
 
             elif ingest_job.status == 0:
                 # Job is still in progress
-                # check status of the step function
-                session = bossutils.aws.get_session()
-                if bossutils.aws.sfn_status(session, ingest_job.step_function_arn) == 'SUCCEEDED':
+                # check status of the step function, as last seen by the status poller
+                sfn_status = get_sfn_status(ingest_job.step_function_arn)
+                if sfn_status == 'SUCCEEDED':
                     # generate credentials
-                    ingest_job.status = 1
-                    ingest_job.save()
-                    ingest_mgmr.generate_ingest_credentials(ingest_job)
-                elif bossutils.aws.sfn_status(session, ingest_job.step_function_arn) == 'FAILED':
+                    ingest_mgmr.update_ingest_status(ingest_job, sfn_status)
+                elif sfn_status == 'FAILED':
                     # This indicates an error in step function
                     raise BossError("Error generating ingest job messages"
                                     " Delete the ingest job with id {} and try again.".format(ingest_job_id),
@@ -313,6 +315,12 @@ class IngestJobCompleteView(IngestServiceView):
                 return BossHTTPError("Only the creator or admin can complete an ingest job",
                                      ErrorCodes.INGEST_NOT_CREATOR)
 
+            # The uploaded data is now in the channel, so responses cached by clients are stale
+            boss_key = "&".join([ingest_job.collection, ingest_job.experiment, ingest_job.channel])
+            lookup_key = LookUpKey.get_lookup_key(boss_key).lookup_key
+            bump_data_version(lookup_key)
+            clear_cuboid_ids(lookup_key)
+
             # Curently have issues with clean up.  Skipping that for now.
             return Response(status=status.HTTP_200_OK)
 
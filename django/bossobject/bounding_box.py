@@ -0,0 +1,129 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from bosscore.error import BossError, ErrorCodes
+from bossspatialdb.retired_ids import RetiredIds
+
+from .tight_bbox import get_tight_bounding_box
+
+from spdb.spatialdb.spatialdb import SpatialDB
+
+# Columns of a bulk bounding box response, in addition to the ids
+BOX_COLUMNS = ('x_start', 'x_stop', 'y_start', 'y_stop', 'z_start', 'z_stop', 't_start', 't_stop')
+
+
+def parse_bulk_ids(data, bb_type='loose'):
+    """Get the ids of a bulk bounding box request
+
+    Tight boxes scan the object's cuboids, so far fewer of them are allowed per request than loose boxes.
+
+    Args:
+        data (dict|numpy.ndarray): Parsed body. Either JSON with an "ids" list or binary uint64 ids
+        bb_type (str): Type of bounding box requested. loose or tight
+
+    Returns:
+        (numpy.ndarray): Sorted, unique uint64 ids
+
+    Raises:
+        BossError: If the ids are missing, invalid or too many
+    """
+    if isinstance(data, np.ndarray):
+        ids = data
+    else:
+        raw = data.get("ids") if isinstance(data, dict) else None
+        if not isinstance(raw, list):
+            raise BossError("Bulk bounding box requests must provide a list of ids", ErrorCodes.INVALID_POST_ARGUMENT)
+        try:
+            raw = [int(id) for id in raw]
+            if any(id < 0 for id in raw):
+                raise ValueError
+            ids = np.array(raw, dtype=np.uint64)
+        except (TypeError, ValueError, OverflowError):
+            raise BossError("Object ids must be non-negative integers", ErrorCodes.TYPE_ERROR)
+
+    ids = np.unique(ids)
+    if len(ids) == 0 or ids[0] == 0:
+        raise BossError("Bulk bounding box requests must provide one or more non-zero ids",
+                        ErrorCodes.INVALID_POST_ARGUMENT)
+    max_ids = settings.BOUNDING_BOX_BULK_MAX_TIGHT_IDS if bb_type == 'tight' else settings.BOUNDING_BOX_BULK_MAX_IDS
+    if len(ids) > max_ids:
+        raise BossError("Bulk {} bounding box requests support at most {} ids".format(bb_type, max_ids),
+                        ErrorCodes.REQUEST_TOO_LARGE)
+    return ids
+
+
+def get_bounding_boxes(resource, resolution, ids, bb_type='loose'):
+    """Look up the bounding boxes of many objects concurrently
+
+    Each worker thread reuses its own SpatialDB for all the ids it handles. Ids a relabel retired, see RetiredIds, are
+    reported as missing without being looked up.
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the annotation channel
+        resolution (int): Resolution level of the boxes
+        ids (numpy.ndarray): Object ids
+        bb_type (str): loose or tight
+
+    Returns:
+        (list(dict|None)): Bounding box of each id, or None if the id does not exist
+    """
+    local = threading.local()
+
+    def lookup(id):
+        if not hasattr(local, 'spdb'):
+            local.spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
+        if bb_type == 'tight':
+            # The ids are already spread over the pool, so each tight box is scanned by its own thread
+            return get_tight_bounding_box(local.spdb, resource, resolution, int(id), workers=1)
+        return local.spdb.get_bounding_box(resource, resolution, int(id), bb_type=bb_type)
+
+    retired = RetiredIds(settings.STATEIO_CONFIG).get_retired(resource.get_lookup_key(), resolution, ids)
+    live = [id for id, is_retired in zip(ids, retired) if not is_retired]
+    workers = max(1, min(settings.BOUNDING_BOX_BULK_WORKERS, len(live)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        found = iter(list(executor.map(lookup, live)))
+    return [None if is_retired else next(found) for is_retired in retired]
+
+
+def to_columns(ids, boxes):
+    """Arrange bounding boxes as columns
+
+    Args:
+        ids (numpy.ndarray): Object ids
+        boxes (list(dict|None)): Bounding box of each id, with x_range, y_range, z_range and t_range. None if the id
+                                 does not exist
+
+    Returns:
+        (dict): "ids" and a list per BOX_COLUMNS entry for the ids that exist, and "missing" for the ids that don't.
+                Ids are strings, like the ids service returns
+    """
+    columns = {"ids": [], "missing": []}
+    for column in BOX_COLUMNS:
+        columns[column] = []
+
+    for id, box in zip(ids, boxes):
+        if box is None:
+            columns["missing"].append(str(id))
+            continue
+        columns["ids"].append(str(id))
+        for axis in ('x', 'y', 'z', 't'):
+            start, stop = box['{}_range'.format(axis)]
+            columns['{}_start'.format(axis)].append(int(start))
+            columns['{}_stop'.format(axis)].append(int(stop))
+    return columns
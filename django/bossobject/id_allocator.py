@@ -0,0 +1,258 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from bossutils.logger import BossLogger
+
+from spdb.spatialdb.state import CacheStateDB
+
+# Counters kept for each channel. reserved ids were taken from the channel's id counter, issued ids were handed out,
+# leaked ids were left over in a replaced block and lost ids may have been taken by a refill that never finished.
+# reserved == issued + leaked + lost + the ids left in the current block, once no refill is in progress
+COUNTERS = ('reserved', 'issued', 'leaked', 'lost', 'blocks', 'direct')
+
+
+class IdBlockAllocator:
+    """
+    Hands out annotation ids from blocks reserved in bulk from a channel's id counter
+
+    Every request used to increment the channel's counter in DynamoDB, so parallel workers serialised on that one item.
+    Instead one worker at a time reserves a block of ID_RESERVE_BLOCK_SIZE ids and every worker takes sequential
+    ranges from it with a Redis transaction. A request that doesn't fit in what is left of the block replaces it, and
+    the rest of the old block is recorded as leaked. Ids are never handed out twice, they can only be skipped.
+
+    A refill is marked in Redis before the counter is incremented. If the worker dies before the new block is stored,
+    the next refill after ID_RESERVE_REFILL_TIMEOUT counts the block as lost so the accounting still adds up.
+
+    Blocks and counters are kept in the cache state database, which is not subject to cache eviction, so the rest of a
+    block and its accounting can't silently disappear.
+    """
+
+    def __init__(self, state_conf):
+        """
+        Args:
+            state_conf (dict): STATEIO settings used to connect to the cache state database
+        """
+        self.client = CacheStateDB(state_conf).status_client
+
+    @staticmethod
+    def get_block_key(lookup_key):
+        return "ID-BLOCK&{}".format(lookup_key)
+
+    @staticmethod
+    def get_leaks_key(lookup_key):
+        return "ID-BLOCK-LEAKS&{}".format(lookup_key)
+
+    @staticmethod
+    def parse_state(raw):
+        """Convert the hash of a channel's block to ints
+
+        Args:
+            raw (dict): Fields and values as returned by Redis
+
+        Returns:
+            (dict)
+        """
+        return {(field.decode() if isinstance(field, bytes) else field): int(value) for field, value in raw.items()}
+
+    def reserve(self, cache, resource, count):
+        """Reserve a range of sequential ids
+
+        Args:
+            cache (spdb.spatialdb.SpatialDB): Interface to the cache, used to reserve blocks
+            resource (spdb.project.BossResource): Data model info of the annotation channel
+            count (int): Number of ids to reserve
+
+        Returns:
+            (int): First id of the range
+        """
+        lookup_key = resource.get_lookup_key()
+        if count >= settings.ID_RESERVE_BLOCK_SIZE:
+            # Blocks would be used up by one request, so large requests go straight to the counter
+            return self.reserve_direct(cache, resource, count)
+
+        deadline = time.time() + settings.ID_RESERVE_REFILL_WAIT
+        while True:
+            start_id = self.take(lookup_key, count)
+            if start_id is not None:
+                return start_id
+
+            if self.begin_refill(lookup_key, settings.ID_RESERVE_BLOCK_SIZE):
+                try:
+                    # Another worker may have installed a block since the range was taken
+                    start_id = self.take(lookup_key, count)
+                    if start_id is None:
+                        block_start = int(cache.reserve_ids(resource, settings.ID_RESERVE_BLOCK_SIZE)[0])
+                        return self.install(lookup_key, block_start, settings.ID_RESERVE_BLOCK_SIZE, count)
+                except Exception:
+                    self.client.hdel(self.get_block_key(lookup_key), 'refill_time', 'refill_size')
+                    raise
+                self.client.hdel(self.get_block_key(lookup_key), 'refill_time', 'refill_size')
+                return start_id
+
+            if time.time() > deadline:
+                # Another worker is taking too long to refill. Don't make this request wait on it
+                BossLogger().logger.warning("Timed out waiting for an id block refill of {}".format(lookup_key))
+                return self.reserve_direct(cache, resource, count)
+            time.sleep(0.05)
+
+    def reserve_direct(self, cache, resource, count):
+        """Reserve a range straight from the channel's id counter
+
+        Args:
+            cache (spdb.spatialdb.SpatialDB): Interface to the cache
+            resource (spdb.project.BossResource): Data model info of the annotation channel
+            count (int): Number of ids to reserve
+
+        Returns:
+            (int): First id of the range
+        """
+        start_id = int(cache.reserve_ids(resource, count)[0])
+        key = self.get_block_key(resource.get_lookup_key())
+        pipe = self.client.pipeline()
+        for counter in ('reserved', 'issued', 'direct'):
+            pipe.hincrby(key, counter, count)
+        pipe.execute()
+        return start_id
+
+    def take(self, lookup_key, count):
+        """Take a range from the current block
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            count (int): Number of ids to take
+
+        Returns:
+            (int|None): First id of the range, or None if the block doesn't have enough ids left
+        """
+        key = self.get_block_key(lookup_key)
+
+        def take_range(pipe):
+            state = self.parse_state(pipe.hgetall(key))
+            start_id = state.get('next', 0)
+            if state.get('stop', 0) - start_id < count:
+                return None
+            pipe.multi()
+            pipe.hincrby(key, 'next', count)
+            pipe.hincrby(key, 'issued', count)
+            return start_id
+
+        return self.client.transaction(take_range, key, value_from_callable=True)
+
+    def begin_refill(self, lookup_key, block_size):
+        """Mark a refill of the block as in progress
+
+        A refill left behind by a worker that died is taken over, and its block counted as lost.
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            block_size (int): Number of ids the refill will reserve
+
+        Returns:
+            (bool): True if the caller should refill the block, False if another worker is refilling it
+        """
+        key = self.get_block_key(lookup_key)
+
+        def mark(pipe):
+            state = self.parse_state(pipe.hgetall(key))
+            now = int(time.time())
+            started = state.get('refill_time')
+            if started is not None and now - started < settings.ID_RESERVE_REFILL_TIMEOUT:
+                return False
+            pipe.multi()
+            if started is not None:
+                pipe.hincrby(key, 'lost', state.get('refill_size', 0))
+            pipe.hset(key, 'refill_time', now)
+            pipe.hset(key, 'refill_size', block_size)
+            return True
+
+        return self.client.transaction(mark, key, value_from_callable=True)
+
+    def install(self, lookup_key, block_start, block_size, count):
+        """Replace the current block with a new one and take a range from it
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            block_start (int): First id of the new block
+            block_size (int): Number of ids in the new block
+            count (int): Number of ids to take
+
+        Returns:
+            (int): First id of the range
+        """
+        key = self.get_block_key(lookup_key)
+
+        def replace(pipe):
+            state = self.parse_state(pipe.hgetall(key))
+            remainder = state.get('stop', 0) - state.get('next', 0)
+            pipe.multi()
+            if remainder > 0:
+                pipe.hincrby(key, 'leaked', remainder)
+                pipe.lpush(self.get_leaks_key(lookup_key), "{}:{}".format(state['next'], state['stop']))
+                pipe.ltrim(self.get_leaks_key(lookup_key), 0, settings.ID_RESERVE_MAX_LEAKS - 1)
+            pipe.hset(key, 'next', block_start + count)
+            pipe.hset(key, 'stop', block_start + block_size)
+            pipe.hincrby(key, 'reserved', block_size)
+            pipe.hincrby(key, 'issued', count)
+            pipe.hincrby(key, 'blocks', 1)
+            pipe.hdel(key, 'refill_time', 'refill_size')
+            return block_start
+
+        return self.client.transaction(replace, key, value_from_callable=True)
+
+    def get_status(self, lookup_key):
+        """Get the utilisation of a channel's ids
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+
+        Returns:
+            (dict): The COUNTERS, the ids left in the current block, if a refill is in progress, the fraction of the
+                    reserved ids that were issued and the most recent leaked ranges as [start, stop] pairs
+        """
+        state = self.parse_state(self.client.hgetall(self.get_block_key(lookup_key)))
+        status = {counter: state.get(counter, 0) for counter in COUNTERS}
+        status['block_size'] = settings.ID_RESERVE_BLOCK_SIZE
+        status['available'] = max(0, state.get('stop', 0) - state.get('next', 0))
+        status['refilling'] = 'refill_time' in state
+        status['utilisation'] = status['issued'] / status['reserved'] if status['reserved'] else None
+
+        leaks = self.client.lrange(self.get_leaks_key(lookup_key), 0, -1)
+        status['leaked_ranges'] = [[int(bound) for bound in (leak.decode() if isinstance(leak, bytes) else leak)
+                                    .split(':')] for leak in leaks]
+        return status
+
+
+def reserve_ids(cache, resource, count):
+    """Reserve a range of sequential ids through the block allocator
+
+    If the allocator's Redis can't be used the ids are reserved straight from the channel's id counter, which can
+    only skip ids, never hand them out twice.
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the cache
+        resource (spdb.project.BossResource): Data model info of the annotation channel
+        count (int): Number of ids to reserve
+
+    Returns:
+        (int): First id of the range
+    """
+    try:
+        return IdBlockAllocator(settings.STATEIO_CONFIG).reserve(cache, resource, count)
+    except RedisError:
+        BossLogger().logger.exception("Problem using the id block allocator of {}".format(resource.get_lookup_key()))
+        return int(cache.reserve_ids(resource, count)[0])
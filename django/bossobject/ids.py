@@ -0,0 +1,163 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import numpy as np
+from django.conf import settings
+
+from bosscore.error import BossError, ErrorCodes
+from bossspatialdb.cache_index import register_cached_cuboids
+from bossspatialdb.cuboids import get_region_cuboids
+from bossspatialdb.data_version import get_data_version
+
+# Ids are sent as little endian unsigned 64 bit integers in binary responses
+ID_DTYPE = np.dtype('<u8')
+
+
+def iter_block_ids(cache, resource, resolution, corner, extent, time_range, id_cache=None):
+    """Get the ids in a region one cuboid at a time
+
+    Cuboids the region fully covers are looked up in the id cache first, and are only scanned, and then cached, on a
+    miss. The parts of partially covered cuboids are always scanned. Id sets are only cached if the channel's data
+    version did not change while they were computed, so a concurrent write can't leave a stale set behind.
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the cache
+        resource (spdb.project.BossResource): Data model info of the annotation channel
+        resolution (int): Resolution level of the region
+        corner ((int, int, int)): X, Y, Z corner of the region in voxels
+        extent ((int, int, int)): X, Y, Z extent of the region in voxels
+        time_range ([int, int]): Time samples of the region
+        id_cache (bossspatialdb.id_cache.CuboidIdCache|None): Cache of per cuboid id sets. None scans every cuboid
+
+    Returns:
+        (generator(numpy.ndarray)): Sorted, unique, non-zero uint64 ids of each cuboid's part of the region at each
+                                    time sample
+    """
+    lookup_key = resource.get_lookup_key()
+    parts = list(get_region_cuboids(resolution, corner, extent))
+    covered = [cuboid for cuboid, _, _, full in parts if full]
+    if id_cache is None or not covered:
+        id_cache = None
+        version = None
+    else:
+        version = get_data_version(lookup_key)[0]
+
+    for t_idx in range(*time_range):
+        cached = {}
+        if id_cache is not None:
+            cached = dict(zip(covered, id_cache.get_many(lookup_key, resolution, t_idx, covered)))
+
+        scanned = {}
+        read = False
+        for cuboid, sub_corner, sub_extent, full in parts:
+            ids = cached.get(cuboid)
+            if ids is None:
+                data = cache.cutout(resource, sub_corner, sub_extent, resolution, [t_idx, t_idx + 1])
+                read = True
+                ids = np.unique(data.data)
+                ids = ids[ids != 0].astype(np.uint64, copy=False)
+                if full:
+                    scanned[cuboid] = ids
+            yield ids
+
+        if read:
+            register_cached_cuboids(resource, resolution, corner, extent, [t_idx, t_idx + 1])
+        if id_cache is not None and scanned and get_data_version(lookup_key)[0] == version:
+            id_cache.put_many(lookup_key, resolution, t_idx, scanned)
+
+
+def merge_ids(blocks):
+    """Merge the ids of a sequence of blocks
+
+    Args:
+        blocks (iterable(numpy.ndarray)): Ids of each block
+
+    Returns:
+        (numpy.ndarray): Sorted, unique uint64 ids
+    """
+    return np.unique(np.concatenate([np.empty(0, dtype=np.uint64)] + list(blocks)))
+
+
+def stream_new_ids(blocks):
+    """De-duplicate the ids of a sequence of blocks, emitting each id the first time it is seen
+
+    The ids already emitted are kept as one sorted array that each block is merged into, so memory grows with the
+    number of distinct ids rather than the size of the region.
+
+    Args:
+        blocks (iterable(numpy.ndarray)): Sorted, unique ids of each block
+
+    Returns:
+        (generator(numpy.ndarray)): The ids of each block that were not in an earlier block
+    """
+    seen = np.empty(0, dtype=np.uint64)
+    for ids in blocks:
+        new = ids[~np.in1d(ids, seen, assume_unique=True)]
+        if len(new):
+            seen = np.union1d(seen, new)
+            yield new
+
+
+def get_ids_page(blocks, cursor, limit):
+    """Get one page of a region's ids in ascending order
+
+    Only the smallest limit + 1 ids after the cursor are kept while merging the blocks, so a page needs memory
+    proportional to its size.
+
+    Args:
+        blocks (iterable(numpy.ndarray)): Sorted, unique ids of each block of the region
+        cursor (int|None): Return ids greater than this. None starts from the first id
+        limit (int): Maximum number of ids in the page
+
+    Returns:
+        (numpy.ndarray, int|None): The ids of the page and the cursor of the next page, or None if it is the last
+    """
+    page = np.empty(0, dtype=np.uint64)
+    for ids in blocks:
+        if cursor is not None:
+            ids = ids[ids > np.uint64(cursor)]
+        page = np.union1d(page, ids)[:limit + 1]
+
+    if len(page) > limit:
+        return page[:limit], int(page[limit - 1])
+    return page, None
+
+
+def get_page_args(query_params):
+    """Parse the limit and cursor query parameters of an ids request
+
+    Args:
+        query_params (dict): Query parameters of the request
+
+    Returns:
+        (int|None, int|None): Page size, or None if the request is not paginated, and the cursor
+
+    Raises:
+        BossError: If the parameters are invalid
+    """
+    limit = query_params.get("limit")
+    cursor = query_params.get("cursor")
+    if limit is None:
+        if cursor is not None:
+            raise BossError("The cursor query parameter requires limit", ErrorCodes.INVALID_ARGUMENT)
+        return None, None
+
+    try:
+        limit = int(limit)
+        cursor = int(cursor) if cursor else None
+        if limit < 1 or limit > settings.IDS_MAX_PAGE_SIZE or (cursor is not None and cursor < 0):
+            raise ValueError
+    except ValueError:
+        raise BossError("Invalid ids page. limit must be 1-{} and cursor a non-negative id".format(
+            settings.IDS_MAX_PAGE_SIZE), ErrorCodes.INVALID_ARGUMENT)
+    return limit, cursor
@@ -0,0 +1,41 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import numpy as np
+from rest_framework.parsers import BaseParser
+
+from bosscore.error import BossParserError, ErrorCodes
+
+from .ids import ID_DTYPE
+
+
+class Uint64Parser(BaseParser):
+    """
+    Parser that handles a list of ids sent as packed little endian uint64 values
+    """
+    media_type = 'application/octet-stream'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Method to read the ids of a POST
+
+        :param stream: Request stream
+        stream type: django.core.handlers.wsgi.WSGIRequest
+        :param media_type:
+        :param parser_context:
+        :return: numpy.ndarray of uint64 ids
+        """
+        raw_data = stream.read()
+        if len(raw_data) % ID_DTYPE.itemsize != 0:
+            return BossParserError("Binary ids must be packed 8 byte unsigned integers",
+                                   ErrorCodes.INVALID_POST_ARGUMENT)
+        return np.frombuffer(raw_data, dtype=ID_DTYPE).astype(np.uint64)
@@ -0,0 +1,287 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import numpy as np
+from django.conf import settings
+
+from bosscore.error import BossError, ErrorCodes
+from bossspatialdb.downsample import get_level_region
+from bossspatialdb.overwrite import CuboidRewriter
+from bossspatialdb.retired_ids import RetiredIds
+from bossspatialdb.writes import finish_write
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from .bounding_box import get_bounding_boxes
+from .ids import get_region_cuboids
+from .scan import ObjectScanner
+
+# Keys of the optional bounding box a relabel is limited to
+RELABEL_REGION_KEYS = ('x_start', 'x_stop', 'y_start', 'y_stop', 'z_start', 'z_stop')
+
+
+def parse_mapping(data):
+    """Get the id mapping of a relabel request
+
+    Args:
+        data (dict): Parsed body, with a "mapping" of old ids to new ids. Many ids may map to one
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): Sorted uint64 ids to relabel and the uint64 id each one becomes
+
+    Raises:
+        BossError: If the mapping is missing, invalid or too large
+    """
+    mapping = data.get("mapping") if isinstance(data, dict) else None
+    if not isinstance(mapping, dict) or not mapping:
+        raise BossError("Relabel requests must provide a mapping of old ids to new ids",
+                        ErrorCodes.INVALID_POST_ARGUMENT)
+    if len(mapping) > settings.RELABEL_MAX_IDS:
+        raise BossError("Relabel requests support at most {} ids".format(settings.RELABEL_MAX_IDS),
+                        ErrorCodes.REQUEST_TOO_LARGE)
+
+    pairs = []
+    try:
+        for source, target in mapping.items():
+            source = int(source)
+            target = int(target)
+            if source <= 0 or target < 0:
+                raise ValueError
+            if source != target:
+                pairs.append((source, target))
+    except (TypeError, ValueError, OverflowError):
+        raise BossError("Invalid relabel mapping. Old ids must be positive integers and new ids non-negative integers",
+                        ErrorCodes.TYPE_ERROR)
+    if not pairs:
+        raise BossError("The relabel mapping doesn't change any ids", ErrorCodes.INVALID_POST_ARGUMENT)
+
+    pairs.sort()
+    try:
+        sources = np.array([source for source, _ in pairs], dtype=np.uint64)
+        targets = np.array([target for _, target in pairs], dtype=np.uint64)
+    except OverflowError:
+        raise BossError("Invalid relabel mapping. Ids must fit in 64 bits", ErrorCodes.TYPE_ERROR)
+    return sources, targets
+
+
+def parse_region(data):
+    """Get the optional bounding box of a relabel request
+
+    Args:
+        data (dict): Parsed body, with optional x_start, x_stop, y_start, y_stop, z_start and z_stop
+
+    Returns:
+        ((int, int, int), (int, int, int))|None: X, Y, Z start and stop of the box, or None if the relabel isn't limited
+
+    Raises:
+        BossError: If the box is invalid
+    """
+    if not any(key in data for key in RELABEL_REGION_KEYS):
+        return None
+
+    start = []
+    stop = []
+    for axis in ('x', 'y', 'z'):
+        try:
+            start.append(int(data.get('{}_start'.format(axis), 0)))
+            stop.append(int(data['{}_stop'.format(axis)]) if '{}_stop'.format(axis) in data else None)
+        except (TypeError, ValueError):
+            raise BossError("Invalid relabel region. Region bounds must be integers", ErrorCodes.INVALID_ARGUMENT)
+        if start[-1] < 0 or (stop[-1] is not None and stop[-1] <= start[-1]):
+            raise BossError("Invalid relabel region. The {} range {}:{} is empty or negative".format(
+                axis, start[-1], stop[-1]), ErrorCodes.INVALID_ARGUMENT)
+    return tuple(start), tuple(stop)
+
+
+def remap(data, sources, targets):
+    """Relabel an array of ids in place
+
+    Args:
+        data (numpy.ndarray): uint64 ids
+        sources (numpy.ndarray): Sorted uint64 ids to relabel
+        targets (numpy.ndarray): uint64 id each source becomes
+
+    Returns:
+        (int): Number of voxels relabeled
+    """
+    idx = np.searchsorted(sources, data)
+    idx[idx == len(sources)] = 0
+    hits = sources[idx] == data
+    count = int(np.count_nonzero(hits))
+    if count:
+        data[hits] = targets[idx[hits]]
+    return count
+
+
+class Relabel(ObjectScanner):
+    """
+    Relabels annotation ids in place, optionally only inside a bounding box
+
+    The cuboids to rewrite come from the loose bounding boxes of the old ids, narrowed by the cached per cuboid id
+    sets. Each cuboid is read, remapped and replaced by its own worker while holding the cuboid's rewrite lock, see
+    CuboidRewriter, and the channel's caches are brought up to date in the same call.
+    """
+
+    def __init__(self, resource, resolution, sources, targets, region=None, workers=None):
+        """
+        Args:
+            resource (spdb.project.BossResource): Data model info of the annotation channel
+            resolution (int): Resolution level to relabel
+            sources (numpy.ndarray): Sorted uint64 ids to relabel
+            targets (numpy.ndarray): uint64 id each source becomes
+            region (((int, int, int), (int, int, int))|None): X, Y, Z start and stop to limit the relabel to. A None
+                                                              stop is unbounded
+            workers (int|None): Number of threads rewriting cuboids. Defaults to RELABEL_WORKERS
+        """
+        super().__init__(resource, resolution, sources, workers or settings.RELABEL_WORKERS)
+        self.targets = targets
+        self.region = region
+
+    def get_bounds(self):
+        """Get the part of the coordinate frame the relabel may touch
+
+        Returns:
+            ([int, int, int], [int, int, int]): X, Y, Z start and stop at the relabel's resolution
+        """
+        coord_frame = self.resource.get_coord_frame()
+        frame_start = [coord_frame.x_start, coord_frame.y_start, coord_frame.z_start]
+        frame_stop = [coord_frame.x_stop, coord_frame.y_stop, coord_frame.z_stop]
+        corner, extent = get_level_region(self.resource, self.resolution, frame_start, frame_stop)
+        start = list(corner)
+        stop = [corner[i] + extent[i] for i in range(3)]
+
+        if self.region is not None:
+            for i in range(3):
+                start[i] = max(start[i], self.region[0][i])
+                if self.region[1][i] is not None:
+                    stop[i] = min(stop[i], self.region[1][i])
+        return start, stop
+
+    def get_relabel_parts(self, boxes):
+        """Get the parts of the old ids' boxes, by cuboid, that may need rewriting
+
+        Args:
+            boxes (list(dict|None)): Loose bounding box of each old id, or None if it doesn't exist
+
+        Returns:
+            (dict, [int, int]): X, Y, Z corner and extent of each part keyed by X, Y, Z cuboid index and the time
+                                range covering every box
+        """
+        bound_start, bound_stop = self.get_bounds()
+        parts = {}
+        t_start = None
+        t_stop = None
+        for box in boxes:
+            if box is None:
+                continue
+            start = [max(bound_start[i], box['{}_range'.format(axis)][0]) for i, axis in enumerate(('x', 'y', 'z'))]
+            stop = [min(bound_stop[i], box['{}_range'.format(axis)][1]) for i, axis in enumerate(('x', 'y', 'z'))]
+            if any(start[i] >= stop[i] for i in range(3)):
+                continue
+
+            t_start = box['t_range'][0] if t_start is None else min(t_start, box['t_range'][0])
+            t_stop = box['t_range'][1] if t_stop is None else max(t_stop, box['t_range'][1])
+            # Loose boxes are aligned to cuboids, so every box splits a shared cuboid the same way
+            extent = [stop[i] - start[i] for i in range(3)]
+            for cuboid, sub_corner, sub_extent, _ in get_region_cuboids(self.resolution, start, extent):
+                parts[cuboid] = (sub_corner, sub_extent)
+
+        if not parts:
+            return {}, None
+        time_range = [t_start, t_stop]
+        for cuboid in self.get_absent(list(parts), time_range):
+            del parts[cuboid]
+        return parts, time_range
+
+    def apply(self, boxes):
+        """Relabel the cuboids of the old ids' boxes
+
+        Each cuboid is rewritten whole under its rewrite lock, so a new id of 0 really erases voxels and concurrent
+        rewrites of a cuboid can't lose each other's changes. After a relabel that isn't limited to a bounding box the
+        old ids that aren't also new ids are retired, so their stale loose bounding boxes are no longer served.
+
+        Args:
+            boxes (list(dict|None)): Loose bounding box of each old id, or None if it doesn't exist
+
+        Returns:
+            (dict): Number of cuboids read and written and of voxels relabeled
+        """
+        parts, time_range = self.get_relabel_parts(boxes)
+        sources = self.get_ids()
+        cube_dim = CUBOIDSIZE[self.resolution]
+
+        def rewrite(item):
+            cuboid, (corner, extent) = item
+            if not hasattr(self.local, 'rewriter'):
+                self.local.rewriter = CuboidRewriter(self.get_spatialdb())
+
+            # Part of the cuboid inside the boxes, relative to the cuboid
+            covered = [slice(corner[i] - cuboid[i] * cube_dim[i], corner[i] - cuboid[i] * cube_dim[i] + extent[i])
+                       for i in range(3)]
+
+            def update(data):
+                return remap(data[:, covered[2], covered[1], covered[0]], sources, self.targets)
+
+            count = self.local.rewriter.rewrite(self.resource, self.resolution, cuboid, time_range, update)
+            if count:
+                # Recorded as soon as it's written, so the caches are updated even if another cuboid fails
+                with self.lock:
+                    written.append((corner, extent))
+            return count
+
+        written = []
+        try:
+            with self.get_executor() as executor:
+                voxels = sum(executor.map(rewrite, parts.items()))
+        finally:
+            if written:
+                finish_write(self.resource, self.resolution, written, time_range)
+
+        self.update_retired(boxes, voxels)
+        return {'cuboids_read': len(parts), 'cuboids_written': len(written), 'voxels_relabeled': voxels}
+
+    def update_retired(self, boxes, voxels):
+        """Retire the old ids a finished relabel removed everywhere, and restore the new ids it wrote
+
+        Args:
+            boxes (list(dict|None)): Loose bounding box of each old id, or None if it doesn't exist
+            voxels (int): Number of voxels relabeled
+
+        Returns:
+            None
+        """
+        lookup_key = self.resource.get_lookup_key()
+        retired_ids = RetiredIds(settings.STATEIO_CONFIG)
+        if voxels:
+            targets = np.unique(self.targets)
+            retired_ids.restore(lookup_key, self.resolution, targets[targets != 0])
+        if self.region is None:
+            existing = np.array([id for id, box in zip(self.get_ids(), boxes) if box is not None], dtype=np.uint64)
+            retired_ids.retire(lookup_key, self.resolution, np.setdiff1d(existing, self.targets))
+
+
+def relabel(resource, resolution, sources, targets, region=None):
+    """Relabel annotation ids in place
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the annotation channel
+        resolution (int): Resolution level to relabel
+        sources (numpy.ndarray): Sorted uint64 ids to relabel
+        targets (numpy.ndarray): uint64 id each source becomes
+        region (((int, int, int), (int, int, int))|None): X, Y, Z start and stop to limit the relabel to
+
+    Returns:
+        (dict): Number of cuboids read and written and of voxels relabeled
+    """
+    boxes = get_bounding_boxes(resource, resolution, sources, 'loose')
+    return Relabel(resource, resolution, sources, targets, region).apply(boxes)
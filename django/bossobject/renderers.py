@@ -0,0 +1,46 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import blosc
+import numpy as np
+from rest_framework import renderers
+
+from bosscore.renderer_helper import check_for_403
+
+from .ids import ID_DTYPE
+
+
+class Uint64Renderer(renderers.BaseRenderer):
+    """ A DRF renderer for a list of ids as packed little endian uint64 values
+    """
+    media_type = 'application/octet-stream'
+    format = 'bin'
+    charset = None
+    render_style = 'binary'
+
+    @check_for_403
+    def render(self, data, media_type=None, renderer_context=None):
+        return np.asarray(data, dtype=ID_DTYPE).tobytes()
+
+
+class BloscUint64Renderer(renderers.BaseRenderer):
+    """ A DRF renderer for a table of uint64 values, packed little endian in row major order and blosc compressed
+    """
+    media_type = 'application/blosc'
+    format = 'bin'
+    charset = None
+    render_style = 'binary'
+
+    @check_for_403
+    def render(self, data, media_type=None, renderer_context=None):
+        return blosc.compress(np.ascontiguousarray(data, dtype=ID_DTYPE).tobytes(), typesize=ID_DTYPE.itemsize)
@@ -0,0 +1,188 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from bossutils.logger import BossLogger
+from bossspatialdb.cache_index import register_cached_cuboids
+from bossspatialdb.data_version import get_data_version
+from bossspatialdb.id_cache import CuboidIdCache
+
+from spdb.spatialdb.spatialdb import SpatialDB
+from spdb.spatialdb.rediskvio import RedisKVIO
+
+from .ids import get_region_cuboids
+
+
+def get_box_region(box):
+    """Get the region of a bounding box
+
+    Args:
+        box (dict): Bounding box with x_range, y_range, z_range and t_range
+
+    Returns:
+        ((int, int, int), (int, int, int), [int, int]): X, Y, Z corner and extent and the time range of the box
+    """
+    corner = tuple(box['{}_range'.format(axis)][0] for axis in ('x', 'y', 'z'))
+    extent = tuple(box['{}_range'.format(axis)][1] - corner[i] for i, axis in enumerate(('x', 'y', 'z')))
+    return corner, extent, list(box['t_range'])
+
+
+class ObjectScanner:
+    """
+    Reads the cuboids that may hold one annotation object, or any of several, concurrently
+
+    Each worker thread keeps its own SpatialDB. Cuboids whose cached id set (see CuboidIdCache) shows they don't hold
+    the object are left out without being read.
+    """
+
+    def __init__(self, resource, resolution, id, workers):
+        """
+        Args:
+            resource (spdb.project.BossResource): Data model info of the annotation channel
+            resolution (int): Resolution level to read
+            id (int|numpy.ndarray): Object id, or uint64 ids
+            workers (int): Number of threads reading cuboids
+        """
+        self.resource = resource
+        self.resolution = resolution
+        self.id = id
+        self.workers = workers
+        self.id_cache = CuboidIdCache(settings.KVIO_SETTINGS)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.cuboids_read = 0
+
+    def get_ids(self):
+        """Get the ids being scanned for
+
+        Returns:
+            (numpy.ndarray): uint64 ids
+        """
+        return np.atleast_1d(np.asarray(self.id, dtype=np.uint64))
+
+    def get_spatialdb(self):
+        """Get the calling thread's SpatialDB"""
+        if not hasattr(self.local, 'spdb'):
+            self.local.spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
+        return self.local.spdb
+
+    def get_executor(self):
+        """Get a thread pool to read cuboids with
+
+        Returns:
+            (concurrent.futures.ThreadPoolExecutor)
+        """
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    def get_mask(self, corner, extent, time_range):
+        """Read the object's voxels in part of a cuboid
+
+        Args:
+            corner ((int, int, int)): X, Y, Z corner of the part
+            extent ((int, int, int)): X, Y, Z extent of the part
+            time_range ([int, int]): Time range to read
+
+        Returns:
+            (numpy.ndarray): Boolean mask of the object's voxels, indexed [t, z, y, x]
+        """
+        with self.lock:
+            self.cuboids_read += 1
+        data = self.get_spatialdb().cutout(self.resource, corner, extent, self.resolution, list(time_range))
+        register_cached_cuboids(self.resource, self.resolution, corner, extent, list(time_range))
+        return data.data == np.uint64(self.id)
+
+    def get_absent(self, cuboids, time_range):
+        """Get the cuboids whose cached id sets show they don't contain the object, or any of the objects
+
+        Args:
+            cuboids (list((int, int, int))): X, Y, Z indices of the cuboids
+            time_range ([int, int]): Time range being read
+
+        Returns:
+            (set((int, int, int)))
+        """
+        lookup_key = self.resource.get_lookup_key()
+        absent = set(cuboids)
+        try:
+            for t_idx in range(*time_range):
+                candidates = list(absent)
+                id_sets = self.id_cache.get_many(lookup_key, self.resolution, t_idx, candidates)
+                absent = {cuboid for cuboid, ids in zip(candidates, id_sets)
+                          if ids is not None and not np.in1d(self.get_ids(), ids).any()}
+        except Exception:
+            BossLogger().logger.exception("Problem reading cuboid id sets of {}".format(lookup_key))
+            return set()
+        return absent
+
+    def get_parts(self, box):
+        """Get the parts of a bounding box, by cuboid, that may hold the object
+
+        Args:
+            box (dict): Bounding box with x_range, y_range, z_range and t_range
+
+        Returns:
+            (dict): X, Y, Z corner and extent of each part keyed by X, Y, Z cuboid index
+        """
+        corner, extent, time_range = get_box_region(box)
+        parts = {cuboid: (sub_corner, sub_extent)
+                 for cuboid, sub_corner, sub_extent, _ in get_region_cuboids(self.resolution, corner, extent)}
+        for cuboid in self.get_absent(list(parts), time_range):
+            del parts[cuboid]
+        return parts
+
+
+def get_memoized(kind, resource, resolution, id, compute, ttl):
+    """Get a result computed from an object's voxels, memoized until the channel is next written
+
+    Results are stored in Redis under the channel's data version, so any write to the channel makes them
+    unreachable and they expire after ttl seconds. A result is only stored if the data version did not change while
+    it was computed. Cache failures are logged and the result is computed directly.
+
+    Args:
+        kind (str): Name of the result, e.g. TIGHT-BBOX
+        resource (spdb.project.BossResource): Data model info of the annotation channel
+        resolution (int): Resolution level of the result
+        id (int): Object id
+        compute (callable): Computes the JSON serializable result, or None if the object doesn't exist
+        ttl (int): Seconds to keep the result
+
+    Returns:
+        The result of compute()
+    """
+    lookup_key = resource.get_lookup_key()
+    version = get_data_version(lookup_key)[0]
+    key = "{}&{}&{}&{}&{}".format(kind, lookup_key, version, resolution, id)
+
+    client = None
+    try:
+        client = RedisKVIO(settings.KVIO_SETTINGS).cache_client
+        cached = client.get(key)
+        if cached is not None:
+            return json.loads(cached.decode() if isinstance(cached, bytes) else cached)
+    except Exception:
+        BossLogger().logger.exception("Problem reading the {} of {} in {}".format(kind, id, lookup_key))
+
+    result = compute()
+
+    if result is not None and client is not None and get_data_version(lookup_key)[0] == version:
+        try:
+            client.setex(key, ttl, json.dumps(result))
+        except Exception:
+            BossLogger().logger.exception("Problem storing the {} of {} in {}".format(kind, id, lookup_key))
+    return result
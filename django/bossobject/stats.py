@@ -0,0 +1,117 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import numpy as np
+from django.conf import settings
+
+from .scan import ObjectScanner, get_box_region, get_memoized
+
+
+def get_axis_counts(mask):
+    """Project an object's voxels onto each axis
+
+    Args:
+        mask (numpy.ndarray): Boolean mask of the object's voxels, indexed [t, z, y, x]
+
+    Returns:
+        (list(numpy.ndarray)): Number of the object's voxels in each X, Y and Z slice of the mask
+    """
+    return [mask.sum(axis=(0, 1, 2)), mask.sum(axis=(0, 1, 3)), mask.sum(axis=(0, 2, 3))]
+
+
+class VoxelStatistics(ObjectScanner):
+    """
+    Computes the voxel count, centroid, extents and area of each z slice of an object
+
+    Every cuboid of the object's loose box that may hold the object is read concurrently and reduced to per axis
+    voxel counts, which are all the statistics need, before being merged.
+    """
+
+    def __init__(self, resource, resolution, id, workers=None):
+        """
+        Args:
+            resource (spdb.project.BossResource): Data model info of the annotation channel
+            resolution (int): Resolution level of the statistics
+            id (int): Object id
+            workers (int|None): Number of threads reading cuboids. Defaults to OBJECT_STATS_WORKERS
+        """
+        super().__init__(resource, resolution, id, workers or settings.OBJECT_STATS_WORKERS)
+
+    def compute(self, loose):
+        """Compute the statistics
+
+        Args:
+            loose (dict): Loose bounding box of the object with x_range, y_range, z_range and t_range
+
+        Returns:
+            (dict|None): The statistics, or None if the object has no voxels in the box
+        """
+        corner, extent, time_range = get_box_region(loose)
+        parts = list(self.get_parts(loose).values())
+
+        def measure(part):
+            sub_corner, sub_extent = part
+            return sub_corner, get_axis_counts(self.get_mask(sub_corner, sub_extent, time_range))
+
+        # Voxel counts of each X, Y and Z slice of the loose box
+        totals = [np.zeros(extent[i], dtype=np.int64) for i in range(3)]
+        with self.get_executor() as executor:
+            for sub_corner, counts in executor.map(measure, parts):
+                for i in range(3):
+                    offset = sub_corner[i] - corner[i]
+                    totals[i][offset:offset + len(counts[i])] += counts[i]
+
+        voxel_count = int(totals[2].sum())
+        if voxel_count == 0:
+            return None
+
+        centroid = []
+        box = {'t_range': time_range}
+        for i, axis in enumerate(('x', 'y', 'z')):
+            # Summed as Python ints so large objects can't overflow
+            coords = np.arange(corner[i], corner[i] + extent[i], dtype=np.int64)
+            centroid.append(sum(int(total) * int(coord) for total, coord in
+                                zip(totals[i][totals[i] > 0], coords[totals[i] > 0])) / voxel_count)
+            hits = np.flatnonzero(totals[i])
+            box['{}_range'.format(axis)] = [corner[i] + int(hits[0]), corner[i] + int(hits[-1]) + 1]
+
+        z_start, z_stop = box['z_range']
+        return {'id': str(self.id),
+                'voxel_count': voxel_count,
+                'centroid': centroid,
+                'bounding_box': box,
+                'z_area': {'z_start': z_start,
+                           'areas': [int(area) for area in totals[2][z_start - corner[2]:z_stop - corner[2]]]}}
+
+
+def get_object_statistics(cache, resource, resolution, id, workers=None):
+    """Get the statistics of an object, memoized until the channel is next written
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the cache, used to get the loose box
+        resource (spdb.project.BossResource): Data model info of the annotation channel
+        resolution (int): Resolution level of the statistics
+        id (int): Object id
+        workers (int|None): Number of threads reading cuboids. Defaults to OBJECT_STATS_WORKERS
+
+    Returns:
+        (dict|None): voxel_count, centroid, bounding_box and z_area, the area of each z slice from z_start, or None
+                     if the id doesn't exist
+    """
+    def compute():
+        loose = cache.get_bounding_box(resource, resolution, id, bb_type='loose')
+        if loose is None:
+            return None
+        return VoxelStatistics(resource, resolution, id, workers).compute(loose)
+
+    return get_memoized("OBJECT-STATS", resource, resolution, id, compute, settings.OBJECT_STATS_CACHE_TTL)
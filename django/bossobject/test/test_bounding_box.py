@@ -0,0 +1,100 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import io
+import unittest
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from django.test import override_settings
+
+from bosscore.error import BossError, BossParserError
+from bossobject.bounding_box import parse_bulk_ids, get_bounding_boxes, to_columns
+from bossobject.parsers import Uint64Parser
+
+
+def make_box(id):
+    return {'x_range': [id, id + 512], 'y_range': [0, 512], 'z_range': [0, 16], 't_range': [0, 1]}
+
+
+def no_retired(lookup_key, resolution, ids):
+    return [False] * len(ids)
+
+
+class TestBulkBoundingBox(unittest.TestCase):
+
+    @override_settings(BOUNDING_BOX_BULK_MAX_IDS=3)
+    def test_parse_ids(self):
+        np.testing.assert_array_equal(parse_bulk_ids({"ids": [9, "4", 9]}), [4, 9])
+        np.testing.assert_array_equal(parse_bulk_ids(np.array([2 ** 63, 1], dtype=np.uint64)), [1, 2 ** 63])
+        for data in ({}, {"ids": 4}, {"ids": []}, {"ids": [0, 1]}, {"ids": [-1]}, {"ids": ["x"]},
+                     {"ids": [1, 2, 3, 4]}):
+            with self.assertRaises(BossError):
+                parse_bulk_ids(data)
+
+    @override_settings(BOUNDING_BOX_BULK_MAX_IDS=3, BOUNDING_BOX_BULK_MAX_TIGHT_IDS=1)
+    def test_parse_tight_ids(self):
+        """Tight boxes have a lower cap"""
+        np.testing.assert_array_equal(parse_bulk_ids({"ids": [1, 2]}), [1, 2])
+        with self.assertRaises(BossError):
+            parse_bulk_ids({"ids": [1, 2]}, 'tight')
+
+    def test_binary_parser(self):
+        ids = Uint64Parser().parse(io.BytesIO(np.array([7, 3], dtype='<u8').tobytes()))
+        np.testing.assert_array_equal(ids, [7, 3])
+        self.assertIsInstance(Uint64Parser().parse(io.BytesIO(b"1234")), BossParserError)
+
+    @override_settings(BOUNDING_BOX_BULK_WORKERS=4)
+    @patch('bossobject.bounding_box.RetiredIds')
+    @patch('bossobject.bounding_box.SpatialDB')
+    def test_lookup(self, mock_spdb, mock_retired):
+        mock_retired.return_value.get_retired.side_effect = no_retired
+        mock_spdb.return_value.get_bounding_box.side_effect = \
+            lambda resource, resolution, id, bb_type: make_box(id) if id != 5 else None
+        ids = np.array([3, 5, 8], dtype=np.uint64)
+
+        boxes = get_bounding_boxes(MagicMock(), 0, ids, 'loose')
+        self.assertEqual(boxes, [make_box(3), None, make_box(8)])
+        self.assertLessEqual(mock_spdb.call_count, 3)
+        self.assertEqual(mock_spdb.return_value.get_bounding_box.call_args[1]["bb_type"], 'loose')
+
+    @patch('bossobject.bounding_box.RetiredIds')
+    @patch('bossobject.bounding_box.SpatialDB')
+    def test_lookup_retired(self, mock_spdb, mock_retired):
+        """Ids a relabel removed are missing, although the id index still has their boxes"""
+        mock_spdb.return_value.get_bounding_box.side_effect = \
+            lambda resource, resolution, id, bb_type: make_box(id)
+        mock_retired.return_value.get_retired.return_value = [False, True, False]
+
+        boxes = get_bounding_boxes(MagicMock(), 0, np.array([3, 5, 8], dtype=np.uint64), 'loose')
+        self.assertEqual(boxes, [make_box(3), None, make_box(8)])
+        self.assertEqual(mock_spdb.return_value.get_bounding_box.call_count, 2)
+
+    @patch('bossobject.bounding_box.RetiredIds')
+    @patch('bossobject.bounding_box.get_tight_bounding_box')
+    @patch('bossobject.bounding_box.SpatialDB')
+    def test_lookup_tight(self, mock_spdb, mock_tight, mock_retired):
+        mock_retired.return_value.get_retired.side_effect = no_retired
+        mock_tight.side_effect = lambda cache, resource, resolution, id, workers: make_box(id)
+        boxes = get_bounding_boxes(MagicMock(), 0, np.array([3], dtype=np.uint64), 'tight')
+        self.assertEqual(boxes, [make_box(3)])
+        self.assertEqual(mock_tight.call_args[1]["workers"], 1)
+        mock_spdb.return_value.get_bounding_box.assert_not_called()
+
+    def test_columns(self):
+        columns = to_columns(np.array([3, 5], dtype=np.uint64), [make_box(3), None])
+        self.assertEqual(columns["ids"], ["3"])
+        self.assertEqual(columns["missing"], ["5"])
+        self.assertEqual(columns["x_start"], [3])
+        self.assertEqual(columns["x_stop"], [515])
+        self.assertEqual(columns["t_stop"], [1])
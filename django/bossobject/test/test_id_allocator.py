@@ -0,0 +1,128 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch, MagicMock
+from mockredis import mock_strict_redis_client
+
+from django.test import override_settings
+from redis.exceptions import RedisError
+
+from bossobject.id_allocator import IdBlockAllocator, reserve_ids
+
+STATE_CONF = {"cache_state_host": "localhost", "cache_state_db": 1}
+
+
+def make_counter():
+    """SpatialDB mock whose reserve_ids increments a counter starting at 1"""
+    cache = MagicMock()
+    counter = {'next': 1}
+
+    def reserve(resource, count):
+        start = counter['next']
+        counter['next'] += count
+        return [start]
+
+    cache.reserve_ids.side_effect = reserve
+    return cache
+
+
+def make_resource():
+    resource = MagicMock()
+    resource.get_lookup_key.return_value = "4&3&2"
+    return resource
+
+
+@override_settings(ID_RESERVE_BLOCK_SIZE=10, ID_RESERVE_REFILL_WAIT=0, ID_RESERVE_REFILL_TIMEOUT=60,
+                   ID_RESERVE_MAX_LEAKS=10)
+@patch('redis.StrictRedis', mock_strict_redis_client)
+class TestIdBlockAllocator(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = make_counter()
+        self.resource = make_resource()
+
+    def test_blocks(self):
+        """Small requests share one counter increment"""
+        allocator = IdBlockAllocator(STATE_CONF)
+        self.assertEqual(allocator.reserve(self.cache, self.resource, 3), 1)
+        self.assertEqual(allocator.reserve(self.cache, self.resource, 4), 4)
+        self.assertEqual(self.cache.reserve_ids.call_count, 1)
+
+        # The remaining 3 ids don't fit, so they are leaked and a new block is reserved
+        self.assertEqual(allocator.reserve(self.cache, self.resource, 5), 11)
+        self.assertEqual(self.cache.reserve_ids.call_count, 2)
+
+        status = allocator.get_status("4&3&2")
+        self.assertEqual(status['reserved'], 20)
+        self.assertEqual(status['issued'], 12)
+        self.assertEqual(status['leaked'], 3)
+        self.assertEqual(status['available'], 5)
+        self.assertEqual(status['blocks'], 2)
+        self.assertEqual(status['leaked_ranges'], [[8, 11]])
+        self.assertEqual(status['utilisation'], 12 / 20)
+        self.assertFalse(status['refilling'])
+
+    def test_large_request(self):
+        """Requests of a block or more go straight to the counter"""
+        allocator = IdBlockAllocator(STATE_CONF)
+        allocator.reserve(self.cache, self.resource, 2)
+        self.assertEqual(allocator.reserve(self.cache, self.resource, 25), 11)
+        self.assertEqual(allocator.reserve(self.cache, self.resource, 2), 3)
+
+        status = allocator.get_status("4&3&2")
+        self.assertEqual(status['direct'], 25)
+        self.assertEqual(status['reserved'], 35)
+        self.assertEqual(status['issued'], 29)
+
+    def test_lost_refill(self):
+        """A refill left unfinished by a dead worker is counted as lost once it times out"""
+        allocator = IdBlockAllocator(STATE_CONF)
+        self.assertTrue(allocator.begin_refill("4&3&2", 10))
+        self.assertFalse(allocator.begin_refill("4&3&2", 10))
+        self.assertTrue(allocator.get_status("4&3&2")['refilling'])
+
+        allocator.client.hset(IdBlockAllocator.get_block_key("4&3&2"), 'refill_time', 0)
+        self.assertEqual(allocator.reserve(self.cache, self.resource, 2), 1)
+        status = allocator.get_status("4&3&2")
+        self.assertEqual(status['lost'], 10)
+        self.assertFalse(status['refilling'])
+
+    def test_refill_in_progress(self):
+        """Requests that can't wait for another worker's refill use the counter directly"""
+        allocator = IdBlockAllocator(STATE_CONF)
+        allocator.begin_refill("4&3&2", 10)
+        self.assertEqual(allocator.reserve(self.cache, self.resource, 2), 1)
+        self.assertEqual(allocator.get_status("4&3&2")['direct'], 2)
+
+    def test_failed_refill(self):
+        allocator = IdBlockAllocator(STATE_CONF)
+        self.cache.reserve_ids.side_effect = Exception("DynamoDB")
+        with self.assertRaises(Exception):
+            allocator.reserve(self.cache, self.resource, 2)
+        self.assertFalse(allocator.get_status("4&3&2")['refilling'])
+
+    def test_unique(self):
+        """Ranges never overlap"""
+        allocator = IdBlockAllocator(STATE_CONF)
+        issued = set()
+        for count in (1, 3, 9, 2, 12, 5, 5, 1, 7):
+            start = allocator.reserve(self.cache, self.resource, count)
+            ids = set(range(start, start + count))
+            self.assertFalse(ids & issued)
+            issued |= ids
+
+    @patch('bossobject.id_allocator.IdBlockAllocator.reserve', side_effect=RedisError("down"))
+    def test_fallback(self, mock_reserve):
+        self.assertEqual(reserve_ids(self.cache, self.resource, 2), 1)
+        self.cache.reserve_ids.assert_called_once_with(self.resource, 2)
@@ -0,0 +1,79 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+from django.test import override_settings
+
+from bosscore.error import BossError
+from bossobject.ids import get_region_cuboids, iter_block_ids, stream_new_ids, get_ids_page, get_page_args
+from bossobject.renderers import Uint64Renderer
+
+
+def make_blocks(*blocks):
+    return [np.array(block, dtype=np.uint64) for block in blocks]
+
+
+class TestIdsInRegion(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('bossobject.ids.register_cached_cuboids')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_region_cuboids(self):
+        """Resolution 0 cuboids are 512x512x16"""
+        parts = list(get_region_cuboids(0, (500, 0, 0), (524, 512, 16)))
+        self.assertEqual(len(parts), 2)
+        self.assertEqual(parts[0], ((0, 0, 0), (500, 0, 0), (12, 512, 16), False))
+        self.assertEqual(parts[1], ((1, 0, 0), (512, 0, 0), (512, 512, 16), True))
+
+    def test_block_ids(self):
+        """Each cuboid is cut out on its own and background is dropped"""
+        cache = MagicMock()
+        cache.cutout.side_effect = [MagicMock(data=np.array([[0, 3, 3, 1]], dtype=np.uint64)),
+                                    MagicMock(data=np.array([[2, 0, 1]], dtype=np.uint64))]
+        blocks = list(iter_block_ids(cache, MagicMock(), 0, (500, 0, 0), (524, 512, 16), [0, 1]))
+        self.assertEqual(cache.cutout.call_count, 2)
+        np.testing.assert_array_equal(blocks[0], [1, 3])
+        np.testing.assert_array_equal(blocks[1], [1, 2])
+
+    def test_stream_new_ids(self):
+        new = list(stream_new_ids(make_blocks([1, 3], [1, 2], [2, 3], [5])))
+        self.assertEqual([block.tolist() for block in new], [[1, 3], [2], [5]])
+
+    def test_page(self):
+        blocks = make_blocks([5, 9], [1, 5, 7], [2, 11])
+        ids, cursor = get_ids_page(blocks, None, 3)
+        self.assertEqual(ids.tolist(), [1, 2, 5])
+        self.assertEqual(cursor, 5)
+
+        ids, cursor = get_ids_page(blocks, cursor, 3)
+        self.assertEqual(ids.tolist(), [7, 9, 11])
+        self.assertIsNone(cursor)
+
+    @override_settings(IDS_MAX_PAGE_SIZE=10)
+    def test_page_args(self):
+        self.assertEqual(get_page_args({}), (None, None))
+        self.assertEqual(get_page_args({"limit": "5"}), (5, None))
+        self.assertEqual(get_page_args({"limit": "5", "cursor": "12"}), (5, 12))
+        for params in ({"cursor": "12"}, {"limit": "0"}, {"limit": "11"}, {"limit": "x"},
+                       {"limit": "5", "cursor": "-1"}):
+            with self.assertRaises(BossError):
+                get_page_args(params)
+
+    def test_binary(self):
+        data = Uint64Renderer().render(np.array([1, 2 ** 63], dtype=np.uint64))
+        np.testing.assert_array_equal(np.frombuffer(data, dtype='<u8'), [1, 2 ** 63])
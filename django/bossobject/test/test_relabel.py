@@ -0,0 +1,168 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+from django.conf import settings
+from django.test import override_settings
+from mockredis import mock_strict_redis_client
+
+from bosscore.error import BossError
+from bossobject.relabel import parse_mapping, parse_region, remap, Relabel
+from bossobject.test.test_tight_bbox import CUBE_DIM, make_loose
+from bossspatialdb.retired_ids import RetiredIds
+from bossspatialdb.test.test_writes import FakeSpatialDB
+
+from spdb.c_lib.ndlib import XYZMorton
+
+
+def get_stored(fake):
+    """The fake's volume with the cuboids put into the object store pasted over it"""
+    volume = fake.volume.copy()
+    for t_idx in range(volume.shape[0]):
+        for z in range(4):
+            for y in range(4):
+                for x in range(4):
+                    cube = fake.objects.get("OBJECT&{}&{}".format(t_idx, XYZMorton([x, y, z])))
+                    if cube is not None:
+                        volume[t_idx, z * 4:(z + 1) * 4, y * 8:(y + 1) * 8, x * 8:(x + 1) * 8] = cube
+    return volume
+
+
+def make_resource():
+    resource = MagicMock()
+    resource.get_lookup_key.return_value = "4&3&2"
+    resource.get_coord_frame.return_value = MagicMock(x_start=0, x_stop=32, y_start=0, y_stop=32, z_start=0, z_stop=16)
+    resource.get_downsampled_voxel_dims.return_value = [[4, 4, 35]]
+    resource.get_channel.return_value.is_image.return_value = False
+    return resource
+
+
+class TestRelabelArgs(unittest.TestCase):
+
+    @override_settings(RELABEL_MAX_IDS=3)
+    def test_mapping(self):
+        sources, targets = parse_mapping({"mapping": {"9": 4, "3": 4, "5": 0}})
+        np.testing.assert_array_equal(sources, [3, 5, 9])
+        np.testing.assert_array_equal(targets, [4, 0, 4])
+
+        for data in ({}, {"mapping": {}}, {"mapping": [1, 2]}, {"mapping": {"0": 1}}, {"mapping": {"1": -1}},
+                     {"mapping": {"a": 1}}, {"mapping": {"1": 1}},
+                     {"mapping": {"1": 2, "2": 3, "3": 4, "4": 5}}):
+            with self.assertRaises(BossError):
+                parse_mapping(data)
+
+    def test_region(self):
+        self.assertIsNone(parse_region({"mapping": {}}))
+        self.assertEqual(parse_region({"x_start": 8, "x_stop": 16, "z_stop": 4}), ((8, 0, 0), (16, None, 4)))
+        for data in ({"x_start": 8, "x_stop": 8}, {"y_start": -1}, {"z_stop": "a"}):
+            with self.assertRaises(BossError):
+                parse_region(data)
+
+    def test_remap(self):
+        data = np.array([[0, 3, 9], [5, 3, 12]], dtype=np.uint64)
+        count = remap(data, np.array([3, 5, 9], dtype=np.uint64), np.array([4, 0, 4], dtype=np.uint64))
+        self.assertEqual(count, 4)
+        np.testing.assert_array_equal(data, [[0, 4, 4], [0, 4, 12]])
+
+
+@override_settings(RELABEL_WORKERS=4, CUBOID_LOCK_TTL=60, CUBOID_LOCK_WAIT=1)
+@patch('bossspatialdb.cuboids.CUBOIDSIZE', CUBE_DIM)
+@patch('bossspatialdb.overwrite.CUBOIDSIZE', CUBE_DIM)
+@patch('bossobject.relabel.CUBOIDSIZE', CUBE_DIM)
+@patch('bossobject.relabel.finish_write')
+@patch('bossobject.scan.CuboidIdCache')
+class TestRelabel(unittest.TestCase):
+
+    def setUp(self):
+        # 4 x 4 x 4 cuboids of 8 x 8 x 4 voxels
+        volume = np.zeros((1, 16, 32, 32), dtype=np.uint64)
+        volume[0, 1, 2, 3] = 7
+        volume[0, 13, 20, 28] = 7
+        volume[0, 6, 12, 12] = 9
+        volume[0, 6, 12, 13] = 5
+        self.fake = FakeSpatialDB(volume)
+        self.resource = make_resource()
+
+        # Every RetiredIds shares one fake Redis, as they would share the real one
+        client = mock_strict_redis_client()
+        patcher = patch('redis.StrictRedis', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def apply(self, mock_id_cache, boxes, region=None, targets=(5, 5)):
+        mock_id_cache.return_value.get_many.side_effect = lambda lookup, res, t, cuboids: [None] * len(cuboids)
+        with patch('bossobject.scan.SpatialDB', return_value=self.fake):
+            engine = Relabel(self.resource, 0, np.array([7, 9], dtype=np.uint64), np.array(targets, dtype=np.uint64),
+                             region)
+            return engine.apply(boxes)
+
+    def get_retired(self, ids):
+        return RetiredIds(settings.STATEIO_CONFIG).get_retired("4&3&2", 0, ids)
+
+    def test_merge(self, mock_id_cache, mock_finish):
+        boxes = [make_loose(), {'x_range': [8, 16], 'y_range': [8, 16], 'z_range': [4, 8], 't_range': [0, 1]}]
+        result = self.apply(mock_id_cache, boxes)
+
+        self.assertEqual(result['voxels_relabeled'], 3)
+        self.assertEqual(result['cuboids_written'], 3)
+        volume = get_stored(self.fake)
+        self.assertEqual(set(np.unique(volume)), {0, 5})
+        self.assertEqual(int(np.count_nonzero(volume == 5)), 4)
+
+        # The written cuboids are indexed and the caches are updated for them only
+        self.assertEqual(self.fake.objectio.update_id_indices.call_count, 3)
+        written = mock_finish.call_args[0][2]
+        self.assertEqual(sorted(written), [((0, 0, 0), (8, 8, 4)), ((8, 8, 4), (8, 8, 4)), ((24, 16, 12), (8, 8, 4))])
+
+        # The old ids are gone everywhere, so their stale loose boxes are no longer served
+        self.assertEqual(self.get_retired([7, 9, 5]), [True, True, False])
+        self.assertEqual(self.fake.kvio.cache_client.keys("CUBOID-LOCK&*"), [])
+
+    def test_erase(self, mock_id_cache, mock_finish):
+        """A new id of 0 erases the old id's voxels, although write_cuboid only merges non-zero voxels"""
+        result = self.apply(mock_id_cache, [make_loose(), None], targets=(0, 0))
+        self.assertEqual(result['voxels_relabeled'], 3)
+        volume = get_stored(self.fake)
+        self.assertEqual(set(np.unique(volume)), {0, 5})
+        self.assertEqual(volume[0, 6, 12, 13], 5)
+
+        # Only the old id that had a box is retired
+        self.assertEqual(self.get_retired([7, 9]), [True, False])
+
+    def test_region(self, mock_id_cache, mock_finish):
+        """Only voxels inside the bounding box are relabeled"""
+        result = self.apply(mock_id_cache, [make_loose()], ((0, 0, 0), (16, 16, None)))
+        self.assertEqual(result['voxels_relabeled'], 2)
+        volume = get_stored(self.fake)
+        self.assertEqual(volume[0, 13, 20, 28], 7)
+        self.assertEqual(volume[0, 1, 2, 3], 5)
+
+        # The old id still exists outside the box
+        self.assertEqual(self.get_retired([7]), [False])
+
+    def test_locked_cuboid(self, mock_id_cache, mock_finish):
+        """A cuboid another request is rewriting is not written, and nothing is retired"""
+        self.fake.kvio.cache_client.set("CUBOID-LOCK&4&3&2&0&{}".format(XYZMorton([3, 2, 3])), "other")
+        with self.assertRaises(BossError):
+            self.apply(mock_id_cache, [make_loose()])
+        self.assertEqual(get_stored(self.fake)[0, 13, 20, 28], 7)
+        self.assertEqual(sorted(mock_finish.call_args[0][2]), [((0, 0, 0), (8, 8, 4)), ((8, 8, 4), (8, 8, 4))])
+        self.assertEqual(self.get_retired([7]), [False])
+
+    def test_nothing_to_do(self, mock_id_cache, mock_finish):
+        result = self.apply(mock_id_cache, [None, None])
+        self.assertEqual(result, {'cuboids_read': 0, 'cuboids_written': 0, 'voxels_relabeled': 0})
+        mock_finish.assert_not_called()
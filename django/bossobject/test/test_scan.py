@@ -0,0 +1,91 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch, MagicMock
+from mockredis import mock_strict_redis_client
+
+import numpy as np
+
+from bossobject.scan import ObjectScanner, get_box_region, get_memoized
+from bossobject.test.test_tight_bbox import CUBE_DIM, make_loose
+
+
+def make_resource():
+    resource = MagicMock()
+    resource.get_lookup_key.return_value = "4&3&2"
+    return resource
+
+
+class TestObjectScanner(unittest.TestCase):
+
+    def test_box_region(self):
+        self.assertEqual(get_box_region(make_loose(16, 8, 4)), ((0, 0, 0), (16, 8, 4), [0, 1]))
+
+    @patch('bossspatialdb.cuboids.CUBOIDSIZE', CUBE_DIM)
+    @patch('bossobject.scan.CuboidIdCache')
+    def test_parts(self, mock_id_cache):
+        """Cuboids whose cached id set lacks the object are left out"""
+        mock_id_cache.return_value.get_many.side_effect = \
+            lambda lookup, res, t, cuboids: [np.array([3, 7], dtype=np.uint64) if c == (1, 0, 0) else
+                                             np.array([3], dtype=np.uint64) if c == (0, 1, 0) else None
+                                             for c in cuboids]
+        parts = ObjectScanner(make_resource(), 0, 7, 1).get_parts(make_loose(16, 16, 4))
+        self.assertEqual(parts, {(0, 0, 0): ((0, 0, 0), (8, 8, 4)),
+                                 (1, 0, 0): ((8, 0, 0), (8, 8, 4)),
+                                 (1, 1, 0): ((8, 8, 0), (8, 8, 4))})
+
+
+@patch('bossobject.scan.RedisKVIO')
+@patch('bossobject.scan.get_data_version')
+class TestMemoized(unittest.TestCase):
+
+    def test_memoized_until_write(self, mock_version, mock_kvio):
+        mock_kvio.return_value.cache_client = mock_strict_redis_client()
+        mock_version.return_value = (1, 1000.0)
+        compute = MagicMock(return_value=make_loose())
+
+        self.assertEqual(get_memoized("TIGHT-BBOX", make_resource(), 0, 7, compute, 60), make_loose())
+        self.assertEqual(get_memoized("TIGHT-BBOX", make_resource(), 0, 7, compute, 60), make_loose())
+        self.assertEqual(compute.call_count, 1)
+
+        # Other ids, resolutions and kinds are kept apart
+        get_memoized("TIGHT-BBOX", make_resource(), 0, 8, compute, 60)
+        get_memoized("TIGHT-BBOX", make_resource(), 1, 7, compute, 60)
+        get_memoized("OBJECT-STATS", make_resource(), 0, 7, compute, 60)
+        self.assertEqual(compute.call_count, 4)
+
+        # A write bumps the data version
+        mock_version.return_value = (2, 1001.0)
+        get_memoized("TIGHT-BBOX", make_resource(), 0, 7, compute, 60)
+        self.assertEqual(compute.call_count, 5)
+
+    def test_not_stored(self, mock_version, mock_kvio):
+        """Missing objects and results computed during a write are not stored"""
+        mock_kvio.return_value.cache_client = mock_strict_redis_client()
+        mock_version.return_value = (1, 1000.0)
+        compute = MagicMock(return_value=None)
+        self.assertIsNone(get_memoized("TIGHT-BBOX", make_resource(), 0, 7, compute, 60))
+        self.assertIsNone(get_memoized("TIGHT-BBOX", make_resource(), 0, 7, compute, 60))
+        self.assertEqual(compute.call_count, 2)
+
+        mock_version.side_effect = [(1, 1000.0), (2, 1001.0), (2, 1001.0), (2, 1001.0)]
+        compute.return_value = make_loose()
+        get_memoized("TIGHT-BBOX", make_resource(), 0, 7, compute, 60)
+        get_memoized("TIGHT-BBOX", make_resource(), 0, 7, compute, 60)
+        self.assertEqual(compute.call_count, 4)
+
+    def test_cache_failure(self, mock_version, mock_kvio):
+        mock_kvio.side_effect = Exception("down")
+        mock_version.return_value = (1, 1000.0)
+        self.assertEqual(get_memoized("TIGHT-BBOX", make_resource(), 0, 7, lambda: make_loose(), 60), make_loose())
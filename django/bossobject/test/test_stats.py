@@ -0,0 +1,66 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+from django.test import override_settings
+
+from bossobject.stats import get_axis_counts, VoxelStatistics
+from bossobject.test.test_tight_bbox import CUBE_DIM, make_cache, make_loose
+
+
+@override_settings(OBJECT_STATS_WORKERS=4)
+@patch('bossspatialdb.cuboids.CUBOIDSIZE', CUBE_DIM)
+@patch('bossobject.scan.CuboidIdCache')
+class TestVoxelStatistics(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('bossobject.scan.register_cached_cuboids')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 4 x 4 x 4 cuboids of 8 x 8 x 4 voxels
+        self.volume = np.zeros((1, 16, 32, 32), dtype=np.uint64)
+
+    def compute(self, mock_id_cache, loose):
+        mock_id_cache.return_value.get_many.side_effect = lambda lookup, res, t, cuboids: [None] * len(cuboids)
+        with patch('bossobject.scan.SpatialDB', return_value=make_cache(self.volume)):
+            return VoxelStatistics(MagicMock(), 0, 7).compute(loose)
+
+    def test_axis_counts(self, mock_id_cache):
+        mask = np.zeros((1, 2, 3, 4), dtype=bool)
+        mask[0, 1, 2, 3] = True
+        mask[0, 1, 0, 3] = True
+        x_counts, y_counts, z_counts = get_axis_counts(mask)
+        np.testing.assert_array_equal(x_counts, [0, 0, 0, 2])
+        np.testing.assert_array_equal(y_counts, [1, 0, 1])
+        np.testing.assert_array_equal(z_counts, [0, 2])
+
+    def test_statistics(self, mock_id_cache):
+        self.volume[0, 1, 3, 2] = 7
+        self.volume[0, 14, 30, 29] = 7
+        self.volume[0, 6, 12, 12:14] = 7
+        self.volume[0, 6, 13, 12] = 5
+
+        stats = self.compute(mock_id_cache, make_loose())
+        self.assertEqual(stats['id'], '7')
+        self.assertEqual(stats['voxel_count'], 4)
+        np.testing.assert_allclose(stats['centroid'], [(2 + 29 + 12 + 13) / 4, (3 + 30 + 24) / 4, (1 + 14 + 12) / 4])
+        self.assertEqual(stats['bounding_box'],
+                         {'x_range': [2, 30], 'y_range': [3, 31], 'z_range': [1, 15], 't_range': [0, 1]})
+        self.assertEqual(stats['z_area']['z_start'], 1)
+        self.assertEqual(stats['z_area']['areas'], [1, 0, 0, 0, 0, 2, 0, 0, 0, 0, 0, 0, 0, 1])
+
+    def test_missing(self, mock_id_cache):
+        self.assertIsNone(self.compute(mock_id_cache, make_loose()))
@@ -0,0 +1,108 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+from django.test import override_settings
+
+from bossobject.tight_bbox import get_voxel_extents, TightBoundingBox
+
+CUBE_DIM = [[8, 8, 4]]
+
+
+def make_cache(volume):
+    """SpatialDB mock cutting out of a [t, z, y, x] volume"""
+    cache = MagicMock()
+
+    def cutout(resource, corner, extent, resolution, time_range):
+        data = MagicMock()
+        data.data = volume[time_range[0]:time_range[1],
+                           corner[2]:corner[2] + extent[2],
+                           corner[1]:corner[1] + extent[1],
+                           corner[0]:corner[0] + extent[0]]
+        return data
+
+    cache.cutout.side_effect = cutout
+    return cache
+
+
+def make_loose(x_stop=32, y_stop=32, z_stop=16):
+    return {'x_range': [0, x_stop], 'y_range': [0, y_stop], 'z_range': [0, z_stop], 't_range': [0, 1]}
+
+
+@override_settings(BOUNDING_BOX_TIGHT_WORKERS=4)
+@patch('bossspatialdb.cuboids.CUBOIDSIZE', CUBE_DIM)
+@patch('bossobject.tight_bbox.CUBOIDSIZE', CUBE_DIM)
+@patch('bossobject.scan.CuboidIdCache')
+class TestTightBoundingBox(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('bossobject.scan.register_cached_cuboids')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 4 x 4 x 4 cuboids of 8 x 8 x 4 voxels
+        self.volume = np.zeros((1, 16, 32, 32), dtype=np.uint64)
+
+    def compute(self, mock_id_cache, loose):
+        mock_id_cache.return_value.get_many.side_effect = lambda lookup, res, t, cuboids: [None] * len(cuboids)
+        resource = MagicMock()
+        resource.get_lookup_key.return_value = "4&3&2"
+        engine = TightBoundingBox(resource, 0, 7)
+        with patch('bossobject.scan.SpatialDB', return_value=make_cache(self.volume)):
+            return engine, engine.compute(loose)
+
+    def test_extents(self, mock_id_cache):
+        data = np.zeros((1, 4, 8, 8), dtype=np.uint64)
+        data[0, 1, 2, 3] = 7
+        data[0, 3, 5, 1] = 7
+        data[0, 0, 0, 0] = 6
+        self.assertEqual(get_voxel_extents(data == 7, (8, 16, 4)), [(9, 11), (18, 21), (5, 7)])
+        self.assertIsNone(get_voxel_extents(data == 5, (0, 0, 0)))
+
+    def test_outer_layers_only(self, mock_id_cache):
+        """The interior cuboids never need to be read"""
+        self.volume[0, 1, 3, 2] = 7
+        self.volume[0, 14, 30, 29] = 7
+        self.volume[0, 6, 12, 12] = 7
+
+        engine, box = self.compute(mock_id_cache, make_loose())
+        self.assertEqual(box, {'x_range': [2, 30], 'y_range': [3, 31], 'z_range': [1, 15], 't_range': [0, 1]})
+        self.assertEqual(engine.cuboids_read, 4 ** 3 - 2 ** 3)
+
+    def test_stale_loose_box(self, mock_id_cache):
+        """Faces whose outer layer is empty move inwards"""
+        self.volume[0, 5, 12, 12] = 7
+
+        engine, box = self.compute(mock_id_cache, make_loose())
+        self.assertEqual(box, {'x_range': [12, 13], 'y_range': [12, 13], 'z_range': [5, 6], 't_range': [0, 1]})
+
+    def test_missing(self, mock_id_cache):
+        engine, box = self.compute(mock_id_cache, make_loose(8, 8, 4))
+        self.assertIsNone(box)
+
+    def test_skips_cached_cuboids(self, mock_id_cache):
+        """Cuboids whose cached id set lacks the object are not read"""
+        self.volume[0, 1, 3, 2] = 7
+        cache = make_cache(self.volume)
+        mock_id_cache.return_value.get_many.side_effect = \
+            lambda lookup, res, t, cuboids: [np.array([3], dtype=np.uint64) if c != (0, 0, 0) else None
+                                             for c in cuboids]
+        resource = MagicMock()
+        engine = TightBoundingBox(resource, 0, 7)
+        with patch('bossobject.scan.SpatialDB', return_value=cache):
+            box = engine.compute(make_loose(16, 16, 8))
+        self.assertEqual(box['x_range'], [2, 3])
+        self.assertEqual(cache.cutout.call_count, 1)
+
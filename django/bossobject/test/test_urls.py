@@ -16,7 +16,8 @@ from rest_framework.test import APITestCase
 from django.core.urlresolvers import resolve
 from django.conf import settings
 
-from bossobject.views import Reserve, Ids, BoundingBox
+from bossobject.views import Reserve, ReserveStatus, Ids, BoundingBox, BulkBoundingBox, ObjectStatistics, ObjectVoxels
+from bossobject.views import RelabelIds
 
 version = version = settings.BOSS_VERSION
 
@@ -33,6 +34,9 @@ class ReserveIDRoutingTests(APITestCase):
         match = resolve('/' + version + '/reserve/col1/exp1/channel1/10')
         self.assertEqual(match.func.__name__, Reserve.as_view().__name__)
 
+        match = resolve('/' + version + '/reserve/col1/exp1/channel1/')
+        self.assertEqual(match.func.__name__, ReserveStatus.as_view().__name__)
+
 class IdsRoutingTests(APITestCase):
 
     def test_ids_resolves(self):
@@ -60,3 +64,45 @@ class BoundingBoxRoutingTests(APITestCase):
         """
         match = resolve('/' + version + '/boundingbox/col1/exp1/channel1/0/10')
         self.assertEqual(match.func.__name__, BoundingBox.as_view().__name__)
+
+        match = resolve('/' + version + '/boundingbox/col1/exp1/channel1/0/')
+        self.assertEqual(match.func.__name__, BulkBoundingBox.as_view().__name__)
+
+
+class StatisticsRoutingTests(APITestCase):
+
+    def test_statistics_resolves(self):
+        """
+        Test that the object statistics url resolves
+
+        Returns: None
+
+        """
+        match = resolve('/' + version + '/stats/col1/exp1/channel1/0/10')
+        self.assertEqual(match.func.__name__, ObjectStatistics.as_view().__name__)
+
+
+class VoxelsRoutingTests(APITestCase):
+
+    def test_voxels_resolves(self):
+        """
+        Test that the object voxels url resolves
+
+        Returns: None
+
+        """
+        match = resolve('/' + version + '/voxels/col1/exp1/channel1/0/10')
+        self.assertEqual(match.func.__name__, ObjectVoxels.as_view().__name__)
+
+
+class RelabelRoutingTests(APITestCase):
+
+    def test_relabel_resolves(self):
+        """
+        Test that the relabel url resolves
+
+        Returns: None
+
+        """
+        match = resolve('/' + version + '/relabel/col1/exp1/channel1/0/')
+        self.assertEqual(match.func.__name__, RelabelIds.as_view().__name__)
@@ -0,0 +1,95 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+from django.http import QueryDict
+from django.test import override_settings
+
+from bosscore.error import BossError
+from bossobject.voxels import get_runs, merge_runs, get_coords, get_encoding, VoxelExport
+from bossobject.test.test_tight_bbox import CUBE_DIM, make_cache, make_loose
+
+
+class TestVoxelEncoding(unittest.TestCase):
+
+    def test_runs(self):
+        mask = np.zeros((1, 2, 2, 6), dtype=bool)
+        mask[0, 0, 1, 0:2] = True
+        mask[0, 0, 1, 3:6] = True
+        mask[0, 1, 0, 2] = True
+        np.testing.assert_array_equal(get_runs(mask, (10, 20, 30), 2),
+                                      [[10, 21, 30, 2, 2], [13, 21, 30, 2, 3], [12, 20, 31, 2, 1]])
+        self.assertEqual(get_runs(np.zeros((1, 1, 1, 4), dtype=bool), (0, 0, 0), 0).shape, (0, 5))
+
+    def test_merge_runs(self):
+        """Runs split at a cuboid boundary are joined and rows are sorted"""
+        runs = np.array([[8, 1, 0, 0, 3], [5, 0, 0, 0, 1], [4, 1, 0, 0, 4], [11, 1, 0, 0, 1], [0, 1, 1, 0, 2]],
+                        dtype=np.uint64)
+        np.testing.assert_array_equal(merge_runs(runs), [[5, 0, 0, 0, 1], [4, 1, 0, 0, 8], [0, 1, 1, 0, 2]])
+
+    def test_coords(self):
+        mask = np.zeros((1, 2, 2, 2), dtype=bool)
+        mask[0, 1, 0, 1] = True
+        mask[0, 0, 1, 0] = True
+        np.testing.assert_array_equal(get_coords(mask, (8, 0, 4), 0), [[8, 1, 4, 0], [9, 0, 5, 0]])
+
+    def test_encoding(self):
+        self.assertEqual(get_encoding(QueryDict("")), 'rle')
+        self.assertEqual(get_encoding(QueryDict("encoding=coords")), 'coords')
+        with self.assertRaises(BossError):
+            get_encoding(QueryDict("encoding=mesh"))
+
+
+@override_settings(OBJECT_VOXELS_WORKERS=4, OBJECT_VOXELS_MAX_ROWS=100)
+@patch('bossspatialdb.cuboids.CUBOIDSIZE', CUBE_DIM)
+@patch('bossobject.scan.CuboidIdCache')
+class TestVoxelExport(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('bossobject.scan.register_cached_cuboids')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 4 x 4 x 4 cuboids of 8 x 8 x 4 voxels
+        self.volume = np.zeros((1, 16, 32, 32), dtype=np.uint64)
+        self.volume[0, 5, 12, 6:19] = 7
+        self.volume[0, 5, 12, 10] = 3
+        self.volume[0, 1, 2, 30] = 7
+
+    def export(self, mock_id_cache, encoding, max_rows=None):
+        mock_id_cache.return_value.get_many.side_effect = lambda lookup, res, t, cuboids: [None] * len(cuboids)
+        with patch('bossobject.scan.SpatialDB', return_value=make_cache(self.volume)):
+            return VoxelExport(MagicMock(), 0, 7, encoding, max_rows=max_rows).compute(make_loose())
+
+    def test_rle(self, mock_id_cache):
+        np.testing.assert_array_equal(self.export(mock_id_cache, 'rle'),
+                                      [[30, 2, 1, 0, 1], [6, 12, 5, 0, 4], [11, 12, 5, 0, 8]])
+
+    def test_coords(self, mock_id_cache):
+        coords = self.export(mock_id_cache, 'coords')
+        self.assertEqual(len(coords), 13)
+        np.testing.assert_array_equal(coords[0], [30, 2, 1, 0])
+        np.testing.assert_array_equal(coords[1:, 0], [6, 7, 8, 9, 11, 12, 13, 14, 15, 16, 17, 18])
+
+    @override_settings(OBJECT_VOXELS_MAX_ROWS=10)
+    def test_too_large(self, mock_id_cache):
+        with self.assertRaises(BossError):
+            self.export(mock_id_cache, 'coords')
+
+    def test_max_rows(self, mock_id_cache):
+        """A lower cap, as used for JSON responses, overrides OBJECT_VOXELS_MAX_ROWS"""
+        self.assertEqual(len(self.export(mock_id_cache, 'coords', max_rows=13)), 13)
+        with self.assertRaises(BossError):
+            self.export(mock_id_cache, 'coords', max_rows=12)
@@ -0,0 +1,146 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import numpy as np
+from django.conf import settings
+
+from bossspatialdb.cuboids import get_cuboid_range
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from .scan import ObjectScanner, get_box_region, get_memoized
+
+
+def get_voxel_extents(mask, corner):
+    """Find the extents of an object's voxels with per axis any() reductions
+
+    Args:
+        mask (numpy.ndarray): Boolean mask of the object's voxels, indexed [t, z, y, x]
+        corner ((int, int, int)): X, Y, Z corner of the mask
+
+    Returns:
+        (list((int, int))|None): X, Y, Z first and last voxel of the object, or None if the mask is empty
+    """
+    # Voxels along X are reduced over t, z and y, and so on
+    axes = ((0, 1, 2), (0, 1, 3), (0, 2, 3))
+    extents = []
+    for i in range(3):
+        hits = np.flatnonzero(mask.any(axis=axes[i]))
+        if len(hits) == 0:
+            return None
+        extents.append((corner[i] + int(hits[0]), corner[i] + int(hits[-1])))
+    return extents
+
+
+class TightBoundingBox(ObjectScanner):
+    """
+    Computes the tight bounding box of an object from its loose box
+
+    The loose box is the union of the cuboids that contain the object, so each of its six faces has the object in
+    its outermost layer of cuboids. Only those layers are scanned, concurrently, and a face only moves inwards if its
+    layer turns out not to contain the object, e.g. because the id index is stale.
+    """
+
+    def __init__(self, resource, resolution, id, workers=None):
+        """
+        Args:
+            resource (spdb.project.BossResource): Data model info of the annotation channel
+            resolution (int): Resolution level of the box
+            id (int): Object id
+            workers (int|None): Number of threads scanning cuboids. Defaults to BOUNDING_BOX_TIGHT_WORKERS
+        """
+        super().__init__(resource, resolution, id, workers or settings.BOUNDING_BOX_TIGHT_WORKERS)
+
+    def compute(self, loose):
+        """Compute the tight box
+
+        Args:
+            loose (dict): Loose bounding box with x_range, y_range, z_range and t_range
+
+        Returns:
+            (dict|None): Tight bounding box in the same format, or None if the object has no voxels in the box
+        """
+        corner, extent, time_range = get_box_region(loose)
+        cube_dim = CUBOIDSIZE[self.resolution]
+        ranges = [list(rng) for rng in get_cuboid_range(self.resolution, corner, extent)]
+        parts = self.get_parts(loose)
+
+        # Layer of each face still being searched, by axis and side (0 = low face, 1 = high face)
+        faces = {(axis, side): 0 for axis in range(3) for side in (0, 1)}
+        low = [None] * 3
+        high = [None] * 3
+        scanned = set()
+
+        def scan(cuboid):
+            sub_corner, sub_extent = parts[cuboid]
+            return get_voxel_extents(self.get_mask(sub_corner, sub_extent, time_range), sub_corner)
+
+        with self.get_executor() as executor:
+            while faces:
+                layers = {}
+                for (axis, side), depth in faces.items():
+                    layers[(axis, side)] = ranges[axis][depth] if side == 0 else ranges[axis][-1 - depth]
+
+                cuboids = set()
+                for (axis, side), layer in layers.items():
+                    face_ranges = list(ranges)
+                    face_ranges[axis] = [layer]
+                    cuboids.update((x, y, z) for x in face_ranges[0] for y in face_ranges[1] for z in face_ranges[2])
+                cuboids = [cuboid for cuboid in cuboids if cuboid not in scanned and cuboid in parts]
+                scanned.update(cuboids)
+
+                for extents in executor.map(scan, cuboids):
+                    if extents is None:
+                        continue
+                    for i in range(3):
+                        low[i] = extents[i][0] if low[i] is None else min(low[i], extents[i][0])
+                        high[i] = extents[i][1] if high[i] is None else max(high[i], extents[i][1])
+
+                # A face is proven once the object is found in its layer. Otherwise it moves one layer inwards
+                for (axis, side), layer in layers.items():
+                    bound = low[axis] if side == 0 else high[axis]
+                    if bound is not None and bound // cube_dim[axis] == layer:
+                        del faces[(axis, side)]
+                    elif faces[(axis, side)] + 1 < len(ranges[axis]):
+                        faces[(axis, side)] += 1
+                    else:
+                        del faces[(axis, side)]
+
+        if low[0] is None:
+            return None
+        return {'x_range': [low[0], high[0] + 1],
+                'y_range': [low[1], high[1] + 1],
+                'z_range': [low[2], high[2] + 1],
+                't_range': time_range}
+
+
+def get_tight_bounding_box(cache, resource, resolution, id, workers=None):
+    """Get the tight bounding box of an object, memoized until the channel is next written
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the cache, used to get the loose box
+        resource (spdb.project.BossResource): Data model info of the annotation channel
+        resolution (int): Resolution level of the box
+        id (int): Object id
+        workers (int|None): Number of threads scanning cuboids. Defaults to BOUNDING_BOX_TIGHT_WORKERS
+
+    Returns:
+        (dict|None): Bounding box with x_range, y_range, z_range and t_range, or None if the id doesn't exist
+    """
+    def compute():
+        loose = cache.get_bounding_box(resource, resolution, id, bb_type='loose')
+        if loose is None:
+            return None
+        return TightBoundingBox(resource, resolution, id, workers).compute(loose)
+
+    return get_memoized("TIGHT-BBOX", resource, resolution, id, compute, settings.BOUNDING_BOX_TIGHT_CACHE_TTL)
@@ -20,4 +20,8 @@ urlpatterns = [
     # Url to get the bouding box for an object
     url(r'(?P<collection>[\w_-]+)/(?P<experiment>[\w_-]+)/(?P<channel>[\w_-]+)/(?P<resolution>\d)/(?P<id>\d+)/?$',
         views.BoundingBox.as_view()),
+
+    # Url to get the bounding boxes of many objects
+    url(r'^(?P<collection>[\w_-]+)/(?P<experiment>[\w_-]+)/(?P<channel>[\w_-]+)/(?P<resolution>\d)/?$',
+        views.BulkBoundingBox.as_view()),
 ]
@@ -20,4 +20,8 @@ urlpatterns = [
     # Url to reserve ids for a channel
     url(r'(?P<collection>[\w_-]+)/(?P<experiment>[\w_-]+)/(?P<channel>[\w_-]+)/(?P<num_ids>\d+)/?$',
         views.Reserve.as_view()),
+
+    # Url to get the utilisation of a channel's reserved id blocks
+    url(r'^(?P<collection>[\w_-]+)/(?P<experiment>[\w_-]+)/(?P<channel>[\w_-]+)/?$',
+        views.ReserveStatus.as_view()),
 ]
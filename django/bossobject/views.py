@@ -14,15 +14,32 @@
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.parsers import JSONParser
+from django.http import StreamingHttpResponse
 
 from bosscore.request import BossRequest
-from bosscore.error import BossError, BossHTTPError, ErrorCodes
+from bosscore.error import BossError, BossHTTPError, BossParserError, ErrorCodes
 
 from spdb.spatialdb.spatialdb import SpatialDB
 from spdb import project
 
 from django.conf import settings
 
+from bossspatialdb.id_cache import CuboidIdCache
+from bossspatialdb.resource import ServiceRequest
+from bossspatialdb.retired_ids import is_retired
+
+from .bounding_box import parse_bulk_ids, get_bounding_boxes, to_columns
+from .id_allocator import IdBlockAllocator, reserve_ids
+from .ids import ID_DTYPE, get_page_args, get_ids_page, iter_block_ids, merge_ids, stream_new_ids
+from .stats import get_object_statistics
+from .tight_bbox import get_tight_bounding_box
+from .voxels import VOXEL_COLUMNS, VoxelExport, get_encoding
+from .parsers import Uint64Parser
+from .relabel import parse_mapping, parse_region, relabel
+from .renderers import BloscUint64Renderer, Uint64Renderer
+
 
 class Reserve(APIView):
     """
@@ -34,6 +51,9 @@ class Reserve(APIView):
         Reserve a unique, sequential list of annotation ids for the provided channel to use as
         object ids for annotations.
 
+        Small requests are served from blocks of ids reserved in bulk, so parallel clients don't contend on the
+        channel's id counter. Ids skipped when a block is replaced are never handed out.
+
         Args:
             request: DRF Request object
             collection: Collection name specifying the collection you want
@@ -67,30 +87,77 @@ class Reserve(APIView):
         try:
             # Reserve ids
             spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
-            start_id = spdb.reserve_ids(resource, int(num_ids))
-            data = {'start_id': start_id[0], 'count': num_ids}
+            start_id = reserve_ids(spdb, resource, int(num_ids))
+            data = {'start_id': start_id, 'count': num_ids}
             return Response(data, status=200)
         except (TypeError, ValueError)as e:
             return BossHTTPError("Type error in the reserve id view. {}".format(e), ErrorCodes.TYPE_ERROR)
 
 
+class ReserveStatus(APIView):
+    """
+        View to get the utilisation of a channel's reserved id blocks
+
+    """
+    def get(self, request, collection, experiment, channel):
+        """
+        Return how many ids were reserved from the channel's id counter, issued, leaked and lost
+
+        Args:
+            request: DRF Request object
+            collection: Collection name specifying the collection you want
+            experiment: Experiment name specifying the experiment
+            channel: Channel_name
+        Returns:
+            JSON dict with the allocator's counters
+        Raises:
+            BossHTTPError for an invalid request
+        """
+        try:
+            request_args = {
+                "service": "reserve",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        resource = project.BossResourceDjango(req)
+        data = IdBlockAllocator(settings.STATEIO_CONFIG).get_status(resource.get_lookup_key())
+        return Response(data, status=200)
+
+
 class Ids(APIView):
     """
         View to get the ids of all the annotation objects in a spatial region
 
     """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer, Uint64Renderer)
+
     def get(self, request, collection, experiment,channel, resolution, x_range, y_range, z_range, t_range=None):
         """
         Return a list of ids in the spatial region.
 
+        Large regions can be paged through with the limit and cursor query parameters. Each page holds up to limit
+        ids in ascending order, and the next page is requested with cursor set to the previous page's next_cursor.
+        Clients that accept application/octet-stream get the ids as packed little endian uint64 values. Without
+        limit the binary response is streamed as the region is scanned, one cuboid at a time, and is not sorted.
+        Binary pages return their next cursor in the X-Next-Cursor header.
+
         Args:
             request: DRF Request object
             collection: Collection name specifying the collection you want
             experiment: Experiment name specifying the experiment
             channel: Channel_name
-            num_ids: Number of id you want to reserve
+            resolution: Data resolution
+            x_range: Python style range indicating the X coordinates of the region (eg. 100:200)
+            y_range: Python style range indicating the Y coordinates of the region (eg. 100:200)
+            z_range: Python style range indicating the Z coordinates of the region (eg. 100:200)
+            t_range: Python style range indicating the time samples of the region (eg. 0:1)
         Returns:
-            JSON dict with start_id and count of ids reserved
+            JSON dict with the ids in the region, or the binary ids
         Raises:
             BossHTTPError for an invalid request
         """
@@ -122,11 +189,37 @@ class Ids(APIView):
         corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
         extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
 
+        time_range = [req.get_time().start, req.get_time().stop]
+
+        try:
+            limit, cursor = get_page_args(request.query_params)
+        except BossError as err:
+            return err.to_http()
+        binary = request.accepted_renderer.media_type == Uint64Renderer.media_type
+
         try:
-            # Reserve ids
             spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
-            ids = spdb.get_ids_in_region(resource, int(resolution), corner, extent)
-            return Response(ids, status=200)
+
+            # Cuboids the region covers are answered from their cached id sets when possible
+            blocks = iter_block_ids(spdb, resource, int(resolution), corner, extent, time_range,
+                                    id_cache=CuboidIdCache(settings.KVIO_SETTINGS))
+
+            if limit is not None:
+                ids, next_cursor = get_ids_page(blocks, cursor, limit)
+                if binary:
+                    response = Response(ids, status=200)
+                    if next_cursor is not None:
+                        response['X-Next-Cursor'] = str(next_cursor)
+                    return response
+                return Response({'ids': [str(id) for id in ids],
+                                 'next_cursor': str(next_cursor) if next_cursor is not None else None}, status=200)
+
+            if binary:
+                # Stream the ids as they are found instead of holding the whole region's ids in memory
+                return StreamingHttpResponse((ids.astype(ID_DTYPE).tobytes() for ids in stream_new_ids(blocks)),
+                                             content_type=Uint64Renderer.media_type)
+
+            return Response({'ids': [str(id) for id in merge_ids(blocks)]}, status=200)
         except (TypeError, ValueError) as e:
             return BossHTTPError("Type error in the ids view. {}".format(e), ErrorCodes.TYPE_ERROR)
 
@@ -185,9 +278,257 @@ class BoundingBox(APIView):
         try:
             # Get interface to SPDB cache
             spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
-            data = spdb.get_bounding_box(resource, int(resolution), int(id), bb_type=bb_type)
+            if is_retired(resource.get_lookup_key(), int(resolution), int(id)):
+                # A relabel removed the id everywhere, but the id index still has its cuboids
+                data = None
+            elif bb_type == 'tight':
+                # Tight boxes scan the object's voxels, so they are computed in parallel and memoized
+                data = get_tight_bounding_box(spdb, resource, int(resolution), int(id))
+            else:
+                data = spdb.get_bounding_box(resource, int(resolution), int(id), bb_type=bb_type)
             if data is None:
                 return BossHTTPError("The id does not exist. {}".format(id), ErrorCodes.OBJECT_NOT_FOUND)
             return Response(data, status=200)
         except (TypeError, ValueError) as e:
             return BossHTTPError("Type error in the boundingbox view. {}".format(e), ErrorCodes.TYPE_ERROR)
+
+
+class BulkBoundingBox(APIView):
+    """
+        View to get the bounding boxes of many annotation objects at once
+
+    """
+    parser_classes = (JSONParser, Uint64Parser)
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def post(self, request, collection, experiment, channel, resolution):
+        """
+        Return the bounding boxes of a list of objects
+
+        The ids are POSTed as JSON, {"ids": [...]}, or as packed little endian uint64 values with content type
+        application/octet-stream. The type query parameter selects loose (default) or tight boxes, like the single
+        object view. The ids are only read, so the request is authorized like a GET of the single object view. It is
+        validated once and the boxes are looked up concurrently.
+
+        Args:
+            request: DRF Request object
+            collection: Collection name specifying the collection you want
+            experiment: Experiment name specifying the experiment
+            channel: Channel_name
+            resolution: Data resolution
+        Returns:
+            JSON dict with the ids, columns of box bounds and the ids that don't exist
+        Raises:
+            BossHTTPError for an invalid request
+        """
+        if isinstance(request.data, BossParserError):
+            return request.data.to_http()
+
+        bb_type = request.query_params.get('type', 'loose')
+        if bb_type != 'loose' and bb_type != 'tight':
+            return BossHTTPError("Invalid option for bounding box type {}. The valid options are : loose or tight"
+                                 .format(bb_type), ErrorCodes.INVALID_ARGUMENT)
+
+        try:
+            ids = parse_bulk_ids(request.data, bb_type)
+            request_args = {
+                "service": "boundingbox",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "resolution": resolution,
+                "id": str(ids[0])
+            }
+            # The body is POSTed only because it can be large, so read permission is enough
+            req = BossRequest(ServiceRequest(request.user, 'GET', request.version), request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # create a resource
+        resource = project.BossResourceDjango(req)
+
+        try:
+            boxes = get_bounding_boxes(resource, int(resolution), ids, bb_type)
+        except (TypeError, ValueError) as e:
+            return BossHTTPError("Type error in the boundingbox view. {}".format(e), ErrorCodes.TYPE_ERROR)
+
+        data = to_columns(ids, boxes)
+        data['type'] = bb_type
+        return Response(data, status=200)
+
+
+class ObjectStatistics(APIView):
+    """
+        View to get the voxel statistics of an annotation object
+
+    """
+    def get(self, request, collection, experiment, channel, resolution, id):
+        """
+        Return the voxel count, centroid, bounding box and area of each z slice of an object
+
+        Only the cuboids that may hold the object are read, so clients don't need to download and mask a cutout of
+        its bounding box. Statistics are cached until the channel is next written.
+
+        Args:
+            request: DRF Request object
+            collection: Collection name specifying the collection you want
+            experiment: Experiment name specifying the experiment
+            channel: Channel_name
+            resolution: Data resolution
+            id: The id of the object
+        Returns:
+            JSON dict with the statistics of the object
+        Raises:
+            BossHTTPError for an invalid request
+        """
+        try:
+            request_args = {
+                "service": "boundingbox",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "resolution": resolution,
+                "id": id
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # create a resource
+        resource = project.BossResourceDjango(req)
+
+        try:
+            if is_retired(resource.get_lookup_key(), int(resolution), int(id)):
+                return BossHTTPError("The id does not exist. {}".format(id), ErrorCodes.OBJECT_NOT_FOUND)
+            spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
+            data = get_object_statistics(spdb, resource, int(resolution), int(id))
+            if data is None:
+                return BossHTTPError("The id does not exist. {}".format(id), ErrorCodes.OBJECT_NOT_FOUND)
+            return Response(data, status=200)
+        except (TypeError, ValueError) as e:
+            return BossHTTPError("Type error in the statistics view. {}".format(e), ErrorCodes.TYPE_ERROR)
+
+
+class ObjectVoxels(APIView):
+    """
+        View to export the voxels of an annotation object
+
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer, BloscUint64Renderer, Uint64Renderer)
+
+    def get(self, request, collection, experiment, channel, resolution, id):
+        """
+        Return the voxels of an object as runs along X or as a list of coordinates
+
+        The encoding query parameter selects rle (default), x, y, z, t, length rows, or coords, x, y, z, t rows.
+        Rows are sorted by t, z, y and then x. Clients that accept application/blosc or application/octet-stream get
+        the rows as packed little endian uint64 values in row major order, compressed or not, with the columns in
+        the X-Voxel-Columns header.
+
+        Args:
+            request: DRF Request object
+            collection: Collection name specifying the collection you want
+            experiment: Experiment name specifying the experiment
+            channel: Channel_name
+            resolution: Data resolution
+            id: The id of the object
+        Returns:
+            JSON dict with the rows of the object, or the binary rows
+        Raises:
+            BossHTTPError for an invalid request
+        """
+        try:
+            encoding = get_encoding(request.query_params)
+            request_args = {
+                "service": "boundingbox",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "resolution": resolution,
+                "id": id
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # create a resource
+        resource = project.BossResourceDjango(req)
+
+        try:
+            spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
+            loose = None
+            if not is_retired(resource.get_lookup_key(), int(resolution), int(id)):
+                loose = spdb.get_bounding_box(resource, int(resolution), int(id), bb_type='loose')
+            if loose is None:
+                return BossHTTPError("The id does not exist. {}".format(id), ErrorCodes.OBJECT_NOT_FOUND)
+            # JSON rows become Python objects, so far fewer of them are allowed than packed binary rows
+            max_rows = None if request.accepted_renderer.format == 'bin' else settings.OBJECT_VOXELS_MAX_JSON_ROWS
+            rows = VoxelExport(resource, int(resolution), int(id), encoding, max_rows=max_rows).compute(loose)
+        except BossError as err:
+            return err.to_http()
+        except (TypeError, ValueError) as e:
+            return BossHTTPError("Type error in the voxels view. {}".format(e), ErrorCodes.TYPE_ERROR)
+
+        columns = VOXEL_COLUMNS[encoding]
+        if request.accepted_renderer.format == 'bin':
+            response = Response(rows, status=200)
+            response['X-Voxel-Columns'] = ",".join(columns)
+            return response
+        return Response({'id': str(id), 'encoding': encoding, 'columns': columns, 'data': rows.tolist()}, status=200)
+
+
+class RelabelIds(APIView):
+    """
+        View to relabel annotation objects in place
+
+    """
+    parser_classes = (JSONParser,)
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def post(self, request, collection, experiment, channel, resolution):
+        """
+        Relabel annotation ids, e.g. to merge objects while proofreading
+
+        The body is JSON with a "mapping" of old ids to new ids, where many ids may map to one and 0 erases, and an
+        optional bounding box, x_start, x_stop, y_start, y_stop, z_start and z_stop, at the given resolution. Only
+        the cuboids that may hold the old ids are read and rewritten, on the server.
+
+        Args:
+            request: DRF Request object
+            collection: Collection name specifying the collection you want
+            experiment: Experiment name specifying the experiment
+            channel: Channel_name
+            resolution: Data resolution
+        Returns:
+            JSON dict with the number of cuboids read and written and of voxels relabeled
+        Raises:
+            BossHTTPError for an invalid request
+        """
+        if isinstance(request.data, BossParserError):
+            return request.data.to_http()
+
+        try:
+            sources, targets = parse_mapping(request.data)
+            region = parse_region(request.data)
+            request_args = {
+                "service": "boundingbox",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "resolution": resolution,
+                "id": str(sources[0])
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # create a resource
+        resource = project.BossResourceDjango(req)
+
+        try:
+            data = relabel(resource, int(resolution), sources, targets, region)
+        except BossError as err:
+            return err.to_http()
+        except (TypeError, ValueError) as e:
+            return BossHTTPError("Type error in the relabel view. {}".format(e), ErrorCodes.TYPE_ERROR)
+        return Response(data, status=200)
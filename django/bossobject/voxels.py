@@ -0,0 +1,171 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import numpy as np
+from django.conf import settings
+
+from bosscore.error import BossError, ErrorCodes
+
+from .ids import ID_DTYPE
+from .scan import ObjectScanner, get_box_region
+
+# Columns of each voxel export encoding. Rows are sorted by t, z, y and then x
+VOXEL_COLUMNS = {'rle': ('x', 'y', 'z', 't', 'length'),
+                 'coords': ('x', 'y', 'z', 't')}
+
+
+def get_runs(mask, corner, t_start):
+    """Run length encode an object's voxels along X
+
+    Args:
+        mask (numpy.ndarray): Boolean mask of the object's voxels, indexed [t, z, y, x]
+        corner ((int, int, int)): X, Y, Z corner of the mask
+        t_start (int): Time sample of the mask's first index
+
+    Returns:
+        (numpy.ndarray): One x, y, z, t, length row per run
+    """
+    # Runs start where the padded mask steps up and stop where it steps down. Both are found in the same row major
+    # order, so the nth start and nth stop belong to the same run
+    padded = np.zeros(mask.shape[:-1] + (mask.shape[-1] + 2,), dtype=np.int8)
+    padded[..., 1:-1] = mask
+    edges = np.diff(padded, axis=-1)
+    t, z, y, starts = np.nonzero(edges == 1)
+    stops = np.nonzero(edges == -1)[3]
+    return np.stack([starts + corner[0], y + corner[1], z + corner[2], t + t_start, stops - starts],
+                    axis=1).astype(ID_DTYPE)
+
+
+def merge_runs(runs):
+    """Sort runs and join the ones split at cuboid boundaries
+
+    Args:
+        runs (numpy.ndarray): x, y, z, t, length rows
+
+    Returns:
+        (numpy.ndarray): Sorted x, y, z, t, length rows with no two runs touching along X
+    """
+    if len(runs) == 0:
+        return runs
+    runs = runs[np.lexsort((runs[:, 0], runs[:, 1], runs[:, 2], runs[:, 3]))]
+
+    # A run continues the previous one if it is on the same row and starts where the previous one stops
+    same_row = np.all(runs[1:, 1:4] == runs[:-1, 1:4], axis=1)
+    continues = np.concatenate([[False], same_row & (runs[1:, 0] == runs[:-1, 0] + runs[:-1, 4])])
+    firsts = np.flatnonzero(~continues)
+
+    merged = runs[firsts]
+    merged[:, 4] = np.add.reduceat(runs[:, 4], firsts)
+    return merged
+
+
+def get_coords(mask, corner, t_start):
+    """List an object's voxels
+
+    Args:
+        mask (numpy.ndarray): Boolean mask of the object's voxels, indexed [t, z, y, x]
+        corner ((int, int, int)): X, Y, Z corner of the mask
+        t_start (int): Time sample of the mask's first index
+
+    Returns:
+        (numpy.ndarray): One x, y, z, t row per voxel
+    """
+    t, z, y, x = np.nonzero(mask)
+    return np.stack([x + corner[0], y + corner[1], z + corner[2], t + t_start], axis=1).astype(ID_DTYPE)
+
+
+def sort_coords(coords):
+    """Sort voxel coordinates by t, z, y and then x
+
+    Args:
+        coords (numpy.ndarray): x, y, z, t rows
+
+    Returns:
+        (numpy.ndarray)
+    """
+    return coords[np.lexsort((coords[:, 0], coords[:, 1], coords[:, 2], coords[:, 3]))]
+
+
+def get_encoding(query_params):
+    """Parse the encoding query parameter of a voxel export
+
+    Args:
+        query_params (dict): Query parameters of the request
+
+    Returns:
+        (str): rle (default) or coords
+
+    Raises:
+        BossError: If the encoding is not supported
+    """
+    encoding = query_params.get('encoding', 'rle')
+    if encoding not in VOXEL_COLUMNS:
+        raise BossError("Invalid voxel encoding {}. The valid options are : rle or coords".format(encoding),
+                        ErrorCodes.INVALID_ARGUMENT)
+    return encoding
+
+
+class VoxelExport(ObjectScanner):
+    """
+    Lists the voxels of one object, as runs along X or as coordinates
+
+    Only the cuboids of the object's loose box that may hold it are read, concurrently, and each is encoded on its
+    own before the results are merged, so the response grows with the object rather than its bounding box.
+    """
+
+    def __init__(self, resource, resolution, id, encoding='rle', workers=None, max_rows=None):
+        """
+        Args:
+            resource (spdb.project.BossResource): Data model info of the annotation channel
+            resolution (int): Resolution level to export
+            id (int): Object id
+            encoding (str): rle or coords
+            workers (int|None): Number of threads reading cuboids. Defaults to OBJECT_VOXELS_WORKERS
+            max_rows (int|None): Maximum number of rows exported. Defaults to OBJECT_VOXELS_MAX_ROWS
+        """
+        super().__init__(resource, resolution, id, workers or settings.OBJECT_VOXELS_WORKERS)
+        self.encoding = encoding
+        self.max_rows = max_rows or settings.OBJECT_VOXELS_MAX_ROWS
+
+    def compute(self, loose):
+        """Export the voxels
+
+        Args:
+            loose (dict): Loose bounding box of the object with x_range, y_range, z_range and t_range
+
+        Returns:
+            (numpy.ndarray): One row per run or voxel, with the columns of VOXEL_COLUMNS[encoding]
+
+        Raises:
+            BossError: If the export has more than max_rows rows
+        """
+        time_range = get_box_region(loose)[2]
+        encode = get_runs if self.encoding == 'rle' else get_coords
+
+        def export(part):
+            sub_corner, sub_extent = part
+            return encode(self.get_mask(sub_corner, sub_extent, time_range), sub_corner, time_range[0])
+
+        blocks = [np.empty((0, len(VOXEL_COLUMNS[self.encoding])), dtype=ID_DTYPE)]
+        rows = 0
+        with self.get_executor() as executor:
+            for block in executor.map(export, self.get_parts(loose).values()):
+                rows += len(block)
+                if rows > self.max_rows:
+                    raise BossError("Object has more than {} {}. Use a lower resolution, the rle encoding or a binary "
+                                    "response".format(self.max_rows, 'runs' if self.encoding == 'rle' else 'voxels'),
+                                    ErrorCodes.REQUEST_TOO_LARGE)
+                blocks.append(block)
+
+        data = np.concatenate(blocks)
+        return merge_runs(data) if self.encoding == 'rle' else sort_coords(data)
@@ -17,3 +17,7 @@ from django.apps import AppConfig
 
 class BossspatialdbConfig(AppConfig):
     name = 'bossspatialdb'
+
+    def ready(self):
+        # Connect the signals that invalidate cached downsample geometry
+        import bossspatialdb.geometry
@@ -0,0 +1,243 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+
+from django.conf import settings
+
+from spdb.spatialdb.rediskvio import RedisKVIO
+from bossutils.logger import BossLogger
+
+from .cuboids import get_morton_ids
+
+# Number of keys removed per pipelined UNLINK when clearing an index
+CLEAR_CHUNK_SIZE = 1000
+
+# Prefix of the lock taken while an index set is trimmed
+TRIM_LOCK_PREFIX = "CACHED-CUBOID-INDEX-TRIM&"
+
+
+class CuboidCacheIndex:
+    """
+    Index of the CACHED-CUBOID keys held in the Redis cache for each channel and resolution
+
+    Every request that pages cuboids into the cache, or writes them through it, registers their keys in a Redis set,
+    so clearing a channel removes those keys without scanning the whole keyspace. Each set expires CACHE_INDEX_TTL
+    seconds after its last registration and is trimmed of evicted keys in a background thread once it grows past
+    CACHE_INDEX_TRIM_SIZE. sweep() catches anything cached without being registered. It scans the keyspace, so it
+    is only run by the sweep_cached_cuboids management command.
+    """
+
+    def __init__(self, kv_conf):
+        """
+        Args:
+            kv_conf (dict): KVIO settings used to connect to the cache
+        """
+        self.kvio = RedisKVIO(kv_conf)
+        self.client = self.kvio.cache_client
+
+    @staticmethod
+    def get_index_key(lookup_key, resolution, iso=False):
+        """Get the key of the Redis set holding the cached cuboid keys of a channel at a resolution
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            resolution (int): Resolution level
+            iso (bool): Flag indicating if the isotropic cuboids are indexed
+
+        Returns:
+            (str): The index key
+        """
+        if iso:
+            return "CACHED-CUBOID-INDEX&ISO&{}&{}".format(lookup_key, resolution)
+        else:
+            return "CACHED-CUBOID-INDEX&{}&{}".format(lookup_key, resolution)
+
+    def add(self, resource, resolution, corner, extent, time_range, iso=False):
+        """Register the cached cuboid keys covering a region
+
+        Args:
+            resource (spdb.project.BossResource): Data model info based on the request or target resource
+            resolution (int): Resolution level of the region
+            corner ((int, int, int)): X, Y, Z corner of the region
+            extent ((int, int, int)): X, Y, Z extent of the region
+            time_range ([int, int]): Time range of the region
+            iso (bool): Flag indicating if the isotropic cuboids were used
+
+        Returns:
+            None
+        """
+        morton_ids = get_morton_ids(resolution, corner, extent)
+        keys = self.kvio.generate_cached_cuboid_keys(resource, resolution, list(range(*time_range)),
+                                                     morton_ids, iso=iso)
+        if not keys:
+            return
+
+        index_key = self.get_index_key(resource.get_lookup_key(), resolution, iso)
+        pipe = self.client.pipeline()
+        pipe.sadd(index_key, *keys)
+        pipe.expire(index_key, settings.CACHE_INDEX_TTL)
+        pipe.scard(index_key)
+        size = pipe.execute()[-1]
+
+        # The LRU cache evicts keys without telling the index, so prune it once it grows. The lock keeps
+        # concurrent requests from trimming the same set
+        if size > settings.CACHE_INDEX_TRIM_SIZE and \
+                self.client.set(TRIM_LOCK_PREFIX + index_key, 1, nx=True, ex=settings.CACHE_INDEX_TRIM_INTERVAL):
+            self.trim_async(index_key)
+
+    def trim(self, index_key):
+        """Drop the keys that are no longer in the cache from an index set
+
+        Args:
+            index_key (str): Key of the index set
+
+        Returns:
+            (int): Number of keys dropped
+        """
+        dropped = 0
+        chunk = []
+        for key in self.client.sscan_iter(index_key, count=CLEAR_CHUNK_SIZE):
+            chunk.append(key)
+            if len(chunk) >= CLEAR_CHUNK_SIZE:
+                dropped += self._drop_evicted(index_key, chunk)
+                chunk = []
+        if chunk:
+            dropped += self._drop_evicted(index_key, chunk)
+        return dropped
+
+    def trim_async(self, index_key):
+        """Drop the keys that are no longer in the cache from an index set in a background thread
+
+        Args:
+            index_key (str): Key of the index set
+
+        Returns:
+            (threading.Thread): The thread running the trim
+        """
+        return self._run_async(self.trim, (index_key,), "Problem trimming cache index {}".format(index_key))
+
+    def _drop_evicted(self, index_key, keys):
+        """Remove the keys of a chunk that no longer exist from the index"""
+        pipe = self.client.pipeline()
+        for key in keys:
+            pipe.exists(key)
+        evicted = [key for key, exists in zip(keys, pipe.execute()) if not exists]
+        if evicted:
+            self.client.srem(index_key, *evicted)
+        return len(evicted)
+
+    def clear(self, lookup_key, num_hierarchy_levels):
+        """Remove all indexed cuboids of a channel from the cache
+
+        Indexed keys are unlinked in pipelined chunks and removed from the index as they go, so keys registered
+        while the clear is running are left in the index for the next clear.
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            num_hierarchy_levels (int): Number of resolution levels of the channel's experiment
+
+        Returns:
+            None
+        """
+        for iso in (False, True):
+            for resolution in range(num_hierarchy_levels):
+                index_key = self.get_index_key(lookup_key, resolution, iso)
+                chunk = []
+                for key in self.client.sscan_iter(index_key, count=CLEAR_CHUNK_SIZE):
+                    chunk.append(key)
+                    if len(chunk) >= CLEAR_CHUNK_SIZE:
+                        self._unlink(index_key, chunk)
+                        chunk = []
+                if chunk:
+                    self._unlink(index_key, chunk)
+
+    def sweep(self, lookup_key):
+        """Remove every cached cuboid of a channel, including any that were never registered in the index
+
+        This SCANs the whole keyspace, so it is a maintenance job. Don't call it while serving requests.
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+
+        Returns:
+            (int): Number of keys removed
+        """
+        removed = 0
+        for pattern in ("CACHED-CUBOID&{}&*".format(lookup_key), "CACHED-CUBOID&ISO&{}&*".format(lookup_key)):
+            chunk = []
+            for key in self.client.scan_iter(match=pattern, count=CLEAR_CHUNK_SIZE):
+                chunk.append(key)
+                if len(chunk) >= CLEAR_CHUNK_SIZE:
+                    self._unlink(None, chunk)
+                    removed += len(chunk)
+                    chunk = []
+            if chunk:
+                self._unlink(None, chunk)
+                removed += len(chunk)
+        return removed
+
+    def clear_async(self, lookup_key, num_hierarchy_levels):
+        """Remove all indexed cuboids of a channel from the cache in a background thread
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            num_hierarchy_levels (int): Number of resolution levels of the channel's experiment
+
+        Returns:
+            (threading.Thread): The thread running the clear
+        """
+        return self._run_async(self.clear, (lookup_key, num_hierarchy_levels),
+                               "Problem clearing cache index for {}".format(lookup_key))
+
+    @staticmethod
+    def _run_async(target, args, message):
+        """Run a method in a daemon thread, logging instead of raising any error"""
+        def run():
+            try:
+                target(*args)
+            except Exception:
+                BossLogger().logger.exception(message)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def _unlink(self, index_key, keys):
+        """Unlink a chunk of cached cuboid keys and drop them from the index, if given, in one round trip"""
+        pipe = self.client.pipeline()
+        # UNLINK frees the values off the Redis main thread. Clients without it fall back to DEL
+        getattr(pipe, 'unlink', pipe.delete)(*keys)
+        if index_key is not None:
+            pipe.srem(index_key, *keys)
+        pipe.execute()
+
+
+def register_cached_cuboids(resource, resolution, corner, extent, time_range, iso=False):
+    """Register a region's cuboids in the cache index without failing the calling request
+
+    Args:
+        resource (spdb.project.BossResource): Data model info based on the request or target resource
+        resolution (int): Resolution level of the region
+        corner ((int, int, int)): X, Y, Z corner of the region
+        extent ((int, int, int)): X, Y, Z extent of the region
+        time_range ([int, int]): Time range of the region
+        iso (bool): Flag indicating if the isotropic cuboids were used
+
+    Returns:
+        None
+    """
+    try:
+        CuboidCacheIndex(settings.KVIO_SETTINGS).add(resource, resolution, corner, extent, time_range, iso=iso)
+    except Exception:
+        BossLogger().logger.exception("Problem registering cached cuboids for {}".format(resource.get_lookup_key()))
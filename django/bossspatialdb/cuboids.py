@@ -0,0 +1,70 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+from spdb.c_lib.ndlib import XYZMorton
+
+
+def get_cuboid_range(resolution, corner, extent):
+    """Get the cuboid indices that intersect a region
+
+    Args:
+        resolution (int): Resolution level of the region
+        corner ((int, int, int)): X, Y, Z corner of the region in voxels
+        extent ((int, int, int)): X, Y, Z extent of the region in voxels
+
+    Returns:
+        (list(range)): The X, Y and Z ranges of cuboid indices touched by the region
+    """
+    cube_dim = CUBOIDSIZE[resolution]
+    return [range(corner[i] // cube_dim[i], (corner[i] + extent[i] - 1) // cube_dim[i] + 1) for i in range(3)]
+
+
+def get_region_cuboids(resolution, corner, extent):
+    """Split a region into the parts that fall in each cuboid
+
+    Args:
+        resolution (int): Resolution level of the region
+        corner ((int, int, int)): X, Y, Z corner of the region in voxels
+        extent ((int, int, int)): X, Y, Z extent of the region in voxels
+
+    Returns:
+        (generator(((int, int, int), (int, int, int), (int, int, int), bool))): X, Y, Z index of each cuboid, the
+            corner and extent of the region inside it and if the region covers the whole cuboid
+    """
+    cube_dim = CUBOIDSIZE[resolution]
+    stop = [corner[i] + extent[i] for i in range(3)]
+    x_rng, y_rng, z_rng = get_cuboid_range(resolution, corner, extent)
+    for z in z_rng:
+        for y in y_rng:
+            for x in x_rng:
+                cuboid = (x, y, z)
+                start = [max(corner[i], cuboid[i] * cube_dim[i]) for i in range(3)]
+                end = [min(stop[i], (cuboid[i] + 1) * cube_dim[i]) for i in range(3)]
+                sub_extent = tuple(end[i] - start[i] for i in range(3))
+                yield cuboid, tuple(start), sub_extent, sub_extent == tuple(cube_dim)
+
+
+def get_morton_ids(resolution, corner, extent):
+    """Get the morton ids of all cuboids that intersect a region
+
+    Args:
+        resolution (int): Resolution level of the region
+        corner ((int, int, int)): X, Y, Z corner of the region in voxels
+        extent ((int, int, int)): X, Y, Z extent of the region in voxels
+
+    Returns:
+        (list(int)): Morton ids of the cuboids, ordered x fastest then y then z
+    """
+    x_rng, y_rng, z_rng = get_cuboid_range(resolution, corner, extent)
+    return [XYZMorton([x, y, z]) for z in z_rng for y in y_rng for x in x_rng]
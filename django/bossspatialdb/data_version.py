@@ -0,0 +1,103 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+
+from django.conf import settings
+
+from bossutils.logger import BossLogger
+from spdb.spatialdb.state import CacheStateDB
+
+
+class DataVersion:
+    """
+    Version number of a channel's data, changed every time the data is changed
+
+    Versions are kept in the cache state database, which is not subject to cache eviction. A version that is missing
+    anyway starts from the current time in microseconds, so it never repeats a version handed out before.
+    """
+
+    def __init__(self, state_conf):
+        """
+        Args:
+            state_conf (dict): STATEIO settings used to connect to the cache state database
+        """
+        self.client = CacheStateDB(state_conf).status_client
+
+    @staticmethod
+    def get_key(lookup_key):
+        return "DATA-VERSION&{}".format(lookup_key)
+
+    def get(self, lookup_key):
+        """Get the data version of a channel
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+
+        Returns:
+            (int, float): The version and the time it was set
+        """
+        key = self.get_key(lookup_key)
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.hsetnx(key, "version", int(now * 1000000))
+        pipe.hsetnx(key, "modified", now)
+        pipe.hmget(key, "version", "modified")
+        version, modified = pipe.execute()[-1]
+        return int(version), float(modified)
+
+    def bump(self, lookup_key):
+        """Change the data version of a channel after its data changed
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+
+        Returns:
+            (int): The new version
+        """
+        key = self.get_key(lookup_key)
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.hsetnx(key, "version", int(now * 1000000))
+        pipe.hincrby(key, "version", 1)
+        pipe.hset(key, "modified", now)
+        return int(pipe.execute()[1])
+
+
+def get_data_version(lookup_key):
+    """Get the data version of a channel
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+
+    Returns:
+        (int, float): The version and the time it was set
+    """
+    return DataVersion(settings.STATEIO_CONFIG).get(lookup_key)
+
+
+def bump_data_version(lookup_key):
+    """Change the data version of a channel after its data changed
+
+    Failures are logged rather than raised, so they do not fail the write that changed the data.
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+
+    Returns:
+        None
+    """
+    try:
+        DataVersion(settings.STATEIO_CONFIG).bump(lookup_key)
+    except Exception:
+        BossLogger().logger.exception("Problem changing the data version of {}".format(lookup_key))
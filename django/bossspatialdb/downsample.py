@@ -0,0 +1,232 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.conf import settings
+
+from bossutils.logger import BossLogger
+
+from bosscore.error import BossError, ErrorCodes
+from bosscore.models import Channel
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from .cache_index import CuboidCacheIndex
+from .cuboids import get_cuboid_range
+from .data_version import bump_data_version
+from .id_cache import clear_cuboid_ids
+from .progress import JobProgress
+from .signals import downsample_finished
+
+# Keys of the bounding box accepted when starting a downsample
+DOWNSAMPLE_REGION_KEYS = ('x_start', 'x_stop', 'y_start', 'y_stop', 'z_start', 'z_stop')
+
+
+def get_channel_lookup_key(channel_obj):
+    """Build the lookup key of a channel model instance
+
+    Args:
+        channel_obj (bosscore.models.Channel): Channel instance
+
+    Returns:
+        (str): The channel's lookup key
+    """
+    experiment = channel_obj.experiment
+    return "{}&{}&{}".format(experiment.collection.id, experiment.id, channel_obj.id)
+
+
+def update_downsample_status(channel_obj, sfn_status):
+    """Apply the status of a channel's downsample step function to the channel
+
+    Args:
+        channel_obj (bosscore.models.Channel): Channel that is being downsampled
+        sfn_status (str): Status of the step function execution
+
+    Returns:
+        (str): The channel's downsample status after the update
+    """
+    if channel_obj.downsample_status != "IN_PROGRESS":
+        return channel_obj.downsample_status
+
+    if sfn_status == "SUCCEEDED":
+        # Change to DOWNSAMPLED. The status poller and the views can both see the execution finish, so only the
+        # one whose conditional update wins clears the cache and announces the downsample
+        if not transition_downsample_status(channel_obj, "DOWNSAMPLED"):
+            return channel_obj.downsample_status
+
+        # DP NOTE: This code should be moved to spdb when change
+        #          tracking is added to automatically calculate
+        #          frame extents for the user
+        # DP NOTE: Clear the cache of any cubes for the channel
+        #          This is to prevent serving stale data after
+        #          (re)downsampling
+        log = BossLogger().logger
+        lookup_key = get_channel_lookup_key(channel_obj)
+        log.debug("Clearing cache of {} cubes".format(lookup_key))
+        try:
+            cache_index = CuboidCacheIndex(settings.KVIO_SETTINGS)
+            cache_index.clear_async(lookup_key, channel_obj.experiment.num_hierarchy_levels)
+        except Exception as ex:
+            log.exception("Problem clearing cache after downsample finished")
+
+        # The downsampled levels changed, so responses cached by clients are stale
+        bump_data_version(lookup_key)
+        clear_cuboid_ids(lookup_key)
+
+        # Levels the workers did not report on are done as well
+        try:
+            JobProgress(settings.KVIO_SETTINGS, lookup_key).finish()
+        except Exception:
+            log.exception("Problem marking the downsample progress of {} finished".format(lookup_key))
+
+        downsample_finished.send(sender=Channel, channel=channel_obj)
+
+    elif sfn_status == "FAILED" or sfn_status == "TIMED_OUT":
+        # Change status to FAILED
+        transition_downsample_status(channel_obj, "FAILED")
+
+    return channel_obj.downsample_status
+
+
+def transition_downsample_status(channel_obj, status):
+    """Move a channel out of IN_PROGRESS only if no other process has done so already
+
+    Args:
+        channel_obj (bosscore.models.Channel): Channel that is being downsampled
+        status (str): New downsample status
+
+    Returns:
+        (bool): True if this call made the transition. The channel instance holds the stored status either way
+    """
+    updated = Channel.objects.filter(id=channel_obj.id, downsample_status="IN_PROGRESS") \
+        .update(downsample_status=status)
+    if updated:
+        channel_obj.downsample_status = status
+    else:
+        channel_obj.refresh_from_db(fields=["downsample_status"])
+    return bool(updated)
+
+
+def get_level_region(resource, resolution, start, stop, iso=False):
+    """Scale a region given in base resolution voxels to a resolution level
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the channel
+        resolution (int): Resolution level to scale to
+        start ((int, int, int)): X, Y, Z start of the region at resolution 0
+        stop ((int, int, int)): X, Y, Z stop of the region at resolution 0
+        iso (bool): Flag indicating if the region is scaled to the isotropic level
+
+    Returns:
+        ((int, int, int), (int, int, int)): The corner and extent of the region at the resolution level
+    """
+    voxel_dims = resource.get_downsampled_voxel_dims(iso=iso)
+    scale = [int(round(voxel_dims[resolution][i] / voxel_dims[0][i])) for i in range(3)]
+    corner = [start[i] // scale[i] for i in range(3)]
+    extent = [-(-stop[i] // scale[i]) - corner[i] for i in range(3)]
+    return corner, extent
+
+
+def get_region_alignment(resource):
+    """Get the alignment, in resolution 0 voxels, of the cuboids of a channel's base resolution
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the channel
+
+    Returns:
+        ([int, int, int]): X, Y, Z alignment
+    """
+    base_resolution = int(resource.get_channel().base_resolution)
+    voxel_dims = resource.get_downsampled_voxel_dims()
+    scale = [int(round(voxel_dims[base_resolution][i] / voxel_dims[0][i])) for i in range(3)]
+    return [CUBOIDSIZE[base_resolution][i] * scale[i] for i in range(3)]
+
+
+def get_downsample_region(resource, region):
+    """Validate a requested downsample region and snap it outwards to the cuboids of the base resolution
+
+    Each coarser level is not snapped here. It only rewrites the cuboids its scaled copy of the region touches, see
+    get_downsample_totals(), so a small region stays small at every level.
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the channel being downsampled
+        region (dict): x_start, x_stop, y_start, y_stop, z_start and z_stop in resolution 0 voxels, or an empty dict
+                       for the whole coordinate frame
+
+    Returns:
+        ((int, int, int), (int, int, int)): X, Y, Z start and stop of the region to downsample
+
+    Raises:
+        BossError: If the region is incomplete, invalid or outside of the coordinate frame
+    """
+    coord_frame = resource.get_coord_frame()
+    frame_start = [coord_frame.x_start, coord_frame.y_start, coord_frame.z_start]
+    frame_stop = [coord_frame.x_stop, coord_frame.y_stop, coord_frame.z_stop]
+    if not region:
+        return tuple(frame_start), tuple(frame_stop)
+
+    missing = [key for key in DOWNSAMPLE_REGION_KEYS if key not in region]
+    if missing:
+        raise BossError("Invalid downsample region {}. A region must give all of {}".format(
+            region, ", ".join(DOWNSAMPLE_REGION_KEYS)), ErrorCodes.INVALID_ARGUMENT)
+
+    start = []
+    stop = []
+    for i, axis in enumerate(('x', 'y', 'z')):
+        try:
+            start.append(int(region['{}_start'.format(axis)]))
+            stop.append(int(region['{}_stop'.format(axis)]))
+        except (TypeError, ValueError):
+            raise BossError("Invalid downsample region {}. Region bounds must be integers".format(region),
+                            ErrorCodes.INVALID_ARGUMENT)
+
+        if start[i] >= stop[i] or start[i] < frame_start[i] or stop[i] > frame_stop[i]:
+            raise BossError("Invalid downsample region {}. The {} range {}:{} must be within the coordinate frame "
+                            "{}:{}".format(region, axis, start[i], stop[i], frame_start[i], frame_stop[i]),
+                            ErrorCodes.INVALID_ARGUMENT)
+
+    # Snap to the base resolution's cuboid boundaries, without leaving the frame
+    alignment = get_region_alignment(resource)
+    start = [max(frame_start[i], (start[i] // alignment[i]) * alignment[i]) for i in range(3)]
+    stop = [min(frame_stop[i], -(-stop[i] // alignment[i]) * alignment[i]) for i in range(3)]
+
+    return tuple(start), tuple(stop)
+
+
+def get_downsample_totals(resource, start, stop):
+    """Count the cuboids a downsample writes at each resolution level
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the channel being downsampled
+        start ((int, int, int)): X, Y, Z start of the downsampled region at resolution 0
+        stop ((int, int, int)): X, Y, Z stop of the downsampled region at resolution 0
+
+    Returns:
+        (dict): Number of cuboids keyed by resolution level. The isotropic cuboids an anisotropic experiment gets above
+                its isotropic level are keyed "iso-<level>"
+    """
+    base_resolution = int(resource.get_channel().base_resolution)
+    experiment = resource.get_experiment()
+    num_hierarchy_levels = int(experiment.num_hierarchy_levels)
+
+    levels = [(resolution, False) for resolution in range(base_resolution + 1, num_hierarchy_levels)]
+    if experiment.hierarchy_method == "anisotropic":
+        iso_level = int(resource.get_isotropic_level())
+        levels += [(resolution, True) for resolution in range(max(base_resolution, iso_level) + 1,
+                                                              num_hierarchy_levels)]
+
+    totals = {}
+    for resolution, iso in levels:
+        corner, extent = get_level_region(resource, resolution, start, stop, iso=iso)
+        x_rng, y_rng, z_rng = get_cuboid_range(resolution, corner, extent)
+        totals["iso-{}".format(resolution) if iso else resolution] = len(x_rng) * len(y_rng) * len(z_rng)
+    return totals
@@ -0,0 +1,98 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from bosscore.models import Experiment, CoordinateFrame
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+
+def get_geometry_cache_key(experiment_id, iso=False):
+    """Get the cache key of an experiment's downsample geometry
+
+    Args:
+        experiment_id (int): Id of the experiment
+        iso (bool): Flag indicating if the isotropic geometry is cached
+
+    Returns:
+        (str): The cache key
+    """
+    return "DOWNSAMPLE-GEOMETRY&{}&{}".format(experiment_id, "ISO" if iso else "ANISO")
+
+
+def get_downsample_geometry(resource, iso=False):
+    """Get the voxel size, extent and cuboid size of every resolution level of a resource's experiment
+
+    The geometry only depends on the experiment and its coordinate frame, so it is cached per experiment until
+    either is updated or DOWNSAMPLE_GEOMETRY_CACHE_TIMEOUT seconds pass.
+
+    Args:
+        resource (spdb.project.BossResource): Data model info based on the request or target resource
+        iso (bool): Flag indicating if the isotropic geometry should be returned
+
+    Returns:
+        (dict): The num_hierarchy_levels, and the voxel_size, extent and cuboid_size keyed by resolution level
+    """
+    _, exp_id, _ = resource.get_lookup_key().split("&")
+    key = get_geometry_cache_key(exp_id, iso)
+    geometry = cache.get(key)
+    if geometry is not None:
+        return geometry
+
+    num_hierarchy_levels = resource.get_experiment().num_hierarchy_levels
+
+    voxel_size = {}
+    for res, dims in enumerate(resource.get_downsampled_voxel_dims(iso=iso)):
+        voxel_size["{}".format(res)] = dims
+
+    extent = {}
+    for res, dims in enumerate(resource.get_downsampled_extent_dims(iso=iso)):
+        extent["{}".format(res)] = dims
+
+    cuboid_size = {}
+    for res in range(0, num_hierarchy_levels):
+        cuboid_size["{}".format(res)] = CUBOIDSIZE[res]
+
+    geometry = {"num_hierarchy_levels": num_hierarchy_levels,
+                "voxel_size": voxel_size,
+                "extent": extent,
+                "cuboid_size": cuboid_size}
+    cache.set(key, geometry, settings.DOWNSAMPLE_GEOMETRY_CACHE_TIMEOUT)
+    return geometry
+
+
+def clear_downsample_geometry(experiment_id):
+    """Remove an experiment's cached geometry
+
+    Args:
+        experiment_id (int): Id of the experiment
+
+    Returns:
+        None
+    """
+    cache.delete_many([get_geometry_cache_key(experiment_id, False), get_geometry_cache_key(experiment_id, True)])
+
+
+@receiver(post_save, sender=Experiment)
+def experiment_saved(sender, instance, **kwargs):
+    clear_downsample_geometry(instance.id)
+
+
+@receiver(post_save, sender=CoordinateFrame)
+def coord_frame_saved(sender, instance, **kwargs):
+    for experiment in instance.exps.all():
+        clear_downsample_geometry(experiment.id)
@@ -0,0 +1,161 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import numpy as np
+from django.conf import settings
+
+from spdb.spatialdb.rediskvio import RedisKVIO
+from spdb.c_lib.ndlib import XYZMorton
+from bossutils.logger import BossLogger
+
+from .cuboids import get_cuboid_range
+
+
+class CuboidIdCache:
+    """
+    Sorted set of the annotation ids in each cuboid of a channel, kept in Redis
+
+    Id sets are computed lazily by the first region query that scans a cuboid. Each channel has one Redis hash,
+    with a field per resolution, time sample and cuboid holding the packed uint64 ids, so writes can drop the
+    cuboids they touch and a channel can be dropped in one call.
+    """
+
+    def __init__(self, kv_conf):
+        """
+        Args:
+            kv_conf (dict): KVIO settings used to connect to the cache
+        """
+        self.client = RedisKVIO(kv_conf).cache_client
+
+    @staticmethod
+    def get_cache_key(lookup_key):
+        return "CUBOID-IDS&{}".format(lookup_key)
+
+    @staticmethod
+    def get_field(resolution, t_idx, cuboid):
+        """Get the hash field of a cuboid
+
+        Args:
+            resolution (int): Resolution level of the cuboid
+            t_idx (int): Time sample
+            cuboid ((int, int, int)): X, Y, Z index of the cuboid
+
+        Returns:
+            (str)
+        """
+        return "{}&{}&{}".format(resolution, t_idx, XYZMorton(list(cuboid)))
+
+    def get_many(self, lookup_key, resolution, t_idx, cuboids):
+        """Get the id sets of several cuboids in one round trip
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            resolution (int): Resolution level of the cuboids
+            t_idx (int): Time sample
+            cuboids (list((int, int, int))): X, Y, Z indices of the cuboids
+
+        Returns:
+            (list(numpy.ndarray|None)): Sorted uint64 ids of each cuboid, or None if it is not cached
+        """
+        if not cuboids:
+            return []
+        fields = [self.get_field(resolution, t_idx, cuboid) for cuboid in cuboids]
+        values = self.client.hmget(self.get_cache_key(lookup_key), fields)
+        return [np.frombuffer(value, dtype='<u8').astype(np.uint64) if value is not None else None
+                for value in values]
+
+    def put_many(self, lookup_key, resolution, t_idx, id_sets):
+        """Store the id sets of several cuboids
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            resolution (int): Resolution level of the cuboids
+            t_idx (int): Time sample
+            id_sets (dict): Sorted, unique uint64 ids keyed by X, Y, Z cuboid index
+
+        Returns:
+            None
+        """
+        if not id_sets:
+            return
+        key = self.get_cache_key(lookup_key)
+        mapping = {self.get_field(resolution, t_idx, cuboid): np.asarray(ids, dtype='<u8').tobytes()
+                   for cuboid, ids in id_sets.items()}
+        pipe = self.client.pipeline()
+        pipe.hmset(key, mapping)
+        pipe.expire(key, settings.CUBOID_IDS_CACHE_TTL)
+        pipe.execute()
+
+    def invalidate(self, lookup_key, resolution, corner, extent, time_range):
+        """Drop the id sets of the cuboids a write touched
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            resolution (int): Resolution level of the write
+            corner ((int, int, int)): X, Y, Z corner of the written region
+            extent ((int, int, int)): X, Y, Z extent of the written region
+            time_range ([int, int]): Time range of the written region
+
+        Returns:
+            None
+        """
+        x_rng, y_rng, z_rng = get_cuboid_range(resolution, corner, extent)
+        fields = [self.get_field(resolution, t_idx, (x, y, z))
+                  for t_idx in range(*time_range) for z in z_rng for y in y_rng for x in x_rng]
+        if fields:
+            self.client.hdel(self.get_cache_key(lookup_key), *fields)
+
+    def clear(self, lookup_key):
+        """Drop every id set of a channel
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+
+        Returns:
+            None
+        """
+        self.client.delete(self.get_cache_key(lookup_key))
+
+
+def invalidate_cuboid_ids(lookup_key, resolution, corner, extent, time_range):
+    """Drop the cached id sets of a written region without failing the calling request
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+        resolution (int): Resolution level of the write
+        corner ((int, int, int)): X, Y, Z corner of the written region
+        extent ((int, int, int)): X, Y, Z extent of the written region
+        time_range ([int, int]): Time range of the written region
+
+    Returns:
+        None
+    """
+    try:
+        CuboidIdCache(settings.KVIO_SETTINGS).invalidate(lookup_key, resolution, corner, extent, time_range)
+    except Exception:
+        BossLogger().logger.exception("Problem invalidating cuboid id sets of {}".format(lookup_key))
+
+
+def clear_cuboid_ids(lookup_key):
+    """Drop every cached id set of a channel without failing the caller
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+
+    Returns:
+        None
+    """
+    try:
+        CuboidIdCache(settings.KVIO_SETTINGS).clear(lookup_key)
+    except Exception:
+        BossLogger().logger.exception("Problem clearing cuboid id sets of {}".format(lookup_key))
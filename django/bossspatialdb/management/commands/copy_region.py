@@ -0,0 +1,52 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.core.management.base import BaseCommand, CommandError
+
+from bossspatialdb.resource import get_channel_resource
+from bossspatialdb.region_copy import copy_region
+
+
+def parse_range(value):
+    """Parse a start:stop range argument"""
+    try:
+        start, stop = (int(bound) for bound in value.split(":"))
+    except ValueError:
+        raise CommandError("Invalid range {}. Ranges are given as start:stop".format(value))
+    return start, stop
+
+
+class Command(BaseCommand):
+    help = "Copy a region from one channel to another. Progress is reported by the destination's copy service"
+
+    def add_arguments(self, parser):
+        for role in ('source', 'destination'):
+            parser.add_argument('{}_collection'.format(role), help="Collection name of the {}".format(role))
+            parser.add_argument('{}_experiment'.format(role), help="Experiment name of the {}".format(role))
+            parser.add_argument('{}_channel'.format(role), help="Channel name of the {}".format(role))
+        parser.add_argument('resolution', type=int, help="Resolution level of the region")
+        parser.add_argument('x_range', type=parse_range, help="X start:stop of the region")
+        parser.add_argument('y_range', type=parse_range, help="Y start:stop of the region")
+        parser.add_argument('z_range', type=parse_range, help="Z start:stop of the region")
+        parser.add_argument('t_range', type=parse_range, help="Time start:stop of the region")
+        parser.add_argument('--iso', action='store_true', default=False, help="Copy the isotropic cuboids")
+
+    def handle(self, *args, **options):
+        source = get_channel_resource(options['source_collection'], options['source_experiment'],
+                                      options['source_channel'])
+        destination = get_channel_resource(options['destination_collection'], options['destination_experiment'],
+                                           options['destination_channel'])
+        ranges = [options['{}_range'.format(axis)] for axis in ('x', 'y', 'z')]
+        summary = copy_region(source, destination, options['resolution'], [start for start, _ in ranges],
+                              [stop - start for start, stop in ranges], list(options['t_range']), iso=options['iso'])
+        self.stdout.write("Copied {cuboids_copied} cuboids, {voxels_copied} voxels".format(**summary))
@@ -0,0 +1,181 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+import uuid
+from contextlib import contextmanager
+
+import blosc
+import numpy as np
+from django.conf import settings
+
+from bosscore.error import BossError, ErrorCodes
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+from spdb.c_lib.ndlib import XYZMorton
+
+from .cache_index import register_cached_cuboids
+
+# Prefix of the keys that serialise the rewrites of a cuboid
+CUBOID_LOCK_PREFIX = "CUBOID-LOCK&"
+
+
+class CuboidRewriter:
+    """
+    Replaces whole cuboids, so voxels can be set to zero
+
+    SpatialDB.write_cuboid only merges the non-zero voxels of a write into the stored cuboid, so it can't clear voxels
+    or overwrite them with zeros. A rewriter puts the new cuboid straight into the object store, replacing the stored
+    cuboid, and into the cache, so reads see it at once. Rewrites of a cuboid are serialised by a lock in the cache, so
+    two requests reading, changing and writing back the same cuboid can't lose each other's changes. A write still
+    waiting in the SpatialDB's write buffer is merged over the replaced cuboid when it is flushed, so callers that
+    must not be undone by one wait for the cuboids' pending writes first, see PendingWrites.
+    """
+
+    def __init__(self, spdb):
+        """
+        Args:
+            spdb (spdb.spatialdb.SpatialDB): Interface to the cache and the object store. Not shared between threads
+        """
+        self.spdb = spdb
+        self.client = spdb.kvio.cache_client
+
+    @staticmethod
+    def get_lock_key(resource, resolution, cuboid, iso=False):
+        return "{}{}{}&{}&{}".format(CUBOID_LOCK_PREFIX, "ISO&" if iso else "", resource.get_lookup_key(), resolution,
+                                     XYZMorton(list(cuboid)))
+
+    @contextmanager
+    def lock(self, resource, resolution, cuboid, iso=False):
+        """Hold the rewrite lock of a cuboid, for every time sample
+
+        The lock expires after CUBOID_LOCK_TTL seconds, so a crashed request can't hold it forever.
+
+        Args:
+            resource (spdb.project.BossResource): Data model info of the channel
+            resolution (int): Resolution level of the cuboid
+            cuboid ((int, int, int)): X, Y, Z index of the cuboid
+            iso (bool): Flag indicating if the cuboid is isotropic
+
+        Raises:
+            BossError: If another request held the lock for longer than CUBOID_LOCK_WAIT seconds
+        """
+        lock_key = self.get_lock_key(resource, resolution, cuboid, iso)
+        token = uuid.uuid4().hex
+        deadline = time.time() + settings.CUBOID_LOCK_WAIT
+        while not self.client.set(lock_key, token, nx=True, ex=settings.CUBOID_LOCK_TTL):
+            if time.time() > deadline:
+                raise BossError("Cuboid {} is being rewritten by another request. Try again later".format(cuboid),
+                                ErrorCodes.INVALID_STATE)
+            time.sleep(0.05)
+
+        try:
+            yield
+        finally:
+            def release(pipe):
+                owner = pipe.get(lock_key)
+                if isinstance(owner, bytes):
+                    owner = owner.decode()
+                if owner == token:
+                    pipe.multi()
+                    pipe.delete(lock_key)
+
+            self.client.transaction(release, lock_key)
+
+    def put(self, resource, resolution, cuboid, t_idx, data, iso=False):
+        """Replace one time sample of a cuboid in the object store and the cache. The caller holds the lock
+
+        Args:
+            resource (spdb.project.BossResource): Data model info of the channel
+            resolution (int): Resolution level of the cuboid
+            cuboid ((int, int, int)): X, Y, Z index of the cuboid
+            t_idx (int): Time sample
+            data (numpy.ndarray): Whole cuboid, indexed [z, y, x]
+            iso (bool): Flag indicating if the cuboid is isotropic
+
+        Returns:
+            None
+        """
+        self.put_bytes(resource, resolution, cuboid, t_idx, blosc.pack_array(np.ascontiguousarray(data)), iso)
+
+    def put_bytes(self, resource, resolution, cuboid, t_idx, cube_bytes, iso=False):
+        """Replace one time sample of a cuboid with already compressed data. The caller holds the lock
+
+        Args:
+            resource (spdb.project.BossResource): Data model info of the channel
+            resolution (int): Resolution level of the cuboid
+            cuboid ((int, int, int)): X, Y, Z index of the cuboid
+            t_idx (int): Time sample
+            cube_bytes (bytes): Whole cuboid, indexed [z, y, x] and packed with blosc.pack_array
+            iso (bool): Flag indicating if the cuboid is isotropic
+
+        Returns:
+            None
+        """
+        morton = XYZMorton(list(cuboid))
+        object_key = self.spdb.objectio.generate_object_key(resource, resolution, t_idx, morton, iso=iso)
+        self.spdb.objectio.put_objects([object_key], [cube_bytes])
+        self.spdb.objectio.add_cuboid_to_index(object_key)
+        if not iso and not resource.get_channel().is_image():
+            # Index the ids now in the cuboid, as flushing a buffered write would
+            self.spdb.objectio.update_id_indices(resource, resolution, [object_key], [cube_bytes])
+
+        cache_key = self.spdb.kvio.generate_cached_cuboid_keys(resource, resolution, [t_idx], [morton], iso=iso)[0]
+        self.client.set(cache_key, cube_bytes)
+
+    def replace(self, resource, resolution, cuboid, time_range, data, iso=False):
+        """Replace a cuboid without reading it
+
+        Args:
+            resource (spdb.project.BossResource): Data model info of the channel
+            resolution (int): Resolution level of the cuboid
+            cuboid ((int, int, int)): X, Y, Z index of the cuboid
+            time_range ([int, int]): Time samples to replace
+            data (numpy.ndarray): Whole cuboid, indexed [t, z, y, x]
+            iso (bool): Flag indicating if the cuboid is isotropic
+
+        Returns:
+            None
+        """
+        with self.lock(resource, resolution, cuboid, iso):
+            for i, t_idx in enumerate(range(*time_range)):
+                self.put(resource, resolution, cuboid, t_idx, data[i], iso)
+
+    def rewrite(self, resource, resolution, cuboid, time_range, update, iso=False):
+        """Read a whole cuboid, change it and write it back whole
+
+        The cuboid is read through the SpatialDB, so it is paged in if needed and includes buffered writes.
+
+        Args:
+            resource (spdb.project.BossResource): Data model info of the channel
+            resolution (int): Resolution level of the cuboid
+            cuboid ((int, int, int)): X, Y, Z index of the cuboid
+            time_range ([int, int]): Time samples to rewrite
+            update (callable): Changes the cuboid, indexed [t, z, y, x], in place and returns the number of voxels
+                               changed. Nothing is written if it returns 0
+            iso (bool): Flag indicating if the cuboid is isotropic
+
+        Returns:
+            (int): Number of voxels changed
+        """
+        cube_dim = CUBOIDSIZE[resolution]
+        corner = [cuboid[i] * cube_dim[i] for i in range(3)]
+        with self.lock(resource, resolution, cuboid, iso):
+            data = np.array(self.spdb.cutout(resource, corner, list(cube_dim), resolution, list(time_range),
+                                             iso=iso).data)
+            register_cached_cuboids(resource, resolution, corner, list(cube_dim), list(time_range), iso=iso)
+            count = update(data)
+            if count:
+                for i, t_idx in enumerate(range(*time_range)):
+                    self.put(resource, resolution, cuboid, t_idx, data[i], iso)
+        return count
@@ -0,0 +1,140 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+
+from django.conf import settings
+
+from bosscore.error import BossError, ErrorCodes
+from bossutils.logger import BossLogger
+
+from spdb.spatialdb.state import CacheStateDB
+from spdb.c_lib.ndlib import XYZMorton
+
+from .cuboids import get_region_cuboids
+
+
+class PendingWrites:
+    """
+    Cuboids written through the SpatialDB write buffer that may not be flushed to the object store yet
+
+    SpatialDB.write_cuboid only buffers a write. The flush merges it into the stored cuboid later, so it would be merged
+    back over a cuboid that was replaced in the meantime. Buffered writes are recorded here for WRITE_BUFFER_FLUSH_TIME
+    seconds, one key per cuboid and time sample in the cache state database. A cuboid is also pending while it is in
+    the SpatialDB's page out set, i.e. being flushed.
+    """
+
+    def __init__(self, state_conf):
+        """
+        Args:
+            state_conf (dict): STATEIO settings used to connect to the cache state database
+        """
+        self.client = CacheStateDB(state_conf).status_client
+
+    @staticmethod
+    def get_cache_key(lookup_key, resolution, t_idx, morton, iso=False):
+        return "PENDING-WRITE&{}{}&{}&{}&{}".format("ISO&" if iso else "", lookup_key, resolution, t_idx, morton)
+
+    def add(self, resource, resolution, corner, extent, time_range, iso=False):
+        """Record a buffered write of a region
+
+        Args:
+            resource (spdb.project.BossResource): Data model info of the written channel
+            resolution (int): Resolution level of the write
+            corner ((int, int, int)): X, Y, Z corner of the region
+            extent ((int, int, int)): X, Y, Z extent of the region
+            time_range ([int, int]): Time range of the write
+            iso (bool): Flag indicating if the isotropic cuboids were written
+
+        Returns:
+            None
+        """
+        lookup_key = resource.get_lookup_key()
+        pipe = self.client.pipeline()
+        for cuboid, _, _, _ in get_region_cuboids(resolution, corner, extent):
+            morton = XYZMorton(list(cuboid))
+            for t_idx in range(*time_range):
+                pipe.set(self.get_cache_key(lookup_key, resolution, t_idx, morton, iso), 1,
+                         ex=settings.WRITE_BUFFER_FLUSH_TIME)
+        pipe.execute()
+
+    def get_pending(self, resource, resolution, cuboids, time_range, iso=False):
+        """Find which cuboids may still have a buffered write waiting to be flushed, in one round trip
+
+        Args:
+            resource (spdb.project.BossResource): Data model info of the channel
+            resolution (int): Resolution level of the cuboids
+            cuboids (list((int, int, int))): X, Y, Z indices of the cuboids
+            time_range ([int, int]): Time range to check
+            iso (bool): Flag indicating if the cuboids are isotropic
+
+        Returns:
+            (list((int, int, int))): The pending cuboids
+        """
+        lookup_key = resource.get_lookup_key()
+        page_out_key = "PAGE-OUT&{}&{}".format(lookup_key, resolution)
+        pipe = self.client.pipeline()
+        for cuboid in cuboids:
+            morton = XYZMorton(list(cuboid))
+            for t_idx in range(*time_range):
+                pipe.exists(self.get_cache_key(lookup_key, resolution, t_idx, morton, iso))
+                pipe.sismember(page_out_key, "{}&{}".format(t_idx, morton))
+        found = pipe.execute()
+
+        per_cuboid = 2 * (time_range[1] - time_range[0])
+        return [cuboid for i, cuboid in enumerate(cuboids) if any(found[i * per_cuboid:(i + 1) * per_cuboid])]
+
+    def wait(self, resource, resolution, cuboids, time_range, iso=False):
+        """Wait for the buffered writes of cuboids to be flushed
+
+        Args:
+            resource (spdb.project.BossResource): Data model info of the channel
+            resolution (int): Resolution level of the cuboids
+            cuboids (list((int, int, int))): X, Y, Z indices of the cuboids
+            time_range ([int, int]): Time range to check
+            iso (bool): Flag indicating if the cuboids are isotropic
+
+        Returns:
+            None
+
+        Raises:
+            BossError: If a cuboid still had a pending write after WRITE_BUFFER_WAIT seconds
+        """
+        deadline = time.time() + settings.WRITE_BUFFER_WAIT
+        pending = self.get_pending(resource, resolution, cuboids, time_range, iso)
+        while pending:
+            if time.time() > deadline:
+                raise BossError("{} cuboids of the region have writes that are not flushed yet. Try again later".format(
+                    len(pending)), ErrorCodes.INVALID_STATE)
+            time.sleep(0.5)
+            pending = self.get_pending(resource, resolution, pending, time_range, iso)
+
+
+def record_buffered_write(resource, resolution, corner, extent, time_range, iso=False):
+    """Record a write made through the SpatialDB write buffer, without failing the write
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the written channel
+        resolution (int): Resolution level of the write
+        corner ((int, int, int)): X, Y, Z corner of the region
+        extent ((int, int, int)): X, Y, Z extent of the region
+        time_range ([int, int]): Time range of the write
+        iso (bool): Flag indicating if the isotropic cuboids were written
+
+    Returns:
+        None
+    """
+    try:
+        PendingWrites(settings.STATEIO_CONFIG).add(resource, resolution, corner, extent, time_range, iso=iso)
+    except Exception:
+        BossLogger().logger.exception("Problem recording the buffered write of {}".format(resource.get_lookup_key()))
@@ -0,0 +1,171 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+
+from spdb.spatialdb.rediskvio import RedisKVIO
+
+
+class JobProgress:
+    """
+    Per level progress of a long running job, kept in a Redis hash so the workers and the views share it
+
+    The job is started with the number of cuboids to process at each level. Workers call record(), or increment the
+    same hash fields, as they finish cuboids and readers get the completion, throughput and ETA of each level. Levels
+    no worker has reported on yet have no completion or ETA rather than a misleading 0%. finish() marks every level
+    done once the job is known to have succeeded and fail() records why it didn't.
+    """
+
+    def __init__(self, kv_conf, job_key):
+        """
+        Args:
+            kv_conf (dict): KVIO settings used to connect to the cache
+            job_key (str): Unique key of the job, e.g. the lookup key of the channel being processed
+        """
+        self.client = RedisKVIO(kv_conf).cache_client
+        self.key = "JOB-PROGRESS&{}".format(job_key)
+
+    def start(self, totals):
+        """Reset the progress of the job
+
+        Args:
+            totals (dict): Number of cuboids to process keyed by level
+
+        Returns:
+            None
+        """
+        pipe = self.client.pipeline()
+        pipe.delete(self.key)
+        for level, total in totals.items():
+            pipe.hset(self.key, "{}&cuboids_total".format(level), int(total))
+            pipe.hset(self.key, "{}&cuboids_done".format(level), 0)
+            pipe.hset(self.key, "{}&voxels_done".format(level), 0)
+        pipe.hset(self.key, "started", time.time())
+        pipe.execute()
+
+    def record(self, level, cuboids, voxels):
+        """Record work finished by a worker
+
+        Args:
+            level (int): Level the work was done at
+            cuboids (int): Number of cuboids finished
+            voxels (int): Number of voxels written
+
+        Returns:
+            None
+        """
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.hsetnx(self.key, "{}&start".format(level), now)
+        pipe.hincrby(self.key, "{}&cuboids_done".format(level), int(cuboids))
+        pipe.hincrby(self.key, "{}&voxels_done".format(level), int(voxels))
+        pipe.hset(self.key, "{}&updated".format(level), now)
+        pipe.execute()
+
+    def finish(self):
+        """Mark every level of the job as done
+
+        Returns:
+            None
+        """
+        fields = self.client.hgetall(self.key)
+        if not fields:
+            return
+        now = time.time()
+        pipe = self.client.pipeline()
+        for field, value in fields.items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            if field.endswith("&cuboids_total"):
+                pipe.hset(self.key, field.replace("&cuboids_total", "&cuboids_done"), value)
+        pipe.hset(self.key, "finished", now)
+        pipe.execute()
+
+    def fail(self, message):
+        """Record that the job failed, keeping the progress it made
+
+        Args:
+            message (str): What went wrong
+
+        Returns:
+            None
+        """
+        pipe = self.client.pipeline()
+        pipe.hset(self.key, "error", message)
+        pipe.hset(self.key, "failed", time.time())
+        pipe.execute()
+
+    def get_error(self):
+        """Get why the job failed
+
+        Returns:
+            (str|None): The message recorded by fail(), or None if the job has not failed
+        """
+        message = self.client.hget(self.key, "error")
+        if isinstance(message, bytes):
+            message = message.decode()
+        return message
+
+    def clear(self):
+        """Remove the progress of the job"""
+        self.client.delete(self.key)
+
+    def get(self):
+        """Get the progress of each level of the job
+
+        Returns:
+            (dict|None): Progress keyed by level, or None if the job was never started
+        """
+        raw = self.client.hgetall(self.key)
+        if not raw:
+            return None
+
+        fields = {}
+        for field, value in raw.items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            if isinstance(value, bytes):
+                value = value.decode()
+            fields[field] = value
+
+        now = time.time()
+        levels = {}
+        for field, value in fields.items():
+            if not field.endswith("&cuboids_total"):
+                continue
+            level = field.split("&")[0]
+            total = int(value)
+            done = int(fields.get("{}&cuboids_done".format(level), 0))
+            voxels = int(fields.get("{}&voxels_done".format(level), 0))
+            start = fields.get("{}&start".format(level))
+            updated = fields.get("{}&updated".format(level))
+
+            reported = updated is not None or "finished" in fields
+            progress = {"cuboids_total": total,
+                        "cuboids_done": done,
+                        "reported": reported,
+                        "percent_complete": (100.0 * done / total if total else 100.0) if reported else None,
+                        "voxels_per_sec": None,
+                        "eta_sec": None,
+                        "sec_since_update": None}
+
+            if start is not None and updated is not None:
+                elapsed = float(updated) - float(start)
+                if elapsed > 0 and done > 0:
+                    progress["voxels_per_sec"] = voxels / elapsed
+                    progress["eta_sec"] = max(total - done, 0) * elapsed / done
+                progress["sec_since_update"] = now - float(updated)
+
+            levels[level] = progress
+
+        return levels
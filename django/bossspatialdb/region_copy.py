@@ -0,0 +1,311 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import blosc
+import numpy as np
+from django.conf import settings
+
+from bosscore.error import BossError, ErrorCodes
+
+from spdb.spatialdb.spatialdb import SpatialDB, CUBOIDSIZE
+from spdb.c_lib.ndlib import XYZMorton
+
+from .cache_index import register_cached_cuboids
+from .cuboids import get_region_cuboids
+from .overwrite import CuboidRewriter
+from .pending_writes import PendingWrites
+from .progress import JobProgress
+from .retired_ids import RetiredIds, restore_written_ids
+from .writes import finish_write
+
+# Keys of the source channel in the body of a copy request
+COPY_SOURCE_KEYS = ('collection', 'experiment', 'channel')
+
+
+def get_copy_job_key(lookup_key):
+    """Get the progress job key of copies into a channel
+
+    Args:
+        lookup_key (str): Lookup key of the destination channel
+
+    Returns:
+        (str)
+    """
+    return "COPY&{}".format(lookup_key)
+
+
+def parse_copy_source(data):
+    """Get the source channel of a copy request
+
+    Args:
+        data (dict): Parsed body, with a "source" holding the collection, experiment and channel names
+
+    Returns:
+        (str, str, str): Collection, experiment and channel name of the source
+
+    Raises:
+        BossError: If the source is missing or incomplete
+    """
+    source = data.get("source") if isinstance(data, dict) else None
+    if not isinstance(source, dict) or not all(isinstance(source.get(key), str) and source[key]
+                                               for key in COPY_SOURCE_KEYS):
+        raise BossError("Copy requests must provide a source with a collection, experiment and channel",
+                        ErrorCodes.INVALID_POST_ARGUMENT)
+    return tuple(source[key] for key in COPY_SOURCE_KEYS)
+
+
+def check_copy_channels(source, destination, resolution, iso=False):
+    """Make sure a region can be copied between two channels voxel for voxel
+
+    Args:
+        source (spdb.project.BossResource): Data model info of the channel copied from
+        destination (spdb.project.BossResource): Data model info of the channel copied to
+        resolution (int): Resolution level of the copy
+        iso (bool): Flag indicating if the isotropic cuboids are copied
+
+    Returns:
+        None
+
+    Raises:
+        BossError: If the channels are the same, their data types differ or their geometry at the level differs
+    """
+    if source.get_lookup_key() == destination.get_lookup_key():
+        raise BossError("The source and destination of a copy must be different channels", ErrorCodes.INVALID_REQUEST)
+
+    if source.get_data_type() != destination.get_data_type():
+        raise BossError("Cannot copy {} data into a {} channel".format(source.get_data_type(),
+                                                                      destination.get_data_type()),
+                        ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+    # Channels of different experiments must share the frame and the scaling of the level
+    source_frame = source.get_coord_frame()
+    destination_frame = destination.get_coord_frame()
+    for axis in ('x', 'y', 'z'):
+        for bound in ('start', 'stop'):
+            attr = '{}_{}'.format(axis, bound)
+            if getattr(source_frame, attr) != getattr(destination_frame, attr):
+                raise BossError("The source and destination of a copy must have the same coordinate frame",
+                                ErrorCodes.DATA_DIMENSION_MISMATCH)
+
+    source_dims = source.get_downsampled_voxel_dims(iso=iso)
+    destination_dims = destination.get_downsampled_voxel_dims(iso=iso)
+    if list(source_dims[resolution]) != list(destination_dims[resolution]):
+        raise BossError("The source and destination of a copy have different voxel sizes at resolution {}".format(
+            resolution), ErrorCodes.DATA_DIMENSION_MISMATCH)
+
+
+def get_copy_parts(resolution, corner, extent):
+    """Get the cuboid parts of a region to copy
+
+    Args:
+        resolution (int): Resolution level of the region
+        corner ((int, int, int)): X, Y, Z corner of the region
+        extent ((int, int, int)): X, Y, Z extent of the region
+
+    Returns:
+        (list): Cuboid, corner, extent and full flag of each part, see get_region_cuboids()
+
+    Raises:
+        BossError: If the region covers more than COPY_MAX_CUBOIDS cuboids
+    """
+    parts = list(get_region_cuboids(resolution, corner, extent))
+    if len(parts) > settings.COPY_MAX_CUBOIDS:
+        raise BossError("Copies support at most {} cuboids. Reduce the region dimensions.".format(
+            settings.COPY_MAX_CUBOIDS), ErrorCodes.REQUEST_TOO_LARGE)
+    return parts
+
+
+def get_stored_cuboid(spdb, resource, resolution, cuboid, time_range, iso=False):
+    """Get the compressed time samples of a cuboid without decompressing them
+
+    Samples are read from the cache if they are cached, otherwise from the object store.
+
+    Args:
+        spdb (spdb.spatialdb.SpatialDB): Interface to the cache and the object store
+        resource (spdb.project.BossResource): Data model info of the channel
+        resolution (int): Resolution level of the cuboid
+        cuboid ((int, int, int)): X, Y, Z index of the cuboid
+        time_range ([int, int]): Time samples to read
+        iso (bool): Flag indicating if the cuboid is isotropic
+
+    Returns:
+        (list(bytes|None)): Blosc packed cuboid of each time sample, or None if it was never written
+    """
+    morton = XYZMorton(list(cuboid))
+    cache_keys = spdb.kvio.generate_cached_cuboid_keys(resource, resolution, list(range(*time_range)), [morton],
+                                                       iso=iso)
+    blobs = spdb.kvio.cache_client.mget(cache_keys)
+    missing = [i for i, blob in enumerate(blobs) if blob is None]
+    if missing:
+        stored, _ = spdb.objectio.cuboids_exist(cache_keys, missing)
+        for i in stored:
+            object_key = spdb.objectio.generate_object_key(resource, resolution, time_range[0] + i, morton, iso=iso)
+            blobs[i] = spdb.objectio.get_single_object(object_key)
+    return blobs
+
+
+def get_copy_command(source_names, destination_names, resolution, corner, extent, time_range, iso=False):
+    """Build the copy_region command line for a copy
+
+    Args:
+        source_names ((str, str, str)): Collection, experiment and channel name of the source
+        destination_names ((str, str, str)): Collection, experiment and channel name of the destination
+        resolution (int): Resolution level of the region
+        corner ((int, int, int)): X, Y, Z corner of the region
+        extent ((int, int, int)): X, Y, Z extent of the region
+        time_range ([int, int]): Time range of the region
+        iso (bool): Flag indicating if the isotropic cuboids should be copied
+
+    Returns:
+        (list(str)): Command line arguments
+    """
+    ranges = ["{}:{}".format(corner[i], corner[i] + extent[i]) for i in range(3)]
+    ranges.append("{}:{}".format(*time_range))
+    args = [sys.executable, "manage.py", "copy_region"] + list(source_names) + list(destination_names)
+    args += [str(resolution)] + ranges
+    if iso:
+        args.append("--iso")
+    return args
+
+
+def start_copy(source_names, destination_names, destination, resolution, corner, extent, time_range, iso=False):
+    """Start copying a region in a detached process
+
+    The copy's progress is started here, so it is reported as soon as the request returns, and the copy_region
+    management command does the work, see copy_region().
+
+    Args:
+        source_names ((str, str, str)): Collection, experiment and channel name of the source
+        destination_names ((str, str, str)): Collection, experiment and channel name of the destination
+        destination (spdb.project.BossResource): Data model info of the channel copied to
+        resolution (int): Resolution level of the region
+        corner ((int, int, int)): X, Y, Z corner of the region
+        extent ((int, int, int)): X, Y, Z extent of the region
+        time_range ([int, int]): Time range of the region
+        iso (bool): Flag indicating if the isotropic cuboids should be copied
+
+    Returns:
+        (int): Number of cuboids to copy
+
+    Raises:
+        BossError: If the region covers more than COPY_MAX_CUBOIDS cuboids
+    """
+    parts = get_copy_parts(resolution, corner, extent)
+    JobProgress(settings.KVIO_SETTINGS, get_copy_job_key(destination.get_lookup_key())).start({resolution: len(parts)})
+    args = get_copy_command(source_names, destination_names, resolution, corner, extent, time_range, iso=iso)
+    subprocess.Popen(args, cwd=os.path.dirname(settings.BASE_DIR), start_new_session=True)
+    return len(parts)
+
+
+def copy_region(source, destination, resolution, corner, extent, time_range, iso=False):
+    """Copy a region from one channel to another without sending it through the client
+
+    Both channels share their geometry, so the region is copied one cuboid at a time in a thread pool and never
+    held in memory as a whole. SpatialDB.write_cuboid would only merge the source's non-zero voxels, so destination
+    cuboids are replaced whole, see CuboidRewriter. Fully covered ones get the source's stored cuboid as is, without
+    decompressing it, and partially covered ones the stored cuboid with the covered part overwritten. Buffered writes
+    to either channel's cuboids are waited for first, see PendingWrites. Progress is recorded per cuboid under the
+    destination's copy job, which is marked finished or failed at the end. The destination's caches are brought up to
+    date even if a copy fails part way.
+
+    Args:
+        source (spdb.project.BossResource): Data model info of the channel copied from
+        destination (spdb.project.BossResource): Data model info of the channel copied to
+        resolution (int): Resolution level of the region
+        corner ((int, int, int)): X, Y, Z corner of the region
+        extent ((int, int, int)): X, Y, Z extent of the region
+        time_range ([int, int]): Time range of the region
+        iso (bool): Flag indicating if the isotropic cuboids should be copied
+
+    Returns:
+        (dict): Number of cuboids and voxels copied
+
+    Raises:
+        BossError: If the region covers more than COPY_MAX_CUBOIDS cuboids, or its cuboids still have pending writes
+                   after WRITE_BUFFER_WAIT seconds
+    """
+    parts = get_copy_parts(resolution, corner, extent)
+    progress = JobProgress(settings.KVIO_SETTINGS, get_copy_job_key(destination.get_lookup_key()))
+    progress.start({resolution: len(parts)})
+
+    cube_dim = CUBOIDSIZE[resolution]
+    num_samples = time_range[1] - time_range[0]
+    annotation = not iso and not destination.get_channel().is_image()
+    local = threading.local()
+
+    def copy(part):
+        cuboid, sub_corner, sub_extent, full = part
+        if not hasattr(local, 'rewriter'):
+            local.rewriter = CuboidRewriter(SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG,
+                                                      settings.OBJECTIO_CONFIG))
+        if full:
+            blobs = get_stored_cuboid(local.rewriter.spdb, source, resolution, cuboid, time_range, iso=iso)
+            with local.rewriter.lock(destination, resolution, cuboid, iso):
+                for i, t_idx in enumerate(range(*time_range)):
+                    # Never written source cuboids are zeros, which must still overwrite the destination
+                    local.rewriter.put_bytes(destination, resolution, cuboid, t_idx,
+                                             empty if blobs[i] is None else blobs[i], iso)
+            if restore:
+                for blob in blobs:
+                    if blob is not None:
+                        restore_written_ids(destination.get_lookup_key(), resolution, blosc.unpack_array(blob))
+            voxels = num_samples * cube_dim[0] * cube_dim[1] * cube_dim[2]
+        else:
+            data = local.rewriter.spdb.cutout(source, sub_corner, sub_extent, resolution, list(time_range),
+                                              iso=iso).data
+            register_cached_cuboids(source, resolution, sub_corner, sub_extent, list(time_range), iso=iso)
+            # Covered part of the cuboid, relative to the cuboid
+            covered = [slice(sub_corner[i] - cuboid[i] * cube_dim[i],
+                             sub_corner[i] - cuboid[i] * cube_dim[i] + sub_extent[i]) for i in range(3)]
+
+            def overwrite(cube):
+                cube[:, covered[2], covered[1], covered[0]] = data
+                return data.size
+
+            local.rewriter.rewrite(destination, resolution, cuboid, time_range, overwrite, iso=iso)
+            if restore:
+                restore_written_ids(destination.get_lookup_key(), resolution, data)
+            voxels = data.size
+
+        progress.record(resolution, 1, voxels)
+        return voxels
+
+    try:
+        cuboids = [part[0] for part in parts]
+        pending_writes = PendingWrites(settings.STATEIO_CONFIG)
+        pending_writes.wait(source, resolution, cuboids, time_range, iso=iso)
+        pending_writes.wait(destination, resolution, cuboids, time_range, iso=iso)
+
+        empty = blosc.pack_array(np.zeros((cube_dim[2], cube_dim[1], cube_dim[0]),
+                                          dtype=destination.get_numpy_data_type()))
+        # Ids a relabel retired exist again once they are copied in, which is only worth decompressing the
+        # copied cuboids for if the destination has retired ids
+        restore = annotation and RetiredIds(settings.STATEIO_CONFIG).has_retired(destination.get_lookup_key(),
+                                                                                   resolution)
+        try:
+            with ThreadPoolExecutor(max_workers=settings.COPY_WORKERS) as executor:
+                voxels = sum(executor.map(copy, parts))
+        finally:
+            finish_write(destination, resolution, [(corner, extent)], time_range, iso=iso)
+    except Exception as err:
+        progress.fail(err.message if isinstance(err, BossError) else str(err))
+        raise
+
+    progress.finish()
+    return {'cuboids_copied': len(parts), 'voxels_copied': voxels}
@@ -0,0 +1,50 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from bosscore.constants import ADMIN_USER
+from bosscore.request import BossRequest
+
+import spdb
+
+# Minimal stand-in for the DRF request BossRequest reads the user, method and version from
+ServiceRequest = namedtuple('ServiceRequest', ['user', 'method', 'version'])
+
+
+def get_channel_resource(collection, experiment, channel):
+    """Build the spdb resource of a channel outside of an API request
+
+    Background jobs (status poller, management commands) act as the admin user, so the usual request validation and
+    permission checks are reused as is.
+
+    Args:
+        collection (str): Collection name
+        experiment (str): Experiment name
+        channel (str): Channel name
+
+    Returns:
+        (spdb.project.BossResourceDjango): Data model info of the channel
+
+    Raises:
+        BossError: If the channel does not exist
+    """
+    request = ServiceRequest(User.objects.get(username=ADMIN_USER), 'GET', settings.BOSS_VERSION)
+    req = BossRequest(request, {"service": "downsample",
+                                "collection_name": collection,
+                                "experiment_name": experiment,
+                                "channel_name": channel})
+    return spdb.project.BossResourceDjango(req)
@@ -0,0 +1,132 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import numpy as np
+from django.conf import settings
+
+from spdb.spatialdb.state import CacheStateDB
+from bossutils.logger import BossLogger
+
+
+class RetiredIds:
+    """
+    Set of the annotation ids a relabel removed from every cuboid of a channel, kept in Redis
+
+    The id index only ever gains cuboids, so an id relabeled away still has a loose bounding box. Lookups check this
+    set and report retired ids as missing. Writing an id again takes it out of the set. There is one set per channel
+    and resolution, kept in the cache state database so eviction can't bring retired ids back.
+    """
+
+    def __init__(self, state_conf):
+        """
+        Args:
+            state_conf (dict): STATEIO settings used to connect to the cache state database
+        """
+        self.client = CacheStateDB(state_conf).status_client
+
+    @staticmethod
+    def get_cache_key(lookup_key, resolution):
+        return "RETIRED-IDS&{}&{}".format(lookup_key, resolution)
+
+    def retire(self, lookup_key, resolution, ids):
+        """Record ids that no longer have any voxels
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            resolution (int): Resolution level of the ids
+            ids (numpy.ndarray): uint64 ids
+
+        Returns:
+            None
+        """
+        if len(ids):
+            self.client.sadd(self.get_cache_key(lookup_key, resolution), *[int(id) for id in ids])
+
+    def restore(self, lookup_key, resolution, ids):
+        """Forget ids that have voxels again
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            resolution (int): Resolution level of the ids
+            ids (numpy.ndarray): uint64 ids
+
+        Returns:
+            None
+        """
+        if len(ids):
+            self.client.srem(self.get_cache_key(lookup_key, resolution), *[int(id) for id in ids])
+
+    def has_retired(self, lookup_key, resolution):
+        """Check if a channel has any retired ids, so callers can skip the work of checking ids one by one
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            resolution (int): Resolution level of the ids
+
+        Returns:
+            (bool)
+        """
+        return bool(self.client.exists(self.get_cache_key(lookup_key, resolution)))
+
+    def get_retired(self, lookup_key, resolution, ids):
+        """Find which of several ids are retired, in one round trip
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            resolution (int): Resolution level of the ids
+            ids (list(int)|numpy.ndarray): Ids to check
+
+        Returns:
+            (list(bool)): True for each retired id
+        """
+        if not len(ids) or not self.has_retired(lookup_key, resolution):
+            return [False] * len(ids)
+        key = self.get_cache_key(lookup_key, resolution)
+        pipe = self.client.pipeline()
+        for id in ids:
+            pipe.sismember(key, int(id))
+        return [bool(member) for member in pipe.execute()]
+
+
+def restore_written_ids(lookup_key, resolution, data):
+    """Take the ids of written annotation voxels out of the retired set, without failing the write
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+        resolution (int): Resolution level of the write
+        data (numpy.ndarray): Written uint64 voxels
+
+    Returns:
+        None
+    """
+    try:
+        retired_ids = RetiredIds(settings.STATEIO_CONFIG)
+        if retired_ids.has_retired(lookup_key, resolution):
+            ids = np.unique(data)
+            retired_ids.restore(lookup_key, resolution, ids[ids != 0])
+    except Exception:
+        BossLogger().logger.exception("Problem restoring retired ids of {}".format(lookup_key))
+
+
+def is_retired(lookup_key, resolution, id):
+    """Check if a relabel removed an id everywhere, although the id index still has its cuboids
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+        resolution (int): Resolution level of the id
+        id (int): Object id
+
+    Returns:
+        (bool)
+    """
+    return RetiredIds(settings.STATEIO_CONFIG).get_retired(lookup_key, resolution, [id])[0]
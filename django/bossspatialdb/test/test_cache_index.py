@@ -0,0 +1,132 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch, MagicMock
+from mockredis import mock_strict_redis_client
+from django.test import override_settings
+
+from bossspatialdb.cuboids import get_cuboid_range
+from bossspatialdb.cache_index import CuboidCacheIndex
+
+KV_CONF = {"cache_host": "localhost", "cache_db": 1, "read_timeout": 86400}
+
+
+class TestCuboidRange(unittest.TestCase):
+
+    def test_single_cuboid(self):
+        """A region inside one cuboid touches only that cuboid"""
+        x_rng, y_rng, z_rng = get_cuboid_range(0, (10, 20, 1), (100, 100, 5))
+        self.assertEqual(list(x_rng), [0])
+        self.assertEqual(list(y_rng), [0])
+        self.assertEqual(list(z_rng), [0])
+
+    def test_region_spanning_cuboids(self):
+        """A region crossing cuboid boundaries touches every cuboid it overlaps"""
+        x_rng, y_rng, z_rng = get_cuboid_range(0, (500, 0, 15), (600, 512, 2))
+        self.assertEqual(list(x_rng), [0, 1, 2])
+        self.assertEqual(list(y_rng), [0])
+        self.assertEqual(list(z_rng), [0, 1])
+
+
+@patch('redis.StrictRedis', mock_strict_redis_client)
+class TestCuboidCacheIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = MagicMock()
+        self.resource.get_lookup_key.return_value = "4&3&2"
+
+    def test_index_key(self):
+        self.assertEqual(CuboidCacheIndex.get_index_key("4&3&2", 1), "CACHED-CUBOID-INDEX&4&3&2&1")
+        self.assertEqual(CuboidCacheIndex.get_index_key("4&3&2", 1, iso=True), "CACHED-CUBOID-INDEX&ISO&4&3&2&1")
+
+    def test_add_registers_keys(self):
+        """Adding a region indexes one key per cuboid and time sample"""
+        index = CuboidCacheIndex(KV_CONF)
+        index.add(self.resource, 0, (0, 0, 0), (1024, 512, 16), [0, 2])
+
+        members = index.client.smembers(CuboidCacheIndex.get_index_key("4&3&2", 0))
+        self.assertEqual(len(members), 4)
+        for key in members:
+            if isinstance(key, bytes):
+                key = key.decode()
+            self.assertTrue(key.startswith("CACHED-CUBOID&4&3&2&0&"))
+
+    def test_clear_removes_indexed_keys(self):
+        """A clear unlinks only the indexed keys, without scanning the keyspace"""
+        index = CuboidCacheIndex(KV_CONF)
+        index.add(self.resource, 0, (0, 0, 0), (1024, 512, 16), [0, 1])
+        for key in index.client.smembers(CuboidCacheIndex.get_index_key("4&3&2", 0)):
+            index.client.set(key, b"cuboid")
+        index.client.set("CACHED-CUBOID&4&3&2&1&0&7", b"unregistered")
+
+        with patch.object(index.client, 'scan_iter') as scan_iter:
+            index.clear("4&3&2", 4)
+            scan_iter.assert_not_called()
+
+        self.assertEqual(index.client.keys("CACHED-CUBOID&4&3&2&0&*"), [])
+        self.assertEqual(index.client.smembers(CuboidCacheIndex.get_index_key("4&3&2", 0)), set())
+        self.assertEqual(index.client.get("CACHED-CUBOID&4&3&2&1&0&7"), b"unregistered")
+
+    def test_sweep_removes_unregistered_keys(self):
+        """The maintenance sweep removes the channel's cached cuboids whether or not they were registered"""
+        index = CuboidCacheIndex(KV_CONF)
+        index.client.set("CACHED-CUBOID&4&3&2&1&0&7", b"cuboid")
+        index.client.set("CACHED-CUBOID&ISO&4&3&2&3&0&7", b"cuboid")
+        index.client.set("CACHED-CUBOID&4&3&5&0&0&7", b"other channel")
+
+        self.assertEqual(index.sweep("4&3&2"), 2)
+        self.assertEqual(index.client.keys("CACHED-CUBOID&4&3&2&*"), [])
+        self.assertEqual(index.client.keys("CACHED-CUBOID&ISO&4&3&2&*"), [])
+        self.assertEqual(index.client.get("CACHED-CUBOID&4&3&5&0&0&7"), b"other channel")
+
+    def test_unlink_drops_index_members(self):
+        index = CuboidCacheIndex(KV_CONF)
+        index_key = CuboidCacheIndex.get_index_key("4&3&2", 0)
+        index.client.sadd(index_key, "a", "b", "c")
+        index.client.set("a", 1)
+        index.client.set("b", 1)
+
+        index._unlink(index_key, [b"a", b"b"])
+        self.assertIsNone(index.client.get("a"))
+        self.assertEqual(index.client.smembers(index_key), {b"c"})
+
+    @override_settings(CACHE_INDEX_TRIM_SIZE=2, CACHE_INDEX_TTL=60, CACHE_INDEX_TRIM_INTERVAL=60)
+    def test_add_trims_in_background(self):
+        """Registering past the trim size starts one background trim, not a trim in the request"""
+        index = CuboidCacheIndex(KV_CONF)
+        index_key = CuboidCacheIndex.get_index_key("4&3&2", 0)
+        with patch.object(index, 'trim') as trim, patch.object(index, 'trim_async') as trim_async:
+            index.add(self.resource, 0, (0, 0, 0), (1024, 512, 16), [0, 1])
+            index.add(self.resource, 0, (0, 0, 0), (1024, 512, 16), [1, 2])
+            trim.assert_not_called()
+            trim_async.assert_called_once_with(index_key)
+        self.assertGreater(index.client.ttl(index_key), 0)
+
+    def test_trim_async(self):
+        index = CuboidCacheIndex(KV_CONF)
+        index_key = CuboidCacheIndex.get_index_key("4&3&2", 0)
+        index.client.sadd(index_key, "CACHED-CUBOID&evicted", "CACHED-CUBOID&kept")
+        index.client.set("CACHED-CUBOID&kept", b"cuboid")
+
+        index.trim_async(index_key).join()
+        self.assertEqual(index.client.smembers(index_key), {b"CACHED-CUBOID&kept"})
+
+    def test_trim(self):
+        index = CuboidCacheIndex(KV_CONF)
+        index_key = CuboidCacheIndex.get_index_key("4&3&2", 0)
+        index.client.sadd(index_key, "kept", "evicted")
+        index.client.set("kept", 1)
+
+        self.assertEqual(index.trim(index_key), 1)
+        self.assertEqual(index.client.smembers(index_key), {b"kept"})
@@ -0,0 +1,48 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+import unittest
+from unittest.mock import patch
+from mockredis import mock_strict_redis_client
+
+from bossspatialdb.data_version import DataVersion
+
+STATE_CONF = {"cache_state_host": "localhost", "cache_state_db": 1}
+
+
+@patch('redis.StrictRedis', mock_strict_redis_client)
+class TestDataVersion(unittest.TestCase):
+
+    def test_version_is_stable(self):
+        versions = DataVersion(STATE_CONF)
+        self.assertEqual(versions.get("1&2&3"), versions.get("1&2&3"))
+
+    def test_bump(self):
+        versions = DataVersion(STATE_CONF)
+        version, modified = versions.get("1&2&3")
+        self.assertEqual(versions.bump("1&2&3"), version + 1)
+        self.assertEqual(versions.get("1&2&3")[0], version + 1)
+        self.assertGreaterEqual(versions.get("1&2&3")[1], modified)
+
+        # Other channels are unaffected
+        self.assertNotEqual(versions.get("1&2&4")[0], version + 1)
+
+    def test_lost_version_does_not_repeat(self):
+        """A version that disappears restarts above every version handed out before"""
+        versions = DataVersion(STATE_CONF)
+        versions.get("1&2&3")
+        bumped = versions.bump("1&2&3")
+        versions.client.delete(DataVersion.get_key("1&2&3"))
+        with patch('bossspatialdb.data_version.time.time', return_value=time.time() + 1):
+            self.assertGreater(versions.get("1&2&3")[0], bumped)
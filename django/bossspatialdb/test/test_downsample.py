@@ -0,0 +1,98 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import MagicMock
+
+from bosscore.error import BossError
+from bossspatialdb.downsample import get_downsample_totals, get_downsample_region
+
+
+def make_resource(num_hierarchy_levels=3, hierarchy_method="anisotropic"):
+    """Build an anisotropic resource with a 4096x4096x128 frame, isotropic above level 2"""
+    resource = MagicMock()
+    resource.get_channel.return_value.base_resolution = 0
+    resource.get_experiment.return_value.num_hierarchy_levels = num_hierarchy_levels
+    resource.get_experiment.return_value.hierarchy_method = hierarchy_method
+    resource.get_isotropic_level.return_value = 2
+    resource.get_coord_frame.return_value.x_start = 0
+    resource.get_coord_frame.return_value.x_stop = 4096
+    resource.get_coord_frame.return_value.y_start = 0
+    resource.get_coord_frame.return_value.y_stop = 4096
+    resource.get_coord_frame.return_value.z_start = 0
+    resource.get_coord_frame.return_value.z_stop = 128
+
+    def voxel_dims(iso=False):
+        dims = []
+        for res in range(num_hierarchy_levels):
+            z = 35 * 2 ** res if iso and res > 2 else 35
+            dims.append([4 * 2 ** res, 4 * 2 ** res, z])
+        return dims
+    resource.get_downsampled_voxel_dims.side_effect = voxel_dims
+    return resource
+
+
+class TestDownsampleTotals(unittest.TestCase):
+
+    def test_anisotropic_totals(self):
+        """Each level halves x and y while keeping z"""
+        totals = get_downsample_totals(make_resource(), (0, 0, 0), (4096, 4096, 128))
+        self.assertEqual(totals, {1: 4 * 4 * 8, 2: 2 * 2 * 8})
+
+    def test_anisotropic_iso_totals(self):
+        """Anisotropic experiments also write isotropic cuboids above the isotropic level"""
+        totals = get_downsample_totals(make_resource(4, "anisotropic"), (0, 0, 0), (4096, 4096, 128))
+        self.assertEqual(totals, {1: 4 * 4 * 8, 2: 2 * 2 * 8, 3: 8, "iso-3": 1})
+
+
+class TestDownsampleRegion(unittest.TestCase):
+
+    def test_default_is_frame(self):
+        start, stop = get_downsample_region(make_resource(), {})
+        self.assertEqual(start, (0, 0, 0))
+        self.assertEqual(stop, (4096, 4096, 128))
+
+    def test_region_snapped_to_cuboids(self):
+        """The region grows to the cuboid boundaries of the base resolution only"""
+        region = {'x_start': 1000, 'x_stop': 1100, 'y_start': 10, 'y_stop': 20, 'z_start': 17, 'z_stop': 18}
+        start, stop = get_downsample_region(make_resource(), region)
+        self.assertEqual(start, (512, 0, 16))
+        self.assertEqual(stop, (1536, 512, 32))
+
+    def test_region_small_at_every_level(self):
+        """Coarser levels only count the cuboids the scaled region touches"""
+        region = {'x_start': 1000, 'x_stop': 1100, 'y_start': 10, 'y_stop': 20, 'z_start': 17, 'z_stop': 18}
+        resource = make_resource()
+        start, stop = get_downsample_region(resource, region)
+        totals = get_downsample_totals(resource, start, stop)
+        self.assertEqual(totals, {1: 2, 2: 1})
+
+    def test_region_incomplete(self):
+        """A partial region does not default to the coordinate frame"""
+        with self.assertRaises(BossError):
+            get_downsample_region(make_resource(), {'x_start': 0})
+
+    def test_region_outside_frame(self):
+        region = {'x_start': 0, 'x_stop': 5000, 'y_start': 0, 'y_stop': 512, 'z_start': 0, 'z_stop': 16}
+        with self.assertRaises(BossError):
+            get_downsample_region(make_resource(), region)
+
+    def test_region_empty(self):
+        region = {'x_start': 0, 'x_stop': 512, 'y_start': 0, 'y_stop': 512, 'z_start': 20, 'z_stop': 20}
+        with self.assertRaises(BossError):
+            get_downsample_region(make_resource(), region)
+
+    def test_region_not_integer(self):
+        region = {'x_start': 0, 'x_stop': 512, 'y_start': 'abc', 'y_stop': 512, 'z_start': 0, 'z_stop': 16}
+        with self.assertRaises(BossError):
+            get_downsample_region(make_resource(), region)
@@ -18,12 +18,14 @@ from rest_framework.test import APITestCase, APIRequestFactory
 from rest_framework.test import force_authenticate
 from rest_framework import status
 
-from bossspatialdb.views import Downsample
+from bossspatialdb.views import Downsample, DownsampleGeometry
 
 from bosscore.test.setup_db import SetupTestDB
 from bosscore.error import BossError
+from bosscore.models import Channel
 import json
 from unittest.mock import patch
+from mockredis import mock_strict_redis_client
 
 
 version = settings.BOSS_VERSION
@@ -187,6 +189,73 @@ class DownsampleInterfaceViewMixin(object):
         self.assertEqual(response.data["cuboid_size"]['3'], [512, 512, 16])
         self.assertEqual(response.data["cuboid_size"]['5'], [512, 512, 16])
 
+    def test_get_geometry(self):
+        """ Test getting the geometry of an anisotropic channel, including the iso variant"""
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.get('/' + version + '/downsample/col1/exp_aniso/channel1/geometry/',
+                              content_type='application/json')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = DownsampleGeometry.as_view()(request, collection='col1', experiment='exp_aniso',
+                                                channel='channel1').render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["num_hierarchy_levels"], 8)
+        self.assertNotIn("status", response.data)
+        self.assertEqual(response.data["voxel_size"]['5'], [128.0, 128.0, 35.0])
+        self.assertEqual(response.data["extent"]['5'], [63, 157, 200])
+        self.assertEqual(response.data["cuboid_size"]['5'], [512, 512, 16])
+        self.assertEqual(response.data["iso"]["voxel_size"]['5'], [128.0, 128.0, 140])
+        self.assertEqual(response.data["iso"]["extent"]['5'], [63, 157, 50])
+        self.assertIn("max-age", response["Cache-Control"])
+
+        # A request with the returned ETag is not modified
+        request = factory.get('/' + version + '/downsample/col1/exp_aniso/channel1/geometry/',
+                              content_type='application/json', HTTP_IF_NONE_MATCH=response["ETag"])
+        force_authenticate(request, user=self.user)
+        response = DownsampleGeometry.as_view()(request, collection='col1', experiment='exp_aniso',
+                                                channel='channel1')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_region_downsample_of_downsampled_channel(self):
+        """ Test that any user can downsample a region of an already downsampled channel"""
+        self.dbsetup.insert_downsample_data()
+        channel_obj = Channel.objects.get(name='channel1', experiment__name='exp_ds_aniso')
+        channel_obj.downsample_status = "DOWNSAMPLED"
+        channel_obj.save()
+
+        # A full frame downsample is rejected
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/downsample/col1/exp_ds_aniso/channel1/',
+                               content_type='application/json')
+        force_authenticate(request, user=self.user)
+        response = Downsample.as_view()(request, collection='col1', experiment='exp_ds_aniso',
+                                        channel='channel1')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        # A region outside of the frame is rejected
+        request = factory.post('/' + version + '/downsample/col1/exp_ds_aniso/channel1/',
+                               data=json.dumps({"x_start": 0, "x_stop": 5000}),
+                               content_type='application/json')
+        force_authenticate(request, user=self.user)
+        response = Downsample.as_view()(request, collection='col1', experiment='exp_ds_aniso',
+                                        channel='channel1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # A region inside of the frame is started
+        request = factory.post('/' + version + '/downsample/col1/exp_ds_aniso/channel1/',
+                               data=json.dumps({"x_start": 100, "x_stop": 200, "z_start": 20, "z_stop": 30}),
+                               content_type='application/json')
+        force_authenticate(request, user=self.user)
+        response = Downsample.as_view()(request, collection='col1', experiment='exp_ds_aniso',
+                                        channel='channel1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        channel_obj = Channel.objects.get(name='channel1', experiment__name='exp_ds_aniso')
+        self.assertEqual(channel_obj.downsample_status, "IN_PROGRESS")
+
     def test_start_and_cancel_downsample_aniso(self):
         self.dbsetup.insert_downsample_data()
 
@@ -251,6 +320,7 @@ class DownsampleInterfaceViewMixin(object):
         self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
 
 
+@patch('redis.StrictRedis', mock_strict_redis_client)
 @patch('bossutils.aws.sfn_status', mock_sfn_status)
 @patch('bossutils.aws.sfn_execute', mock_sfn_execute)
 @patch('bossutils.aws.sfn_cancel', mock_sfn_cancel)
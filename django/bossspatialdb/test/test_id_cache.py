@@ -0,0 +1,85 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch, MagicMock
+from mockredis import mock_strict_redis_client
+
+import numpy as np
+from django.test import override_settings
+
+from bossspatialdb.id_cache import CuboidIdCache
+from bossobject.ids import iter_block_ids
+
+KV_CONF = {"cache_host": "localhost", "cache_db": 1, "read_timeout": 86400}
+
+
+@override_settings(CUBOID_IDS_CACHE_TTL=60)
+@patch('redis.StrictRedis', mock_strict_redis_client)
+class TestCuboidIdCache(unittest.TestCase):
+
+    def test_put_get(self):
+        id_cache = CuboidIdCache(KV_CONF)
+        id_cache.put_many("4&3&2", 0, 0, {(0, 0, 0): np.array([1, 2 ** 63], dtype=np.uint64)})
+
+        cached, missing = id_cache.get_many("4&3&2", 0, 0, [(0, 0, 0), (1, 0, 0)])
+        np.testing.assert_array_equal(cached, [1, 2 ** 63])
+        self.assertIsNone(missing)
+
+        # Resolutions and time samples are kept apart
+        self.assertEqual(id_cache.get_many("4&3&2", 1, 0, [(0, 0, 0)]), [None])
+        self.assertEqual(id_cache.get_many("4&3&2", 0, 1, [(0, 0, 0)]), [None])
+
+    def test_invalidate(self):
+        """Writes only drop the cuboids they touch"""
+        id_cache = CuboidIdCache(KV_CONF)
+        ids = np.array([5], dtype=np.uint64)
+        id_cache.put_many("4&3&2", 0, 0, {(0, 0, 0): ids, (1, 0, 0): ids})
+
+        id_cache.invalidate("4&3&2", 0, (10, 10, 0), (5, 5, 5), [0, 1])
+        cached = id_cache.get_many("4&3&2", 0, 0, [(0, 0, 0), (1, 0, 0)])
+        self.assertIsNone(cached[0])
+        np.testing.assert_array_equal(cached[1], ids)
+
+        id_cache.clear("4&3&2")
+        self.assertEqual(id_cache.get_many("4&3&2", 0, 0, [(1, 0, 0)]), [None])
+
+    @patch('bossobject.ids.get_data_version', return_value=(1, 1000.0))
+    def test_region_query_uses_cache(self, mock_version):
+        """Covered cuboids are scanned once and then answered from the cache"""
+        id_cache = CuboidIdCache(KV_CONF)
+        resource = MagicMock()
+        resource.get_lookup_key.return_value = "4&3&2"
+        cache = MagicMock()
+        cache.cutout.return_value.data = np.array([[0, 7, 3]], dtype=np.uint64)
+
+        blocks = list(iter_block_ids(cache, resource, 0, (0, 0, 0), (512, 512, 16), [0, 1], id_cache))
+        np.testing.assert_array_equal(blocks[0], [3, 7])
+        self.assertEqual(cache.cutout.call_count, 1)
+
+        blocks = list(iter_block_ids(cache, resource, 0, (0, 0, 0), (512, 512, 16), [0, 1], id_cache))
+        np.testing.assert_array_equal(blocks[0], [3, 7])
+        self.assertEqual(cache.cutout.call_count, 1)
+
+    @patch('bossobject.ids.get_data_version')
+    def test_region_query_during_write(self, mock_version):
+        """Id sets computed while the channel was written are not cached"""
+        mock_version.side_effect = [(1, 1000.0), (2, 1001.0)]
+        id_cache = CuboidIdCache(KV_CONF)
+        resource = MagicMock()
+        resource.get_lookup_key.return_value = "4&3&2"
+        cache = MagicMock()
+        cache.cutout.return_value.data = np.array([[7]], dtype=np.uint64)
+
+        list(iter_block_ids(cache, resource, 0, (0, 0, 0), (512, 512, 16), [0, 1], id_cache))
+        self.assertEqual(id_cache.get_many("4&3&2", 0, 0, [(0, 0, 0)]), [None])
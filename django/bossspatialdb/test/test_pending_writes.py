@@ -0,0 +1,65 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch, MagicMock
+from mockredis import mock_strict_redis_client
+
+from django.conf import settings
+from django.test import override_settings
+
+from bosscore.error import BossError
+from bossspatialdb.pending_writes import PendingWrites
+
+from spdb.c_lib.ndlib import XYZMorton
+
+CUBE_DIM = [[8, 8, 4]]
+
+
+@patch('bossspatialdb.cuboids.CUBOIDSIZE', CUBE_DIM)
+@override_settings(WRITE_BUFFER_FLUSH_TIME=60, WRITE_BUFFER_WAIT=0)
+class TestPendingWrites(unittest.TestCase):
+
+    def setUp(self):
+        client = mock_strict_redis_client()
+        patcher = patch('redis.StrictRedis', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.resource = MagicMock()
+        self.resource.get_lookup_key.return_value = "1&2&3"
+
+    def test_add(self):
+        """A buffered write makes each of its cuboids pending at its time samples"""
+        pending_writes = PendingWrites(settings.STATEIO_CONFIG)
+        pending_writes.add(self.resource, 0, (4, 0, 0), (8, 8, 4), [1, 2])
+
+        cuboids = [(0, 0, 0), (1, 0, 0), (0, 1, 0)]
+        self.assertEqual(pending_writes.get_pending(self.resource, 0, cuboids, [1, 2]), [(0, 0, 0), (1, 0, 0)])
+        self.assertEqual(pending_writes.get_pending(self.resource, 0, cuboids, [0, 1]), [])
+        self.assertEqual(pending_writes.get_pending(self.resource, 0, cuboids, [1, 2], iso=True), [])
+        self.assertGreater(pending_writes.client.ttl(
+            PendingWrites.get_cache_key("1&2&3", 0, 1, XYZMorton([0, 0, 0]))), 0)
+
+    def test_page_out(self):
+        """A cuboid being flushed is pending"""
+        pending_writes = PendingWrites(settings.STATEIO_CONFIG)
+        pending_writes.client.sadd("PAGE-OUT&1&2&3&0", "0&{}".format(XYZMorton([1, 0, 0])))
+        self.assertEqual(pending_writes.get_pending(self.resource, 0, [(0, 0, 0), (1, 0, 0)], [0, 1]), [(1, 0, 0)])
+
+    def test_wait(self):
+        pending_writes = PendingWrites(settings.STATEIO_CONFIG)
+        pending_writes.wait(self.resource, 0, [(0, 0, 0)], [0, 1])
+
+        pending_writes.add(self.resource, 0, (0, 0, 0), (8, 8, 4), [0, 1])
+        with self.assertRaises(BossError):
+            pending_writes.wait(self.resource, 0, [(0, 0, 0)], [0, 1])
@@ -0,0 +1,81 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch
+from mockredis import mock_strict_redis_client
+
+from bossspatialdb.progress import JobProgress
+
+KV_CONF = {"cache_host": "localhost", "cache_db": 1, "read_timeout": 86400}
+
+
+@patch('redis.StrictRedis', mock_strict_redis_client)
+class TestJobProgress(unittest.TestCase):
+
+    def test_not_started(self):
+        self.assertIsNone(JobProgress(KV_CONF, "1&2&3").get())
+
+    def test_progress(self):
+        """Completion, throughput and ETA are reported per level"""
+        progress = JobProgress(KV_CONF, "1&2&3")
+        progress.start({1: 10, 2: 4})
+
+        with patch('time.time', return_value=100.0):
+            progress.record(1, 1, 1000)
+        with patch('time.time', return_value=110.0):
+            progress.record(1, 4, 4000)
+            levels = progress.get()
+
+        self.assertEqual(levels["1"]["cuboids_total"], 10)
+        self.assertEqual(levels["1"]["cuboids_done"], 5)
+        self.assertEqual(levels["1"]["percent_complete"], 50.0)
+        self.assertEqual(levels["1"]["voxels_per_sec"], 500.0)
+        self.assertEqual(levels["1"]["eta_sec"], 10.0)
+        self.assertEqual(levels["1"]["sec_since_update"], 0.0)
+
+        self.assertEqual(levels["2"]["cuboids_done"], 0)
+        self.assertFalse(levels["2"]["reported"])
+        self.assertIsNone(levels["2"]["percent_complete"])
+        self.assertIsNone(levels["2"]["eta_sec"])
+
+    def test_finish(self):
+        """Finishing marks levels the workers never reported on as done"""
+        progress = JobProgress(KV_CONF, "1&2&3")
+        progress.start({1: 10, "iso-3": 4})
+        progress.finish()
+
+        levels = progress.get()
+        self.assertEqual(levels["1"]["cuboids_done"], 10)
+        self.assertEqual(levels["iso-3"]["percent_complete"], 100.0)
+
+    def test_fail(self):
+        """A failure is reported until the job is started again"""
+        progress = JobProgress(KV_CONF, "1&2&3")
+        progress.start({1: 10})
+        self.assertIsNone(progress.get_error())
+
+        progress.record(1, 3, 300)
+        progress.fail("down")
+        self.assertEqual(progress.get_error(), "down")
+        self.assertEqual(progress.get()["1"]["cuboids_done"], 3)
+
+        progress.start({1: 10})
+        self.assertIsNone(progress.get_error())
+
+    def test_clear(self):
+        progress = JobProgress(KV_CONF, "1&2&3")
+        progress.start({1: 10})
+        progress.clear()
+        self.assertIsNone(progress.get())
+
@@ -0,0 +1,216 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch, MagicMock
+
+import blosc
+import numpy as np
+from django.test import override_settings
+
+from bosscore.error import BossError
+from bossspatialdb.region_copy import parse_copy_source, check_copy_channels, copy_region, start_copy
+from bossspatialdb.test.test_writes import FakeSpatialDB
+
+from spdb.c_lib.ndlib import XYZMorton
+
+CUBE_DIM = [[8, 8, 4]]
+
+
+def make_resource(lookup_key, data_type="uint8", x_stop=16, voxel_dims=(4, 4, 35)):
+    resource = MagicMock()
+    resource.get_lookup_key.return_value = lookup_key
+    resource.get_data_type.return_value = data_type
+    resource.get_coord_frame.return_value = MagicMock(x_start=0, x_stop=x_stop, y_start=0, y_stop=16,
+                                                      z_start=0, z_stop=8)
+    resource.get_downsampled_voxel_dims.return_value = [list(voxel_dims)]
+    return resource
+
+
+class TestCopyArgs(unittest.TestCase):
+
+    def test_source(self):
+        source = {"source": {"collection": "col1", "experiment": "exp2", "channel": "ch3"}}
+        self.assertEqual(parse_copy_source(source), ("col1", "exp2", "ch3"))
+
+        for data in (None, {}, {"source": "col1/exp2/ch3"}, {"source": {"collection": "col1", "experiment": "exp2"}},
+                     {"source": {"collection": "col1", "experiment": "exp2", "channel": 3}}):
+            with self.assertRaises(BossError):
+                parse_copy_source(data)
+
+    def test_channels(self):
+        source = make_resource("1&2&3")
+        check_copy_channels(source, make_resource("1&4&5"), 0)
+
+        for destination in (make_resource("1&2&3"), make_resource("1&2&4", data_type="uint16"),
+                            make_resource("1&4&5", x_stop=32), make_resource("1&4&5", voxel_dims=(8, 8, 35))):
+            with self.assertRaises(BossError):
+                check_copy_channels(source, destination, 0)
+
+
+class CopyFakeSpatialDB(FakeSpatialDB):
+    """
+    FakeSpatialDB cutting out of one [t, z, y, x] volume per channel, with the source's cuboids in the object store
+    """
+
+    def __init__(self, volumes):
+        super().__init__(volumes["1&4&5"])
+        self.volumes = volumes
+        self.cutouts = []
+        self.kvio.generate_cached_cuboid_keys.side_effect = \
+            lambda resource, resolution, t_list, morton_ids, iso=False: \
+            ["CACHED-CUBOID&{}&{}&{}".format(resource.get_lookup_key(), t, morton)
+             for t in t_list for morton in morton_ids]
+        self.objectio.generate_object_key.side_effect = \
+            lambda resource, resolution, t_idx, morton, iso=False: \
+            "OBJECT&{}&{}&{}".format(resource.get_lookup_key(), t_idx, morton)
+
+        # Every source cuboid is stored
+        self.stored = {}
+        source = volumes["1&2&3"]
+        for t_idx in range(source.shape[0]):
+            for x in range(2):
+                for y in range(2):
+                    for z in range(2):
+                        cube = source[t_idx, z * 4:(z + 1) * 4, y * 8:(y + 1) * 8, x * 8:(x + 1) * 8]
+                        key = "OBJECT&1&2&3&{}&{}".format(t_idx, XYZMorton([x, y, z]))
+                        self.stored[key] = blosc.pack_array(np.ascontiguousarray(cube))
+        self.objectio.cuboids_exist.side_effect = lambda keys, missing: (
+            [i for i in missing if keys[i].replace("CACHED-CUBOID", "OBJECT") in self.stored],
+            [i for i in missing if keys[i].replace("CACHED-CUBOID", "OBJECT") not in self.stored])
+        self.objectio.get_single_object.side_effect = lambda key: self.stored[key]
+
+    def cutout(self, resource, corner, extent, resolution, time_range, iso=False):
+        self.cutouts.append((resource.get_lookup_key(), tuple(corner)))
+        volume = self.volumes[resource.get_lookup_key()]
+        return MagicMock(data=volume[time_range[0]:time_range[1], corner[2]:corner[2] + extent[2],
+                                     corner[1]:corner[1] + extent[1], corner[0]:corner[0] + extent[0]].copy())
+
+
+@override_settings(COPY_WORKERS=2, COPY_MAX_CUBOIDS=8, CUBOID_LOCK_TTL=60, CUBOID_LOCK_WAIT=1)
+@patch('bossspatialdb.cuboids.CUBOIDSIZE', CUBE_DIM)
+@patch('bossspatialdb.region_copy.CUBOIDSIZE', CUBE_DIM)
+@patch('bossspatialdb.overwrite.CUBOIDSIZE', CUBE_DIM)
+@patch('bossspatialdb.region_copy.JobProgress')
+@patch('bossspatialdb.region_copy.finish_write')
+@patch('bossspatialdb.region_copy.SpatialDB')
+class TestCopyRegion(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('bossspatialdb.cache_index.CuboidCacheIndex')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('bossspatialdb.region_copy.PendingWrites')
+        self.mock_pending = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.source = make_resource("1&2&3")
+        self.destination = make_resource("1&4&5")
+        self.destination.get_numpy_data_type.return_value = np.uint64
+        # The source has zeros, which must overwrite the destination's voxels
+        source = np.arange(2 * 8 * 16 * 16, dtype=np.uint64).reshape((2, 8, 16, 16)) % 3
+        self.fake = CopyFakeSpatialDB({"1&2&3": source,
+                                       "1&4&5": np.random.randint(1, 1000, (2, 8, 16, 16)).astype(np.uint64)})
+
+    def get_object(self, t_idx, cuboid):
+        return self.fake.objects["OBJECT&1&4&5&{}&{}".format(t_idx, XYZMorton(list(cuboid)))]
+
+    def test_copy(self, mock_spdb, mock_finish, mock_progress):
+        mock_spdb.return_value = self.fake
+        source = self.fake.volumes["1&2&3"]
+        original = self.fake.volumes["1&4&5"].copy()
+        summary = copy_region(self.source, self.destination, 0, (4, 0, 0), (12, 8, 4), [1, 2])
+        self.assertEqual(summary, {'cuboids_copied': 2, 'voxels_copied': 12 * 8 * 4})
+
+        # The region covers cuboid (1, 0, 0) fully and cuboid (0, 0, 0) in part
+        self.assertEqual(len(self.fake.objects), 2)
+        np.testing.assert_array_equal(self.get_object(1, (1, 0, 0)), source[1, 0:4, 0:8, 8:16])
+        partial = self.get_object(1, (0, 0, 0))
+        np.testing.assert_array_equal(partial[:, :, 4:8], source[1, 0:4, 0:8, 4:8])
+        np.testing.assert_array_equal(partial[:, :, 0:4], original[1, 0:4, 0:8, 0:4])
+        self.assertEqual(self.fake.kvio.cache_client.keys("CUBOID-LOCK&*"), [])
+
+        # Only the source's part of the partial cuboid is cut out. The full one is copied as stored
+        self.assertEqual([cutout for cutout in self.fake.cutouts if cutout[0] == "1&2&3"], [("1&2&3", (4, 0, 0))])
+        self.assertEqual(self.fake.kvio.cache_client.get("CACHED-CUBOID&1&4&5&1&{}".format(XYZMorton([1, 0, 0]))),
+                         self.fake.stored["OBJECT&1&2&3&1&{}".format(XYZMorton([1, 0, 0]))])
+
+        mock_progress.assert_called_once_with({}, "COPY&1&4&5")
+        mock_progress.return_value.start.assert_called_once_with({0: 2})
+        self.assertEqual(mock_progress.return_value.record.call_count, 2)
+        mock_progress.return_value.finish.assert_called_once_with()
+        mock_finish.assert_called_once_with(self.destination, 0, [((4, 0, 0), (12, 8, 4))], [1, 2], iso=False)
+
+    def test_copy_cached_and_unwritten(self, mock_spdb, mock_finish, mock_progress):
+        """Full cuboids are copied from the cache if cached, and as zeros if the source never wrote them"""
+        mock_spdb.return_value = self.fake
+        morton = XYZMorton([1, 0, 0])
+        cached = np.full((4, 8, 8), 7, dtype=np.uint64)
+        self.fake.kvio.cache_client.set("CACHED-CUBOID&1&2&3&0&{}".format(morton), blosc.pack_array(cached))
+        del self.fake.stored["OBJECT&1&2&3&1&{}".format(morton)]
+
+        copy_region(self.source, self.destination, 0, (8, 0, 0), (8, 8, 4), [0, 2])
+        self.assertEqual(self.fake.cutouts, [])
+        np.testing.assert_array_equal(self.get_object(0, (1, 0, 0)), cached)
+        np.testing.assert_array_equal(self.get_object(1, (1, 0, 0)), 0)
+
+    def test_pending_writes(self, mock_spdb, mock_finish, mock_progress):
+        """Nothing is copied while a buffered write could still be flushed, and the job reports why"""
+        mock_spdb.return_value = self.fake
+        self.mock_pending.return_value.wait.side_effect = BossError("Not flushed", 0)
+        with self.assertRaises(BossError):
+            copy_region(self.source, self.destination, 0, (0, 0, 0), (8, 8, 4), [0, 1])
+        self.assertEqual(self.fake.objects, {})
+        mock_finish.assert_not_called()
+        mock_progress.return_value.fail.assert_called_once_with("Not flushed")
+
+    def test_failed_copy_finishes(self, mock_spdb, mock_finish, mock_progress):
+        """Caches of the destination are updated even if a cuboid fails to copy"""
+        mock_spdb.return_value = self.fake
+        self.fake.objectio.put_objects.side_effect = IOError("down")
+        with self.assertRaises(IOError):
+            copy_region(self.source, self.destination, 0, (0, 0, 0), (8, 8, 4), [0, 1])
+        mock_finish.assert_called_once_with(self.destination, 0, [((0, 0, 0), (8, 8, 4))], [0, 1], iso=False)
+        mock_progress.return_value.fail.assert_called_once_with("down")
+        mock_progress.return_value.finish.assert_not_called()
+
+    def test_too_large(self, mock_spdb, mock_finish, mock_progress):
+        mock_spdb.return_value = self.fake
+        with self.assertRaises(BossError):
+            copy_region(self.source, self.destination, 0, (0, 0, 0), (24, 24, 4), [0, 1])
+        self.assertEqual(self.fake.objects, {})
+        mock_finish.assert_not_called()
+
+
+@override_settings(COPY_MAX_CUBOIDS=8)
+@patch('bossspatialdb.cuboids.CUBOIDSIZE', CUBE_DIM)
+@patch('bossspatialdb.region_copy.JobProgress')
+@patch('bossspatialdb.region_copy.subprocess.Popen')
+class TestStartCopy(unittest.TestCase):
+
+    def test_start(self, mock_popen, mock_progress):
+        """The progress is started before the detached copy process"""
+        cuboids = start_copy(("col1", "exp2", "ch3"), ("col1", "exp4", "ch5"), make_resource("1&4&5"), 0,
+                             (4, 0, 0), (12, 8, 4), [1, 2], iso=True)
+        self.assertEqual(cuboids, 2)
+        mock_progress.assert_called_once_with({}, "COPY&1&4&5")
+        mock_progress.return_value.start.assert_called_once_with({0: 2})
+        self.assertEqual(mock_popen.call_args[0][0][1:], ["manage.py", "copy_region", "col1", "exp2", "ch3", "col1",
+                                                          "exp4", "ch5", "0", "4:16", "0:8", "0:4", "1:2", "--iso"])
+        self.assertTrue(mock_popen.call_args[1]['start_new_session'])
+
+    def test_too_large(self, mock_popen, mock_progress):
+        with self.assertRaises(BossError):
+            start_copy(("col1", "exp2", "ch3"), ("col1", "exp4", "ch5"), make_resource("1&4&5"), 0,
+                       (0, 0, 0), (24, 24, 4), [0, 1])
+        mock_progress.return_value.start.assert_not_called()
+        mock_popen.assert_not_called()
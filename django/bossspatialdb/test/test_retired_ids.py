@@ -0,0 +1,52 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch
+from mockredis import mock_strict_redis_client
+
+import numpy as np
+from django.conf import settings
+
+from bossspatialdb.retired_ids import RetiredIds, restore_written_ids
+
+
+class TestRetiredIds(unittest.TestCase):
+
+    def setUp(self):
+        # Every RetiredIds shares one fake Redis, as they would share the real one
+        client = mock_strict_redis_client()
+        patcher = patch('redis.StrictRedis', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retire_restore(self):
+        retired_ids = RetiredIds(settings.STATEIO_CONFIG)
+        self.assertEqual(retired_ids.get_retired("4&3&2", 0, [5, 6]), [False, False])
+
+        retired_ids.retire("4&3&2", 0, np.array([5, 2 ** 63], dtype=np.uint64))
+        self.assertEqual(retired_ids.get_retired("4&3&2", 0, [5, 6, 2 ** 63]), [True, False, True])
+
+        # Resolutions are kept apart
+        self.assertEqual(retired_ids.get_retired("4&3&2", 1, [5]), [False])
+
+        retired_ids.restore("4&3&2", 0, np.array([5], dtype=np.uint64))
+        self.assertEqual(retired_ids.get_retired("4&3&2", 0, [5, 2 ** 63]), [False, True])
+
+    def test_restore_written_ids(self):
+        """Writing a retired id brings it back"""
+        retired_ids = RetiredIds(settings.STATEIO_CONFIG)
+        retired_ids.retire("4&3&2", 0, np.array([5, 7], dtype=np.uint64))
+
+        restore_written_ids("4&3&2", 0, np.array([[0, 7], [9, 7]], dtype=np.uint64))
+        self.assertEqual(retired_ids.get_retired("4&3&2", 0, [5, 7, 9]), [True, False, False])
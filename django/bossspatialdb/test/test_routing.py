@@ -13,7 +13,7 @@
 # limitations under the License.
 
 from django.core.urlresolvers import resolve
-from ..views import Cutout
+from ..views import Cutout, DownsampleGeometry, RegionCopy
 
 from rest_framework.test import APITestCase
 
@@ -48,3 +48,29 @@ class CutoutInterfaceRoutingTests(APITestCase):
         view_based_cutout = resolve('/' + version + '/cutout/col1/exp1/ds1/2/0:5/0:6/0:2/5:57')
         self.assertEqual(view_based_cutout.func.__name__, Cutout.as_view().__name__)
 
+    def test_downsample_geometry_resolves(self):
+        """
+        Test to make sure the downsample geometry URL resolves
+        :return:
+        """
+        view_based_geometry = resolve('/' + version + '/downsample/col1/exp1/ds1/geometry/')
+        self.assertEqual(view_based_geometry.func.__name__, DownsampleGeometry.as_view().__name__)
+
+    def test_copy_resolves(self):
+        """
+        Test to make sure the copy URLs, with and without a time range, resolve
+        :return:
+        """
+        view_based_copy = resolve('/' + version + '/copy/col1/exp1/ds1/2/0:5/0:6/0:2')
+        self.assertEqual(view_based_copy.func.__name__, RegionCopy.as_view().__name__)
+
+        view_based_copy = resolve('/' + version + '/copy/col1/exp1/ds1/2/0:5/0:6/0:2/5:57/')
+        self.assertEqual(view_based_copy.func.__name__, RegionCopy.as_view().__name__)
+
+    def test_copy_progress_resolves(self):
+        """
+        Test to make sure the copy progress URL resolves
+        :return:
+        """
+        view_based_copy = resolve('/' + version + '/copy/col1/exp1/ds1/')
+        self.assertEqual(view_based_copy.func.__name__, RegionCopy.as_view().__name__)
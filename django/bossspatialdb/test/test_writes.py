@@ -0,0 +1,164 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch, MagicMock
+
+import blosc
+import numpy as np
+from django.test import override_settings
+from mockredis import mock_strict_redis_client
+
+from bosscore.error import BossError
+from bossspatialdb.writes import clear_region
+
+from spdb.c_lib.ndlib import XYZMorton
+
+CUBE_DIM = [[8, 8, 4]]
+
+
+class FakeSpatialDB:
+    """
+    SpatialDB over a small volume, with the merge semantics of the real write_cuboid
+    """
+
+    def __init__(self, volume):
+        self.volume = volume
+        self.objects = {}
+        self.kvio = MagicMock()
+        self.kvio.cache_client = mock_strict_redis_client()
+        self.kvio.generate_cached_cuboid_keys.side_effect = \
+            lambda resource, resolution, t_list, morton_ids, iso=False: \
+            ["CACHED-CUBOID&{}&{}".format(t, morton) for t in t_list for morton in morton_ids]
+        self.objectio = MagicMock()
+        self.objectio.generate_object_key.side_effect = \
+            lambda resource, resolution, t_idx, morton, iso=False: "OBJECT&{}&{}".format(t_idx, morton)
+        self.objectio.put_objects.side_effect = \
+            lambda keys, cubes: self.objects.update((key, blosc.unpack_array(cube)) for key, cube in zip(keys, cubes))
+
+    def cutout(self, resource, corner, extent, resolution, time_range, iso=False):
+        return MagicMock(data=self.volume[time_range[0]:time_range[1], corner[2]:corner[2] + extent[2],
+                                          corner[1]:corner[1] + extent[1], corner[0]:corner[0] + extent[0]].copy())
+
+    def write_cuboid(self, resource, corner, resolution, data, t_start, iso=False):
+        # Only non-zero voxels are merged into the stored data
+        region = self.volume[t_start:t_start + data.shape[0], corner[2]:corner[2] + data.shape[1],
+                             corner[1]:corner[1] + data.shape[2], corner[0]:corner[0] + data.shape[3]]
+        region[data != 0] = data[data != 0]
+
+
+@override_settings(CUTOUT_CLEAR_WORKERS=2, CUTOUT_CLEAR_MAX_CUBOIDS=8, CUBOID_LOCK_TTL=60, CUBOID_LOCK_WAIT=1)
+@patch('bossspatialdb.cuboids.CUBOIDSIZE', CUBE_DIM)
+@patch('bossspatialdb.writes.CUBOIDSIZE', CUBE_DIM)
+@patch('bossspatialdb.overwrite.CUBOIDSIZE', CUBE_DIM)
+@patch('bossspatialdb.writes.finish_write')
+@patch('bossspatialdb.writes.SpatialDB')
+class TestClearRegion(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('bossspatialdb.cache_index.CuboidCacheIndex')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('bossspatialdb.writes.PendingWrites')
+        self.mock_pending = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('bossspatialdb.writes.RetiredIds')
+        self.mock_retired = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.resource = MagicMock()
+        self.resource.get_numpy_data_type.return_value = np.uint64
+        self.resource.get_lookup_key.return_value = "1&2&3"
+        self.fake = FakeSpatialDB(np.random.randint(1, 1000, (2, 8, 16, 16)).astype(np.uint64))
+
+    def test_clear(self, mock_spdb, mock_finish):
+        """Non-zero voxels really become zero, although write_cuboid only merges non-zero voxels"""
+        mock_spdb.return_value = self.fake
+        original = self.fake.volume.copy()
+        count = clear_region(self.resource, 0, (4, 0, 0), (12, 8, 4), [1, 2])
+
+        # The region covers cuboid (1, 0, 0) fully and cuboid (0, 0, 0) in part
+        self.assertEqual(count, 2)
+        self.assertEqual(set(self.fake.objects), {"OBJECT&1&{}".format(XYZMorton([0, 0, 0])),
+                                                  "OBJECT&1&{}".format(XYZMorton([1, 0, 0]))})
+
+        partial = self.fake.objects["OBJECT&1&{}".format(XYZMorton([0, 0, 0]))]
+        np.testing.assert_array_equal(partial[:, :, 4:8], 0)
+        np.testing.assert_array_equal(partial[:, :, 0:4], original[1, 0:4, 0:8, 0:4])
+        np.testing.assert_array_equal(self.fake.objects["OBJECT&1&{}".format(XYZMorton([1, 0, 0]))], 0)
+
+        # The cache holds the same cuboids, so reads see the zeros at once
+        cached = self.fake.kvio.cache_client.get("CACHED-CUBOID&1&{}".format(XYZMorton([0, 0, 0])))
+        np.testing.assert_array_equal(blosc.unpack_array(cached), partial)
+
+        # No locks are left behind
+        self.assertEqual(self.fake.kvio.cache_client.keys("CUBOID-LOCK&*"), [])
+        mock_finish.assert_called_once_with(self.resource, 0, [((4, 0, 0), (12, 8, 4))], [1, 2], iso=False)
+
+    def test_locked_cuboid(self, mock_spdb, mock_finish):
+        """A cuboid another request is rewriting is not written"""
+        mock_spdb.return_value = self.fake
+        self.fake.kvio.cache_client.set("CUBOID-LOCK&1&2&3&0&{}".format(XYZMorton([0, 0, 0])), "other")
+        with self.assertRaises(BossError):
+            clear_region(self.resource, 0, (0, 0, 0), (8, 8, 4), [0, 1])
+        self.assertEqual(self.fake.objects, {})
+        mock_finish.assert_called_once_with(self.resource, 0, [((0, 0, 0), (8, 8, 4))], [0, 1], iso=False)
+
+    def test_failed_write_finishes(self, mock_spdb, mock_finish):
+        """Caches are updated for the cuboids cleared before a write failed"""
+        mock_spdb.return_value = self.fake
+        self.fake.objectio.put_objects.side_effect = IOError("down")
+        with self.assertRaises(IOError):
+            clear_region(self.resource, 0, (0, 0, 0), (8, 8, 4), [0, 1])
+        mock_finish.assert_called_once_with(self.resource, 0, [((0, 0, 0), (8, 8, 4))], [0, 1], iso=False)
+
+    def test_pending_writes(self, mock_spdb, mock_finish):
+        """Nothing is cleared while a buffered write to the region could still be flushed over it"""
+        mock_spdb.return_value = self.fake
+        self.mock_pending.return_value.wait.side_effect = BossError("pending", 0)
+        with self.assertRaises(BossError):
+            clear_region(self.resource, 0, (4, 0, 0), (12, 8, 4), [1, 2])
+        self.mock_pending.return_value.wait.assert_called_once_with(self.resource, 0, [(0, 0, 0), (1, 0, 0)],
+                                                                    [1, 2], iso=False)
+        self.assertEqual(self.fake.objects, {})
+        mock_finish.assert_not_called()
+
+    def test_retire_erased_ids(self, mock_spdb, mock_finish):
+        """Erased ids are retired unless they are left in a cleared cuboid or their box reaches past the cuboids"""
+        mock_spdb.return_value = self.fake
+        self.resource.get_channel.return_value.is_image.return_value = False
+        self.fake.volume[...] = 0
+        # Only in the cleared part
+        self.fake.volume[0, 0, 0, 0] = 5
+        # Also in the next cuboid
+        self.fake.volume[0, 0, 0, 1] = 6
+        self.fake.volume[0, 0, 0, 12] = 6
+        # Also in the part of the cuboid that isn't cleared
+        self.fake.volume[0, 0, 0, 2] = 8
+        self.fake.volume[0, 0, 0, 6] = 8
+        boxes = {5: [0, 8], 6: [0, 16], 8: [0, 8]}
+        self.fake.get_bounding_box = lambda resource, resolution, id, bb_type: \
+            {'x_range': boxes[id], 'y_range': [0, 8], 'z_range': [0, 4], 't_range': [0, 1]}
+
+        clear_region(self.resource, 0, (0, 0, 0), (4, 8, 4), [0, 1])
+
+        retire = self.mock_retired.return_value.retire
+        retire.assert_called_once()
+        self.assertEqual(retire.call_args[0][:2], ("1&2&3", 0))
+        np.testing.assert_array_equal(retire.call_args[0][2], [5])
+
+    def test_too_large(self, mock_spdb, mock_finish):
+        mock_spdb.return_value = self.fake
+        with self.assertRaises(BossError):
+            clear_region(self.resource, 0, (0, 0, 0), (24, 24, 4), [0, 1])
+        self.assertEqual(self.fake.objects, {})
+        mock_finish.assert_not_called()
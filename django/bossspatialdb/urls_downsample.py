@@ -19,4 +19,8 @@ from . import views
 urlpatterns = [
     # Url to handle cutout with a collection, experiment, channel
     url(r'^(?P<collection>[\w_-]+)/(?P<experiment>[\w_-]+)/(?P<channel>[\w_-]+)/?$', views.Downsample.as_view()),
+
+    # Url to get the per resolution geometry of a channel
+    url(r'^(?P<collection>[\w_-]+)/(?P<experiment>[\w_-]+)/(?P<channel>[\w_-]+)/geometry/?$',
+        views.DownsampleGeometry.as_view()),
 ]
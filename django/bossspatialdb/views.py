@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import numpy as np
+import hashlib
+import json
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -21,20 +23,30 @@ from rest_framework.parsers import JSONParser
 
 from .parsers import BloscParser, BloscPythonParser, NpygzParser, is_too_large
 from .renderers import BloscRenderer, BloscPythonRenderer, NpygzRenderer, JpegRenderer
+from .cache_index import register_cached_cuboids
+from .downsample import update_downsample_status, get_downsample_totals
+from .downsample import get_downsample_region, DOWNSAMPLE_REGION_KEYS
+from .progress import JobProgress
+from .geometry import get_downsample_geometry
+from .pending_writes import record_buffered_write
+from .writes import finish_write, clear_region
+from .region_copy import parse_copy_source, check_copy_channels, start_copy, get_copy_job_key
+from .resource import ServiceRequest
+from .retired_ids import restore_written_ids
 
 from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
 from django.conf import settings
 
 from bosscore.request import BossRequest
 from bosscore.error import BossError, BossHTTPError, BossParserError, ErrorCodes
 from bosscore.models import Channel
+from bosscore.sfn_status import get_sfn_status
 
 from spdb.spatialdb.spatialdb import SpatialDB, CUBOIDSIZE
-from spdb.spatialdb.rediskvio import RedisKVIO
 from spdb import project
 import bossutils
 from bossutils.aws import get_region
-from bossutils.logger import BossLogger
 
 
 class Cutout(APIView):
@@ -137,6 +149,9 @@ class Cutout(APIView):
         # Get a Cube instance with all time samples
         data = cache.cutout(resource, corner, extent, req.get_resolution(), [req.get_time().start, req.get_time().stop],
                             filter_ids=req.get_filter_ids(), iso=iso, no_cache=no_cache)
+        if not no_cache:
+            register_cached_cuboids(resource, req.get_resolution(), corner, extent,
+                                    [req.get_time().start, req.get_time().stop], iso=iso)
         to_renderer = {"time_request": req.time_request,
                        "data": data}
 
@@ -215,20 +230,84 @@ class Cutout(APIView):
             # TODO: Eventually remove as this level of detail should not be sent to the user
             return BossHTTPError('Error during write_cuboid: {}'.format(e), ErrorCodes.BOSS_SYSTEM_ERROR)
 
-        # If the channel status is DOWNSAMPLED change status to NOT_DOWNSAMPLED since you just wrote data
-        channel = resource.get_channel()
-        if channel.downsample_status.upper() == "DOWNSAMPLED":
-            # Get Channel object and update status
-            lookup_key = resource.get_lookup_key()
-            _, exp_id, _ = lookup_key.split("&")
-            channel_obj = Channel.objects.get(name=channel.name, experiment=int(exp_id))
-            channel_obj.downsample_status = "NOT_DOWNSAMPLED"
-            channel_obj.downsample_arn = ""
-            channel_obj.save()
+        # Keep the cache index, data version, id sets and downsample status consistent with the write
+        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        record_buffered_write(resource, req.get_resolution(), corner, extent,
+                              [req.get_time().start, req.get_time().stop], iso=iso)
+        finish_write(resource, req.get_resolution(), [(corner, extent)],
+                     [req.get_time().start, req.get_time().stop], iso=iso)
+        if not iso and not resource.get_channel().is_image():
+            # Ids a relabel retired exist again once they are written
+            restore_written_ids(resource.get_lookup_key(), req.get_resolution(), request.data[2])
 
         # Send data to renderer
         return HttpResponse(status=201)
 
+    def delete(self, request, collection, experiment, channel, resolution, x_range, y_range, z_range, t_range=None):
+        """
+        View to handle DELETE requests that set a region of a channel to zero
+
+        No data is sent with the request. The region is cleared server side, one cuboid at a time.
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param collection: Unique Collection identifier, indicating which collection you want to access
+        :param experiment: Experiment identifier, indicating which experiment you want to access
+        :param channel: Channel identifier, indicating which dataset or annotation project you want to access
+        :param resolution: Integer indicating the level in the resolution hierarchy (0 = native)
+        :param x_range: Python style range indicating the X coordinates of the region to clear (eg. 100:200)
+        :param y_range: Python style range indicating the Y coordinates of the region to clear (eg. 100:200)
+        :param z_range: Python style range indicating the Z coordinates of the region to clear (eg. 100:200)
+        :return:
+        """
+        # Check for optional iso flag
+        if "iso" in request.query_params:
+            if request.query_params["iso"].lower() == "true":
+                iso = True
+            else:
+                iso = False
+        else:
+            iso = False
+
+        # Process request and validate
+        try:
+            request_args = {
+                "service": "cutout",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "resolution": resolution,
+                "x_args": x_range,
+                "y_args": y_range,
+                "z_args": z_range,
+                "time_args": t_range,
+                "ids": None
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # Convert to Resource
+        resource = project.BossResourceDjango(req)
+
+        try:
+            resource.get_numpy_data_type()
+        except ValueError:
+            return BossHTTPError("Unsupported data type: {}".format(resource.get_data_type()), ErrorCodes.TYPE_ERROR)
+
+        corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
+        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        try:
+            clear_region(resource, req.get_resolution(), corner, extent,
+                         [req.get_time().start, req.get_time().stop], iso=iso)
+        except BossError as err:
+            return err.to_http()
+        except Exception as e:
+            # TODO: Eventually remove as this level of detail should not be sent to the user
+            return BossHTTPError('Error during write_cuboid: {}'.format(e), ErrorCodes.BOSS_SYSTEM_ERROR)
+
+        return HttpResponse(status=204)
+
 
 class Downsample(APIView):
     """
@@ -277,7 +356,6 @@ class Downsample(APIView):
 
         # Get Status
         channel = resource.get_channel()
-        experiment = resource.get_experiment()
         to_renderer = {"status": channel.downsample_status}
 
         # Check Step Function if status is in-progress and update
@@ -286,64 +364,17 @@ class Downsample(APIView):
             _, exp_id, _ = lookup_key.split("&")
             # Get channel object
             channel_obj = Channel.objects.get(name=channel.name, experiment=int(exp_id))
-            # Update the status from the step function
-            session = bossutils.aws.get_session()
-            status = bossutils.aws.sfn_status(session, channel_obj.downsample_arn)
-            if status == "SUCCEEDED":
-                # Change to DOWNSAMPLED
-                channel_obj.downsample_status = "DOWNSAMPLED"
-                channel_obj.save()
-                to_renderer["status"] = "DOWNSAMPLED"
-
-                # DP NOTE: This code should be moved to spdb when change
-                #          tracking is added to automatically calculate
-                #          frame extents for the user
-                # DP NOTE: Clear the cache of any cubes for the channel
-                #          This is to prevent serving stale data after
-                #          (re)downsampling
-                log = BossLogger().logger
-                for pattern in ("CACHED-CUBOID&"+lookup_key+"&*",
-                                "CACHED-CUBOID&ISO&"+lookup_key+"&*"):
-                    log.debug("Clearing cache of {} cubes".format(pattern))
-                    try:
-                        cache = RedisKVIO(settings.KVIO_SETTINGS)
-                        pipe = cache.cache_client.pipeline()
-                        for key in cache.cache_client.scan_iter(match=pattern):
-                            pipe.delete(key)
-                        pipe.execute()
-                    except Exception as ex:
-                        log.exception("Problem clearing cache after downsample finished")
-
-            elif status == "FAILED" or status == "TIMED_OUT":
-                # Change status to FAILED
-                channel_obj = Channel.objects.get(name=channel.name, experiment=int(exp_id))
-                channel_obj.downsample_status = "FAILED"
-                channel_obj.save()
-                to_renderer["status"] = "FAILED"
-
-        # Get hierarchy levels
-        to_renderer["num_hierarchy_levels"] = experiment.num_hierarchy_levels
-
-        # Gen Voxel dims
-        voxel_size = {}
-        voxel_dims = resource.get_downsampled_voxel_dims(iso=iso)
-        for res, dims in enumerate(voxel_dims):
-            voxel_size["{}".format(res)] = dims
-
-        to_renderer["voxel_size"] = voxel_size
-
-        # Gen Extent dims
-        extent = {}
-        extent_dims = resource.get_downsampled_extent_dims(iso=iso)
-        for res, dims in enumerate(extent_dims):
-            extent["{}".format(res)] = dims
-        to_renderer["extent"] = extent
-
-        # Get Cuboid dims
-        cuboid_size = {}
-        for res in range(0, experiment.num_hierarchy_levels):
-            cuboid_size["{}".format(res)] = CUBOIDSIZE[res]
-        to_renderer["cuboid_size"] = cuboid_size
+            # Update the status from the step function, as last seen by the status poller
+            status = get_sfn_status(channel_obj.downsample_arn)
+            to_renderer["status"] = update_downsample_status(channel_obj, status)
+
+        # Get the per level progress reported by the downsample workers. Clients poll for updates no more often
+        # than the status poller refreshes the status
+        to_renderer["progress"] = JobProgress(settings.KVIO_SETTINGS, resource.get_lookup_key()).get()
+        to_renderer["poll_interval"] = settings.SFN_STATUS_POLL_INTERVAL
+
+        # Get hierarchy levels, voxel dims, extent dims and cuboid dims
+        to_renderer.update(get_downsample_geometry(resource, iso=iso))
 
         # Send data to renderer
         return Response(to_renderer)
@@ -375,29 +406,34 @@ class Downsample(APIView):
         # Convert to Resource
         resource = project.BossResourceDjango(req)
 
+        # An optional bounding box limits the downsample to the part of the frame that changed
+        region = {}
+        if isinstance(request.data, dict):
+            region = {key: value for key, value in request.data.items() if key in DOWNSAMPLE_REGION_KEYS}
+
         channel = resource.get_channel()
         if channel.downsample_status.upper() == "IN_PROGRESS":
             return BossHTTPError("Channel is currently being downsampled. Invalid Request.", ErrorCodes.INVALID_STATE)
-        elif channel.downsample_status.upper() == "DOWNSAMPLED" and \
-             not request.user.is_staff:
-            return BossHTTPError("Channel is already downsampled. Invalid Request.", ErrorCodes.INVALID_STATE)
 
-        if request.user.is_staff:
-            # DP HACK: allow admin users to override the coordinate frame
-            frame = request.data
-        else:
-            frame = {}
+        try:
+            start, stop = get_downsample_region(resource, region)
+        except BossError as err:
+            return err.to_http()
+
+        # Users other than staff may only re-downsample a downsampled channel one region at a time
+        if channel.downsample_status.upper() == "DOWNSAMPLED" and not request.user.is_staff:
+            frame = resource.get_coord_frame()
+            if start == (frame.x_start, frame.y_start, frame.z_start) and \
+                    stop == (frame.x_stop, frame.y_stop, frame.z_stop):
+                return BossHTTPError("Channel is already downsampled. Give a region smaller than the coordinate "
+                                     "frame to re-downsample part of it.", ErrorCodes.INVALID_STATE)
 
         # Call Step Function
         boss_config = bossutils.configuration.BossConfig()
         experiment = resource.get_experiment()
-        coord_frame = resource.get_coord_frame()
         lookup_key = resource.get_lookup_key()
         col_id, exp_id, ch_id = lookup_key.split("&")
 
-        def get_frame(idx):
-            return int(frame.get(idx, getattr(coord_frame, idx)))
-
         args = {
             'collection_id': int(col_id),
             'experiment_id': int(exp_id),
@@ -408,13 +444,13 @@ class Downsample(APIView):
             's3_bucket': boss_config["aws"]["cuboid_bucket"],
             's3_index': boss_config["aws"]["s3-index-table"],
 
-            'x_start': get_frame('x_start'),
-            'y_start': get_frame('y_start'),
-            'z_start': get_frame('z_start'),
+            'x_start': start[0],
+            'y_start': start[1],
+            'z_start': start[2],
 
-            'x_stop': get_frame('x_stop'),
-            'y_stop': get_frame('y_stop'),
-            'z_stop': get_frame('z_stop'),
+            'x_stop': stop[0],
+            'y_stop': stop[1],
+            'z_stop': stop[2],
 
             'resolution': int(channel.base_resolution),
             'resolution_max': int(experiment.num_hierarchy_levels),
@@ -430,6 +466,15 @@ class Downsample(APIView):
 
         }
 
+        # Workers report per level progress to this Redis hash (see bossspatialdb.progress.JobProgress)
+        totals = get_downsample_totals(resource, start, stop)
+        progress = JobProgress(settings.KVIO_SETTINGS, lookup_key)
+        progress.start(totals)
+        args['progress_key'] = progress.key
+        args['progress_levels'] = [str(level) for level in totals]
+        args['progress_cache_host'] = settings.KVIO_SETTINGS['cache_host']
+        args['progress_cache_db'] = settings.KVIO_SETTINGS['cache_db']
+
         session = bossutils.aws.get_session()
         downsample_sfn = boss_config['sfn']['downsample_sfn']
         arn = bossutils.aws.sfn_execute(session, downsample_sfn, dict(args))
@@ -483,11 +528,175 @@ class Downsample(APIView):
         bossutils.aws.sfn_cancel(session, channel_obj.downsample_arn, error="User Cancel",
                                  cause="User has requested the downsample operation to stop.")
 
-        # Clear ARN
+        # Clear ARN and progress
         channel_obj.downsample_arn = ""
+        JobProgress(settings.KVIO_SETTINGS, lookup_key).clear()
 
         # Change Status
         channel_obj.downsample_status = "NOT_DOWNSAMPLED"
         channel_obj.save()
 
         return HttpResponse(status=204)
+
+
+class DownsampleGeometry(APIView):
+    """
+    View to provide the per resolution geometry of a channel without its downsample status
+
+    * Requires authentication.
+    """
+    # Set Parser and Renderer
+    parser_classes = (JSONParser, BrowsableAPIRenderer)
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request, collection, experiment, channel):
+        """View to provide the voxel size, extent and cuboid size of each resolution level, including iso variants
+
+        The response carries an ETag and Cache-Control max-age so viewers can plan tile requests from a cached copy.
+
+        Args:
+            request: DRF Request object
+            collection (str): Unique Collection identifier, indicating which collection you want to access
+            experiment (str): Experiment identifier, indicating which experiment you want to access
+            channel (str): Channel identifier, indicating which channel you want to access
+
+        Returns:
+
+        """
+        # Process request and validate
+        try:
+            request_args = {
+                "service": "downsample",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # Convert to Resource
+        resource = project.BossResourceDjango(req)
+
+        geometry = get_downsample_geometry(resource, iso=False)
+        iso_geometry = get_downsample_geometry(resource, iso=True)
+        to_renderer = dict(geometry)
+        to_renderer["iso"] = {"voxel_size": iso_geometry["voxel_size"],
+                              "extent": iso_geometry["extent"]}
+
+        etag = '"{}"'.format(hashlib.md5(json.dumps(to_renderer, sort_keys=True).encode()).hexdigest())
+        if etag in request.META.get("HTTP_IF_NONE_MATCH", ""):
+            response = HttpResponse(status=304)
+        else:
+            response = Response(to_renderer)
+
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, max_age=settings.DOWNSAMPLE_GEOMETRY_MAX_AGE)
+        return response
+
+
+class RegionCopy(APIView):
+    """
+    View to copy a region from one channel to another server side
+
+    * Requires authentication.
+    """
+    parser_classes = (JSONParser, BrowsableAPIRenderer)
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request, collection, experiment, channel):
+        """View to provide the progress of the latest copy into a channel
+
+        Args:
+            request: DRF Request object
+            collection (str): Unique Collection identifier, indicating which collection you want to access
+            experiment (str): Experiment identifier, indicating which experiment you want to access
+            channel (str): Channel identifier, indicating which channel you want to access
+
+        Returns:
+
+        """
+        try:
+            request_args = {
+                "service": "downsample",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        resource = project.BossResourceDjango(req)
+        progress = JobProgress(settings.KVIO_SETTINGS, get_copy_job_key(resource.get_lookup_key()))
+        return Response({"progress": progress.get(), "error": progress.get_error()})
+
+    def post(self, request, collection, experiment, channel, resolution, x_range, y_range, z_range, t_range=None):
+        """View to start copying a region of the source channel given in the body into the same region of this channel
+
+        The copy runs in a detached process. Its progress, or why it failed, is reported by GET.
+
+        Args:
+            request: DRF Request object
+            collection (str): Unique Collection identifier of the destination channel
+            experiment (str): Experiment identifier of the destination channel
+            channel (str): Channel identifier of the destination channel
+            resolution (str): Integer indicating the level in the resolution hierarchy (0 = native)
+            x_range (str): Python style range indicating the X coordinates of the region to copy (eg. 100:200)
+            y_range (str): Python style range indicating the Y coordinates of the region to copy (eg. 100:200)
+            z_range (str): Python style range indicating the Z coordinates of the region to copy (eg. 100:200)
+            t_range (str): Optional python style range indicating the time samples to copy (eg. 0:2)
+
+        Returns:
+
+        """
+        # Check for optional iso flag
+        if "iso" in request.query_params:
+            if request.query_params["iso"].lower() == "true":
+                iso = True
+            else:
+                iso = False
+        else:
+            iso = False
+
+        region_args = {
+            "service": "cutout",
+            "resolution": resolution,
+            "x_args": x_range,
+            "y_args": y_range,
+            "z_args": z_range,
+            "time_args": t_range,
+            "ids": None
+        }
+
+        # The destination is written, so it is validated against the POST permissions of this request, while the
+        # source is only read
+        try:
+            source_names = parse_copy_source(request.data)
+            request_args = dict(region_args, collection_name=collection, experiment_name=experiment,
+                                channel_name=channel)
+            req = BossRequest(request, request_args)
+
+            source_request = ServiceRequest(request.user, 'GET', request.version)
+            source_args = dict(region_args, collection_name=source_names[0], experiment_name=source_names[1],
+                               channel_name=source_names[2])
+            source_req = BossRequest(source_request, source_args)
+        except BossError as err:
+            return err.to_http()
+
+        destination = project.BossResourceDjango(req)
+        source = project.BossResourceDjango(source_req)
+
+        corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
+        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        try:
+            check_copy_channels(source, destination, req.get_resolution(), iso=iso)
+            cuboids = start_copy(source_names, (collection, experiment, channel), destination, req.get_resolution(),
+                                 corner, extent, [req.get_time().start, req.get_time().stop], iso=iso)
+        except BossError as err:
+            return err.to_http()
+        except Exception as e:
+            # TODO: Eventually remove as this level of detail should not be sent to the user
+            return BossHTTPError('Error starting the copy: {}'.format(e), ErrorCodes.BOSS_SYSTEM_ERROR)
+
+        return Response({"cuboids_total": cuboids}, status=202)
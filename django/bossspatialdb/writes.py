@@ -0,0 +1,224 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from bosscore.error import BossError, ErrorCodes
+from bosscore.models import Channel
+from bossutils.logger import BossLogger
+
+from spdb.spatialdb.spatialdb import SpatialDB, CUBOIDSIZE
+
+from .cache_index import CuboidCacheIndex
+from .cuboids import get_region_cuboids
+from .data_version import bump_data_version
+from .id_cache import CuboidIdCache
+from .overwrite import CuboidRewriter
+from .pending_writes import PendingWrites
+from .retired_ids import RetiredIds
+
+
+def mark_not_downsampled(resource):
+    """Mark a downsampled channel as NOT_DOWNSAMPLED after its data changed
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the written channel
+
+    Returns:
+        None
+    """
+    channel = resource.get_channel()
+    if channel.downsample_status.upper() == "DOWNSAMPLED":
+        # Get Channel object and update status
+        _, exp_id, _ = resource.get_lookup_key().split("&")
+        channel_obj = Channel.objects.get(name=channel.name, experiment=int(exp_id))
+        channel_obj.downsample_status = "NOT_DOWNSAMPLED"
+        channel_obj.downsample_arn = ""
+        channel_obj.save()
+
+
+def finish_write(resource, resolution, regions, time_range, iso=False):
+    """Bring a channel's caches and downsample status up to date after regions of it were written
+
+    The written cuboids are registered with the cache index, since flushing the write updates them, the channel's
+    data version is bumped and the id sets of the written cuboids are dropped. The id sets are dropped after the
+    version bump, so a region query that scanned the old data can't cache it again. Cache failures are logged
+    rather than failing the write, which has already happened.
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the written channel
+        resolution (int): Resolution level of the writes
+        regions (list(((int, int, int), (int, int, int)))): X, Y, Z corner and extent of each written region
+        time_range ([int, int]): Time range of the writes
+        iso (bool): Flag indicating if the isotropic cuboids were written
+
+    Returns:
+        None
+    """
+    lookup_key = resource.get_lookup_key()
+    try:
+        cache_index = CuboidCacheIndex(settings.KVIO_SETTINGS)
+        for corner, extent in regions:
+            cache_index.add(resource, resolution, corner, extent, list(time_range), iso=iso)
+    except Exception:
+        BossLogger().logger.exception("Problem registering cached cuboids for {}".format(lookup_key))
+
+    bump_data_version(lookup_key)
+
+    if not iso:
+        try:
+            id_cache = CuboidIdCache(settings.KVIO_SETTINGS)
+            for corner, extent in regions:
+                id_cache.invalidate(lookup_key, resolution, corner, extent, list(time_range))
+        except Exception:
+            BossLogger().logger.exception("Problem invalidating cuboid id sets of {}".format(lookup_key))
+
+    mark_not_downsampled(resource)
+
+
+def retire_cleared_ids(resource, resolution, cuboids, time_range, erased, remaining):
+    """Retire the ids a region clear erased that have no voxels left
+
+    The id index only ever gains cuboids, so an erased id keeps its loose bounding box. An id is retired when none of
+    the cleared cuboids still hold it and its loose bounding box lies inside them, so it can't have voxels anywhere
+    else. Ids whose box reaches past the cleared cuboids are left alone, as checking them would mean reading the rest
+    of the box.
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the annotation channel
+        resolution (int): Resolution level of the clear
+        cuboids (list((int, int, int))): X, Y, Z indices of the cleared cuboids
+        time_range ([int, int]): Time range of the clear
+        erased (numpy.ndarray): uint64 ids found in the cleared parts of the cuboids
+        remaining (numpy.ndarray): uint64 ids left in the cleared cuboids
+
+    Returns:
+        (numpy.ndarray): The retired ids
+    """
+    ids = np.setdiff1d(erased, remaining)
+    ids = ids[ids != 0]
+    if not len(ids):
+        return ids
+
+    cube_dim = CUBOIDSIZE[resolution]
+    start = [min(cuboid[i] for cuboid in cuboids) * cube_dim[i] for i in range(3)]
+    stop = [(max(cuboid[i] for cuboid in cuboids) + 1) * cube_dim[i] for i in range(3)]
+    local = threading.local()
+
+    def is_gone(id):
+        if not hasattr(local, 'spdb'):
+            local.spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
+        box = local.spdb.get_bounding_box(resource, resolution, int(id), bb_type='loose')
+        if box is None:
+            return True
+        if box['t_range'][0] < time_range[0] or box['t_range'][1] > time_range[1]:
+            return False
+        return all(start[i] <= box['{}_range'.format(axis)][0] and box['{}_range'.format(axis)][1] <= stop[i]
+                   for i, axis in enumerate(('x', 'y', 'z')))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(settings.CUTOUT_CLEAR_WORKERS, len(ids)))) as executor:
+        gone = ids[np.array(list(executor.map(is_gone, ids)), dtype=bool)]
+    RetiredIds(settings.STATEIO_CONFIG).retire(resource.get_lookup_key(), resolution, gone)
+    return gone
+
+
+def clear_region(resource, resolution, corner, extent, time_range, iso=False):
+    """Set a region of a channel to zero without the client sending any voxels
+
+    The region is written one cuboid at a time in a thread pool. SpatialDB.write_cuboid can't write zeros, so cuboids
+    are replaced whole: fully covered image cuboids by an empty cuboid without being read, other cuboids by the stored
+    cuboid with the covered part zeroed. Annotation cuboids are read so the erased ids can be retired afterwards, see
+    retire_cleared_ids(). The clear waits for buffered writes to the cuboids to be flushed first, as a later flush
+    would merge them back over the cleared voxels. The channel's caches are brought up to date even if a write fails
+    part way.
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the channel
+        resolution (int): Resolution level of the region
+        corner ((int, int, int)): X, Y, Z corner of the region
+        extent ((int, int, int)): X, Y, Z extent of the region
+        time_range ([int, int]): Time range of the region
+        iso (bool): Flag indicating if the isotropic cuboids should be cleared
+
+    Returns:
+        (int): Number of cuboids written
+
+    Raises:
+        BossError: If the region covers more than CUTOUT_CLEAR_MAX_CUBOIDS cuboids, or its cuboids still have pending
+                   writes after WRITE_BUFFER_WAIT seconds
+    """
+    parts = list(get_region_cuboids(resolution, corner, extent))
+    if len(parts) > settings.CUTOUT_CLEAR_MAX_CUBOIDS:
+        raise BossError("Region clears support at most {} cuboids. Reduce the region dimensions.".format(
+            settings.CUTOUT_CLEAR_MAX_CUBOIDS), ErrorCodes.REQUEST_TOO_LARGE)
+
+    cuboids = [part[0] for part in parts]
+    PendingWrites(settings.STATEIO_CONFIG).wait(resource, resolution, cuboids, time_range, iso=iso)
+
+    data_type = resource.get_numpy_data_type()
+    num_samples = time_range[1] - time_range[0]
+    cube_dim = CUBOIDSIZE[resolution]
+    annotation = not iso and not resource.get_channel().is_image()
+    local = threading.local()
+    lock = threading.Lock()
+    erased = []
+    remaining = []
+
+    def clear(part):
+        cuboid, sub_corner, sub_extent, full = part
+        if not hasattr(local, 'rewriter'):
+            local.rewriter = CuboidRewriter(SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG,
+                                                      settings.OBJECTIO_CONFIG))
+        if full and not annotation:
+            data = np.zeros((num_samples, cube_dim[2], cube_dim[1], cube_dim[0]), dtype=data_type)
+            local.rewriter.replace(resource, resolution, cuboid, time_range, data, iso=iso)
+            return
+
+        # Covered part of the cuboid, relative to the cuboid
+        covered = [slice(sub_corner[i] - cuboid[i] * cube_dim[i],
+                         sub_corner[i] - cuboid[i] * cube_dim[i] + sub_extent[i]) for i in range(3)]
+
+        def zero(data):
+            view = data[:, covered[2], covered[1], covered[0]]
+            count = int(np.count_nonzero(view))
+            if not count:
+                return 0
+            ids = np.unique(view) if annotation else None
+            view[...] = 0
+            if annotation:
+                with lock:
+                    erased.append(ids)
+                    if not full:
+                        # Ids outside the covered part are still in the cuboid
+                        remaining.append(np.unique(data))
+            return count
+
+        local.rewriter.rewrite(resource, resolution, cuboid, time_range, zero, iso=iso)
+
+    try:
+        with ThreadPoolExecutor(max_workers=settings.CUTOUT_CLEAR_WORKERS) as executor:
+            list(executor.map(clear, parts))
+    finally:
+        finish_write(resource, resolution, [(corner, extent)], time_range, iso=iso)
+
+    if erased:
+        try:
+            retire_cleared_ids(resource, resolution, cuboids, time_range, np.unique(np.concatenate(erased)),
+                               np.unique(np.concatenate(remaining or [np.zeros(0, dtype=np.uint64)])))
+        except Exception:
+            BossLogger().logger.exception("Problem retiring the cleared ids of {}".format(resource.get_lookup_key()))
+    return len(parts)
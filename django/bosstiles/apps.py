@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class BosstilesConfig(AppConfig):
     name = 'bosstiles'
+
+    def ready(self):
+        # Connect the signal that refreshes stored tiles when a downsample finishes
+        import bosstiles.prerender
@@ -0,0 +1,190 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from bosscore.error import BossError, ErrorCodes
+from bossspatialdb.cuboids import get_region_cuboids
+
+from spdb.spatialdb import Cube
+
+from .engine import get_tile_region, get_tile_image, cutout_region
+from .prefetch import is_valid_tile
+
+
+def parse_tile_indices(req, resource, orientation, tile_size, tiles):
+    """Validate the tile indices of a batch request
+
+    Every tile goes through the same argument checks as a single tile request, against the request that was already
+    validated for the channel.
+
+    Args:
+        req (bosscore.request.BossRequest): Validated request of the batch's channel and resolution
+        resource (spdb.project.BossResource): Data model info of the channel
+        orientation (str): Image plane of the tiles
+        tile_size (int): Width and height of the tiles in voxels
+        tiles (list): X, Y, Z index of each tile
+
+    Returns:
+        (list((int, int, int))): The tile indices, without duplicates
+
+    Raises:
+        BossError: If the list is empty, too long or has an invalid tile
+    """
+    if not isinstance(tiles, list) or not tiles:
+        raise BossError("Batch tile request must provide a non-empty list of tiles", ErrorCodes.INVALID_ARGUMENT)
+    if len(tiles) > settings.TILE_BATCH_MAX_TILES:
+        raise BossError("Batch tile request has {} tiles. At most {} are supported".format(
+            len(tiles), settings.TILE_BATCH_MAX_TILES), ErrorCodes.REQUEST_TOO_LARGE)
+
+    resolution = req.get_resolution()
+    indices = OrderedDict()
+    for tile in tiles:
+        try:
+            if len(tile) != 3:
+                raise ValueError
+            index = tuple(int(idx) for idx in tile)
+        except (TypeError, ValueError):
+            raise BossError("Invalid tile {}. Tiles are [x, y, z] indices".format(tile), ErrorCodes.TYPE_ERROR)
+
+        if not is_valid_tile(resource, orientation, tile_size, resolution, *index):
+            raise BossError("Incorrect cutout arguments {}/{}/{}/{}".format(resolution, *index),
+                            ErrorCodes.INVALID_CUTOUT_ARGS)
+        req.set_tileargs(tile_size, orientation, resolution, *index)
+        indices[index] = None
+    return list(indices)
+
+
+def get_cuboid_parts(resolution, regions):
+    """Group the parts of a set of regions by the cuboid they fall in
+
+    Args:
+        resolution (int): Resolution level of the regions
+        regions (iterable(((int, int, int), (int, int, int)))): X, Y, Z corner and extent of each region
+
+    Returns:
+        (list(((int, int, int), (int, int, int)))): For each cuboid touched, the corner and extent of the smallest
+            region inside it that covers every part
+    """
+    bounds = OrderedDict()
+    for corner, extent in regions:
+        for cuboid, sub_corner, sub_extent, _ in get_region_cuboids(resolution, corner, extent):
+            start = list(sub_corner)
+            stop = [sub_corner[i] + sub_extent[i] for i in range(3)]
+            if cuboid in bounds:
+                start = [min(start[i], bounds[cuboid][0][i]) for i in range(3)]
+                stop = [max(stop[i], bounds[cuboid][1][i]) for i in range(3)]
+            bounds[cuboid] = (start, stop)
+    return [(tuple(start), tuple(stop[i] - start[i] for i in range(3))) for start, stop in bounds.values()]
+
+
+def merge_parts(parts, max_voxels):
+    """Merge cuboid parts that line up into larger regions
+
+    Parts are merged along X, then Y, then Z wherever two of them share their bounds on the other axes and meet on the
+    merging one, so a merged region never covers voxels outside the parts. No region grows beyond max_voxels.
+
+    Args:
+        parts (list(((int, int, int), (int, int, int)))): X, Y, Z corner and extent of each part
+        max_voxels (int): Maximum number of voxels in a merged region
+
+    Returns:
+        (list(((int, int, int), (int, int, int)))): X, Y, Z corner and extent of each region
+    """
+    boxes = [(list(corner), [corner[i] + extent[i] for i in range(3)]) for corner, extent in parts]
+    for axis in range(3):
+        others = [i for i in range(3) if i != axis]
+        boxes.sort(key=lambda box: [box[0][i] for i in others] + [box[1][i] for i in others] + [box[0][axis]])
+        merged = []
+        for start, stop in boxes:
+            if merged:
+                last_start, last_stop = merged[-1]
+                lined_up = all(last_start[i] == start[i] and last_stop[i] == stop[i] for i in others)
+                size = np.prod([(stop[i] if i == axis else last_stop[i]) - last_start[i] for i in range(3)])
+                if lined_up and last_stop[axis] == start[axis] and size <= max_voxels:
+                    last_stop[axis] = stop[axis]
+                    continue
+            merged.append((list(start), list(stop)))
+        boxes = merged
+    return [(tuple(start), tuple(stop[i] - start[i] for i in range(3))) for start, stop in boxes]
+
+
+def cutout_tiles(cache, resource, orientation, tile_size, resolution, tiles, t_idx, no_cache=False):
+    """Cut out a batch of tiles with as few cutouts as possible
+
+    Tiles smaller than a cuboid share cuboids, so each cuboid the batch touches is read once, covering only the parts
+    of the tiles inside it, and copied into every tile it overlaps. The parts of neighbouring cuboids are merged into
+    one cutout of up to CUTOUT_MAX_SIZE, see merge_parts(), so a viewport of adjacent tiles is usually one cutout
+    while far apart tiles never read the space between them.
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the cache
+        resource (spdb.project.BossResource): Data model info of the channel
+        orientation (str): Image plane of the tiles
+        tile_size (int): Width and height of the tiles in voxels
+        resolution (int): Resolution level of the tiles
+        tiles (list((int, int, int))): X, Y, Z tile indices
+        t_idx (int): Time sample of the tiles
+        no_cache (bool): Read directly from the object store
+
+    Returns:
+        (generator(((int, int, int), PIL.Image))): Each tile index and its image
+    """
+    time_range = [t_idx, t_idx + 1]
+    regions = OrderedDict((tile, get_tile_region(orientation, tile_size, *tile)) for tile in tiles)
+    # Data is indexed [t, z, y, x] like a cutout
+    planes = {tile: np.zeros((1, extent[2], extent[1], extent[0]), dtype=resource.get_numpy_data_type())
+              for tile, (_, extent) in regions.items()}
+
+    max_voxels = settings.CUTOUT_MAX_SIZE // np.dtype(resource.get_numpy_data_type()).itemsize
+    for corner, extent in merge_parts(get_cuboid_parts(resolution, regions.values()), max_voxels):
+        data = cutout_region(cache, resource, orientation, resolution, corner, extent, time_range, no_cache=no_cache)
+        for tile, (tile_corner, tile_extent) in regions.items():
+            low = [max(corner[i], tile_corner[i]) for i in range(3)]
+            high = [min(corner[i] + extent[i], tile_corner[i] + tile_extent[i]) for i in range(3)]
+            if any(low[i] >= high[i] for i in range(3)):
+                continue
+            src = [slice(low[i] - corner[i], high[i] - corner[i]) for i in range(3)]
+            dst = [slice(low[i] - tile_corner[i], high[i] - tile_corner[i]) for i in range(3)]
+            planes[tile][:, dst[2], dst[1], dst[0]] = data.data[:, src[2], src[1], src[0]]
+
+    for tile, (_, tile_extent) in regions.items():
+        tile_cube = Cube.create_cube(resource, list(tile_extent), time_range)
+        tile_cube.data = planes[tile]
+        yield tile, get_tile_image(tile_cube, orientation)
+
+
+def build_multipart(parts):
+    """Frame encoded tiles as a multipart/mixed body
+
+    Each part has a Content-Type and an X-Tile-Index header with the tile's x,y,z index.
+
+    Args:
+        parts (iterable(((int, int, int), str, bytes))): Tile index, media type and encoded tile of each part
+
+    Returns:
+        (bytes, str): The body and its Content-Type, including the boundary
+    """
+    boundary = uuid.uuid4().hex
+    body = []
+    for tile, media_type, data in parts:
+        body.append("--{}\r\nContent-Type: {}\r\nX-Tile-Index: {},{},{}\r\nContent-Length: {}\r\n\r\n".format(
+            boundary, media_type, tile[0], tile[1], tile[2], len(data)).encode())
+        body.append(data)
+        body.append(b"\r\n")
+    body.append("--{}--\r\n".format(boundary).encode())
+    return b"".join(body), "multipart/mixed; boundary={}".format(boundary)
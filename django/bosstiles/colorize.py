@@ -0,0 +1,139 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import numpy as np
+from PIL import Image
+
+from bosscore.error import BossError, ErrorCodes
+
+# Alpha of labels that are not highlighted when a highlight set is given
+DIM_ALPHA = 64
+
+
+def hash_ids(ids):
+    """Hash uint64 ids with the 64 bit finalizer of MurmurHash3, vectorized
+
+    Args:
+        ids (numpy.ndarray): uint64 ids
+
+    Returns:
+        (numpy.ndarray): uint64 hashes
+    """
+    h = ids.astype(np.uint64, copy=True)
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xff51afd7ed558ccd)
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xc4ceb9fe1a85ec53)
+    h ^= h >> np.uint64(33)
+    return h
+
+
+def get_label_colors(ids, highlight=None):
+    """Get the RGBA colour of each id
+
+    Colours are derived from a hash of the id, so an id has the same colour in every tile. Id 0 is transparent.
+
+    Args:
+        ids (numpy.ndarray): uint64 ids
+        highlight (set(int)|None): Ids to show at full opacity. The others are dimmed. None shows every id at full
+                                   opacity
+
+    Returns:
+        (numpy.ndarray): uint8 array of shape (len(ids), 4)
+    """
+    h = hash_ids(ids)
+    colors = np.empty((len(ids), 4), dtype=np.uint8)
+    colors[:, 0] = h & np.uint64(0xFF)
+    colors[:, 1] = (h >> np.uint64(8)) & np.uint64(0xFF)
+    colors[:, 2] = (h >> np.uint64(16)) & np.uint64(0xFF)
+    colors[:, 3] = 255
+
+    if highlight is not None:
+        highlighted = np.in1d(ids, np.fromiter(highlight, dtype=np.uint64, count=len(highlight)))
+        colors[~highlighted, 3] = DIM_ALPHA
+    colors[ids == 0, 3] = 0
+    return colors
+
+
+def colorize_labels(labels, highlight=None):
+    """Render a plane of annotation ids as a colour image
+
+    Each distinct id is coloured once and the colours are mapped back onto the plane through a lookup table. Planes
+    with at most 256 distinct ids become palette images, which encode to a much smaller PNG.
+
+    Args:
+        labels (numpy.ndarray): 2D array of uint64 ids
+        highlight (set(int)|None): Ids to show at full opacity. The others are dimmed
+
+    Returns:
+        (PIL.Image): Palette image with transparency, or RGBA image
+    """
+    ids, inverse = np.unique(labels, return_inverse=True)
+    inverse = inverse.reshape(labels.shape)
+    lut = get_label_colors(ids, highlight)
+
+    if len(ids) <= 256:
+        img = Image.fromarray(inverse.astype(np.uint8), 'P')
+        img.putpalette(lut[:, :3].flatten().tolist())
+        img.info['transparency'] = bytes(lut[:, 3].tolist())
+        return img
+
+    return Image.fromarray(lut[inverse], 'RGBA')
+
+
+def get_plane(data, orientation):
+    """Get the 2D array of a one voxel thick cutout
+
+    Args:
+        data (spdb.spatialdb.Cube): Cutout of a plane
+        orientation (str): Image plane. xy, xz or yz
+
+    Returns:
+        (numpy.ndarray): The plane with rows along y (xy) or z (xz, yz)
+    """
+    # Data is indexed [t, z, y, x]
+    if orientation == 'xy':
+        return data.data[0, 0, :, :]
+    elif orientation == 'xz':
+        return data.data[0, :, 0, :]
+    elif orientation == 'yz':
+        return data.data[0, :, :, 0]
+    else:
+        raise ValueError("Invalid orientation: {}".format(orientation))
+
+
+def get_colorize_args(query_params):
+    """Parse the colorize and highlight query parameters of a tile request
+
+    Args:
+        query_params (dict): Query parameters of the request
+
+    Returns:
+        (bool, set(int)|None): If the labels should be colorized and the ids to highlight
+
+    Raises:
+        BossError: If the highlight ids are not non-negative integers
+    """
+    colorize = query_params.get("colorize", "false").lower() == "true"
+    highlight = query_params.get("highlight")
+    if not colorize or not highlight:
+        return colorize, None
+
+    try:
+        ids = set(int(id) for id in highlight.split(","))
+        if min(ids) < 0:
+            raise ValueError
+    except ValueError:
+        raise BossError("Invalid highlight ids {}. Provide a comma separated list of ids".format(highlight),
+                        ErrorCodes.INVALID_ARGUMENT)
+    return colorize, ids
@@ -0,0 +1,153 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import io
+
+import numpy as np
+from PIL import Image
+from django.conf import settings
+
+from bosscore.error import BossError, ErrorCodes
+
+from .colorize import get_plane
+from .engine import cutout_region, get_spatial_db
+from .tile_store import are_tiles_stale, get_tile_key, get_tile_store
+
+# Colours given to channels that do not set one: red, green, blue, magenta, cyan, yellow, white, orange
+DEFAULT_COLORS = ('ff0000', '00ff00', '0000ff', 'ff00ff', '00ffff', 'ffff00', 'ffffff', 'ff8000')
+
+
+def parse_composite_layers(channels_arg):
+    """Parse the channels query parameter of a composite tile request
+
+    The parameter is a comma separated list of <channel>[:<rrggbb colour>[:<window min>:<window max>]].
+
+    Args:
+        channels_arg (str): Value of the channels query parameter
+
+    Returns:
+        (list(dict)): Channel name, RGB colour scaled to 0-1 and window (or None) of each layer
+
+    Raises:
+        BossError: If the parameter is missing or invalid
+    """
+    if not channels_arg:
+        raise BossError("Composite tile requests must provide a channels query parameter", ErrorCodes.INVALID_ARGUMENT)
+
+    specs = channels_arg.split(",")
+    if len(specs) > settings.TILE_COMPOSITE_MAX_CHANNELS:
+        raise BossError("Composite tile requests support at most {} channels".format(
+            settings.TILE_COMPOSITE_MAX_CHANNELS), ErrorCodes.INVALID_ARGUMENT)
+
+    layers = []
+    for idx, spec in enumerate(specs):
+        parts = spec.split(":")
+        if len(parts) not in (1, 2, 4) or not parts[0]:
+            raise BossError("Invalid composite channel {}. Use <channel>[:<rrggbb>[:<min>:<max>]]".format(spec),
+                            ErrorCodes.INVALID_ARGUMENT)
+
+        color = parts[1] if len(parts) > 1 else DEFAULT_COLORS[idx % len(DEFAULT_COLORS)]
+        window = None
+        try:
+            if len(color) != 6:
+                raise ValueError
+            rgb = np.array([int(color[i:i + 2], 16) for i in (0, 2, 4)], dtype=np.float32) / 255
+            if len(parts) == 4:
+                window = (float(parts[2]), float(parts[3]))
+                if window[0] >= window[1]:
+                    raise ValueError
+        except ValueError:
+            raise BossError("Invalid composite channel {}. Colours are rrggbb hex and windows are min:max with "
+                            "min < max".format(spec), ErrorCodes.INVALID_ARGUMENT)
+
+        layers.append({"channel": parts[0], "color": rgb, "window": window})
+    return layers
+
+
+def blend_layers(planes, layers):
+    """Blend planes of several channels into one RGB image
+
+    Each plane is scaled to 0-1 within its window, tinted with its colour and added to the result.
+
+    Args:
+        planes (list(numpy.ndarray)): 2D plane of each channel, all the same shape
+        layers (list(dict)): Colour and window of each channel. A window of None uses the data type's full range
+
+    Returns:
+        (PIL.Image): RGB image
+    """
+    rgb = np.zeros(planes[0].shape + (3,), dtype=np.float32)
+    for plane, layer in zip(planes, layers):
+        if layer["window"] is not None:
+            low, high = layer["window"]
+        elif np.issubdtype(plane.dtype, np.integer):
+            low, high = 0, np.iinfo(plane.dtype).max
+        else:
+            low, high = 0, 1
+        scaled = np.clip((plane.astype(np.float32) - low) / (high - low), 0, 1)
+        rgb += scaled[:, :, np.newaxis] * layer["color"]
+
+    return Image.fromarray((np.clip(rgb, 0, 1) * 255).astype(np.uint8), 'RGB')
+
+
+def fetch_plane(resource, orientation, tile_key, resolution, corner, extent, t_idx, no_cache=False):
+    """Fetch one channel's plane of a composite tile
+
+    Runs in a worker thread. A pre-rendered tile is used if the channel has one, otherwise the plane is cut out.
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the channel
+        orientation (str): Image plane of the tile
+        tile_key (str|None): Key of the channel's pre-rendered tile, or None to skip the tile store
+        resolution (int): Resolution level of the tile
+        corner ((int, int, int)): X, Y, Z corner of the tile
+        extent ((int, int, int)): X, Y, Z extent of the tile
+        t_idx (int): Time sample of the tile
+        no_cache (bool): Read directly from the object store
+
+    Returns:
+        (numpy.ndarray): 2D plane of the channel
+    """
+    if tile_key is not None:
+        tile = get_tile_store().get(tile_key)
+        if tile is not None:
+            # PIL decodes 16 bit PNGs as 32 bit integers, so cast back to what a cutout would return
+            return np.array(Image.open(io.BytesIO(tile))).astype(resource.get_numpy_data_type(), copy=False)
+
+    data = cutout_region(get_spatial_db(), resource, orientation, resolution, corner, extent, [t_idx, t_idx + 1],
+                         no_cache=no_cache)
+    return get_plane(data, orientation)
+
+
+def get_stored_tile_key(resource, orientation, tile_size, resolution, x_idx, y_idx, z_idx, t_idx):
+    """Get the key of a channel's pre-rendered PNG tile, if stored tiles are current for the channel
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the channel
+        orientation (str): Image plane of the tile
+        tile_size (int): Width and height of the tile in voxels
+        resolution (int): Resolution level of the tile
+        x_idx (int): X index of the tile
+        y_idx (int): Y index of the tile
+        z_idx (int): Z index of the tile
+        t_idx (int): Time sample of the tile
+
+    Returns:
+        (str|None): The key, or None if the channel is not downsampled or its stored tiles are stale
+    """
+    if resource.get_channel().downsample_status.upper() != "DOWNSAMPLED":
+        return None
+    if are_tiles_stale(resource.get_lookup_key()):
+        return None
+    return get_tile_key(resource.get_lookup_key(), orientation, tile_size, resolution, x_idx, y_idx, z_idx, t_idx,
+                        'png', 'default')
@@ -0,0 +1,321 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from bosscore.error import BossError, ErrorCodes
+from bossutils.logger import BossLogger
+from bossspatialdb.cache_index import register_cached_cuboids
+
+import spdb
+
+from .colorize import get_colorize_args, colorize_labels, get_plane
+from .http_cache import get_tile_validator, is_not_modified, add_cache_headers
+from .renderers import encode_image, get_profile_name
+from .tile_store import are_tiles_stale, get_tile_key, get_tile_store
+
+# Axes that are tiled (True) or indexed one slice at a time (False) for each orientation
+TILED_AXES = {'xy': (True, True, False),
+              'yz': (False, True, True),
+              'xz': (True, False, True)}
+
+
+def get_tile_region(orientation, tile_size, x_idx, y_idx, z_idx):
+    """Get the region of a tile
+
+    Args:
+        orientation (str): Image plane of the tile. xy, xz or yz
+        tile_size (int): Width and height of the tile in voxels
+        x_idx (int): X index of the tile
+        y_idx (int): Y index of the tile
+        z_idx (int): Z index of the tile
+
+    Returns:
+        ((int, int, int), (int, int, int)): Corner and extent of the tile
+
+    Raises:
+        ValueError: If the orientation is not supported
+    """
+    if orientation not in TILED_AXES:
+        raise ValueError("Invalid orientation: {}".format(orientation))
+
+    sizes = [tile_size if tiled else 1 for tiled in TILED_AXES[orientation]]
+    corner = (x_idx * sizes[0], y_idx * sizes[1], z_idx * sizes[2])
+    return corner, tuple(sizes)
+
+
+def get_tile_image(data, orientation, colorize=False, highlight=None):
+    """Convert a cutout to the image of a tile
+
+    Args:
+        data (spdb.c_lib.cube.Cube): Cutout of the tile's region
+        orientation (str): Image plane of the tile. xy, xz or yz
+        colorize (bool): Colour each annotation id instead of rendering the raw values
+        highlight (set(int)|None): Ids to show at full opacity when colorizing. None shows every id
+
+    Returns:
+        (PIL.Image): The tile image
+
+    Raises:
+        ValueError: If the orientation is not supported
+    """
+    if colorize:
+        return colorize_labels(get_plane(data, orientation), highlight)
+    elif orientation == 'xy':
+        return data.xy_image()
+    elif orientation == 'yz':
+        return data.yz_image()
+    elif orientation == 'xz':
+        return data.xz_image()
+    else:
+        raise ValueError("Invalid orientation: {}".format(orientation))
+
+
+def get_no_cache(query_params):
+    """Check if a request asked to bypass the cache with no-cache=true
+
+    Args:
+        query_params (dict): Query parameters of the request
+
+    Returns:
+        (bool)
+    """
+    return query_params.get("no-cache", "").lower() == "true"
+
+
+def get_spatial_db():
+    """Get an interface to the SPDB cache
+
+    Returns:
+        (spdb.spatialdb.SpatialDB)
+    """
+    return spdb.spatialdb.SpatialDB(settings.KVIO_SETTINGS,
+                                    settings.STATEIO_CONFIG,
+                                    settings.OBJECTIO_CONFIG)
+
+
+def cutout_region(cache, resource, orientation, resolution, corner, extent, time_range, no_cache=False):
+    """Cut out the region under a tile or image
+
+    The region is cut out in one SpatialDB call, which reads only the cuboids a one voxel thick plane touches, and the
+    cuboids paged in are registered with the cache index.
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the cache
+        resource (spdb.project.BossResource): Data model info of the channel
+        orientation (str): Image plane of the region
+        resolution (int): Resolution level of the region
+        corner ((int, int, int)): X, Y, Z corner of the region
+        extent ((int, int, int)): X, Y, Z extent of the region
+        time_range ([int, int]): Time samples of the region
+        no_cache (bool): Read directly from the object store
+
+    Returns:
+        (spdb.spatialdb.Cube): The cutout
+    """
+    data = cache.cutout(resource, corner, extent, resolution, list(time_range), no_cache=no_cache)
+    if not no_cache:
+        register_cached_cuboids(resource, resolution, corner, extent, list(time_range))
+    return data
+
+
+class TileTimer:
+    """
+    Wall clock time spent in each stage of serving a tile
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage
+
+        Args:
+            name (str): Name of the stage
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.time() - start))
+
+    def get_header(self):
+        """Format the stage times as a Server-Timing header value
+
+        Returns:
+            (str): e.g. "cutout;dur=12.3, encode;dur=4.5", in milliseconds
+        """
+        return ", ".join("{};dur={:.1f}".format(name, duration * 1000) for name, duration in self.stages)
+
+    def add_to(self, response):
+        """Log the stage times and add them to a response if TILE_SERVER_TIMING is set
+
+        Args:
+            response (HttpResponse): The tile response
+
+        Returns:
+            (HttpResponse): The response
+        """
+        if self.stages:
+            header = self.get_header()
+            BossLogger().logger.debug("Tile timing: {}".format(header))
+            if settings.TILE_SERVER_TIMING:
+                response["Server-Timing"] = header
+        return response
+
+
+class TileEngine:
+    """
+    Serves one tile or image of a channel from an already validated request
+
+    The CutoutTile and Tile views only validate their URLs and hand the request to the engine, so both share the
+    conditional request handling, size check, cutout, image conversion, encoding and timing. Tile requests may
+    also be served from the tile store and can warm the cache with their neighbours.
+    """
+
+    def __init__(self, request, req, orientation, tile_index=None, prefetcher=None):
+        """
+        Args:
+            request: DRF Request object, after content negotiation
+            req (bosscore.request.BossRequest): The validated image or tile request
+            orientation (str): Image plane requested. xy, xz or yz
+            tile_index ((int, int, int, int)|None): Tile size and X, Y, Z index of a tile request. None for image
+                                                    requests, which are never stored or prefetched
+            prefetcher (bosstiles.prefetch.TilePrefetcher|None): Prefetcher to record the request with and to
+                                                                 warm the neighbouring tiles. Needs tile_index
+        """
+        self.request = request
+        self.req = req
+        self.orientation = orientation
+        self.tile_index = tile_index
+        self.prefetcher = prefetcher
+        self.timer = TileTimer()
+
+    def render(self):
+        """Serve the tile
+
+        Returns:
+            (HttpResponse): The encoded image, a 304 response if the client's copy is current or an error
+        """
+        try:
+            response = self.get_response()
+        except BossError as err:
+            return err.to_http()
+        return self.timer.add_to(response)
+
+    def get_response(self):
+        """Serve the tile, raising errors
+
+        Returns:
+            (HttpResponse): The encoded image or a 304 response
+
+        Raises:
+            BossError: If the request can't be served
+        """
+        request = self.request
+        req = self.req
+        no_cache = get_no_cache(request.query_params)
+        colorize, highlight = get_colorize_args(request.query_params)
+
+        with self.timer.stage("validate"):
+            # Convert to Resource
+            resource = spdb.project.BossResourceDjango(req)
+            if colorize and resource.get_data_type() != "uint64":
+                raise BossError("Only annotation channels can be colorized", ErrorCodes.DATATYPE_NOT_SUPPORTED)
+
+            # Tiles only change with the channel's data version, so clients can cache and revalidate them
+            etag, modified = get_tile_validator(request, [resource.get_lookup_key()])
+            downsampled = resource.get_channel().downsample_status.upper() == "DOWNSAMPLED"
+
+        if is_not_modified(request, etag):
+            return add_cache_headers(HttpResponse(status=304), etag, modified, downsampled)
+
+        fmt = request.accepted_renderer.format
+        media_type = request.accepted_renderer.media_type
+        t_start = req.get_time().start
+
+        # Serve a pre-rendered tile if there is one. Stored tiles are only current while the channel is downsampled
+        # and no background job is still removing the tiles of an earlier downsample
+        if self.tile_index is not None and not no_cache and not colorize and downsampled and \
+                not are_tiles_stale(resource.get_lookup_key()):
+            tile_size, x_idx, y_idx, z_idx = self.tile_index
+            with self.timer.stage("store"):
+                key = get_tile_key(resource.get_lookup_key(), self.orientation, tile_size, req.get_resolution(),
+                                   x_idx, y_idx, z_idx, t_start, fmt,
+                                   get_profile_name(request.query_params.get("encoder")))
+                tile = get_tile_store().get(key)
+            if tile is not None:
+                return add_cache_headers(HttpResponse(tile, content_type=media_type), etag, modified, downsampled)
+
+        self.check_size(resource)
+
+        corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
+        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        time_range = [t_start, req.get_time().stop]
+
+        prefetcher = self.prefetcher if self.tile_index is not None and not no_cache else None
+        if prefetcher is not None:
+            # Record if the tile is already cached, to measure how well prefetching works
+            try:
+                prefetcher.record_request(resource, req.get_resolution(), corner, extent, t_start)
+            except Exception:
+                BossLogger().logger.exception("Problem recording tile prefetch statistics")
+
+        with self.timer.stage("cutout"):
+            data = cutout_region(get_spatial_db(), resource, self.orientation, req.get_resolution(), corner, extent,
+                                 time_range, no_cache=no_cache)
+
+        with self.timer.stage("image"):
+            try:
+                img = get_tile_image(data, self.orientation, colorize, highlight)
+            except ValueError:
+                raise BossError("Invalid orientation: {}".format(self.orientation), ErrorCodes.INVALID_CUTOUT_ARGS)
+
+        with self.timer.stage("encode"):
+            content = encode_image(img, fmt, request.query_params.get("encoder"))
+
+        if prefetcher is not None:
+            # Warm the cache with the tiles the viewer is likely to ask for next
+            tile_size, x_idx, y_idx, z_idx = self.tile_index
+            try:
+                prefetcher.submit(resource, self.orientation, tile_size, req.get_resolution(),
+                                  x_idx, y_idx, z_idx, t_start)
+            except Exception:
+                BossLogger().logger.exception("Problem queueing tile prefetch")
+
+        return add_cache_headers(HttpResponse(content, content_type=media_type), etag, modified, downsampled)
+
+    def check_size(self, resource):
+        """Check the request is under CUTOUT_MAX_SIZE uncompressed
+
+        Args:
+            resource (spdb.project.BossResource): Data model info of the channel
+
+        Raises:
+            BossError: If the channel's datatype is invalid or the request is too large
+        """
+        try:
+            bit_depth = resource.get_bit_depth()
+        except ValueError:
+            raise BossError("Datatype does not match channel", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+        req = self.req
+        total_bytes = req.get_x_span() * req.get_y_span() * req.get_z_span() * len(req.get_time()) * (bit_depth / 8)
+        if total_bytes > settings.CUTOUT_MAX_SIZE:
+            raise BossError("Cutout request is over 1GB when uncompressed. Reduce cutout dimensions.",
+                            ErrorCodes.REQUEST_TOO_LARGE)
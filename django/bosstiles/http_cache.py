@@ -0,0 +1,97 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from bossutils.logger import BossLogger
+
+from bossspatialdb.data_version import get_data_version
+
+
+def get_tile_validator(request, lookup_keys):
+    """Get the ETag and modification time of a tile response
+
+    The ETag is derived from the request URL, the negotiated image format and the data version of every channel in
+    the tile, so it changes whenever any of them does.
+
+    Args:
+        request: DRF Request object, after content negotiation
+        lookup_keys (list(str)): Lookup keys of the channels in the tile
+
+    Returns:
+        (str|None, float|None): The quoted ETag and the latest modification time, or None and None if the data
+                                versions are not available
+    """
+    try:
+        versions = [get_data_version(lookup_key) for lookup_key in lookup_keys]
+    except Exception:
+        BossLogger().logger.exception("Problem getting data versions of {}".format(lookup_keys))
+        return None, None
+
+    parts = [request.get_full_path(), request.accepted_renderer.format]
+    parts += ["{}={}".format(lookup_key, version) for lookup_key, (version, _) in zip(lookup_keys, versions)]
+    etag = '"{}"'.format(hashlib.md5("|".join(parts).encode()).hexdigest())
+    return etag, max(modified for _, modified in versions)
+
+
+def is_not_modified(request, etag):
+    """Check if the client already has the current tile
+
+    Args:
+        request: DRF Request object
+        etag (str|None): Quoted ETag of the current tile
+
+    Returns:
+        (bool): True if the request's If-None-Match matches the ETag
+    """
+    if etag is None:
+        return False
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def add_cache_headers(response, etag, modified, downsampled):
+    """Add the validator and caching headers to a tile response
+
+    Tiles of downsampled channels may be cached for TILE_CACHE_MAX_AGE seconds. Tiles of other channels may still be
+    changing, so clients must revalidate them on every use.
+
+    Args:
+        response (HttpResponse): The tile response, or a 304 response
+        etag (str|None): Quoted ETag of the tile. None adds no headers
+        modified (float|None): Time the tile's data last changed
+        downsampled (bool): If every channel in the tile is downsampled
+
+    Returns:
+        (HttpResponse): The response
+    """
+    if etag is None:
+        return response
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(modified)
+    patch_vary_headers(response, ("Accept",))
+
+    visibility = {"public": True} if settings.TILE_CACHE_PUBLIC else {"private": True}
+    if downsampled:
+        patch_cache_control(response, max_age=settings.TILE_CACHE_MAX_AGE, **visibility)
+    else:
+        patch_cache_control(response, no_cache=True, **visibility)
+    return response
@@ -0,0 +1,31 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.core.management.base import BaseCommand
+
+from bossspatialdb.resource import get_channel_resource
+from bosstiles.prerender import clear_channel_tiles
+
+
+class Command(BaseCommand):
+    help = "Remove every stored tile of a channel from the tile store"
+
+    def add_arguments(self, parser):
+        parser.add_argument('collection', help="Collection name")
+        parser.add_argument('experiment', help="Experiment name")
+        parser.add_argument('channel', help="Channel name")
+
+    def handle(self, *args, **options):
+        resource = get_channel_resource(options['collection'], options['experiment'], options['channel'])
+        clear_channel_tiles(resource.get_lookup_key())
+        self.stdout.write("Removed the stored tiles")
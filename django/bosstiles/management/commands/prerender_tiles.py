@@ -0,0 +1,50 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.core.management.base import BaseCommand
+
+from bosstiles.prerender import prerender_channel
+
+
+class Command(BaseCommand):
+    help = "Pre-render the tiles of a channel into the tile store"
+
+    def add_arguments(self, parser):
+        parser.add_argument('collection', help="Collection name")
+        parser.add_argument('experiment', help="Experiment name")
+        parser.add_argument('channel', help="Channel name")
+        parser.add_argument('--orientation', action='append', choices=['xy', 'xz', 'yz'],
+                            help="Image plane to render. May be repeated. Defaults to xy")
+        parser.add_argument('--tile-size', action='append', type=int,
+                            help="Tile size to render. May be repeated. Defaults to 512")
+        parser.add_argument('--format', action='append', choices=['png', 'jpg', 'webp'],
+                            help="Image format to store. May be repeated. Defaults to png")
+        parser.add_argument('--profile', action='append',
+                            help="Encoder profile to store each format with. May be repeated. Defaults to default")
+        parser.add_argument('--resolution', action='append', type=int,
+                            help="Resolution level to render. May be repeated. Defaults to every level")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Number of worker processes. Defaults to the number of CPUs")
+        parser.add_argument('--clear', action='store_true', default=False,
+                            help="Remove the channel's previously stored tiles first")
+
+    def handle(self, *args, **options):
+        rendered = prerender_channel(options['collection'], options['experiment'], options['channel'],
+                                     orientations=options['orientation'] or ['xy'],
+                                     tile_sizes=options['tile_size'] or [512],
+                                     formats=options['format'] or ['png'],
+                                     profiles=options['profile'] or ['default'],
+                                     resolutions=options['resolution'],
+                                     workers=options['workers'],
+                                     clear=options['clear'])
+        self.stdout.write("Pre-rendered {} tiles".format(rendered))
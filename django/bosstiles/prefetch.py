@@ -0,0 +1,374 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import queue
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from bossutils.logger import BossLogger
+
+from bossspatialdb.cache_index import register_cached_cuboids
+from bossspatialdb.cuboids import get_morton_ids
+
+from spdb.spatialdb.rediskvio import RedisKVIO
+
+from .engine import get_tile_region, get_spatial_db
+
+# Counters kept in the statistics hash of each channel
+PREFETCH_STATS = ('requests', 'cache_hits', 'prefetch_hits', 'prefetched_tiles', 'prefetched_cuboids',
+                  'dropped', 'rate_limited')
+
+
+def get_neighbour_tiles(resolution, x_idx, y_idx, z_idx, radius):
+    """Get the tiles a viewer is likely to ask for after a tile
+
+    These are the tiles up to radius steps away along each axis (panning in plane, stepping through slices) and the
+    tiles covering the same area one level coarser and one level finer. Levels only halve x and y.
+
+    Args:
+        resolution (int): Resolution level of the requested tile
+        x_idx (int): X index of the requested tile
+        y_idx (int): Y index of the requested tile
+        z_idx (int): Z index of the requested tile
+        radius (int): Number of steps to take along each axis
+
+    Returns:
+        (list((int, int, int, int))): Resolution, X, Y and Z index of each neighbouring tile
+    """
+    tiles = []
+    index = (x_idx, y_idx, z_idx)
+    for axis in range(3):
+        for step in range(1, radius + 1):
+            for sign in (-1, 1):
+                neighbour = list(index)
+                neighbour[axis] += sign * step
+                tiles.append((resolution, neighbour[0], neighbour[1], neighbour[2]))
+
+    tiles.append((resolution + 1, x_idx // 2, y_idx // 2, z_idx))
+    tiles.append((resolution - 1, x_idx * 2, y_idx * 2, z_idx))
+    return tiles
+
+
+def is_valid_tile(resource, orientation, tile_size, resolution, x_idx, y_idx, z_idx):
+    """Check a tile is one the tile service would accept
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the channel
+        orientation (str): Image plane of the tile
+        tile_size (int): Width and height of the tile in voxels
+        resolution (int): Resolution level of the tile
+        x_idx (int): X index of the tile
+        y_idx (int): Y index of the tile
+        z_idx (int): Z index of the tile
+
+    Returns:
+        (bool)
+    """
+    if resolution < 0 or resolution >= int(resource.get_experiment().num_hierarchy_levels):
+        return False
+    if min(x_idx, y_idx, z_idx) < 0:
+        return False
+
+    coord_frame = resource.get_coord_frame()
+    frame_start = [coord_frame.x_start, coord_frame.y_start, coord_frame.z_start]
+    frame_stop = [coord_frame.x_stop, coord_frame.y_stop, coord_frame.z_stop]
+    corner, extent = get_tile_region(orientation, tile_size, x_idx, y_idx, z_idx)
+    return all(frame_start[i] <= corner[i] and corner[i] + extent[i] <= frame_stop[i] for i in range(3))
+
+
+class TilePrefetcher:
+    """
+    Pages the cuboids of tiles a viewer is likely to ask for next into the cache
+
+    Neighbouring tiles are queued by the request thread and fetched by a single background thread, which needs
+    uWSGI's enable-threads option (set in boss_uwsgi.ini). The queue is bounded and requests are rate limited per
+    channel, so a busy server drops prefetches rather than falling behind. Cuboids brought in by a prefetch are marked
+    so later tile requests can report whether the prefetch paid off.
+
+    Statistics counters are kept in memory and written in the same pipeline as the next Redis call the prefetcher
+    makes anyway, so recording a request costs the request thread a single round trip.
+    """
+
+    def __init__(self, kv_conf, queue_size):
+        """
+        Args:
+            kv_conf (dict): KVIO settings used to connect to the cache
+            queue_size (int): Maximum number of tiles waiting to be prefetched
+        """
+        self.kvio = RedisKVIO(kv_conf)
+        self.client = self.kvio.cache_client
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.cache = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.pending_stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.log = BossLogger().logger
+
+    @staticmethod
+    def get_stats_key(lookup_key):
+        return "TILE-PREFETCH-STATS&{}".format(lookup_key)
+
+    @staticmethod
+    def get_marker_key(cached_cuboid_key):
+        return "TILE-PREFETCHED&{}".format(cached_cuboid_key)
+
+    @staticmethod
+    def get_rate_key(lookup_key, second):
+        return "TILE-PREFETCH-RATE&{}&{}".format(lookup_key, second)
+
+    def get_cuboid_keys(self, resource, resolution, corner, extent, t_idx):
+        return self.kvio.generate_cached_cuboid_keys(resource, resolution, [t_idx],
+                                                     get_morton_ids(resolution, corner, extent))
+
+    def count(self, lookup_key, name, amount=1):
+        """Add to a statistics counter of a channel. The counter is written with the next pipeline
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            name (str): Name of the counter
+            amount (int): Amount to add
+
+        Returns:
+            None
+        """
+        with self.stats_lock:
+            self.pending_stats[(self.get_stats_key(lookup_key), name)] += amount
+
+    def add_pending_stats(self, pipe):
+        """Move the counters not written yet into a pipeline
+
+        Args:
+            pipe (redis.client.StrictPipeline): Pipeline that is about to be executed
+
+        Returns:
+            None
+        """
+        with self.stats_lock:
+            pending = self.pending_stats
+            self.pending_stats = Counter()
+        for (stats_key, name), amount in pending.items():
+            pipe.hincrby(stats_key, name, amount)
+
+    def flush_stats(self):
+        """Write the counters not written yet
+
+        Returns:
+            None
+        """
+        pipe = self.client.pipeline()
+        self.add_pending_stats(pipe)
+        pipe.execute()
+
+    def record_request(self, resource, resolution, corner, extent, t_idx):
+        """Record whether a tile request will be served from the cache, and if prefetching put it there
+
+        Must be called before the tile is cut out.
+
+        Args:
+            resource (spdb.project.BossResource): Data model info of the channel
+            resolution (int): Resolution level of the tile
+            corner ((int, int, int)): X, Y, Z corner of the tile
+            extent ((int, int, int)): X, Y, Z extent of the tile
+            t_idx (int): Time sample of the tile
+
+        Returns:
+            (bool, bool): If every cuboid of the tile is cached and if any of them was prefetched
+        """
+        keys = self.get_cuboid_keys(resource, resolution, corner, extent, t_idx)
+        pipe = self.client.pipeline()
+        for key in keys:
+            pipe.exists(key)
+        for key in keys:
+            pipe.delete(self.get_marker_key(key))
+        self.add_pending_stats(pipe)
+        results = pipe.execute()
+
+        cached = all(results[:len(keys)])
+        prefetched = any(results[len(keys):2 * len(keys)])
+
+        lookup_key = resource.get_lookup_key()
+        self.count(lookup_key, 'requests')
+        if cached:
+            self.count(lookup_key, 'cache_hits')
+            if prefetched:
+                self.count(lookup_key, 'prefetch_hits')
+        return cached, prefetched
+
+    def allow(self, lookup_key, count):
+        """Take tiles from a channel's prefetch budget for the current second
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            count (int): Number of tiles to prefetch
+
+        Returns:
+            (bool): If the tiles are within the budget
+        """
+        key = self.get_rate_key(lookup_key, int(time.time()))
+        pipe = self.client.pipeline()
+        pipe.incrby(key, count)
+        pipe.expire(key, 2)
+        self.add_pending_stats(pipe)
+        total = pipe.execute()[0]
+        return total <= settings.TILE_PREFETCH_MAX_PER_SEC
+
+    def submit(self, resource, orientation, tile_size, resolution, x_idx, y_idx, z_idx, t_idx):
+        """Queue the neighbours of a requested tile for prefetching
+
+        Args:
+            resource (spdb.project.BossResource): Data model info of the channel
+            orientation (str): Image plane of the requested tile
+            tile_size (int): Width and height of the requested tile in voxels
+            resolution (int): Resolution level of the requested tile
+            x_idx (int): X index of the requested tile
+            y_idx (int): Y index of the requested tile
+            z_idx (int): Z index of the requested tile
+            t_idx (int): Time sample of the requested tile
+
+        Returns:
+            (int): Number of tiles queued
+        """
+        tiles = [tile for tile in get_neighbour_tiles(resolution, x_idx, y_idx, z_idx, settings.TILE_PREFETCH_RADIUS)
+                 if is_valid_tile(resource, orientation, tile_size, *tile)]
+        if not tiles:
+            return 0
+
+        lookup_key = resource.get_lookup_key()
+        if not self.allow(lookup_key, len(tiles)):
+            self.count(lookup_key, 'rate_limited', len(tiles))
+            return 0
+
+        self.start()
+        queued = 0
+        for tile in tiles:
+            try:
+                self.queue.put_nowait((resource, orientation, tile_size, tile, t_idx))
+                queued += 1
+            except queue.Full:
+                self.count(lookup_key, 'dropped', len(tiles) - queued)
+                break
+        return queued
+
+    def start(self):
+        """Start the background thread if it is not running"""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def run(self):
+        """Prefetch queued tiles forever"""
+        while True:
+            resource, orientation, tile_size, tile, t_idx = self.queue.get()
+            try:
+                self.prefetch(resource, orientation, tile_size, tile, t_idx)
+            except Exception:
+                self.log.exception("Problem prefetching tile {} of {}".format(tile, resource.get_lookup_key()))
+            finally:
+                self.queue.task_done()
+
+    def prefetch(self, resource, orientation, tile_size, tile, t_idx):
+        """Page the cuboids of a tile into the cache
+
+        Args:
+            resource (spdb.project.BossResource): Data model info of the channel
+            orientation (str): Image plane of the tile
+            tile_size (int): Width and height of the tile in voxels
+            tile ((int, int, int, int)): Resolution, X, Y and Z index of the tile
+            t_idx (int): Time sample of the tile
+
+        Returns:
+            (int): Number of cuboids paged in
+        """
+        resolution, x_idx, y_idx, z_idx = tile
+        corner, extent = get_tile_region(orientation, tile_size, x_idx, y_idx, z_idx)
+
+        keys = self.get_cuboid_keys(resource, resolution, corner, extent, t_idx)
+        pipe = self.client.pipeline()
+        for key in keys:
+            pipe.exists(key)
+        missing = [key for key, exists in zip(keys, pipe.execute()) if not exists]
+        if not missing:
+            self.flush_stats()
+            return 0
+
+        if self.cache is None:
+            self.cache = get_spatial_db()
+        self.cache.cutout(resource, corner, extent, resolution, [t_idx, t_idx + 1])
+        register_cached_cuboids(resource, resolution, corner, extent, [t_idx, t_idx + 1])
+
+        lookup_key = resource.get_lookup_key()
+        self.count(lookup_key, 'prefetched_tiles')
+        self.count(lookup_key, 'prefetched_cuboids', len(missing))
+        pipe = self.client.pipeline()
+        for key in missing:
+            pipe.setex(self.get_marker_key(key), settings.TILE_PREFETCH_MARKER_TTL, 1)
+        self.add_pending_stats(pipe)
+        pipe.execute()
+        return len(missing)
+
+    def get_stats(self, lookup_key):
+        """Get the prefetch statistics of a channel
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+
+        Returns:
+            (dict): Counters, plus the fraction of tile requests served from the cache and from prefetched cuboids
+        """
+        self.flush_stats()
+        raw = self.client.hgetall(self.get_stats_key(lookup_key))
+        stats = {name: 0 for name in PREFETCH_STATS}
+        for field, value in raw.items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            stats[field] = int(value)
+
+        requests = stats['requests']
+        stats['hit_rate'] = stats['cache_hits'] / requests if requests else None
+        stats['prefetch_hit_rate'] = stats['prefetch_hits'] / requests if requests else None
+        stats['radius'] = settings.TILE_PREFETCH_RADIUS
+        return stats
+
+    def reset_stats(self, lookup_key):
+        """Remove the prefetch statistics of a channel
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+
+        Returns:
+            None
+        """
+        self.flush_stats()
+        self.client.delete(self.get_stats_key(lookup_key))
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    """Get the prefetcher of this process
+
+    Returns:
+        (TilePrefetcher)
+    """
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = TilePrefetcher(settings.KVIO_SETTINGS, settings.TILE_PREFETCH_QUEUE_SIZE)
+        return _prefetcher
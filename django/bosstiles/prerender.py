@@ -0,0 +1,255 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import receiver
+
+from bossutils.logger import BossLogger
+
+from bossspatialdb.downsample import get_channel_lookup_key, get_level_region
+from bossspatialdb.resource import get_channel_resource
+from bossspatialdb.signals import downsample_finished
+
+from .engine import TILED_AXES, get_tile_region, get_tile_image, get_spatial_db
+from .renderers import IMAGE_FORMATS, encode_image
+from .tile_store import get_tile_key, get_tile_store, mark_tiles_stale
+
+# Number of tiles rendered by a worker per task
+PRERENDER_BATCH_SIZE = 64
+
+
+def get_tile_indices(resource, orientation, tile_size, resolution):
+    """Get the indices of every tile of a resolution level that the tile service accepts
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the channel
+        orientation (str): Image plane of the tiles. xy, xz or yz
+        tile_size (int): Width and height of the tiles in voxels
+        resolution (int): Resolution level of the tiles
+
+    Returns:
+        (generator((int, int, int))): X, Y, Z tile indices ordered so neighbouring tiles are rendered together
+    """
+    coord_frame = resource.get_coord_frame()
+    frame_start = [coord_frame.x_start, coord_frame.y_start, coord_frame.z_start]
+    frame_stop = [coord_frame.x_stop, coord_frame.y_stop, coord_frame.z_stop]
+    corner, extent = get_level_region(resource, resolution, frame_start, frame_stop)
+
+    ranges = []
+    for i, tiled in enumerate(TILED_AXES[orientation]):
+        size = tile_size if tiled else 1
+        # The tile service checks tiles against the coordinate frame, so stay inside it as well as the level
+        first = max(corner[i] // size, -(-frame_start[i] // size))
+        last = min(-(-(corner[i] + extent[i]) // size), frame_stop[i] // size)
+        ranges.append(range(first, last))
+
+    for z_idx in ranges[2]:
+        for y_idx in ranges[1]:
+            for x_idx in ranges[0]:
+                yield x_idx, y_idx, z_idx
+
+
+def _render_tiles(names, orientation, tile_size, resolution, t_idx, formats, profiles, indices):
+    """Render a batch of tiles into the tile store. Runs in a worker process
+
+    Args:
+        names ((str, str, str)): Collection, experiment and channel names
+        orientation (str): Image plane of the tiles
+        tile_size (int): Width and height of the tiles in voxels
+        resolution (int): Resolution level of the tiles
+        t_idx (int): Time sample of the tiles
+        formats (list(str)): Image formats to store each tile in
+        profiles (list(str)): Encoder profiles to store each tile with
+        indices (list((int, int, int))): X, Y, Z indices of the tiles
+
+    Returns:
+        (int): Number of tiles rendered
+    """
+    resource = get_channel_resource(*names)
+    lookup_key = resource.get_lookup_key()
+    cache = get_spatial_db()
+    store = get_tile_store()
+
+    for x_idx, y_idx, z_idx in indices:
+        corner, extent = get_tile_region(orientation, tile_size, x_idx, y_idx, z_idx)
+        # Skip the cache so a full sweep does not evict the cuboids users are working with
+        data = cache.cutout(resource, corner, extent, resolution, [t_idx, t_idx + 1], no_cache=True)
+        img = get_tile_image(data, orientation)
+        for fmt in formats:
+            for profile in profiles:
+                key = get_tile_key(lookup_key, orientation, tile_size, resolution, x_idx, y_idx, z_idx, t_idx, fmt,
+                                   profile)
+                store.put(key, encode_image(img, fmt, profile))
+
+    return len(indices)
+
+
+def clear_channel_tiles(lookup_key):
+    """Remove every stored tile of a channel and then its stale mark, see mark_tiles_stale()
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+
+    Returns:
+        None
+    """
+    get_tile_store().delete_channel(lookup_key)
+    mark_tiles_stale(lookup_key, False)
+
+
+def prerender_channel(collection, experiment, channel, orientations=('xy',), tile_sizes=(512,), formats=('png',),
+                      profiles=('default',), resolutions=None, workers=None, clear=False):
+    """Pre-render the tiles of a channel into the tile store using a pool of worker processes
+
+    Only the channel's default time sample is rendered.
+
+    Args:
+        collection (str): Collection name
+        experiment (str): Experiment name
+        channel (str): Channel name
+        orientations (iterable(str)): Image planes to render. xy, xz and/or yz
+        tile_sizes (iterable(int)): Tile sizes to render
+        formats (iterable(str)): Image formats to store. png, jpg and/or webp
+        profiles (iterable(str)): Encoder profiles from the TILE_ENCODER_PROFILES setting to store each format with
+        resolutions (iterable(int)|None): Resolution levels to render. None renders every level
+        workers (int|None): Number of worker processes. Defaults to the number of CPUs
+        clear (bool): Remove the channel's previously stored tiles first
+
+    Returns:
+        (int): Number of tiles rendered
+
+    Raises:
+        ValueError: If an orientation, format or encoder profile is not supported
+    """
+    for orientation in orientations:
+        if orientation not in TILED_AXES:
+            raise ValueError("Invalid orientation: {}".format(orientation))
+    for fmt in formats:
+        if fmt not in IMAGE_FORMATS:
+            raise ValueError("Unsupported tile format: {}".format(fmt))
+    for profile in profiles:
+        if profile not in settings.TILE_ENCODER_PROFILES:
+            raise ValueError("Unknown encoder profile: {}".format(profile))
+
+    log = BossLogger().logger
+    names = (collection, experiment, channel)
+    resource = get_channel_resource(*names)
+    if clear:
+        clear_channel_tiles(resource.get_lookup_key())
+
+    if resolutions is None:
+        resolutions = range(int(resource.get_channel().base_resolution),
+                            int(resource.get_experiment().num_hierarchy_levels))
+    t_idx = int(resource.get_channel().default_time_sample)
+
+    tasks = []
+    for orientation in orientations:
+        for tile_size in tile_sizes:
+            for resolution in resolutions:
+                indices = list(get_tile_indices(resource, orientation, int(tile_size), int(resolution)))
+                for start in range(0, len(indices), PRERENDER_BATCH_SIZE):
+                    tasks.append((orientation, int(tile_size), int(resolution),
+                                  indices[start:start + PRERENDER_BATCH_SIZE]))
+
+    # Workers are forked, so they must not share the parent's database connections
+    connections.close_all()
+
+    rendered = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_render_tiles, names, orientation, tile_size, resolution, t_idx, list(formats),
+                                   list(profiles), indices)
+                   for orientation, tile_size, resolution, indices in tasks]
+        for future in as_completed(futures):
+            try:
+                rendered += future.result()
+            except Exception:
+                log.exception("Problem pre-rendering tiles of {}/{}/{}".format(*names))
+
+    log.info("Pre-rendered {} tiles of {}/{}/{}".format(rendered, *names))
+    return rendered
+
+
+def get_prerender_command(collection, experiment, channel, conf):
+    """Build the prerender_tiles command line for a pre-render configuration
+
+    Args:
+        collection (str): Collection name
+        experiment (str): Experiment name
+        channel (str): Channel name
+        conf (dict): Pre-render configuration, as in the TILE_PRERENDER_ON_DOWNSAMPLE setting
+
+    Returns:
+        (list(str)): Command line arguments
+    """
+    args = [sys.executable, "manage.py", "prerender_tiles", collection, experiment, channel]
+    for orientation in conf.get("orientations") or []:
+        args += ["--orientation", orientation]
+    for tile_size in conf.get("tile_sizes") or []:
+        args += ["--tile-size", str(tile_size)]
+    for fmt in conf.get("formats") or []:
+        args += ["--format", fmt]
+    for profile in conf.get("profiles") or []:
+        args += ["--profile", profile]
+    for resolution in conf.get("resolutions") or []:
+        args += ["--resolution", str(resolution)]
+    if conf.get("workers"):
+        args += ["--workers", str(conf["workers"])]
+    return args
+
+
+def get_clear_command(collection, experiment, channel):
+    """Build the clear_tiles command line for a channel
+
+    Args:
+        collection (str): Collection name
+        experiment (str): Experiment name
+        channel (str): Channel name
+
+    Returns:
+        (list(str)): Command line arguments
+    """
+    return [sys.executable, "manage.py", "clear_tiles", collection, experiment, channel]
+
+
+@receiver(downsample_finished)
+def refresh_downsampled_tiles(sender, channel, **kwargs):
+    """Replace the stored tiles of a channel that finished downsampling
+
+    Stored tiles are stale once a channel is downsampled again. The signal can fire inside a user request, so it only
+    marks them stale, which stops them being served, and leaves removing them to a detached process. If
+    TILE_PRERENDER_ON_DOWNSAMPLE is set that process is prerender_tiles, which removes the old tiles before rendering
+    new ones, otherwise it is clear_tiles.
+    """
+    log = BossLogger().logger
+    experiment = channel.experiment
+    try:
+        mark_tiles_stale(get_channel_lookup_key(channel))
+    except Exception:
+        log.exception("Problem marking the stored tiles of channel {} stale".format(channel.id))
+
+    conf = settings.TILE_PRERENDER_ON_DOWNSAMPLE
+    names = (experiment.collection.name, experiment.name, channel.name)
+    try:
+        if conf is None:
+            args = get_clear_command(*names)
+        else:
+            args = get_prerender_command(*names, conf) + ["--clear"]
+        subprocess.Popen(args, cwd=os.path.dirname(settings.BASE_DIR), start_new_session=True)
+    except Exception:
+        log.exception("Problem refreshing the stored tiles of channel {}".format(channel.id))
@@ -14,8 +14,73 @@
 import io
 from rest_framework import renderers
 from rest_framework.renderers import JSONRenderer
+from django.conf import settings
 from bosscore.renderer_helper import check_for_403
 
+# PIL format names keyed by the renderer format
+IMAGE_FORMATS = {'png': "PNG", 'jpg': "JPEG", 'webp': "WEBP"}
+
+
+def get_profile_name(profile):
+    """Get the name of the encoder profile that is used for a requested profile
+
+    Args:
+        profile (str|None): Requested encoder profile
+
+    Returns:
+        (str): The profile name. Unknown profiles and None use the default profile
+    """
+    return profile if profile in settings.TILE_ENCODER_PROFILES else "default"
+
+
+def get_encoder_options(fmt, profile=None):
+    """Get the PIL save options of a format from the TILE_ENCODER_PROFILES setting
+
+    Args:
+        fmt (str): Renderer format. png, jpg or webp
+        profile (str|None): Encoder profile. Unknown profiles and None use the default profile
+
+    Returns:
+        (dict): Keyword arguments for PIL.Image.save
+    """
+    return settings.TILE_ENCODER_PROFILES[get_profile_name(profile)].get(fmt, {})
+
+
+def encode_image(img, fmt, profile=None):
+    """Encode an image the same way the tile renderers do
+
+    Args:
+        img (PIL.Image): Image to encode
+        fmt (str): Renderer format. png, jpg or webp
+        profile (str|None): Encoder profile from the TILE_ENCODER_PROFILES setting
+
+    Returns:
+        (bytes): The encoded image
+    """
+    if fmt == 'jpg' and img.mode in ('P', 'RGBA', 'LA'):
+        # JPEG has no transparency
+        img = img.convert('RGB')
+    elif fmt == 'webp' and img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.mode in ('P', 'LA') else 'RGB')
+
+    file_obj = io.BytesIO()
+    img.save(file_obj, IMAGE_FORMATS[fmt], **get_encoder_options(fmt, profile))
+    return file_obj.getvalue()
+
+
+def get_encoder_profile(renderer_context):
+    """Get the encoder profile a request asked for with the encoder query parameter
+
+    Args:
+        renderer_context (dict|None): DRF renderer context
+
+    Returns:
+        (str|None): The profile name
+    """
+    if not renderer_context or 'request' not in renderer_context:
+        return None
+    return renderer_context['request'].query_params.get('encoder')
+
 
 class PNGRenderer(renderers.BaseRenderer):
     """ A DRF renderer for rendering an XY image as a png
@@ -27,10 +92,7 @@ class PNGRenderer(renderers.BaseRenderer):
 
     @check_for_403
     def render(self, data, media_type=None, renderer_context=None):
-        file_obj = io.BytesIO()
-        data.save(file_obj, "PNG")
-        file_obj.seek(0)
-        return file_obj.read()
+        return encode_image(data, self.format, get_encoder_profile(renderer_context))
 
 
 class JPEGRenderer(renderers.BaseRenderer):
@@ -43,8 +105,21 @@ class JPEGRenderer(renderers.BaseRenderer):
 
     @check_for_403
     def render(self, data, media_type=None, renderer_context=None):
-        file_obj = io.BytesIO()
-        data.save(file_obj, "JPEG")
-        file_obj.seek(0)
-        return file_obj.read()
+        return encode_image(data, self.format, get_encoder_profile(renderer_context))
+
+
+class WebPRenderer(renderers.BaseRenderer):
+    """ A DRF renderer for rendering an XY image as a webp
+    """
+    media_type = 'image/webp'
+    format = 'webp'
+    charset = None
+    render_style = 'binary'
+
+    @check_for_403
+    def render(self, data, media_type=None, renderer_context=None):
+        return encode_image(data, self.format, get_encoder_profile(renderer_context))
+
 
+# Tile renderers keyed by format
+TILE_RENDERERS = {renderer.format: renderer for renderer in (PNGRenderer, JPEGRenderer, WebPRenderer)}
@@ -0,0 +1,152 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from django.test import override_settings
+
+from bosscore.error import BossError, ErrorCodes
+from bossspatialdb.test.test_downsample import make_resource
+from bosstiles.batch import parse_tile_indices, get_cuboid_parts, merge_parts, cutout_tiles, build_multipart
+
+
+def make_req(resolution=0):
+    req = MagicMock()
+    req.get_resolution.return_value = resolution
+    return req
+
+
+class TestTileBatch(unittest.TestCase):
+
+    def test_parse_tile_indices(self):
+        """Duplicates are removed and order is kept"""
+        req = make_req()
+        tiles = parse_tile_indices(req, make_resource(), 'xy', 512, [[1, 2, 3], ["0", "0", "3"], [1, 2, 3]])
+        self.assertEqual(tiles, [(1, 2, 3), (0, 0, 3)])
+
+        # Every tile goes through the request's own argument checks
+        self.assertEqual(req.set_tileargs.call_count, 3)
+        req.set_tileargs.assert_any_call(512, 'xy', 0, 0, 0, 3)
+
+    def test_parse_rejected_by_request(self):
+        req = make_req()
+        req.set_tileargs.side_effect = [None, BossError("Incorrect cutout arguments", ErrorCodes.INVALID_CUTOUT_ARGS)]
+        with self.assertRaises(BossError):
+            parse_tile_indices(req, make_resource(), 'xy', 512, [[1, 2, 3], [0, 0, 3]])
+
+    def test_parse_invalid_tiles(self):
+        resource = make_resource()
+        with self.assertRaises(BossError) as err:
+            parse_tile_indices(make_req(), resource, 'xy', 512, [[1, 2]])
+        self.assertEqual(err.exception.error_code, ErrorCodes.TYPE_ERROR)
+
+        with self.assertRaises(BossError) as err:
+            parse_tile_indices(make_req(), resource, 'xy', 512, [[1, 2, 3], [8, 0, 0]])
+        self.assertEqual(err.exception.error_code, ErrorCodes.INVALID_CUTOUT_ARGS)
+
+        with self.assertRaises(BossError) as err:
+            parse_tile_indices(make_req(), resource, 'xy', 512, [])
+        self.assertEqual(err.exception.error_code, ErrorCodes.INVALID_ARGUMENT)
+
+    @override_settings(TILE_BATCH_MAX_TILES=2)
+    def test_parse_too_many_tiles(self):
+        with self.assertRaises(BossError) as err:
+            parse_tile_indices(make_req(), make_resource(), 'xy', 512, [[0, 0, 0], [1, 0, 0], [2, 0, 0]])
+        self.assertEqual(err.exception.error_code, ErrorCodes.REQUEST_TOO_LARGE)
+
+    def test_cuboid_parts(self):
+        """Far apart tiles give one small part per cuboid rather than their bounding box"""
+        regions = [((0, 0, 3), (256, 256, 1)), ((256, 0, 3), (256, 256, 1)), ((3584, 3584, 3), (512, 512, 1))]
+        parts = get_cuboid_parts(0, regions)
+        self.assertEqual(parts, [((0, 0, 3), (512, 256, 1)), ((3584, 3584, 3), (512, 512, 1))])
+
+        # A tile crossing cuboid boundaries is split between them
+        parts = get_cuboid_parts(0, [((256, 0, 0), (512, 512, 1))])
+        self.assertEqual(parts, [((256, 0, 0), (256, 512, 1)), ((512, 0, 0), (256, 512, 1))])
+
+    def test_merge_parts(self):
+        """Parts of a viewport merge into one region, parts that don't line up stay apart"""
+        parts = [((0, 0, 3), (512, 512, 1)), ((512, 0, 3), (512, 512, 1)),
+                 ((0, 512, 3), (512, 512, 1)), ((512, 512, 3), (512, 512, 1))]
+        self.assertEqual(merge_parts(parts, 2 ** 30), [((0, 0, 3), (1024, 1024, 1))])
+
+        # Merged regions stay under the size cap
+        self.assertEqual(sorted(merge_parts(parts, 2 * 512 * 512)), [((0, 0, 3), (1024, 512, 1)),
+                                                                     ((0, 512, 3), (1024, 512, 1))])
+
+        # Parts with different bounds or a gap between them are not merged
+        parts = [((0, 0, 3), (512, 256, 1)), ((512, 0, 3), (512, 512, 1)), ((3584, 0, 3), (512, 256, 1))]
+        self.assertEqual(sorted(merge_parts(parts, 2 ** 30)), sorted(parts))
+
+    @patch('bosstiles.batch.Cube')
+    @patch('bosstiles.batch.cutout_region')
+    def test_one_cutout_per_cuboid(self, mock_cutout, mock_cube):
+        """Tiles in the same cuboid are sliced from a single cutout"""
+        resource = make_resource()
+        resource.get_numpy_data_type.return_value = np.uint8
+
+        volume = np.random.randint(1, 255, (1, 1, 64, 64)).astype(np.uint8)
+        mock_cutout.return_value.data = volume
+
+        with patch('bosstiles.batch.get_tile_image', lambda data, orientation: data.data):
+            tiles = dict(cutout_tiles(MagicMock(), resource, 'xy', 32, 0, [(0, 0, 0), (1, 1, 0)], 0))
+
+        self.assertEqual(mock_cutout.call_count, 1)
+        self.assertEqual(mock_cutout.call_args[0][4:6], ((0, 0, 0), (64, 64, 1)))
+        np.testing.assert_array_equal(tiles[(0, 0, 0)], volume[:, :, 0:32, 0:32])
+        np.testing.assert_array_equal(tiles[(1, 1, 0)], volume[:, :, 32:64, 32:64])
+
+    @override_settings(CUTOUT_MAX_SIZE=1024 * 1024)
+    @patch('bosstiles.batch.Cube')
+    @patch('bosstiles.batch.cutout_region')
+    def test_tile_across_cuboids(self, mock_cutout, mock_cube):
+        """A tile larger than a cuboid is cut out in one piece"""
+        resource = make_resource()
+        resource.get_numpy_data_type.return_value = np.uint8
+        volume = np.random.randint(1, 255, (1, 1, 1024, 1024)).astype(np.uint8)
+        mock_cutout.side_effect = lambda cache, resource, orientation, resolution, corner, extent, time_range, \
+            no_cache: MagicMock(data=volume[:, :, corner[1]:corner[1] + extent[1], corner[0]:corner[0] + extent[0]])
+
+        with patch('bosstiles.batch.get_tile_image', lambda data, orientation: data.data):
+            tiles = dict(cutout_tiles(MagicMock(), resource, 'xy', 1024, 0, [(0, 0, 0)], 0))
+        self.assertEqual(mock_cutout.call_count, 1)
+        np.testing.assert_array_equal(tiles[(0, 0, 0)], volume)
+
+    @override_settings(CUTOUT_MAX_SIZE=512 * 1024)
+    @patch('bosstiles.batch.Cube')
+    @patch('bosstiles.batch.cutout_region')
+    def test_cutout_size_cap(self, mock_cutout, mock_cube):
+        """Cutouts are split to stay under CUTOUT_MAX_SIZE"""
+        resource = make_resource()
+        resource.get_numpy_data_type.return_value = np.uint8
+        volume = np.random.randint(1, 255, (1, 1, 1024, 1024)).astype(np.uint8)
+        mock_cutout.side_effect = lambda cache, resource, orientation, resolution, corner, extent, time_range, \
+            no_cache: MagicMock(data=volume[:, :, corner[1]:corner[1] + extent[1], corner[0]:corner[0] + extent[0]])
+
+        with patch('bosstiles.batch.get_tile_image', lambda data, orientation: data.data):
+            tiles = dict(cutout_tiles(MagicMock(), resource, 'xy', 1024, 0, [(0, 0, 0)], 0))
+        self.assertEqual(mock_cutout.call_count, 2)
+        np.testing.assert_array_equal(tiles[(0, 0, 0)], volume)
+
+    def test_build_multipart(self):
+        body, content_type = build_multipart([((0, 0, 1), "image/png", b"one"), ((1, 0, 1), "image/png", b"two")])
+        boundary = content_type.split("boundary=")[1]
+
+        parts = body.split("--{}".format(boundary).encode())
+        self.assertEqual(len(parts), 4)
+        self.assertIn(b"X-Tile-Index: 0,0,1", parts[1])
+        self.assertTrue(parts[1].endswith(b"\r\n\r\none\r\n"))
+        self.assertIn(b"X-Tile-Index: 1,0,1", parts[2])
+        self.assertEqual(parts[3], b"--\r\n")
@@ -0,0 +1,73 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import numpy as np
+
+from bosscore.error import BossError
+from bosstiles.colorize import get_label_colors, colorize_labels, get_colorize_args, DIM_ALPHA
+from bosstiles.renderers import encode_image
+
+
+class TestColorize(unittest.TestCase):
+
+    def test_colors_are_deterministic(self):
+        ids = np.array([0, 1, 2, 2 ** 63 + 5], dtype=np.uint64)
+        colors = get_label_colors(ids)
+        np.testing.assert_array_equal(colors, get_label_colors(ids))
+        np.testing.assert_array_equal(colors[2], get_label_colors(np.array([2], dtype=np.uint64))[0])
+        self.assertFalse(np.array_equal(colors[1], colors[2]))
+
+    def test_background_transparent(self):
+        colors = get_label_colors(np.array([0, 7], dtype=np.uint64))
+        self.assertEqual(colors[0, 3], 0)
+        self.assertEqual(colors[1, 3], 255)
+
+    def test_highlight(self):
+        colors = get_label_colors(np.array([0, 7, 8], dtype=np.uint64), highlight={8})
+        self.assertEqual(colors[0, 3], 0)
+        self.assertEqual(colors[1, 3], DIM_ALPHA)
+        self.assertEqual(colors[2, 3], 255)
+
+    def test_palette_image(self):
+        """Few ids make a palette image whose pixels match the per id colours"""
+        labels = np.array([[0, 5], [5, 9]], dtype=np.uint64)
+        img = colorize_labels(labels)
+        self.assertEqual(img.mode, 'P')
+
+        rgba = np.array(img.convert('RGBA'))
+        expected = get_label_colors(np.array([0, 5, 9], dtype=np.uint64))
+        np.testing.assert_array_equal(rgba[0, 1], expected[1])
+        np.testing.assert_array_equal(rgba[1, 1], expected[2])
+        self.assertEqual(rgba[0, 0, 3], 0)
+
+    def test_rgba_image(self):
+        labels = np.arange(1, 301, dtype=np.uint64).reshape(15, 20)
+        img = colorize_labels(labels)
+        self.assertEqual(img.mode, 'RGBA')
+        self.assertEqual(img.size, (20, 15))
+
+    def test_encode(self):
+        img = colorize_labels(np.array([[0, 5], [5, 9]], dtype=np.uint64))
+        self.assertTrue(encode_image(img, 'png').startswith(b'\x89PNG'))
+        self.assertTrue(encode_image(img, 'jpg').startswith(b'\xff\xd8'))
+
+    def test_colorize_args(self):
+        self.assertEqual(get_colorize_args({}), (False, None))
+        self.assertEqual(get_colorize_args({"colorize": "true"}), (True, None))
+        self.assertEqual(get_colorize_args({"colorize": "True", "highlight": "1,2,3"}), (True, {1, 2, 3}))
+        with self.assertRaises(BossError):
+            get_colorize_args({"colorize": "true", "highlight": "1,a"})
+        with self.assertRaises(BossError):
+            get_colorize_args({"colorize": "true", "highlight": "-1"})
@@ -0,0 +1,80 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from django.test import override_settings
+
+from bosscore.error import BossError
+from bosstiles.composite import parse_composite_layers, blend_layers, fetch_plane
+
+
+class TestComposite(unittest.TestCase):
+
+    def test_parse_defaults(self):
+        layers = parse_composite_layers("ch1,ch2")
+        self.assertEqual([layer["channel"] for layer in layers], ["ch1", "ch2"])
+        np.testing.assert_array_equal(layers[0]["color"], [1, 0, 0])
+        np.testing.assert_array_equal(layers[1]["color"], [0, 1, 0])
+        self.assertIsNone(layers[0]["window"])
+
+    def test_parse_color_and_window(self):
+        layers = parse_composite_layers("ch1:0000ff:100:4000")
+        np.testing.assert_array_equal(layers[0]["color"], [0, 0, 1])
+        self.assertEqual(layers[0]["window"], (100.0, 4000.0))
+
+    def test_parse_invalid(self):
+        for arg in (None, "", "ch1:00ff", "ch1:zzzzzz", "ch1:00ff00:10", "ch1:00ff00:10:5", ":00ff00"):
+            with self.assertRaises(BossError):
+                parse_composite_layers(arg)
+
+    @override_settings(TILE_COMPOSITE_MAX_CHANNELS=2)
+    def test_parse_too_many(self):
+        with self.assertRaises(BossError):
+            parse_composite_layers("ch1,ch2,ch3")
+
+    def test_blend(self):
+        red = np.array([[255, 0]], dtype=np.uint8)
+        green = np.array([[0, 255]], dtype=np.uint8)
+        layers = parse_composite_layers("red:ff0000,green:00ff00")
+        img = np.array(blend_layers([red, green], layers))
+        np.testing.assert_array_equal(img[0, 0], [255, 0, 0])
+        np.testing.assert_array_equal(img[0, 1], [0, 255, 0])
+
+    def test_blend_window(self):
+        """Values are scaled within the window and clipped outside it"""
+        plane = np.array([[100, 200, 300, 1000]], dtype=np.uint16)
+        layers = parse_composite_layers("ch:ffffff:100:300")
+        img = np.array(blend_layers([plane], layers))
+        self.assertEqual(list(img[0, :, 0]), [0, 127, 255, 255])
+
+    def test_blend_additive(self):
+        plane = np.array([[255]], dtype=np.uint8)
+        layers = parse_composite_layers("a:ff0000,b:ffff00")
+        img = np.array(blend_layers([plane, plane], layers))
+        np.testing.assert_array_equal(img[0, 0], [255, 255, 0])
+
+    @patch('bosstiles.composite.Image')
+    @patch('bosstiles.composite.get_tile_store')
+    def test_stored_tile_dtype(self, mock_store, mock_image):
+        """Stored 16 bit tiles decode to 32 bit integers and are cast back to the channel's type"""
+        mock_store.return_value.get.return_value = b"png"
+        mock_image.open.return_value = np.array([[1, 60000]], dtype=np.int32)
+        resource = MagicMock()
+        resource.get_numpy_data_type.return_value = np.uint16
+
+        plane = fetch_plane(resource, 'xy', "key", 0, (0, 0, 0), (2, 1, 1), 0)
+        self.assertEqual(plane.dtype, np.uint16)
+        np.testing.assert_array_equal(plane, [[1, 60000]])
@@ -0,0 +1,201 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import MagicMock, patch
+
+from django.http import QueryDict
+from django.test import override_settings
+
+from bossspatialdb.test.test_downsample import make_resource
+from bosstiles.engine import get_tile_region, get_no_cache, cutout_region, TileTimer, TileEngine
+
+
+def make_request(query="", fmt="png", media_type="image/png"):
+    request = MagicMock()
+    request.query_params = QueryDict(query)
+    request.accepted_renderer.format = fmt
+    request.accepted_renderer.media_type = media_type
+    request.META = {}
+    return request
+
+
+def make_req(x_span=512, y_span=512, z_span=1):
+    req = MagicMock()
+    req.get_resolution.return_value = 0
+    req.get_time.return_value = range(0, 1)
+    req.get_x_start.return_value = 512
+    req.get_y_start.return_value = 0
+    req.get_z_start.return_value = 3
+    req.get_x_span.return_value = x_span
+    req.get_y_span.return_value = y_span
+    req.get_z_span.return_value = z_span
+    return req
+
+
+class TestTileGeometry(unittest.TestCase):
+
+    def test_tile_region(self):
+        self.assertEqual(get_tile_region('xy', 512, 1, 2, 3), ((512, 1024, 3), (512, 512, 1)))
+        self.assertEqual(get_tile_region('yz', 512, 1, 2, 3), ((1, 1024, 1536), (1, 512, 512)))
+        self.assertEqual(get_tile_region('xz', 512, 1, 2, 3), ((512, 2, 1536), (512, 1, 512)))
+        with self.assertRaises(ValueError):
+            get_tile_region('zz', 512, 1, 2, 3)
+
+    def test_no_cache(self):
+        self.assertTrue(get_no_cache(QueryDict("no-cache=True")))
+        self.assertFalse(get_no_cache(QueryDict("no-cache=false")))
+        self.assertFalse(get_no_cache(QueryDict("")))
+
+
+class TestCutoutRegion(unittest.TestCase):
+
+    @patch('bosstiles.engine.register_cached_cuboids')
+    def test_plane(self, mock_register):
+        """Orthogonal planes are one cutout, which only reads the cuboids the plane touches"""
+        cache = MagicMock()
+        resource = make_resource()
+        data = cutout_region(cache, resource, 'yz', 0, (1, 0, 0), (1, 512, 512), [0, 1])
+        self.assertEqual(data, cache.cutout.return_value)
+        cache.cutout.assert_called_once_with(resource, (1, 0, 0), (1, 512, 512), 0, [0, 1], no_cache=False)
+        mock_register.assert_called_once_with(resource, 0, (1, 0, 0), (1, 512, 512), [0, 1])
+
+    @patch('bosstiles.engine.register_cached_cuboids')
+    def test_no_cache(self, mock_register):
+        cache = MagicMock()
+        cutout_region(cache, make_resource(), 'xz', 0, (0, 1, 0), (512, 1, 512), [0, 1], no_cache=True)
+        mock_register.assert_not_called()
+        self.assertTrue(cache.cutout.call_args[1]["no_cache"])
+
+
+class TestTileTimer(unittest.TestCase):
+
+    def test_header(self):
+        timer = TileTimer()
+        timer.stages = [("cutout", 0.0123), ("encode", 0.0045)]
+        self.assertEqual(timer.get_header(), "cutout;dur=12.3, encode;dur=4.5")
+
+    @override_settings(TILE_SERVER_TIMING=True)
+    def test_add_to(self):
+        timer = TileTimer()
+        with timer.stage("cutout"):
+            pass
+        response = timer.add_to({})
+        self.assertTrue(response["Server-Timing"].startswith("cutout;dur="))
+
+
+@patch('bosstiles.engine.get_tile_validator', return_value=('"tag"', 1000.0))
+@patch('bosstiles.engine.spdb.project.BossResourceDjango')
+class TestTileEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = make_resource()
+        self.resource.get_data_type.return_value = "uint8"
+        self.resource.get_bit_depth.return_value = 8
+        self.resource.get_channel.return_value.downsample_status = "DOWNSAMPLED"
+        patcher = patch('bosstiles.engine.are_tiles_stale', return_value=False)
+        self.mock_stale = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('bosstiles.engine.get_tile_store')
+    def test_not_modified(self, mock_store, mock_resource, mock_validator):
+        mock_resource.return_value = self.resource
+        request = make_request()
+        request.META["HTTP_IF_NONE_MATCH"] = '"tag"'
+        response = TileEngine(request, make_req(), 'xy', (512, 1, 0, 3)).render()
+        self.assertEqual(response.status_code, 304)
+        mock_store.assert_not_called()
+
+    @patch('bosstiles.engine.get_tile_store')
+    def test_stored_tile(self, mock_store, mock_resource, mock_validator):
+        mock_resource.return_value = self.resource
+        mock_store.return_value.get.return_value = b"stored"
+        prefetcher = MagicMock()
+
+        response = TileEngine(make_request(), make_req(), 'xy', (512, 1, 0, 3), prefetcher).render()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"stored")
+        self.assertEqual(response["ETag"], '"tag"')
+        prefetcher.record_request.assert_not_called()
+
+    @patch('bosstiles.engine.get_tile_store')
+    @patch('bosstiles.engine.encode_image', return_value=b"encoded")
+    @patch('bosstiles.engine.cutout_region')
+    @patch('bosstiles.engine.get_spatial_db')
+    def test_stale_tiles(self, mock_db, mock_cutout, mock_encode, mock_store, mock_resource, mock_validator):
+        """Tiles of an earlier downsample are not served while they are being removed"""
+        mock_resource.return_value = self.resource
+        self.mock_stale.return_value = True
+
+        response = TileEngine(make_request(), make_req(), 'xy', (512, 1, 0, 3)).render()
+        self.assertEqual(response.content, b"encoded")
+        mock_store.return_value.get.assert_not_called()
+
+    @patch('bosstiles.engine.get_tile_store')
+    def test_stored_tile_profile(self, mock_store, mock_resource, mock_validator):
+        """Tiles stored with one encoder profile are not served for another"""
+        mock_resource.return_value = self.resource
+        mock_store.return_value.get.return_value = b"stored"
+
+        TileEngine(make_request("encoder=fast"), make_req(), 'xy', (512, 1, 0, 3)).render()
+        key = mock_store.return_value.get.call_args[0][0]
+        self.assertTrue(key.endswith(".fast.png"))
+
+    @patch('bosstiles.engine.get_tile_store')
+    @patch('bosstiles.engine.encode_image', return_value=b"encoded")
+    @patch('bosstiles.engine.cutout_region')
+    @patch('bosstiles.engine.get_spatial_db')
+    def test_cutout(self, mock_db, mock_cutout, mock_encode, mock_store, mock_resource, mock_validator):
+        """Images are never looked up in the tile store or prefetched"""
+        mock_resource.return_value = self.resource
+
+        response = TileEngine(make_request("encoder=fast", "jpg", "image/jpeg"), make_req(), 'xy').render()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"encoded")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        mock_store.assert_not_called()
+        mock_cutout.assert_called_once_with(mock_db.return_value, self.resource, 'xy', 0, (512, 0, 3), (512, 512, 1),
+                                            [0, 1], no_cache=False)
+        mock_encode.assert_called_once_with(mock_cutout.return_value.xy_image.return_value, "jpg", "fast")
+
+    @patch('bosstiles.engine.get_tile_store')
+    @patch('bosstiles.engine.encode_image', return_value=b"encoded")
+    @patch('bosstiles.engine.cutout_region')
+    @patch('bosstiles.engine.get_spatial_db')
+    def test_prefetch(self, mock_db, mock_cutout, mock_encode, mock_store, mock_resource, mock_validator):
+        mock_resource.return_value = self.resource
+        mock_store.return_value.get.return_value = None
+        prefetcher = MagicMock()
+
+        TileEngine(make_request(), make_req(), 'xy', (512, 1, 0, 3), prefetcher).render()
+        prefetcher.record_request.assert_called_once_with(self.resource, 0, (512, 0, 3), (512, 512, 1), 0)
+        prefetcher.submit.assert_called_once_with(self.resource, 'xy', 512, 0, 1, 0, 3, 0)
+
+        # Bypassing the cache bypasses prefetching too
+        prefetcher.reset_mock()
+        TileEngine(make_request("no-cache=true"), make_req(), 'xy', (512, 1, 0, 3), prefetcher).render()
+        prefetcher.record_request.assert_not_called()
+        prefetcher.submit.assert_not_called()
+
+    @override_settings(CUTOUT_MAX_SIZE=1000)
+    @patch('bosstiles.engine.get_spatial_db')
+    def test_too_large(self, mock_db, mock_resource, mock_validator):
+        mock_resource.return_value = self.resource
+        response = TileEngine(make_request(), make_req(), 'xy').render()
+        self.assertEqual(response.status_code, 413)
+        mock_db.assert_not_called()
+
+    def test_colorize_image_channel(self, mock_resource, mock_validator):
+        mock_resource.return_value = self.resource
+        response = TileEngine(make_request("colorize=true"), make_req(), 'xy').render()
+        self.assertEqual(response.status_code, 400)
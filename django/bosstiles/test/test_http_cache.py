@@ -0,0 +1,81 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import MagicMock, patch
+
+from django.http import HttpResponse
+from django.test import override_settings
+
+from bosstiles.http_cache import get_tile_validator, is_not_modified, add_cache_headers
+
+
+def make_request(path="/v1/tile/col1/exp1/ch1/xy/512/0/0/0/0/", fmt="png", if_none_match=None):
+    request = MagicMock()
+    request.get_full_path.return_value = path
+    request.accepted_renderer.format = fmt
+    request.META = {}
+    if if_none_match is not None:
+        request.META["HTTP_IF_NONE_MATCH"] = if_none_match
+    return request
+
+
+class TestTileHttpCache(unittest.TestCase):
+
+    @patch('bosstiles.http_cache.get_data_version', return_value=(5, 1000.0))
+    def test_etag(self, mock_version):
+        etag, modified = get_tile_validator(make_request(), ["1&2&3"])
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+        self.assertEqual(modified, 1000.0)
+
+        # Same tile and version give the same tag
+        self.assertEqual(get_tile_validator(make_request(), ["1&2&3"])[0], etag)
+
+        # Format, URL and version all change it
+        self.assertNotEqual(get_tile_validator(make_request(fmt="jpg"), ["1&2&3"])[0], etag)
+        self.assertNotEqual(get_tile_validator(make_request(path="/v1/tile/a/b/c/xy/512/0/0/0/1/"), ["1&2&3"])[0],
+                            etag)
+        mock_version.return_value = (6, 1001.0)
+        self.assertNotEqual(get_tile_validator(make_request(), ["1&2&3"])[0], etag)
+
+    @patch('bosstiles.http_cache.get_data_version', side_effect=Exception("redis down"))
+    def test_no_version(self, mock_version):
+        self.assertEqual(get_tile_validator(make_request(), ["1&2&3"]), (None, None))
+
+    def test_not_modified(self):
+        self.assertTrue(is_not_modified(make_request(if_none_match='"a", "b"'), '"b"'))
+        self.assertTrue(is_not_modified(make_request(if_none_match='*'), '"b"'))
+        self.assertFalse(is_not_modified(make_request(if_none_match='"a"'), '"b"'))
+        self.assertFalse(is_not_modified(make_request(), '"b"'))
+        self.assertFalse(is_not_modified(make_request(if_none_match='"b"'), None))
+
+    @override_settings(TILE_CACHE_MAX_AGE=600, TILE_CACHE_PUBLIC=False)
+    def test_headers_downsampled(self):
+        response = add_cache_headers(HttpResponse(), '"abc"', 1000.0, True)
+        self.assertEqual(response["ETag"], '"abc"')
+        self.assertIn("GMT", response["Last-Modified"])
+        self.assertIn("max-age=600", response["Cache-Control"])
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("Accept", response["Vary"])
+
+    @override_settings(TILE_CACHE_PUBLIC=True)
+    def test_headers_not_downsampled(self):
+        response = add_cache_headers(HttpResponse(), '"abc"', 1000.0, False)
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertIn("public", response["Cache-Control"])
+        self.assertNotIn("max-age", response["Cache-Control"])
+
+    def test_no_headers_without_etag(self):
+        response = add_cache_headers(HttpResponse(), None, None, True)
+        self.assertFalse(response.has_header("ETag"))
+        self.assertFalse(response.has_header("Cache-Control"))
@@ -0,0 +1,109 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+import unittest
+from unittest.mock import patch
+
+from django.test import override_settings
+from mockredis import mock_strict_redis_client
+
+from bossspatialdb.test.test_downsample import make_resource
+from bosstiles.prefetch import TilePrefetcher, get_neighbour_tiles, is_valid_tile
+
+KV_CONF = {"cache_host": "localhost", "cache_db": 1, "read_timeout": 86400}
+
+
+class TestNeighbourTiles(unittest.TestCase):
+
+    def test_neighbours(self):
+        tiles = get_neighbour_tiles(1, 4, 4, 10, 1)
+        self.assertEqual(len(tiles), 8)
+        self.assertIn((1, 3, 4, 10), tiles)
+        self.assertIn((1, 4, 4, 11), tiles)
+        self.assertIn((2, 2, 2, 10), tiles)
+        self.assertIn((0, 8, 8, 10), tiles)
+
+    def test_radius(self):
+        self.assertEqual(len(get_neighbour_tiles(1, 4, 4, 10, 2)), 14)
+
+    def test_valid_tiles(self):
+        resource = make_resource()
+        self.assertTrue(is_valid_tile(resource, 'xy', 512, 0, 7, 7, 127))
+        self.assertFalse(is_valid_tile(resource, 'xy', 512, 0, 8, 7, 127))
+        self.assertFalse(is_valid_tile(resource, 'xy', 512, 0, 7, 7, 128))
+        self.assertFalse(is_valid_tile(resource, 'xy', 512, 0, -1, 7, 0))
+        self.assertFalse(is_valid_tile(resource, 'xy', 512, 3, 0, 0, 0))
+        self.assertFalse(is_valid_tile(resource, 'xy', 512, -1, 0, 0, 0))
+
+
+@patch('redis.StrictRedis', mock_strict_redis_client)
+class TestTilePrefetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = make_resource()
+        self.resource.get_lookup_key.return_value = "4&3&2"
+
+    def test_record_request(self):
+        """Requests are counted as cache hits once every cuboid is cached, and as prefetch hits if prefetched"""
+        prefetcher = TilePrefetcher(KV_CONF, 10)
+        corner, extent = (0, 0, 0), (512, 512, 1)
+        keys = prefetcher.get_cuboid_keys(self.resource, 0, corner, extent, 0)
+
+        self.assertEqual(prefetcher.record_request(self.resource, 0, corner, extent, 0), (False, False))
+
+        for key in keys:
+            prefetcher.client.set(key, b"cuboid")
+        self.assertEqual(prefetcher.record_request(self.resource, 0, corner, extent, 0), (True, False))
+
+        prefetcher.client.set(prefetcher.get_marker_key(keys[0]), 1)
+        self.assertEqual(prefetcher.record_request(self.resource, 0, corner, extent, 0), (True, True))
+
+        # Markers only count once
+        self.assertEqual(prefetcher.record_request(self.resource, 0, corner, extent, 0), (True, False))
+
+        stats = prefetcher.get_stats("4&3&2")
+        self.assertEqual(stats['requests'], 4)
+        self.assertEqual(stats['cache_hits'], 3)
+        self.assertEqual(stats['prefetch_hits'], 1)
+        self.assertEqual(stats['hit_rate'], 0.75)
+        self.assertEqual(stats['prefetch_hit_rate'], 0.25)
+
+    def test_record_request_round_trips(self):
+        """Recording a request takes a single pipeline, which also writes the counters of earlier requests"""
+        prefetcher = TilePrefetcher(KV_CONF, 10)
+        corner, extent = (0, 0, 0), (512, 512, 1)
+        with patch.object(prefetcher.client, 'pipeline', wraps=prefetcher.client.pipeline) as mock_pipeline:
+            prefetcher.record_request(self.resource, 0, corner, extent, 0)
+            prefetcher.record_request(self.resource, 0, corner, extent, 0)
+        self.assertEqual(mock_pipeline.call_count, 2)
+        self.assertEqual(prefetcher.client.hget(prefetcher.get_stats_key("4&3&2"), 'requests'), b"1")
+        self.assertEqual(prefetcher.get_stats("4&3&2")['requests'], 2)
+
+    @override_settings(TILE_PREFETCH_MAX_PER_SEC=10)
+    @patch('bosstiles.prefetch.time.time', lambda: 1000.0)
+    def test_rate_limit(self):
+        prefetcher = TilePrefetcher(KV_CONF, 10)
+        self.assertTrue(prefetcher.allow("4&3&2", 8))
+        self.assertFalse(prefetcher.allow("4&3&2", 8))
+        self.assertTrue(prefetcher.allow("4&3&1", 8))
+
+    @override_settings(TILE_PREFETCH_RADIUS=1, TILE_PREFETCH_MAX_PER_SEC=100)
+    def test_submit_bounded_queue(self):
+        """Tiles that do not fit in the queue are dropped and counted"""
+        prefetcher = TilePrefetcher(KV_CONF, 3)
+        with patch.object(prefetcher, 'start'):
+            queued = prefetcher.submit(self.resource, 'xy', 512, 1, 1, 1, 10, 0)
+
+        self.assertEqual(queued, 3)
+        self.assertEqual(prefetcher.get_stats("4&3&2")['dropped'], 5)
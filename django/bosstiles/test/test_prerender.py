@@ -0,0 +1,116 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from django.test import override_settings
+
+from bossspatialdb.test.test_downsample import make_resource
+from bosstiles.prerender import get_tile_indices, get_prerender_command, refresh_downsampled_tiles, \
+    clear_channel_tiles
+from bosstiles.tile_store import LocalTileStore, get_tile_key
+
+
+class TestLocalTileStore(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = LocalTileStore(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_put_get(self):
+        key = get_tile_key("1&2&3", "xy", 512, 0, 1, 2, 3, 0, "png")
+        self.assertIsNone(self.store.get(key))
+        self.store.put(key, b"tile")
+        self.assertEqual(self.store.get(key), b"tile")
+
+    def test_delete_channel(self):
+        key = get_tile_key("1&2&3", "xy", 512, 0, 1, 2, 3, 0, "png")
+        other_key = get_tile_key("1&2&4", "xy", 512, 0, 1, 2, 3, 0, "png")
+        self.store.put(key, b"tile")
+        self.store.put(other_key, b"other")
+
+        self.store.delete_channel("1&2&3")
+        self.assertIsNone(self.store.get(key))
+        self.assertEqual(self.store.get(other_key), b"other")
+
+    def test_profiles_stored_separately(self):
+        key = get_tile_key("1&2&3", "xy", 512, 0, 1, 2, 3, 0, "jpg")
+        fast_key = get_tile_key("1&2&3", "xy", 512, 0, 1, 2, 3, 0, "jpg", "fast")
+        self.assertNotEqual(key, fast_key)
+        self.store.put(fast_key, b"fast")
+        self.assertIsNone(self.store.get(key))
+
+
+class TestPrerender(unittest.TestCase):
+
+    def test_tile_indices_per_level(self):
+        """Levels shrink in x and y, so they have fewer xy tiles but the same number of slices"""
+        resource = make_resource()
+        self.assertEqual(len(list(get_tile_indices(resource, 'xy', 512, 0))), 8 * 8 * 128)
+        self.assertEqual(len(list(get_tile_indices(resource, 'xy', 512, 2))), 2 * 2 * 128)
+
+    def test_tile_indices_within_frame(self):
+        """Tiles that would reach past the frame are rejected by the tile service, so are not rendered"""
+        resource = make_resource()
+        indices = list(get_tile_indices(resource, 'xz', 512, 0))
+        self.assertEqual(indices, [])
+
+        indices = list(get_tile_indices(resource, 'xz', 64, 0))
+        self.assertEqual(len(indices), 64 * 4096 * 2)
+
+    def test_prerender_command(self):
+        conf = {"orientations": ["xy"], "tile_sizes": [512], "formats": ["png", "jpg"], "profiles": ["fast"],
+                "resolutions": None}
+        args = get_prerender_command("col", "exp", "ch", conf)
+        self.assertEqual(args[2:], ["prerender_tiles", "col", "exp", "ch", "--orientation", "xy",
+                                    "--tile-size", "512", "--format", "png", "--format", "jpg", "--profile", "fast"])
+
+    @override_settings(TILE_PRERENDER_ON_DOWNSAMPLE={"formats": ["png"]})
+    @patch('bosstiles.prerender.subprocess.Popen')
+    @patch('bosstiles.prerender.mark_tiles_stale')
+    @patch('bosstiles.prerender.get_tile_store')
+    def test_refresh_in_background(self, mock_store, mock_stale, mock_popen):
+        """The signal only marks the tiles stale. The detached process removes them before rendering new ones"""
+        channel = MagicMock(id=3)
+        channel.experiment.id = 2
+        channel.experiment.collection.id = 1
+
+        refresh_downsampled_tiles(None, channel)
+        mock_stale.assert_called_once_with("1&2&3")
+        mock_store.return_value.delete_channel.assert_not_called()
+        args = mock_popen.call_args[0][0]
+        self.assertEqual(args[2], "prerender_tiles")
+        self.assertIn("--clear", args)
+
+    @override_settings(TILE_PRERENDER_ON_DOWNSAMPLE=None)
+    @patch('bosstiles.prerender.subprocess.Popen')
+    @patch('bosstiles.prerender.mark_tiles_stale')
+    def test_refresh_clears_only(self, mock_stale, mock_popen):
+        channel = MagicMock(id=3)
+        refresh_downsampled_tiles(None, channel)
+        self.assertEqual(mock_popen.call_args[0][0][2:], ["clear_tiles", channel.experiment.collection.name,
+                                                          channel.experiment.name, channel.name])
+
+    @patch('bosstiles.prerender.mark_tiles_stale')
+    @patch('bosstiles.prerender.get_tile_store')
+    def test_clear_removes_mark_last(self, mock_store, mock_stale):
+        """The stale mark is only removed once every stale tile is gone"""
+        mock_stale.side_effect = lambda *args: mock_store.return_value.delete_channel.assert_called_once_with("1&2&3")
+        clear_channel_tiles("1&2&3")
+        mock_stale.assert_called_once_with("1&2&3", False)
@@ -0,0 +1,69 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+from PIL import Image
+from django.test import override_settings
+
+from bosstiles.renderers import encode_image, get_encoder_options, PNGRenderer, WebPRenderer
+
+try:
+    from PIL import features
+    HAS_WEBP = features.check('webp')
+except ImportError:
+    HAS_WEBP = False
+
+PROFILES = {"default": {"png": {"compress_level": 9}, "jpg": {"quality": 90}},
+            "fast": {"png": {"compress_level": 0}}}
+
+
+class TestEncoders(unittest.TestCase):
+
+    def setUp(self):
+        self.img = Image.fromarray(np.random.randint(0, 255, (256, 256)).astype(np.uint8), 'L')
+
+    @override_settings(TILE_ENCODER_PROFILES=PROFILES)
+    def test_encoder_options(self):
+        self.assertEqual(get_encoder_options('png'), {"compress_level": 9})
+        self.assertEqual(get_encoder_options('png', 'fast'), {"compress_level": 0})
+        self.assertEqual(get_encoder_options('png', 'unknown'), {"compress_level": 9})
+        self.assertEqual(get_encoder_options('jpg', 'fast'), {})
+
+    @override_settings(TILE_ENCODER_PROFILES=PROFILES)
+    def test_fast_profile_skips_compression(self):
+        fast = encode_image(self.img, 'png', 'fast')
+        default = encode_image(self.img, 'png')
+        self.assertTrue(fast.startswith(b'\x89PNG'))
+        self.assertGreater(len(fast), len(default))
+
+    def test_jpeg(self):
+        self.assertTrue(encode_image(self.img, 'jpg').startswith(b'\xff\xd8'))
+
+    @unittest.skipUnless(HAS_WEBP, "PIL built without WebP support")
+    def test_webp(self):
+        data = encode_image(self.img, 'webp')
+        self.assertEqual(data[:4], b'RIFF')
+        self.assertEqual(data[8:12], b'WEBP')
+
+    @override_settings(TILE_ENCODER_PROFILES=PROFILES)
+    def test_renderer_uses_encoder_param(self):
+        request = MagicMock()
+        request.query_params = {"encoder": "fast"}
+        data = PNGRenderer().render(self.img, renderer_context={"request": request})
+        self.assertEqual(data, encode_image(self.img, 'png', 'fast'))
+
+    def test_webp_renderer_media_type(self):
+        self.assertEqual(WebPRenderer.media_type, 'image/webp')
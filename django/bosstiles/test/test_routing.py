@@ -13,7 +13,7 @@
 # limitations under the License.
 
 from django.core.urlresolvers import resolve
-from bosstiles.views import Tile, CutoutTile
+from bosstiles.views import Tile, CutoutTile, ChannelThumbnail, TileBatch, TileComposite, TilePrefetchStats
 
 from rest_framework.test import APITestCase
 
@@ -92,3 +92,50 @@ class TileInterfaceRoutingTests(APITestCase):
 
         view_tiles = resolve('/' + version + '/tile/col1/exp1/ds1/yz/512/2/0/1/1/3/')
         self.assertEqual(view_tiles.func.__name__, Tile.as_view().__name__)
+
+    def test_prefetch_stats_resolves(self):
+        """
+        Test to make sure the tile prefetch statistics URL resolves
+        :return:
+        """
+        view_tiles = resolve('/' + version + '/tile/col1/exp1/ds1/prefetch')
+        self.assertEqual(view_tiles.func.__name__, TilePrefetchStats.as_view().__name__)
+
+        view_tiles = resolve('/' + version + '/tile/col1/exp1/ds1/prefetch/')
+        self.assertEqual(view_tiles.func.__name__, TilePrefetchStats.as_view().__name__)
+
+    def test_batch_resolves(self):
+        """
+        Test to make sure the batch tile URL resolves
+        :return:
+        """
+        view_tiles = resolve('/' + version + '/tile/col1/exp1/ds1/xy/512/2/batch')
+        self.assertEqual(view_tiles.func.__name__, TileBatch.as_view().__name__)
+
+        view_tiles = resolve('/' + version + '/tile/col1/exp1/ds1/yz/512/2/batch/')
+        self.assertEqual(view_tiles.func.__name__, TileBatch.as_view().__name__)
+
+    def test_composite_resolves(self):
+        """
+        Test to make sure the composite tile URL resolves and does not shadow the tile URL
+        :return:
+        """
+        view_tiles = resolve('/' + version + '/tile/col1/exp1/xy/512/2/0/1/1')
+        self.assertEqual(view_tiles.func.__name__, TileComposite.as_view().__name__)
+
+        view_tiles = resolve('/' + version + '/tile/col1/exp1/yz/512/2/0/1/1/3/')
+        self.assertEqual(view_tiles.func.__name__, TileComposite.as_view().__name__)
+
+        view_tiles = resolve('/' + version + '/tile/col1/exp1/xy/xy/512/2/0/1/1')
+        self.assertEqual(view_tiles.func.__name__, Tile.as_view().__name__)
+
+    def test_thumbnail_resolves(self):
+        """
+        Test to make sure the channel thumbnail URL resolves
+        :return:
+        """
+        view_tiles = resolve('/' + version + '/image/col1/exp1/ds1/thumbnail')
+        self.assertEqual(view_tiles.func.__name__, ChannelThumbnail.as_view().__name__)
+
+        view_tiles = resolve('/' + version + '/image/col1/exp1/ds1/thumbnail/')
+        self.assertEqual(view_tiles.func.__name__, ChannelThumbnail.as_view().__name__)
@@ -0,0 +1,111 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from django.core.cache import cache
+from django.test import override_settings
+
+from bosscore.error import BossError
+from bossspatialdb.test.test_downsample import make_resource
+from bosstiles.thumbnail import get_thumbnail_args, get_thumbnail_level, get_thumbnail_plane, \
+    render_thumbnail, get_thumbnail
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def make_spatial_db(volume):
+    """Fake SpatialDB whose cutouts are taken from a [z, y, x] volume"""
+    def cutout(resource, corner, extent, resolution, time_range, *args, **kwargs):
+        data = MagicMock()
+        data.data = volume[np.newaxis, corner[2]:corner[2] + extent[2],
+                           corner[1]:corner[1] + extent[1], corner[0]:corner[0] + extent[0]]
+        return data
+
+    spatial_db = MagicMock()
+    spatial_db.cutout.side_effect = cutout
+    return spatial_db
+
+
+class TestThumbnail(unittest.TestCase):
+
+    def setUp(self):
+        self.resource = make_resource()
+        self.resource.get_bit_depth.return_value = 8
+        self.resource.get_channel.return_value.downsample_status = "DOWNSAMPLED"
+        self.resource.get_channel.return_value.default_time_sample = 0
+        self.resource.get_lookup_key.return_value = "1&2&3"
+
+        # The coarsest level of the 4096x4096x128 frame is 1024x1024x128
+        self.volume = np.zeros((128, 1024, 1024), dtype=np.uint8)
+        self.volume[64, 10, 20] = 100
+        self.volume[3, 30, 40] = 200
+
+    def test_args(self):
+        self.assertEqual(get_thumbnail_args({}), ("slice", 256))
+        self.assertEqual(get_thumbnail_args({"mode": "MIP", "size": "64"}), ("mip", 64))
+        for params in ({"mode": "average"}, {"size": "0"}, {"size": "4096"}, {"size": "big"}):
+            with self.assertRaises(BossError):
+                get_thumbnail_args(params)
+
+    def test_level(self):
+        self.assertEqual(get_thumbnail_level(self.resource), 2)
+        self.resource.get_channel.return_value.downsample_status = "NOT_DOWNSAMPLED"
+        self.assertEqual(get_thumbnail_level(self.resource), 0)
+
+    def test_slice(self):
+        plane = get_thumbnail_plane(make_spatial_db(self.volume), self.resource, 'slice', 0)
+        self.assertEqual(plane.shape, (1024, 1024))
+        self.assertEqual(plane[10, 20], 100)
+        self.assertEqual(plane[30, 40], 0)
+
+    def test_mip(self):
+        spatial_db = make_spatial_db(self.volume)
+        plane = get_thumbnail_plane(spatial_db, self.resource, 'mip', 0)
+        self.assertEqual(plane[10, 20], 100)
+        self.assertEqual(plane[30, 40], 200)
+
+        # One cutout per cuboid deep slab
+        self.assertEqual(spatial_db.cutout.call_count, 8)
+
+    def test_too_large(self):
+        self.resource.get_channel.return_value.downsample_status = "NOT_DOWNSAMPLED"
+        with override_settings(CUTOUT_MAX_SIZE=1024):
+            with self.assertRaises(BossError):
+                get_thumbnail_plane(make_spatial_db(self.volume), self.resource, 'slice', 0)
+
+    def test_render_bounded(self):
+        img = render_thumbnail(np.ones((1024, 512), dtype=np.uint16), 256)
+        self.assertEqual(img.size, (128, 256))
+
+        img = render_thumbnail(np.ones((100, 50), dtype=np.uint64), 256)
+        self.assertEqual(img.size, (50, 100))
+        self.assertEqual(img.mode, 'RGBA')
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    @patch('bosstiles.thumbnail.get_data_version')
+    def test_cached_per_version(self, mock_version):
+        cache.clear()
+        spatial_db = make_spatial_db(self.volume)
+        mock_version.return_value = (1, 0.0)
+
+        first = get_thumbnail(spatial_db, self.resource, 'slice', 64, 'png')
+        self.assertEqual(get_thumbnail(spatial_db, self.resource, 'slice', 64, 'png'), first)
+        self.assertEqual(spatial_db.cutout.call_count, 1)
+
+        # A new data version, e.g. after downsampling, renders again
+        mock_version.return_value = (2, 0.0)
+        get_thumbnail(spatial_db, self.resource, 'slice', 64, 'png')
+        self.assertEqual(spatial_db.cutout.call_count, 2)
@@ -0,0 +1,170 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import numpy as np
+from PIL import Image
+from django.conf import settings
+from django.core.cache import cache
+
+from bosscore.error import BossError, ErrorCodes
+from bossspatialdb.cache_index import register_cached_cuboids
+from bossspatialdb.downsample import get_level_region
+from bossspatialdb.data_version import get_data_version
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from .colorize import colorize_labels
+from .renderers import encode_image
+
+# Ways of flattening the volume into a thumbnail
+THUMBNAIL_MODES = ('mip', 'slice')
+
+
+def get_thumbnail_args(query_params):
+    """Parse the mode and size query parameters of a thumbnail request
+
+    Args:
+        query_params (dict): Query parameters of the request
+
+    Returns:
+        (str, int): Mode (mip or slice) and maximum width and height in pixels
+
+    Raises:
+        BossError: If the mode or size are invalid
+    """
+    mode = query_params.get("mode", "slice").lower()
+    if mode not in THUMBNAIL_MODES:
+        raise BossError("Invalid thumbnail mode {}. Use mip or slice".format(mode), ErrorCodes.INVALID_ARGUMENT)
+
+    try:
+        size = int(query_params.get("size", settings.THUMBNAIL_DEFAULT_SIZE))
+        if size < 1 or size > settings.THUMBNAIL_MAX_SIZE:
+            raise ValueError
+    except ValueError:
+        raise BossError("Invalid thumbnail size. Use an integer from 1 to {}".format(settings.THUMBNAIL_MAX_SIZE),
+                        ErrorCodes.INVALID_ARGUMENT)
+    return mode, size
+
+
+def get_thumbnail_level(resource):
+    """Get the coarsest resolution level that holds data
+
+    Args:
+        resource (spdb.project.BossResource): Data model info of the channel
+
+    Returns:
+        (int): The resolution level
+    """
+    if resource.get_channel().downsample_status.upper() == "DOWNSAMPLED":
+        return int(resource.get_experiment().num_hierarchy_levels) - 1
+    return int(resource.get_channel().base_resolution)
+
+
+def get_thumbnail_plane(spatial_db, resource, mode, t_idx):
+    """Flatten the coarsest level of a channel into one xy plane
+
+    The max projection is built a cuboid deep slab at a time so only one slab is in memory.
+
+    Args:
+        spatial_db (spdb.spatialdb.SpatialDB): Interface to the cache
+        resource (spdb.project.BossResource): Data model info of the channel
+        mode (str): mip for a max projection through z, slice for the middle z slice
+        t_idx (int): Time sample to render
+
+    Returns:
+        (numpy.ndarray): The 2D plane, indexed [y, x]
+
+    Raises:
+        BossError: If a single cutout of the level is too large, e.g. because the channel is not downsampled
+    """
+    resolution = get_thumbnail_level(resource)
+    coord_frame = resource.get_coord_frame()
+    corner, extent = get_level_region(resource, resolution,
+                                      [coord_frame.x_start, coord_frame.y_start, coord_frame.z_start],
+                                      [coord_frame.x_stop, coord_frame.y_stop, coord_frame.z_stop])
+
+    depth = 1 if mode == 'slice' else CUBOIDSIZE[resolution][2]
+    if extent[0] * extent[1] * depth * resource.get_bit_depth() / 8 > settings.CUTOUT_MAX_SIZE:
+        raise BossError("Resolution level {} is too large for a thumbnail. Downsample the channel first".format(
+            resolution), ErrorCodes.REQUEST_TOO_LARGE)
+
+    if mode == 'slice':
+        z = corner[2] + extent[2] // 2
+        data = spatial_db.cutout(resource, (corner[0], corner[1], z), (extent[0], extent[1], 1), resolution,
+                                 [t_idx, t_idx + 1])
+        register_cached_cuboids(resource, resolution, (corner[0], corner[1], z), (extent[0], extent[1], 1),
+                                [t_idx, t_idx + 1])
+        return data.data[0, 0, :, :]
+
+    plane = None
+    slab_depth = CUBOIDSIZE[resolution][2]
+    for z in range(corner[2], corner[2] + extent[2], slab_depth):
+        depth = min(slab_depth, corner[2] + extent[2] - z)
+        data = spatial_db.cutout(resource, (corner[0], corner[1], z), (extent[0], extent[1], depth), resolution,
+                                 [t_idx, t_idx + 1])
+        slab_max = data.data[0].max(axis=0)
+        plane = slab_max if plane is None else np.maximum(plane, slab_max)
+    register_cached_cuboids(resource, resolution, corner, extent, [t_idx, t_idx + 1])
+    return plane
+
+
+def render_thumbnail(plane, size):
+    """Render a plane as an image no larger than size pixels on a side
+
+    Image data is stretched to its own range so dim channels are visible. Annotation ids are colorized.
+
+    Args:
+        plane (numpy.ndarray): 2D plane, indexed [y, x]
+        size (int): Maximum width and height in pixels
+
+    Returns:
+        (PIL.Image): The thumbnail
+    """
+    if plane.dtype == np.uint64:
+        img = colorize_labels(plane).convert('RGBA')
+    else:
+        high = float(plane.max())
+        scaled = plane.astype(np.float32) * (255.0 / high) if high > 0 else np.zeros(plane.shape, np.float32)
+        img = Image.fromarray(scaled.astype(np.uint8), 'L')
+
+    img.thumbnail((size, size), Image.BILINEAR if plane.dtype != np.uint64 else Image.NEAREST)
+    return img
+
+
+def get_thumbnail(spatial_db, resource, mode, size, fmt, profile=None):
+    """Get the encoded thumbnail of a channel, rendering it if it is not cached
+
+    Thumbnails are cached under the channel's data version, so writes and finished downsamples invalidate them.
+
+    Args:
+        spatial_db (spdb.spatialdb.SpatialDB): Interface to the cache
+        resource (spdb.project.BossResource): Data model info of the channel
+        mode (str): mip or slice
+        size (int): Maximum width and height in pixels
+        fmt (str): Image format. png, jpg or webp
+        profile (str|None): Encoder profile
+
+    Returns:
+        (bytes): The encoded thumbnail
+    """
+    lookup_key = resource.get_lookup_key()
+    version, _ = get_data_version(lookup_key)
+    t_idx = int(resource.get_channel().default_time_sample)
+    key = "THUMBNAIL&{}&{}&{}&{}&{}&{}&{}".format(lookup_key, version, t_idx, mode, size, fmt, profile)
+
+    thumbnail = cache.get(key)
+    if thumbnail is None:
+        img = render_thumbnail(get_thumbnail_plane(spatial_db, resource, mode, t_idx), size)
+        thumbnail = encode_image(img, fmt, profile)
+        cache.set(key, thumbnail, settings.THUMBNAIL_CACHE_TIMEOUT)
+    return thumbnail
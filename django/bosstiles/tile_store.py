@@ -0,0 +1,222 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import shutil
+
+from django.conf import settings
+
+import bossutils
+from bossutils.logger import BossLogger
+from spdb.spatialdb.state import CacheStateDB
+
+
+def get_tile_key(lookup_key, orientation, tile_size, resolution, x_idx, y_idx, z_idx, t_idx, fmt, profile="default"):
+    """Build the key of a tile in a tile store
+
+    All tiles of a channel share the lookup key as a prefix so they can be removed together. Tiles encoded with
+    different encoder profiles are stored separately.
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+        orientation (str): Image plane of the tile. xy, xz or yz
+        tile_size (int): Width and height of the tile in voxels
+        resolution (int): Resolution level of the tile
+        x_idx (int): X index of the tile
+        y_idx (int): Y index of the tile
+        z_idx (int): Z index of the tile
+        t_idx (int): Time sample of the tile
+        fmt (str): Image format of the tile. png, jpg or webp
+        profile (str): Name of the encoder profile the tile is encoded with
+
+    Returns:
+        (str): The tile key
+    """
+    return "{}/{}/{}/{}/{}/{}/{}/{}.{}.{}".format(lookup_key.replace("&", "-"), orientation, tile_size, resolution,
+                                                 t_idx, z_idx, y_idx, x_idx, profile, fmt)
+
+
+def get_channel_prefix(lookup_key):
+    """Get the key prefix of every tile of a channel
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+
+    Returns:
+        (str): The prefix
+    """
+    return "{}/".format(lookup_key.replace("&", "-"))
+
+
+def get_stale_key(lookup_key):
+    return "TILE-STORE-STALE&{}".format(lookup_key)
+
+
+def mark_tiles_stale(lookup_key, stale=True):
+    """Mark a channel's stored tiles as stale until the background job removing them has finished
+
+    The mark is kept in the cache state database, so it can't be evicted while stale tiles remain.
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+        stale (bool): False to remove the mark once the tiles are gone
+
+    Returns:
+        None
+    """
+    client = CacheStateDB(settings.STATEIO_CONFIG).status_client
+    if stale:
+        client.set(get_stale_key(lookup_key), 1)
+    else:
+        client.delete(get_stale_key(lookup_key))
+
+
+def are_tiles_stale(lookup_key):
+    """Check if a channel's stored tiles must not be served
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+
+    Returns:
+        (bool): True if they are stale, or if that can't be checked
+    """
+    try:
+        return bool(CacheStateDB(settings.STATEIO_CONFIG).status_client.exists(get_stale_key(lookup_key)))
+    except Exception:
+        BossLogger().logger.exception("Problem checking if the stored tiles of {} are stale".format(lookup_key))
+        return True
+
+
+class TileStore:
+    """
+    Storage of encoded, pre-rendered tiles
+    """
+
+    def get(self, key):
+        """Get an encoded tile
+
+        Args:
+            key (str): Tile key
+
+        Returns:
+            (bytes|None): The encoded tile or None if it has not been rendered
+        """
+        raise NotImplementedError
+
+    def put(self, key, data):
+        """Store an encoded tile
+
+        Args:
+            key (str): Tile key
+            data (bytes): The encoded tile
+
+        Returns:
+            None
+        """
+        raise NotImplementedError
+
+    def delete_channel(self, lookup_key):
+        """Remove every stored tile of a channel
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+
+        Returns:
+            None
+        """
+        raise NotImplementedError
+
+
+class LocalTileStore(TileStore):
+    """
+    Tile store on the local disk, for development and single server installs
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root (str): Directory the tiles are stored under
+        """
+        self.root = root
+
+    def get_path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        try:
+            with open(self.get_path(key), 'rb') as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial tile
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+
+    def delete_channel(self, lookup_key):
+        shutil.rmtree(self.get_path(get_channel_prefix(lookup_key)), ignore_errors=True)
+
+
+class S3TileStore(TileStore):
+    """
+    Tile store in an S3 bucket
+    """
+
+    def __init__(self, bucket):
+        """
+        Args:
+            bucket (str): Name of the bucket the tiles are stored in
+        """
+        self.bucket = bucket
+        self.client = bossutils.aws.get_session().client('s3')
+
+    def get(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response['Body'].read()
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def delete_channel(self, lookup_key):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=get_channel_prefix(lookup_key)):
+            objects = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if objects:
+                self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects})
+
+
+def get_tile_store():
+    """Get the tile store configured by the TILE_STORE setting
+
+    Returns:
+        (TileStore): The configured tile store
+
+    Raises:
+        ValueError: If the store type is not supported
+    """
+    conf = settings.TILE_STORE
+    if conf['type'] == 'local':
+        return LocalTileStore(conf['root'])
+    elif conf['type'] == 's3':
+        return S3TileStore(conf['bucket'])
+    else:
+        raise ValueError("Unsupported tile store type: {}".format(conf['type']))
@@ -11,17 +11,29 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from concurrent.futures import ThreadPoolExecutor
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.parsers import JSONParser
 from django.conf import settings
+from django.http import HttpResponse
 
 from bosscore.request import BossRequest
 from bosscore.error import BossError, BossHTTPError, ErrorCodes
+from bossspatialdb.resource import ServiceRequest
 
 import spdb
 
-from .renderers import PNGRenderer, JPEGRenderer
+from .composite import parse_composite_layers, blend_layers, fetch_plane, get_stored_tile_key
+from .thumbnail import get_thumbnail_args, get_thumbnail
+from .engine import TileEngine, get_no_cache, get_spatial_db
+from .http_cache import get_tile_validator, is_not_modified, add_cache_headers
+from .batch import parse_tile_indices, cutout_tiles, build_multipart
+from .prefetch import get_prefetcher
+from .renderers import PNGRenderer, JPEGRenderer, WebPRenderer, TILE_RENDERERS, encode_image
 
 
 class CutoutTile(APIView):
@@ -30,12 +42,7 @@ class CutoutTile(APIView):
 
     * Requires authentication.
     """
-    renderer_classes = (PNGRenderer, JPEGRenderer)
-
-    def __init__(self):
-        super().__init__()
-        self.data_type = None
-        self.bit_depth = None
+    renderer_classes = (PNGRenderer, JPEGRenderer, WebPRenderer)
 
     def get(self, request, collection, experiment, channel, orientation, resolution, x_args, y_args, z_args, t_args=None):
         """
@@ -71,54 +78,7 @@ class CutoutTile(APIView):
         except BossError as err:
             return err.to_http()
 
-        if "no-cache" in request.query_params:
-            if request.query_params["no-cache"].lower() == "true":
-                no_cache = True
-            else:
-                no_cache = False
-        else:
-            no_cache = False
-
-        # Convert to Resource
-        resource = spdb.project.BossResourceDjango(req)
-
-        # Get bit depth
-        try:
-            self.bit_depth = resource.get_bit_depth()
-        except ValueError:
-            return BossHTTPError("Datatype does not match channel", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
-
-        # Make sure cutout request is under 1GB UNCOMPRESSED
-        total_bytes = req.get_x_span() * req.get_y_span() * req.get_z_span() * len(req.get_time()) * (self.bit_depth/8)
-        if total_bytes > settings.CUTOUT_MAX_SIZE:
-            return BossHTTPError("Cutout request is over 1GB when uncompressed. Reduce cutout dimensions.",
-                                 ErrorCodes.REQUEST_TOO_LARGE)
-
-        # Get interface to SPDB cache
-        cache = spdb.spatialdb.SpatialDB(settings.KVIO_SETTINGS,
-                                         settings.STATEIO_CONFIG,
-                                         settings.OBJECTIO_CONFIG)
-
-        # Get the params to pull data out of the cache
-        corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
-        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
-
-        # Do a cutout as specified
-        data = cache.cutout(resource, corner, extent, req.get_resolution(),
-                            [req.get_time().start, req.get_time().stop], no_cache=no_cache)
-
-        # Covert the cutout back to an image and return it
-        if orientation == 'xy':
-            img = data.xy_image()
-        elif orientation == 'yz':
-            img = data.yz_image()
-        elif orientation == 'xz':
-            img = data.xz_image()
-        else:
-            return BossHTTPError("Invalid orientation: {}".format(orientation),
-                                 ErrorCodes.INVALID_CUTOUT_ARGS)
-
-        return Response(img)
+        return TileEngine(request, req, orientation).render()
 
 
 class Tile(APIView):
@@ -127,22 +87,19 @@ class Tile(APIView):
 
     * Requires authentication.
     """
-    renderer_classes = (PNGRenderer, JPEGRenderer)
-
-    def __init__(self):
-        super().__init__()
-        self.data_type = None
-        self.bit_depth = None
+    renderer_classes = (PNGRenderer, JPEGRenderer, WebPRenderer)
 
     def get(self, request, collection, experiment, channel, orientation, tile_size, resolution, x_idx, y_idx, z_idx, t_idx=None):
         """
-        View to handle GET requests for a tile when providing indices. Currently only supports XY plane
+        View to handle GET requests for a tile when providing indices
 
         :param request: DRF Request object
         :type request: rest_framework.request.Request
         :param collection: Unique Collection identifier, indicating which collection you want to access
         :param experiment: Experiment identifier, indicating which experiment you want to access
         :param channel: Channel identifier, indicating which channel you want to access
+        :param orientation: Image plane requested. Valid options include xy,xz or yz
+        :param tile_size: Width and height of the tile in voxels
         :param resolution: Integer indicating the level in the resolution hierarchy (0 = native)
         :param x_idx: the tile index in the X dimension
         :param y_idx: the tile index in the Y dimension
@@ -150,7 +107,6 @@ class Tile(APIView):
         :param t_idx: the tile index in the T dimension
         :return:
         """
-        # TODO: DMK Merge Tile and Image view once updated request validation is sorted out
         # Process request and validate
         try:
             request_args = {
@@ -170,51 +126,303 @@ class Tile(APIView):
         except BossError as err:
             return err.to_http()
 
-        if "no-cache" in request.query_params:
-            if request.query_params["no-cache"].lower() == "true":
-                no_cache = True
-            else:
-                no_cache = False
-        else:
-            no_cache = False
+        prefetcher = get_prefetcher() if settings.TILE_PREFETCH_ENABLED else None
+        tile_index = (int(tile_size), int(x_idx), int(y_idx), int(z_idx))
+        return TileEngine(request, req, orientation, tile_index, prefetcher).render()
+
+
+class TileComposite(APIView):
+    """
+    View to render several channels of an experiment as one colour tile
+
+    * Requires authentication.
+    """
+    renderer_classes = (PNGRenderer, JPEGRenderer, WebPRenderer)
+
+    def get(self, request, collection, experiment, orientation, tile_size, resolution, x_idx, y_idx, z_idx,
+            t_idx=None):
+        """
+        View to handle GET requests for a composite tile
+
+        The channels query parameter lists the channels to blend as <channel>[:<rrggbb colour>[:<min>:<max>]],
+        e.g. channels=dapi:0000ff,gfp:00ff00:100:4000. Each channel is validated like a tile request, the channels
+        are fetched concurrently and blended additively after scaling each one to its window.
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param collection: Unique Collection identifier, indicating which collection you want to access
+        :param experiment: Experiment identifier, indicating which experiment you want to access
+        :param orientation: Image plane requested. Valid options include xy,xz or yz
+        :param tile_size: Width and height of the tile in voxels
+        :param resolution: Integer indicating the level in the resolution hierarchy (0 = native)
+        :param x_idx: the tile index in the X dimension
+        :param y_idx: the tile index in the Y dimension
+        :param z_idx: the tile index in the Z dimension
+        :param t_idx: the tile index in the T dimension
+        :return:
+        """
+        try:
+            layers = parse_composite_layers(request.query_params.get("channels"))
+        except BossError as err:
+            return err.to_http()
+
+        no_cache = get_no_cache(request.query_params)
+
+        # Process and validate a tile request per channel
+        reqs = []
+        resources = []
+        for layer in layers:
+            try:
+                request_args = {
+                    "service": "tile",
+                    "collection_name": collection,
+                    "experiment_name": experiment,
+                    "channel_name": layer["channel"],
+                    "orientation": orientation,
+                    "tile_size": tile_size,
+                    "resolution": resolution,
+                    "x_args": x_idx,
+                    "y_args": y_idx,
+                    "z_args": z_idx,
+                    "time_args": t_idx
+                }
+                req = BossRequest(request, request_args)
+            except BossError as err:
+                return err.to_http()
+
+            resource = spdb.project.BossResourceDjango(req)
+            if resource.get_data_type() not in ("uint8", "uint16"):
+                return BossHTTPError("Only image channels can be composited. {} is {}".format(
+                    layer["channel"], resource.get_data_type()), ErrorCodes.DATATYPE_NOT_SUPPORTED)
+            reqs.append(req)
+            resources.append(resource)
+
+        # Composite tiles change with the data version of any of their channels
+        etag, modified = get_tile_validator(request, [resource.get_lookup_key() for resource in resources])
+        downsampled = all(resource.get_channel().downsample_status.upper() == "DOWNSAMPLED"
+                          for resource in resources)
+        if is_not_modified(request, etag):
+            return add_cache_headers(HttpResponse(status=304), etag, modified, downsampled)
+
+        # Every channel shares the tile geometry, so take it from the first channel's request
+        primary_req = reqs[0]
+        corner = (primary_req.get_x_start(), primary_req.get_y_start(), primary_req.get_z_start())
+        extent = (primary_req.get_x_span(), primary_req.get_y_span(), primary_req.get_z_span())
+        t_start = primary_req.get_time().start
+
+        with ThreadPoolExecutor(max_workers=len(resources)) as executor:
+            futures = []
+            for resource in resources:
+                tile_key = None
+                if not no_cache:
+                    tile_key = get_stored_tile_key(resource, orientation, int(tile_size),
+                                                   primary_req.get_resolution(), int(x_idx), int(y_idx), int(z_idx),
+                                                   t_start)
+                futures.append(executor.submit(fetch_plane, resource, orientation, tile_key,
+                                               primary_req.get_resolution(), corner, extent, t_start, no_cache))
+            planes = [future.result() for future in futures]
+
+        return add_cache_headers(Response(blend_layers(planes, layers)), etag, modified, downsampled)
+
+
+class ChannelThumbnail(APIView):
+    """
+    View to get a small preview image of a channel
+
+    * Requires authentication.
+    """
+    renderer_classes = (PNGRenderer, JPEGRenderer, WebPRenderer)
+
+    def get(self, request, collection, experiment, channel):
+        """
+        View to handle GET requests for a channel thumbnail
+
+        The thumbnail is rendered from the coarsest resolution level, as a max projection (mode=mip) or the middle z
+        slice (mode=slice, the default), and is at most size pixels (default THUMBNAIL_DEFAULT_SIZE) on a side.
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param collection: Unique Collection identifier, indicating which collection you want to access
+        :param experiment: Experiment identifier, indicating which experiment you want to access
+        :param channel: Channel identifier, indicating which channel you want to access
+        :return:
+        """
+        try:
+            mode, size = get_thumbnail_args(request.query_params)
+            request_args = {
+                "service": "downsample",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
 
         # Convert to Resource
         resource = spdb.project.BossResourceDjango(req)
 
-        # Get bit depth
+        etag, modified = get_tile_validator(request, [resource.get_lookup_key()])
+        downsampled = resource.get_channel().downsample_status.upper() == "DOWNSAMPLED"
+        if is_not_modified(request, etag):
+            return add_cache_headers(HttpResponse(status=304), etag, modified, downsampled)
+
+        # Get interface to SPDB cache
+        cache = get_spatial_db()
         try:
-            self.bit_depth = resource.get_bit_depth()
+            thumbnail = get_thumbnail(cache, resource, mode, size, request.accepted_renderer.format,
+                                      request.query_params.get("encoder"))
+        except BossError as err:
+            return err.to_http()
+
+        response = HttpResponse(thumbnail, content_type=request.accepted_renderer.media_type)
+        return add_cache_headers(response, etag, modified, downsampled)
+
+
+class TileBatch(APIView):
+    """
+    View to get many tiles of a channel, orientation and resolution in one request
+
+    * Requires authentication.
+    """
+    parser_classes = (JSONParser,)
+    renderer_classes = (JSONRenderer,)
+
+    def post(self, request, collection, experiment, channel, orientation, tile_size, resolution):
+        """
+        View to handle POST requests for a batch of tiles
+
+        The body is JSON with "tiles", a list of [x, y, z] tile indices, and optionally "time", the time sample, and
+        "format", png (default), jpg or webp. The batch only reads data, so it is authorized like a tile GET. The
+        channel is validated once, every tile is checked against it and each cuboid of the batch is cut out once.
+        The response is multipart/mixed with one part per tile, in request order, identified by an X-Tile-Index
+        header.
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param collection: Unique Collection identifier, indicating which collection you want to access
+        :param experiment: Experiment identifier, indicating which experiment you want to access
+        :param channel: Channel identifier, indicating which channel you want to access
+        :param orientation: Image plane requested. Valid options include xy,xz or yz
+        :param tile_size: Width and height of the tiles in voxels
+        :param resolution: Integer indicating the level in the resolution hierarchy (0 = native)
+        :return:
+        """
+        tiles = request.data.get("tiles")
+        fmt = request.data.get("format", "png")
+        if fmt not in TILE_RENDERERS:
+            return BossHTTPError("Unsupported tile format: {}".format(fmt), ErrorCodes.INVALID_ARGUMENT)
+        if not isinstance(tiles, list) or not tiles or not isinstance(tiles[0], list) or len(tiles[0]) != 3:
+            return BossHTTPError("Batch tile request must provide a non-empty list of [x, y, z] tile indices",
+                                 ErrorCodes.INVALID_ARGUMENT)
+
+        # Process request and validate the channel once, using the first tile. The batch is a read, so it needs read
+        # permission rather than the add permission of a POST
+        try:
+            time_args = request.data.get("time")
+            request_args = {
+                "service": "tile",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "orientation": orientation,
+                "tile_size": tile_size,
+                "resolution": resolution,
+                "x_args": tiles[0][0],
+                "y_args": tiles[0][1],
+                "z_args": tiles[0][2],
+                "time_args": str(time_args) if time_args is not None else None
+            }
+            req = BossRequest(ServiceRequest(request.user, 'GET', request.version), request_args)
+        except BossError as err:
+            return err.to_http()
+
+        if req.get_resolution() is None:
+            return BossHTTPError("Invalid resolution: {}".format(resolution), ErrorCodes.INVALID_CUTOUT_ARGS)
+
+        no_cache = get_no_cache(request.query_params)
+
+        # Convert to Resource
+        resource = spdb.project.BossResourceDjango(req)
+
+        try:
+            resource.get_bit_depth()
         except ValueError:
             return BossHTTPError("Datatype does not match channel", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
 
-        # Make sure cutout request is under 1GB UNCOMPRESSED
-        total_bytes = req.get_x_span() * req.get_y_span() * req.get_z_span() * len(req.get_time()) * (self.bit_depth/8)
-        if total_bytes > settings.CUTOUT_MAX_SIZE:
-            return BossHTTPError("Cutout request is over 1GB when uncompressed. Reduce cutout dimensions.",
-                                 ErrorCodes.REQUEST_TOO_LARGE)
+        # Check the rest of the tiles against the already validated channel
+        try:
+            indices = parse_tile_indices(req, resource, orientation, int(tile_size), tiles)
+        except BossError as err:
+            return err.to_http()
 
         # Get interface to SPDB cache
-        cache = spdb.spatialdb.SpatialDB(settings.KVIO_SETTINGS,
-                                         settings.STATEIO_CONFIG,
-                                         settings.OBJECTIO_CONFIG)
-
-        # Get the params to pull data out of the cache
-        corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
-        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
-
-        # Do a cutout as specified
-        data = cache.cutout(resource, corner, extent, req.get_resolution(),
-                            [req.get_time().start, req.get_time().stop], no_cache=no_cache)
-
-        # Covert the cutout back to an image and return it
-        if orientation == 'xy':
-            img = data.xy_image()
-        elif orientation == 'yz':
-            img = data.yz_image()
-        elif orientation == 'xz':
-            img = data.xz_image()
-        else:
-            return BossHTTPError("Invalid orientation: {}".format(orientation),
-                                 ErrorCodes.INVALID_CUTOUT_ARGS)
-
-        return Response(img)
+        cache = get_spatial_db()
+
+        images = dict(cutout_tiles(cache, resource, orientation, int(tile_size), req.get_resolution(), indices,
+                                   req.get_time().start, no_cache=no_cache))
+
+        media_type = TILE_RENDERERS[fmt].media_type
+        profile = request.query_params.get("encoder")
+        body, content_type = build_multipart((tile, media_type, encode_image(images[tile], fmt, profile))
+                                             for tile in indices)
+        return HttpResponse(body, content_type=content_type)
+
+
+class TilePrefetchStats(APIView):
+    """
+    View to report how well neighbour tile prefetching is working for a channel
+
+    * Requires authentication.
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def get_request(self, request, collection, experiment, channel):
+        request_args = {
+            "service": "downsample",
+            "collection_name": collection,
+            "experiment_name": experiment,
+            "channel_name": channel
+        }
+        return BossRequest(request, request_args)
+
+    def get(self, request, collection, experiment, channel):
+        """View to get the tile prefetch counters and hit rates of a channel
+
+        Args:
+            request: DRF Request object
+            collection (str): Unique Collection identifier, indicating which collection you want to access
+            experiment (str): Experiment identifier, indicating which experiment you want to access
+            channel (str): Channel identifier, indicating which channel you want to access
+
+        Returns:
+
+        """
+        try:
+            req = self.get_request(request, collection, experiment, channel)
+        except BossError as err:
+            return err.to_http()
+
+        stats = get_prefetcher().get_stats(req.get_lookup_key())
+        stats["enabled"] = settings.TILE_PREFETCH_ENABLED
+        return Response(stats)
+
+    def delete(self, request, collection, experiment, channel):
+        """View to reset the tile prefetch statistics of a channel, e.g. after changing the prefetch radius
+
+        Args:
+            request: DRF Request object
+            collection (str): Unique Collection identifier, indicating which collection you want to access
+            experiment (str): Experiment identifier, indicating which experiment you want to access
+            channel (str): Channel identifier, indicating which channel you want to access
+
+        Returns:
+
+        """
+        try:
+            req = self.get_request(request, collection, experiment, channel)
+        except BossError as err:
+            return err.to_http()
+
+        get_prefetcher().reset_stats(req.get_lookup_key())
+        return HttpResponse(status=204)